@@ -37,6 +37,7 @@ a token.)
 """
 
 import json
+from collections import OrderedDict
 from itertools import groupby
 from functools import partial
 
@@ -59,6 +60,7 @@ from otter.util.http import (
     wrap_upstream_error,
 )
 from otter.util.retry import repeating_interval, retry, retry_times
+from otter.util.timestamp import timestamp_to_epoch
 
 
 class _DoNothingLogger(BoundLog):
@@ -160,18 +162,37 @@ class CachingAuthenticator(object):
     An authenticator which cases the result of the provided auth_function
     based on the tenant_id.
 
+    In refresh-ahead mode, an entry is kept until its token expires (or
+    until ``ttl`` if the token's expiry is not known) and the first request
+    within ``refresh_ahead`` seconds of the expiry gets the cached token
+    while a new one is fetched in the background. Tenants that keep
+    authenticating never wait for identity.
+
     :param IReactorTime reactor: An IReactorTime provider used for enforcing
         the cache TTL.
     :param IAuthenticator authenticator:
     :param int ttl: An integer indicating the TTL of a cache entry in seconds.
-    """
-    def __init__(self, reactor, authenticator, ttl):
+    :param int refresh_ahead: Number of seconds before an entry expires from
+        which it is refreshed in the background. ``None`` to disable
+        refresh-ahead, in which case entries expire after ``ttl``.
+    :param int max_refreshing: Maximum number of background refreshes
+        running at the same time. Entries that need refreshing when this many
+        are running are refreshed on a later request.
+    :param int max_size: Maximum number of tenants cached. The least recently
+        used tenants are evicted when it is exceeded. ``None`` for no limit.
+    """
+    def __init__(self, reactor, authenticator, ttl, refresh_ahead=None,
+                 max_refreshing=10, max_size=None):
         self._reactor = reactor
         self._authenticator = authenticator
         self._ttl = ttl
+        self._refresh_ahead = refresh_ahead
+        self._max_refreshing = max_refreshing
+        self._max_size = max_size
 
         self._waiters = {}
-        self._cache = {}
+        self._cache = OrderedDict()
+        self._refreshing = set()
         self._log = self._bind_log(default_log)
         self._auth_func = wait(ignore_kwargs=['log'])(self._authenticator.authenticate_tenant)
 
@@ -184,6 +205,41 @@ class CachingAuthenticator(object):
                         cache_ttl=self._ttl,
                         **kwargs)
 
+    def _expires(self, created, result):
+        """
+        Return the EPOCH at which a result got at ``created`` expires.
+        """
+        if self._refresh_ahead is not None:
+            expires = getattr(result[0], 'expires', None)
+            if expires is not None:
+                return expires
+        return created + self._ttl
+
+    def _populate(self, tenant_id, result, log):
+        log.msg('otter.auth.cache.populate')
+        now = self._reactor.seconds()
+        self._cache.pop(tenant_id, None)
+        self._cache[tenant_id] = (now, self._expires(now, result), result)
+        if self._max_size is not None:
+            while len(self._cache) > self._max_size:
+                evicted, _ = self._cache.popitem(last=False)
+                log.msg('otter.auth.cache.evict', evicted_tenant_id=evicted)
+        return result
+
+    def _refresh(self, tenant_id, log):
+        """
+        Authenticate the tenant again in the background.
+        """
+        def refresh_failed(failure):
+            log.err(failure, 'otter.auth.cache.refresh-failed')
+
+        log.msg('otter.auth.cache.refresh')
+        self._refreshing.add(tenant_id)
+        d = self._auth_func(tenant_id, log=log)
+        d.addCallbacks(partial(self._populate, tenant_id, log=log),
+                       refresh_failed)
+        d.addBoth(lambda _: self._refreshing.discard(tenant_id))
+
     def authenticate_tenant(self, tenant_id, log=None):
         """
         see :meth:`IAuthenticator.authenticate_tenant`
@@ -194,23 +250,25 @@ class CachingAuthenticator(object):
             log = self._bind_log(log, tenant_id=tenant_id)
 
         if tenant_id in self._cache:
-            (created, data) = self._cache[tenant_id]
+            (created, expires, data) = self._cache.pop(tenant_id)
             now = self._reactor.seconds()
 
-            if now - created <= self._ttl:
+            if now <= expires:
+                # Move it to the end as the most recently used
+                self._cache[tenant_id] = (created, expires, data)
                 log.msg('otter.auth.cache.hit', age=now - created)
+                if (self._refresh_ahead is not None and
+                        now >= expires - self._refresh_ahead and
+                        tenant_id not in self._refreshing and
+                        len(self._refreshing) < self._max_refreshing):
+                    self._refresh(tenant_id, log)
                 return succeed(data)
 
             log.msg('otter.auth.cache.expired', age=now - created)
 
-        def when_authenticated(result):
-            log.msg('otter.auth.cache.populate')
-            self._cache[tenant_id] = (self._reactor.seconds(), result)
-            return result
-
         log.msg('otter.auth.cache.miss')
         d = self._auth_func(tenant_id, log=log)
-        d.addCallback(when_authenticated)
+        d.addCallback(partial(self._populate, tenant_id, log=log))
 
         return d
 
@@ -222,16 +280,37 @@ class CachingAuthenticator(object):
 @implementer(IAuthenticator)
 class ImpersonatingAuthenticator(object):
     """
-    An authentication handler that first uses a identity admin account to authenticate
-    and then impersonates the desired tenant_id.
-    """
-    def __init__(self, identity_admin_user, identity_admin_password, url, admin_url):
+    An authentication handler that first uses a identity admin account to
+    authenticate and then impersonates the desired tenant_id.
+
+    If a reactor is given, the user of each tenant and each tenant's service
+    catalog are cached separately from the impersonation token, so that
+    re-authenticating a tenant usually only impersonates its user again.
+
+    :param IReactorTime reactor: Used for enforcing the caches' TTLs. If not
+        given, nothing is cached.
+    :param int user_ttl: Number of seconds a tenant's user is cached for
+    :param int catalog_ttl: Number of seconds a tenant's catalog is cached
+        for
+    :param int max_size: Maximum number of tenants whose user and catalog are
+        cached. The least recently used tenants are evicted when it is
+        exceeded. ``None`` for no limit.
+    """
+    def __init__(self, identity_admin_user, identity_admin_password, url,
+                 admin_url, reactor=None, user_ttl=86400, catalog_ttl=3600,
+                 max_size=None):
         self._identity_admin_user = identity_admin_user
         self._identity_admin_password = identity_admin_password
         self._url = url
         self._admin_url = admin_url
+        self._reactor = reactor
+        self._user_ttl = user_ttl
+        self._catalog_ttl = catalog_ttl
+        self._max_size = max_size
         # cached token to admin identity
         self._token = None
+        self._users = OrderedDict()
+        self._catalogs = OrderedDict()
 
     @wait(ignore_kwargs=['log'])
     def _auth_me(self, log=None):
@@ -256,16 +335,44 @@ class ImpersonatingAuthenticator(object):
         d.addCallback(partial(setattr, self, "_token"))
         return d
 
+    def _get_cached(self, cache, ttl, tenant_id):
+        """
+        Return the value cached for the tenant, or ``None`` if it is not
+        cached or has expired.
+        """
+        if self._reactor is None or tenant_id not in cache:
+            return None
+        created, value = cache.pop(tenant_id)
+        if self._reactor.seconds() - created > ttl:
+            return None
+        # Move it to the end as the most recently used
+        cache[tenant_id] = (created, value)
+        return value
+
+    def _cache(self, cache, tenant_id, value):
+        if self._reactor is not None:
+            cache.pop(tenant_id, None)
+            cache[tenant_id] = (self._reactor.seconds(), value)
+            if self._max_size is not None:
+                while len(cache) > self._max_size:
+                    cache.popitem(last=False)
+        return value
+
     def authenticate_tenant(self, tenant_id, log=None):
         """
         see :meth:`IAuthenticator.authenticate_tenant`
         """
         auth = partial(self._auth_me, log=log)
 
-        d = user_for_tenant(self._admin_url,
-                            self._identity_admin_user,
-                            self._identity_admin_password,
-                            tenant_id, log=log)
+        user = self._get_cached(self._users, self._user_ttl, tenant_id)
+        if user is not None:
+            d = succeed(user)
+        else:
+            d = user_for_tenant(self._admin_url,
+                                self._identity_admin_user,
+                                self._identity_admin_password,
+                                tenant_id, log=log)
+            d.addCallback(partial(self._cache, self._users, tenant_id))
 
         def impersonate(user):
             iud = impersonate_user(self._admin_url,
@@ -274,15 +381,29 @@ class ImpersonatingAuthenticator(object):
             iud.addCallback(extract_token)
             return iud
 
-        d.addCallback(lambda user: retry_on_unauth(partial(impersonate, user), auth))
+        def impersonate_failed(failure):
+            # The tenant's user may have changed
+            self._users.pop(tenant_id, None)
+            return failure
+
+        d.addCallback(
+            lambda user: retry_on_unauth(partial(impersonate, user), auth))
+        d.addErrback(impersonate_failed)
 
         def endpoints(token):
+            catalog = self._get_cached(self._catalogs, self._catalog_ttl,
+                                       tenant_id)
+            if catalog is not None:
+                return succeed((token, catalog))
             scd = endpoints_for_token(self._admin_url, self._token,
                                       token, log=log)
-            scd.addCallback(lambda endpoints: (token, _endpoints_to_service_catalog(endpoints)))
+            scd.addCallback(_endpoints_to_service_catalog)
+            scd.addCallback(partial(self._cache, self._catalogs, tenant_id))
+            scd.addCallback(lambda catalog: (token, catalog))
             return scd
 
-        d.addCallback(lambda token: retry_on_unauth(partial(endpoints, token), auth))
+        d.addCallback(
+            lambda token: retry_on_unauth(partial(endpoints, token), auth))
 
         return d
 
@@ -329,15 +450,33 @@ class SingleTenantAuthenticator(object):
         return hash((self._identity_user, self._identity_password, self._url))
 
 
+class Token(str):
+    """
+    An auth token, which is used like the string of its ID and also knows
+    when it expires.
+
+    :ivar expires: EPOCH seconds at which the token expires, or ``None`` if
+        not known
+    """
+    def __new__(cls, token_id, expires=None):
+        token = str.__new__(cls, token_id)
+        token.expires = expires
+        return token
+
+
 def extract_token(auth_response):
     """
     Extract an auth token from an authentication response.
 
     :param dict auth_response: A dictionary containing the decoded response
         from the authentication API.
-    :rtype: str
+    :rtype: :obj:`Token`
     """
-    return auth_response['access']['token']['id'].encode('ascii')
+    token = auth_response['access']['token']
+    expires = token.get('expires')
+    if expires is not None:
+        expires = timestamp_to_epoch(expires)
+    return Token(token['id'].encode('ascii'), expires)
 
 
 def extract_service_catalog(auth_response):
@@ -594,7 +733,11 @@ def generate_authenticator(reactor, config):
             config['username'],
             config['password'],
             config['url'],
-            config['admin_url'])
+            config['admin_url'],
+            reactor,
+            user_ttl=config.get('user_cache_ttl', 86400),
+            catalog_ttl=config.get('catalog_cache_ttl', 3600),
+            max_size=config.get('cache_max_size'))
 
     return CachingAuthenticator(
         reactor,
@@ -606,4 +749,7 @@ def generate_authenticator(reactor, config):
                 max_retries=config['max_retries'],
                 retry_interval=config['retry_interval']),
             config.get('wait', 5)),
-        cache_ttl)
+        cache_ttl,
+        refresh_ahead=config.get('cache_refresh_ahead'),
+        max_refreshing=config.get('cache_max_refreshing', 10),
+        max_size=config.get('cache_max_size'))
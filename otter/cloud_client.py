@@ -16,14 +16,14 @@ from effect import (
     perform,
     sync_performer)
 
+from pyrsistent import pvector
+
 import six
 
 from toolz.dicttoolz import get_in
 from toolz.functoolz import identity
 from toolz.itertoolz import concat
 
-from twisted.internet.task import deferLater
-
 from txeffect import deferred_performer, perform as twisted_perform
 
 from otter.auth import Authenticate, InvalidateToken, public_endpoint_url
@@ -33,6 +33,7 @@ from otter.util.config import config_value
 from otter.util.http import APIError, append_segments, try_json_with_keys
 from otter.util.http import headers as otter_headers
 from otter.util.pure_http import (
+    Request,
     add_bind_root,
     add_effect_on_response,
     add_error_handling,
@@ -40,9 +41,10 @@ from otter.util.pure_http import (
     add_json_request_data,
     add_json_response,
     has_code,
+    perform_pooled_request,
     request,
 )
-from otter.util.weaklocks import WeakLocks
+from otter.util.ratelimit import RateLimiters
 
 
 def add_bind_service(catalog, service_name, region, log, request_func):
@@ -244,46 +246,115 @@ class _Throttle(object):
 @deferred_performer
 def _perform_throttle(dispatcher, throttle):
     """
-    Perform :obj:`_Throttle` by performing the effect after acquiring a lock
-    and delaying but some period of time.
+    Perform :obj:`_Throttle` by performing the effect inside its bracket.
     """
-    lock = throttle.bracket
+    bracket = throttle.bracket
     eff = throttle.effect
-    return lock(twisted_perform, dispatcher, eff)
-
-
-_CFG_NAMES = {
-    (ServiceType.CLOUD_SERVERS, 'post'): 'create_server_delay',
-    (ServiceType.CLOUD_SERVERS, 'delete'): 'delete_server_delay',
+    return bracket(twisted_perform, dispatcher, eff)
+
+
+# Names of the rate limits of requests, and whether they are limited per
+# tenant or globally by default
+_LIMIT_NAMES = {
+    (ServiceType.CLOUD_SERVERS, 'post'): ('create_server', False),
+    (ServiceType.CLOUD_SERVERS, 'delete'): ('delete_server', False),
+    (ServiceType.CLOUD_LOAD_BALANCERS, 'get'): ('get_clb', True),
+    (ServiceType.CLOUD_LOAD_BALANCERS, 'post'): ('post_clb', True),
+    (ServiceType.CLOUD_LOAD_BALANCERS, 'put'): ('put_clb', True),
+    (ServiceType.CLOUD_LOAD_BALANCERS, 'delete'): ('delete_clb', True),
 }
 
-# Throttling configs where locking is done per-tenant instead of globally
-_CFG_NAMES_PER_TENANT = {
-    (ServiceType.CLOUD_LOAD_BALANCERS, 'get'): 'get_clb_delay',
-    (ServiceType.CLOUD_LOAD_BALANCERS, 'post'): 'post_clb_delay',
-    (ServiceType.CLOUD_LOAD_BALANCERS, 'put'): 'put_clb_delay',
-    (ServiceType.CLOUD_LOAD_BALANCERS, 'delete'): 'delete_clb_delay',
-}
+
+def _rate_limit_config(name, per_tenant):
+    """
+    Get the configuration of the named rate limit.
+
+    The limit is configured in ``cloud_client.rate_limits.<name>`` as an
+    object with ``rate`` (requests per second), ``burst`` (defaults to 1),
+    ``max_in_flight`` (defaults to no limit) and ``per_tenant``. The older
+    ``cloud_client.throttling.<name>_delay`` config, which allows one request
+    at a time every ``delay`` seconds, is used if there is no such object.
+
+    :return: dict of :obj:`RateLimiters.get` keyword arguments and
+        ``per_tenant``, or ``None`` if the limit is not configured
+    """
+    limit = config_value('cloud_client.rate_limits.' + name)
+    if limit is not None:
+        return {'rate': limit.get('rate'),
+                'burst': limit.get('burst', 1),
+                'max_in_flight': limit.get('max_in_flight'),
+                'per_tenant': limit.get('per_tenant', per_tenant)}
+    delay = config_value('cloud_client.throttling.{}_delay'.format(name))
+    if delay is not None:
+        return {'rate': 1.0 / delay if delay else None, 'burst': 1,
+                'max_in_flight': 1, 'per_tenant': per_tenant}
+
+
+def _over_limit_wait(failure):
+    """
+    Find out if a request failed because the service is rate limiting us,
+    i.e. it responded with a ``Retry-After`` header, or with 413 or 429 and
+    an ``overLimit`` error (which is how both Nova and CLB report it).
+
+    :return: number of seconds to wait given by ``Retry-After`` (0 if there
+        is none), or ``None`` if the request was not rate limited. See
+        :obj:`AdaptiveLimit`.
+    """
+    if not failure.check(APIError):
+        return None
+    error = failure.value
+    if error.headers is not None:
+        retry_after = error.headers.getRawHeaders('retry-after')
+        if retry_after:
+            try:
+                return max(0, float(retry_after[0]))
+            except ValueError:
+                pass
+    if error.code in (413, 429):
+        try:
+            body = json.loads(error.body)
+        except (TypeError, ValueError):
+            return None
+        if isinstance(body, dict) and 'overLimit' in body:
+            return 0
+    return None
 
 
-def _default_throttler(locks, clock, stype, method, tenant_id):
+def _nest_brackets(outer, inner):
     """
-    Get a throttler function with throttling policies based on configuration.
+    Return a Deferred bracket that runs the call in ``inner`` inside
+    ``outer``.
+    """
+    def bracket(f, *args, **kwargs):
+        return outer(inner, f, *args, **kwargs)
+    return bracket
+
+
+def _default_throttler(limiters, stype, method, tenant_id):
     """
-    cfg_name = _CFG_NAMES.get((stype, method))
-    if cfg_name is not None:
-        delay = config_value('cloud_client.throttling.' + cfg_name)
-        if delay is not None:
-            lock = locks.get_lock((stype, method))
-            return partial(lock.run, deferLater, clock, delay)
+    Get a throttler function with rate limits based on configuration.
+
+    If ``cloud_client.adaptive_limit`` is configured, every request is also
+    run in an :obj:`AdaptiveLimit` of the tenant and service, configured
+    with ``maximum`` and optionally ``minimum``, ``increase``, ``decrease``
+    and ``cooldown``. All requests to a service on behalf of a tenant then
+    back off together when the service starts rate limiting the tenant.
 
-    # Could be a per-tenant lock
-    cfg_name = _CFG_NAMES_PER_TENANT.get((stype, method))
-    if cfg_name is not None:
-        delay = config_value('cloud_client.throttling.' + cfg_name)
-        if delay is not None:
-            lock = locks.get_lock((stype, method, tenant_id))
-            return partial(lock.run, deferLater, clock, delay)
+    :param RateLimiters limiters: The rate limiters to take the buckets from.
+        Buckets are keyed on the name of the limit, and on the tenant ID if
+        the limit is per tenant.
+    """
+    brackets = []
+    adaptive = config_value('cloud_client.adaptive_limit')
+    if adaptive is not None:
+        brackets.append(limiters.get_adaptive(
+            (stype.name, tenant_id), _over_limit_wait, **adaptive).run)
+    name, per_tenant = _LIMIT_NAMES.get((stype, method), (None, False))
+    limit = None if name is None else _rate_limit_config(name, per_tenant)
+    if limit is not None:
+        key = (name, tenant_id) if limit.pop('per_tenant') else (name,)
+        brackets.append(limiters.get(key, **limit).run)
+    return reduce(_nest_brackets, brackets) if brackets else None
 
 
 def perform_tenant_scope(
@@ -311,19 +382,31 @@ def perform_tenant_scope(
     perform(new_disp, tenant_scope.effect.on(box.succeed, box.fail))
 
 
-def get_cloud_client_dispatcher(reactor, authenticator, log, service_configs):
+def get_cloud_client_dispatcher(reactor, authenticator, log, service_configs,
+                                pools=None, limiters=None):
     """
     Get a dispatcher suitable for running :obj:`ServiceRequest` and
     :obj:`TenantScope` intents.
-    """
-    # this throttler could be parameterized but for now it's basically a hack
-    # that we want to keep private to this module
-    throttler = partial(_default_throttler, WeakLocks(), reactor)
-    return TypeDispatcher({
+
+    :param ConnectionPools pools: The connection pools to perform
+        :obj:`Request` intents with, if any. :obj:`Request` intents are left
+        to other dispatchers if not given.
+    :param RateLimiters limiters: The rate limiters to throttle requests
+        with. They should be shared by all the dispatchers of a process, so
+        that the limits apply to all of its requests. If not given, the
+        dispatcher gets rate limiters of its own.
+    """
+    if limiters is None:
+        limiters = RateLimiters(reactor, log)
+    throttler = partial(_default_throttler, limiters)
+    performers = {
         TenantScope: partial(perform_tenant_scope, authenticator, log,
                              service_configs, throttler),
         _Throttle: _perform_throttle,
-    })
+    }
+    if pools is not None:
+        performers[Request] = partial(perform_pooled_request, pools)
+    return TypeDispatcher(performers)
 
 
 # ----- Logging responses -----
@@ -988,47 +1071,67 @@ def list_servers_details_page(parameters=None):
     )
 
 
-def list_servers_details_all(parameters=None):
+def fold_servers_details(f, initial, parameters=None):
     """
-    List all pages of servers details, starting at the page specified by the
-    given filtering and pagination parameters.
+    Fold over all pages of servers details, starting at the page specified by
+    the given filtering and pagination parameters. Each page is combined with
+    the result so far as soon as it is received, so callers can filter and
+    group servers without holding all the pages.
 
+    :param f: function of (result so far, ``list`` of server details `dict`s
+        in a page) -> new result. It should not mutate the result so far,
+        since the effect can be performed again.
+    :param initial: Result so far when the first page is received
     :ivar dict parameters: A dictionary with pagination information,
         changes-since filters, and name filters.
 
     Succeed on 200.
 
-    :return: a `list` of server details `dict`s
+    :return: the result of folding the last page
     :raise: :class:`NovaRateLimitError`, :class:`NovaComputeFaultError`,
         :class:`APIError`
     """
-    last_link = []
-
-    def continue_(result, servers_so_far=None):
-        if servers_so_far is None:
-            servers_so_far = []
-
+    def continue_(result, acc, last_link=None):
         _response, body = result
-        servers = servers_so_far + body['servers']
+        acc = f(acc, body['servers'])
 
         # Only continue if pagination is supported and there is another page
         continuation = [link['href'] for link in body.get('servers_links', [])
                         if link['rel'] == 'next']
         if continuation:
             # blow up if we try to fetch the same link twice
-            if last_link and last_link[-1] == continuation[0]:
+            if last_link == continuation[0]:
                 raise NovaComputeFaultError(
                     "When gathering server details, got the same 'next' link "
-                    "twice from Nova: {0}".format(last_link[-1]))
+                    "twice from Nova: {0}".format(last_link))
 
-            last_link[:] = [continuation[0]]
             parsed_query = parse_qs(urlparse(continuation[0]).query)
             return list_servers_details_page(parsed_query).on(
-                partial(continue_, servers_so_far=servers))
+                partial(continue_, acc=acc, last_link=continuation[0]))
+
+        return acc
+
+    return list_servers_details_page(parameters).on(
+        partial(continue_, acc=initial))
+
+
+def list_servers_details_all(parameters=None):
+    """
+    List all pages of servers details, starting at the page specified by the
+    given filtering and pagination parameters.
 
-        return servers
+    :ivar dict parameters: A dictionary with pagination information,
+        changes-since filters, and name filters.
+
+    Succeed on 200.
 
-    return list_servers_details_page(parameters).on(continue_)
+    :return: a `list` of server details `dict`s
+    :raise: :class:`NovaRateLimitError`, :class:`NovaComputeFaultError`,
+        :class:`APIError`
+    """
+    return fold_servers_details(
+        lambda servers, page: servers.extend(page), pvector(),
+        parameters).on(list)
 
 
 _nova_standard_errors = [
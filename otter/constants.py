@@ -4,6 +4,8 @@ from twisted.python.constants import NamedConstant, Names
 
 
 CONVERGENCE_DIRTY_DIR = '/groups/divergent'
+CONVERGENCE_DIRTY_BUCKETS_DIR = '/groups/divergent-buckets'
+CONVERGENCE_BUCKETS = 10
 CONVERGENCE_PARTITIONER_PATH = '/convergence-partitioner'
 
 
@@ -21,6 +21,7 @@ Storage model for state information:
  * last touched information for policy
 """
 import json
+from copy import deepcopy
 from datetime import datetime
 from decimal import Decimal, ROUND_UP
 from functools import partial
@@ -39,6 +40,7 @@ from six import reraise
 from toolz.dicttoolz import get_in
 
 from twisted.internet import defer
+from twisted.python.failure import Failure
 
 from txeffect import perform
 
@@ -47,6 +49,7 @@ from otter.cloud_client import (
     TenantScope,
     get_server_details,
     set_nova_metadata_item)
+from otter.constants import ServiceType
 from otter.convergence.composition import tenant_is_enabled
 from otter.convergence.model import group_id_from_metadata
 from otter.convergence.planning import DRAINING_METADATA
@@ -65,9 +68,11 @@ from otter.supervisor import (
 from otter.supervisor import (
     remove_server_from_group as worker_remove_server_from_group)
 from otter.util.config import config_value
+from otter.util.deadline import unbound_dispatcher
 from otter.util.deferredutils import unwrap_first_error
 from otter.util.fp import assoc_obj
 from otter.util.retry import (
+    FULL_JITTER,
     exponential_backoff_interval,
     retry_effect,
     retry_times)
@@ -328,6 +333,131 @@ def modify_and_trigger(dispatcher, group, logargs, modifier, *args, **kwargs):
         raise cannot_exec_pol_err
 
 
+class _NoneApplied(Exception):
+    """
+    Raised by the modifier of coalesced policy executions when none of them
+    succeeded, so that the state is not saved.
+    """
+
+
+def execute_and_trigger(dispatcher, group, logargs, modifier, executions,
+                        modify_state_reason=None):
+    """
+    Like :func:`modify_and_trigger`, for a modifier that executes a policy
+    like :func:`maybe_execute_scaling_policy` does.
+
+    Executions for a group that come in while an earlier one with the same
+    ``modify_state_reason`` is waiting for the group's lock are coalesced
+    with it. Once the lock is acquired, the state and config are read once,
+    and each modifier is applied to the state in the order they came in,
+    given the config as its ``config`` argument, so cooldowns are checked
+    against the executions before it. A modifier that fails leaves the state
+    as it was for the next one. The state is then saved once and convergence
+    triggered once, with the ``group`` and ``logargs`` of the first
+    execution. Convergence is triggered outside of the deadline the first
+    execution's dispatcher may be bound to (like the deadline of a REST
+    request), since it is triggered on behalf of all the executions.
+
+    :param dict executions: Executions waiting for the lock of their group,
+        shared by the callers whose executions can be coalesced, like
+        :attr:`IScalingGroupCollection.policy_executions`
+
+    :return: Deferred that fires with None, or fails like
+        :func:`modify_and_trigger` would have for ``modifier`` alone
+    """
+    key = (group.tenant_id, group.uuid, modify_state_reason)
+    d = defer.Deferred()
+    queued = executions.get(key)
+    if queued is not None:
+        queued.append((modifier, d))
+        return d
+    queued = executions[key] = [(modifier, d)]
+    _execute_coalesced(dispatcher, group, logargs, executions, key, queued,
+                       modify_state_reason)
+    return d
+
+
+@defer.inlineCallbacks
+def _execute_coalesced(dispatcher, group, logargs, executions, key, queued,
+                       modify_state_reason):
+    """
+    Apply the queued modifiers of :func:`execute_and_trigger` under one
+    :meth:`IScalingGroup.modify_state` and fire their Deferreds.
+    """
+    def close():
+        # Executions coming in after this wait for the next lock
+        if executions.get(key) is queued:
+            del executions[key]
+
+    failures = {}
+    try:
+        yield group.modify_state(
+            partial(_apply_coalesced, close, queued, failures),
+            with_config=True, modify_state_reason=modify_state_reason)
+    except _NoneApplied:
+        pass
+    except Exception:
+        close()
+        failure = Failure()
+        for i in range(len(queued)):
+            failures.setdefault(i, failure)
+
+    failures = yield _trigger_coalesced(unbound_dispatcher(dispatcher), group,
+                                        logargs, len(queued), failures)
+    for i, (_, d) in enumerate(queued):
+        if i in failures:
+            d.errback(failures[i])
+        else:
+            d.callback(None)
+
+
+@defer.inlineCallbacks
+def _apply_coalesced(close, queued, failures, group, state, config):
+    """
+    Modifier applying the ``queued`` modifiers to ``state`` in turn, keeping
+    the failure of each modifier that fails in ``failures`` by its index.
+
+    :raises _NoneApplied: if every modifier failed
+    """
+    close()
+    applied = False
+    for i, (modifier, _) in enumerate(queued):
+        before = deepcopy(state)
+        try:
+            state = yield modifier(group, state, config=config)
+            applied = True
+        except Exception:
+            failures[i] = Failure()
+            state = before
+    if not applied:
+        raise _NoneApplied()
+    defer.returnValue(state)
+
+
+@defer.inlineCallbacks
+def _trigger_coalesced(dispatcher, group, logargs, count, failures):
+    """
+    Trigger convergence once for ``count`` coalesced executions, if the group
+    converges and any execution succeeded or could not be executed.
+
+    :return: Deferred that fires with ``failures``, updated with the failure
+        to trigger convergence for the executions that triggered it
+    """
+    def triggers(i):
+        return i not in failures or failures[i].check(CannotExecutePolicyError)
+
+    if tenant_is_enabled(group.tenant_id, config_value) and any(
+            triggers(i) for i in range(count)):
+        try:
+            yield perform(dispatcher, Effect(BoundFields(
+                trigger_convergence(group.tenant_id, group.uuid), logargs)))
+        except Exception:
+            failure = Failure()
+            failures = {i: failure if triggers(i) else failures[i]
+                        for i in range(count)}
+    defer.returnValue(failures)
+
+
 def converge(log, transaction_id, config, scaling_group, state, launch_config,
              policy, config_value=config_value):
     """
@@ -389,7 +519,7 @@ def maybe_execute_scaling_policy(
         transaction_id,
         scaling_group,
         state,
-        policy_id, version=None):
+        policy_id, version=None, config=None):
     """
     Checks whether and how much a scaling policy can be executed.
 
@@ -400,6 +530,8 @@ def maybe_execute_scaling_policy(
         state
     :param policy_id: the policy id to execute
     :param version: the policy version to check before executing
+    :param dict config: the scaling group config, if it was already read with
+        ``state``
 
     :return: a ``Deferred`` that fires with the updated
         :class:`otter.models.interface.GroupState` if successful
@@ -427,7 +559,8 @@ def maybe_execute_scaling_policy(
 
     def _do_get_configs(policy):
         deferred = defer.gatherResults([
-            scaling_group.view_config(),
+            (scaling_group.view_config() if config is None
+             else defer.succeed(config)),
             scaling_group.view_launch_config()
         ])
         return deferred.addCallback(lambda results: results + [policy])
@@ -464,9 +597,9 @@ def maybe_execute_scaling_policy(
 
 def check_cooldowns(log, state, config, policy, policy_id):
     """
-    Check the global cooldowns (when was the last time any policy was executed?)
-    and the policy specific cooldown (when was the last time THIS policy was
-    executed?)
+    Check the global cooldowns (when was the last time any policy was
+    executed?) and the policy specific cooldown (when was the last time THIS
+    policy was executed?)
 
     :param log: A twiggy bound log for logging
     :param dict state: the state dictionary
@@ -565,7 +698,8 @@ def _is_server_in_group(group, server_id):
         response, server_info = yield Effect(TenantScope(
             retry_effect(get_server_details(server_id),
                          retry_times(3),
-                         exponential_backoff_interval(2)),
+                         exponential_backoff_interval(2, jitter=FULL_JITTER),
+                         budget=ServiceType.CLOUD_SERVERS),
             group.tenant_id))
     except NoSuchServerError:
         raise ServerNotFoundError(group.tenant_id, group.uuid, server_id)
@@ -642,7 +776,9 @@ def convergence_remove_server_from_group(
                                         scaling_group=group,
                                         server_id=server_id))
     yield Effect(TenantScope(
-        retry_effect(eff, retry_times(3), exponential_backoff_interval(2)),
+        retry_effect(eff, retry_times(3),
+                     exponential_backoff_interval(2, jitter=FULL_JITTER),
+                     budget=ServiceType.CLOUD_SERVERS),
         group.tenant_id))
 
     if not replace:
@@ -0,0 +1,141 @@
+"""
+Node-local cache of the times at which CLB nodes started draining.
+
+The time a CLB node was put in DRAINING is only available from the node's
+atom feed, which is costly to fetch and parse. It does not change while the
+node stays in DRAINING, so :func:`otter.convergence.gathering.get_clb_contents`
+keeps it in :obj:`DrainTimes` and only fetches the feed of a node once per
+drain, instead of on every convergence iteration.
+"""
+
+from functools import partial
+
+import attr
+
+from effect import Effect, TypeDispatcher, sync_performer
+
+
+DRAIN_TIMES_TTL = 3600
+"""
+Default number of seconds after which a drain time that has not been read is
+forgotten.
+"""
+
+
+@attr.s
+class GetDrainTimes(object):
+    """
+    An intent to get the known drain times of the given draining nodes, and
+    forget the drain times of any other nodes of the given load balancers,
+    since those nodes are no longer draining.
+
+    Results in a dict of ``(lb_id, node_id)`` to EPOCH of the nodes whose
+    drain time is known.
+
+    :ivar lb_ids: IDs of the load balancers whose nodes were listed
+    :ivar keys: ``(lb_id, node_id)`` of the nodes in DRAINING
+    """
+    lb_ids = attr.ib()
+    keys = attr.ib()
+
+
+@attr.s
+class StoreDrainTimes(object):
+    """
+    An intent to remember drain times.
+
+    :ivar dict times: ``(lb_id, node_id)`` to EPOCH at which the node was put
+        in DRAINING
+    """
+    times = attr.ib()
+
+
+def get_drain_times(lb_ids, keys):
+    """
+    Return Effect of :obj:`GetDrainTimes`.
+    """
+    return Effect(GetDrainTimes(lb_ids, keys))
+
+
+def store_drain_times(times):
+    """
+    Return Effect of :obj:`StoreDrainTimes`.
+    """
+    return Effect(StoreDrainTimes(times))
+
+
+class DrainTimes(object):
+    """
+    Node-local store of drain times keyed on ``(lb_id, node_id)``.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param number ttl: Number of seconds a drain time is kept for after it
+        was last read or stored
+    """
+
+    def __init__(self, clock, ttl=DRAIN_TIMES_TTL):
+        self.clock = clock
+        self.ttl = ttl
+        self._times = {}
+
+    def _expire(self, now):
+        expired = [key for key, (seen, _) in self._times.iteritems()
+                   if now - seen > self.ttl]
+        for key in expired:
+            del self._times[key]
+
+    def get(self, lb_ids, keys):
+        """
+        See :obj:`GetDrainTimes`.
+        """
+        now = self.clock.seconds()
+        self._expire(now)
+        lb_ids, keys = set(lb_ids), set(keys)
+        stale = [key for key in self._times
+                 if key[0] in lb_ids and key not in keys]
+        for key in stale:
+            del self._times[key]
+        found = {}
+        for key in keys & set(self._times):
+            found[key] = self._times[key][1]
+            self._times[key] = (now, found[key])
+        return found
+
+    def store(self, times):
+        """
+        See :obj:`StoreDrainTimes`.
+        """
+        now = self.clock.seconds()
+        for key, drained_at in times.iteritems():
+            self._times[key] = (now, drained_at)
+
+    def __len__(self):
+        return len(self._times)
+
+
+@sync_performer
+def perform_get_drain_times(drain_times, dispatcher, intent):
+    """Perform a :obj:`GetDrainTimes`."""
+    return drain_times.get(intent.lb_ids, intent.keys)
+
+
+@sync_performer
+def perform_store_drain_times(drain_times, dispatcher, intent):
+    """Perform a :obj:`StoreDrainTimes`."""
+    drain_times.store(intent.times)
+
+
+def get_drain_times_dispatcher(clock, drain_times=None):
+    """
+    Get a dispatcher that can perform :obj:`GetDrainTimes` and
+    :obj:`StoreDrainTimes`.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param DrainTimes drain_times: Store to use. If not given, one is created.
+    """
+    if drain_times is None:
+        drain_times = DrainTimes(clock)
+    return TypeDispatcher({
+        GetDrainTimes: partial(perform_get_drain_times, drain_times),
+        StoreDrainTimes: partial(perform_store_drain_times, drain_times),
+    })
@@ -1,9 +1,12 @@
 """Code related to gathering data to inform convergence."""
+from datetime import datetime
 from functools import partial
 
 from effect import catch, parallel
 from effect.do import do, do_return
 
+from pyrsistent import pmap, pvector
+
 from toolz.curried import filter, groupby, keyfilter, map
 from toolz.dicttoolz import assoc, get_in, merge
 from toolz.functoolz import compose, curry, identity
@@ -12,6 +15,7 @@ from toolz.itertoolz import concat
 from otter.auth import NoSuchEndpoint
 from otter.cloud_client import (
     CLBNotFoundError,
+    fold_servers_details,
     get_clb_node_feed,
     get_clb_nodes,
     get_clbs,
@@ -19,6 +23,7 @@ from otter.cloud_client import (
     list_stacks_all,
     service_request)
 from otter.constants import ServiceType
+from otter.convergence.drain_times import get_drain_times, store_drain_times
 from otter.convergence.model import (
     CLBNode,
     CLBNodeCondition,
@@ -28,19 +33,49 @@ from otter.convergence.model import (
     RCv3Node,
     get_stack_tag_for_group,
     group_id_from_metadata)
+from otter.convergence.snapshot import read_snapshot
 from otter.indexer import atom
 from otter.models.cass import CassScalingGroupServersCache
 from otter.util.fp import assoc_obj
 from otter.util.http import append_segments
 from otter.util.retry import (
-    exponential_backoff_interval, retry_effect, retry_times)
-from otter.util.timestamp import timestamp_to_epoch
+    FULL_JITTER, exponential_backoff_interval, retry_effect,
+    retry_times)
+from otter.util.timestamp import datetime_to_epoch, timestamp_to_epoch
+
+
+CHANGES_SINCE_OVERLAP = 60
+"""
+Number of seconds before the servers cache's last update from which changes
+are requested from Nova, to allow for clock differences and servers that
+changed while the cached servers were being gathered.
+"""
+
+FULL_RESYNC_INTERVAL = 3600
+"""
+Number of seconds after which a group's servers are gathered by listing all
+of the tenant's servers instead of asking Nova for only the changed servers.
+This catches deletions that Nova no longer reports as changes.
+"""
 
 
 def _retry(eff):
-    """Retry an effect with a common policy."""
+    """Retry a CLB request with a common policy."""
     return retry_effect(
-        eff, retry_times(5), exponential_backoff_interval(2))
+        eff, retry_times(5),
+        exponential_backoff_interval(2, jitter=FULL_JITTER),
+        budget=ServiceType.CLOUD_LOAD_BALANCERS)
+
+
+def _servers_query(changes_since=None, batch_size=100):
+    """
+    Return the query parameters to list servers in batches of
+    ``batch_size``, changed since ``changes_since`` if given.
+    """
+    query = {'limit': [str(batch_size)]}
+    if changes_since is not None:
+        query['changes-since'] = ['{0}Z'.format(changes_since.isoformat())]
+    return query
 
 
 def get_all_server_details(changes_since=None, batch_size=100):
@@ -53,11 +88,7 @@ def get_all_server_details(changes_since=None, batch_size=100):
 
     NOTE: This really screams to be a independent fxcloud-type API
     """
-    query = {'limit': [str(batch_size)]}
-    if changes_since is not None:
-        query['changes-since'] = ['{0}Z'.format(changes_since.isoformat())]
-
-    return list_servers_details_all(query)
+    return list_servers_details_all(_servers_query(changes_since, batch_size))
 
 
 def get_all_scaling_group_servers(changes_since=None,
@@ -66,6 +97,9 @@ def get_all_scaling_group_servers(changes_since=None,
     Return tenant's servers that belong to any scaling group as
     {group_id: [server1, server2]} ``dict``. No specific ordering is guaranteed
 
+    The servers are filtered and grouped as each page of servers is received,
+    so servers that are not in any group are not kept.
+
     :param datetime changes_since: Get server since this time. Must be UTC
     :param server_predicate: function of server -> bool that determines whether
         the server should be included in the result.
@@ -78,12 +112,20 @@ def get_all_scaling_group_servers(changes_since=None,
     def group_id(s):
         return group_id_from_metadata(s['metadata'])
 
-    servers_apply = compose(keyfilter(lambda k: k is not None),
+    group_servers = compose(keyfilter(lambda k: k is not None),
                             groupby(group_id),
                             filter(server_predicate),
                             filter(has_group_id))
 
-    return get_all_server_details(changes_since).on(servers_apply)
+    def add_page(groups, servers):
+        for gid, group in group_servers(servers).iteritems():
+            groups = groups.set(gid, groups.get(gid, pvector()).extend(group))
+        return groups
+
+    return fold_servers_details(
+        add_page, pmap(), _servers_query(changes_since)).on(
+            lambda groups: {gid: list(group)
+                            for gid, group in groups.iteritems()})
 
 
 def mark_deleted_servers(old, new):
@@ -107,6 +149,54 @@ def mark_deleted_servers(old, new):
     return merge(old, new).values()
 
 
+def merge_changed_servers(old, changed):
+    """
+    Given old servers and servers that changed since then, return a list of
+    all servers with the changed ones replacing their old versions.
+
+    :param list old: List of old servers
+    :param list changed: List of servers changed since the old servers were
+        fetched. Deleted servers are expected to be included with a status of
+        DELETED.
+    :return: List of updated servers
+    """
+
+    def sdict(servers):
+        return {s['id']: s for s in servers}
+
+    return merge(sdict(old), sdict(changed)).values()
+
+
+def changes_since_time(last_update, overlap):
+    """
+    Return the time from which changes need to be requested to get all the
+    servers that changed since ``last_update``. This is ``overlap`` seconds
+    before ``last_update``, rounded down to a multiple of ``overlap`` so that
+    groups updated at around the same time ask for the same changes.
+
+    :param datetime last_update: Time at which servers were last fetched
+    :param int overlap: Number of seconds to go back from ``last_update``
+    :return: naive UTC ``datetime``
+    """
+    since = int(datetime_to_epoch(last_update)) - overlap
+    return datetime.utcfromtimestamp(since - since % overlap)
+
+
+def needs_full_resync(now, last_update, interval):
+    """
+    Should all the servers be listed, rather than only the servers changed
+    since ``last_update``? This is the case once every ``interval`` seconds,
+    at the same time for all groups.
+
+    :param datetime now: Current time
+    :param datetime last_update: Time at which servers were last fetched
+    :param int interval: Number of seconds between full resyncs
+    :return: ``bool``
+    """
+    return (datetime_to_epoch(now) // interval !=
+            datetime_to_epoch(last_update) // interval)
+
+
 @curry
 def server_of_group(group_id, server):
     """
@@ -119,25 +209,47 @@ def server_of_group(group_id, server):
 def get_scaling_group_servers(tenant_id, group_id, now,
                               all_as_servers=get_all_scaling_group_servers,
                               all_servers=get_all_server_details,
-                              cache_class=CassScalingGroupServersCache):
+                              cache_class=CassScalingGroupServersCache,
+                              changes_since_overlap=CHANGES_SINCE_OVERLAP,
+                              full_resync_interval=FULL_RESYNC_INTERVAL):
     """
     Get a group's servers taken from cache if it exists. Updates cache
-    if it is empty from newly fetched servers
+    if it is empty from newly fetched servers. The tenant's servers are read
+    through the current gathering snapshot (see
+    :mod:`otter.convergence.snapshot`).
+
+    If the cache exists, only the servers that changed since the cache was
+    last updated are fetched from Nova and merged into the cached servers,
+    except once every ``full_resync_interval`` seconds when all the servers
+    are fetched.
     # NOTE: This function takes tenant_id even though the whole effect is
     # scoped on the tenant because cache calls require tenant_id. Should
     # they also not take tenant_id and work on the scope?
 
+    :param int changes_since_overlap: Number of seconds before the cache's
+        last update from which changes are fetched
+    :param int full_resync_interval: Number of seconds between fetching all
+        the servers
+
     :return: Servers as list of dicts
     :rtype: Effect
     """
     cache = cache_class(tenant_id, group_id)
     cached_servers, last_update = yield cache.get_servers(False)
     if last_update is None:
-        servers = (yield all_as_servers()).get(group_id, [])
-    else:
-        current = yield all_servers()
+        servers = (yield read_snapshot(tenant_id, 'as-servers',
+                                       all_as_servers())).get(group_id, [])
+    elif needs_full_resync(now, last_update, full_resync_interval):
+        current = yield read_snapshot(tenant_id, 'servers', all_servers())
         servers = mark_deleted_servers(cached_servers, current)
         servers = list(filter(server_of_group(group_id), servers))
+    else:
+        since = changes_since_time(last_update, changes_since_overlap)
+        changed = yield read_snapshot(
+            tenant_id, 'servers-changes-since-{}'.format(since.isoformat()),
+            all_servers(since))
+        servers = merge_changed_servers(cached_servers, changed)
+        servers = list(filter(server_of_group(group_id), servers))
     yield do_return(servers)
 
 
@@ -174,22 +286,34 @@ def get_clb_contents():
                 for lb_id, nodes in zip(lb_ids, all_nodes)}
     draining = [n for n in concat(lb_nodes.values())
                 if n.description.condition == CLBNodeCondition.DRAINING]
+
+    # A node's drain time does not change while it stays in DRAINING, so its
+    # feed is only fetched the first time it is seen draining
+    def key(node):
+        return (node.description.lb_id, node.node_id)
+    drain_times = yield get_drain_times(
+        [str(lb_id) for lb_id in lb_ids], [key(n) for n in draining])
+    to_fetch = [n for n in draining if key(n) not in drain_times]
     feeds = yield parallel(
         [_retry(get_clb_node_feed(n.description.lb_id, n.node_id).on(
             error=gone(None)))
-         for n in draining]
+         for n in to_fetch]
     )
-    nodes_to_feeds = dict(zip(draining, feeds))
+    nodes_to_feeds = dict(zip(to_fetch, feeds))
     deleted_lbs = set([
         node.description.lb_id
         for (node, feed) in nodes_to_feeds.items() if feed is None])
+    fetched = {key(node): extract_CLB_drained_at(feed)
+               for node, feed in nodes_to_feeds.items() if feed is not None}
+    if fetched:
+        yield store_drain_times(fetched)
+    drain_times = merge(drain_times, fetched)
 
     def update_drained_at(node):
-        feed = nodes_to_feeds.get(node)
         if node.description.lb_id in deleted_lbs:
             return None
-        if feed is not None:
-            return assoc_obj(node, drained_at=extract_CLB_drained_at(feed))
+        if key(node) in drain_times:
+            return assoc_obj(node, drained_at=drain_times[key(node)])
         else:
             return node
     nodes = map(update_drained_at, concat(lb_nodes.values()))
@@ -257,15 +381,16 @@ def get_all_launch_server_data(
         get_rcv3_contents=get_rcv3_contents):
     """
     Gather all launch_server data relevant for convergence w.r.t given time,
-    in parallel where possible.
+    in parallel where possible. Load balancer contents are tenant-wide and
+    hence read through the current gathering snapshot.
 
     Returns an Effect of {'servers': [NovaServer], 'lb_nodes': [LBNode]}.
     """
     eff = parallel(
         [get_scaling_group_servers(tenant_id, group_id, now)
          .on(map(NovaServer.from_server_details_json)).on(list),
-         get_clb_contents(),
-         get_rcv3_contents()]
+         read_snapshot(tenant_id, 'clb', get_clb_contents()),
+         read_snapshot(tenant_id, 'rcv3', get_rcv3_contents())]
     ).on(lambda (servers, clb, rcv3): {
         'servers': servers,
         'lb_nodes': list(concat([clb, rcv3]))
@@ -4,6 +4,8 @@ representation across the different phases of convergence.
 """
 import json
 import re
+from collections import Mapping
+from copy import deepcopy
 
 import attr
 from attr.validators import instance_of
@@ -232,6 +234,86 @@ def _validate_state(_1, _2, state):
         raise AssertionError("{0} is not a ServerState".format(state))
 
 
+class ServerJSON(object):
+    """
+    An immutable mapping of a server's JSON as received from Nova, which
+    behaves like ``freeze(server_json)`` without freezing the whole JSON
+    upfront: values are frozen when they are read, and the whole JSON only
+    when it is hashed.
+
+    It compares equal to, and hashes the same as, the :obj:`PMap` that
+    ``freeze`` returns. The given dict must not be mutated afterwards.
+
+    :param dict json: The server's JSON
+    """
+    __slots__ = ('_json', '_frozen', '_hash')
+
+    get = Mapping.get
+    keys = Mapping.keys
+    items = Mapping.items
+    values = Mapping.values
+    iterkeys = Mapping.iterkeys
+    iteritems = Mapping.iteritems
+    itervalues = Mapping.itervalues
+
+    def __init__(self, json):
+        self._json = json
+        self._frozen = {}
+        self._hash = None
+
+    def __getitem__(self, key):
+        try:
+            return self._frozen[key]
+        except KeyError:
+            value = self._frozen[key] = freeze(self._json[key])
+            return value
+
+    def __iter__(self):
+        return iter(self._json)
+
+    def __len__(self):
+        return len(self._json)
+
+    def __contains__(self, key):
+        return key in self._json
+
+    def __eq__(self, other):
+        if isinstance(other, ServerJSON):
+            return self._json == other._json
+        if isinstance(other, Mapping):
+            return self._json == thaw_server_json(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(freeze(self._json))
+        return self._hash
+
+    def __repr__(self):
+        return 'ServerJSON({0!r})'.format(self._json)
+
+    def thaw(self):
+        """
+        Return a mutable copy of the JSON.
+        """
+        return deepcopy(self._json)
+
+Mapping.register(ServerJSON)
+
+
+def thaw_server_json(server_json):
+    """
+    Return a mutable copy of :obj:`NovaServer.json`, which is either a
+    :obj:`ServerJSON` or a :obj:`PMap`.
+    """
+    if isinstance(server_json, ServerJSON):
+        return server_json.thaw()
+    return thaw(server_json)
+
+
 @attr.s(repr=False)
 class NovaServer(object):
     """
@@ -249,8 +331,9 @@ class NovaServer(object):
     :ivar str flavor_id: The ID of the flavor the server was launched with
     :ivar PSet desired_lbs: An immutable mapping of load balancer IDs to lists
         of :class:`CLBDescription` instances.
-    :var dict json: JSON dict received from Nova from which this server
-        is created
+    :var json: JSON dict received from Nova from which this server
+        is created, as a :obj:`ServerJSON` or :obj:`PMap`. Use
+        :func:`thaw_server_json` to get a ``dict`` of it.
     """
     id = attr.ib()
     state = attr.ib(validator=_validate_state)
@@ -264,7 +347,8 @@ class NovaServer(object):
                           validator=instance_of(PSet))
     servicenet_address = attr.ib(default='',
                                  validator=instance_of(string_types))
-    json = attr.ib(default=attr.Factory(pmap), validator=instance_of(PMap))
+    json = attr.ib(default=attr.Factory(pmap),
+                   validator=instance_of((PMap, ServerJSON)))
 
     @classmethod
     def from_server_details_json(cls, server_json):
@@ -296,7 +380,7 @@ class NovaServer(object):
             links=freeze(server_json['links']),
             desired_lbs=_lbs_from_metadata(metadata),
             servicenet_address=_servicenet_address(server_json),
-            json=freeze(server_json))
+            json=ServerJSON(server_json))
 
     def __repr__(self):
         """
@@ -306,7 +390,9 @@ class NovaServer(object):
         kvpairs = []
         # this gives us an ordered list
         for a in attr.fields(self.__class__):
-            value = thaw(getattr(self, a.name))
+            value = getattr(self, a.name)
+            value = (thaw_server_json(value) if a.name == "json"
+                     else thaw(value))
             if a.name == "json":
                 value = {k: v for k, v in value.items() if k in
                          ('status', 'metadata', 'updated', 'name',
@@ -673,3 +759,66 @@ class RCv3Node(object):
         """
         return (isinstance(server, NovaServer) and
                 server.id == self.cloud_server_id)
+
+
+class LBNodeIndex(object):
+    """
+    :obj:`ILBNode` providers indexed by the servers they match, so that the
+    nodes of every server of a group can be found without checking every node
+    against every server.
+
+    :obj:`CLBNode`s are indexed by their address, which is matched with
+    :obj:`NovaServer.servicenet_address`, and :obj:`RCv3Node`s by their
+    cloud server ID. Any other :obj:`ILBNode` providers are checked using
+    :func:`ILBNode.matches`.
+
+    Iterating over the index gives all the nodes it was built from.
+
+    :param lb_nodes: iterable of :obj:`ILBNode` providers
+    """
+
+    def __init__(self, lb_nodes):
+        self._nodes = list(lb_nodes)
+        self._by_address = {}
+        self._by_server_id = {}
+        self._others = []
+        for node in self._nodes:
+            if isinstance(node, CLBNode):
+                self._by_address.setdefault(node.address, []).append(node)
+            elif isinstance(node, RCv3Node):
+                self._by_server_id.setdefault(
+                    node.cloud_server_id, []).append(node)
+            else:
+                self._others.append(node)
+
+    def matching(self, server):
+        """
+        Return the nodes that match the given server.
+
+        :param server: The server to match against.
+        :type server: :class:`NovaServer`
+
+        :return: `list` of :obj:`ILBNode` providers
+        """
+        others = [node for node in self._others if node.matches(server)]
+        if not isinstance(server, NovaServer):
+            return others
+        return (self._by_address.get(server.servicenet_address, []) +
+                self._by_server_id.get(server.id, []) +
+                others)
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+
+def index_lb_nodes(lb_nodes):
+    """
+    Return :obj:`LBNodeIndex` of the given nodes, or the nodes themselves if
+    they are already indexed.
+    """
+    if isinstance(lb_nodes, LBNodeIndex):
+        return lb_nodes
+    return LBNodeIndex(lb_nodes)
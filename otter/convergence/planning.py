@@ -79,7 +79,8 @@ from otter.convergence.model import (
     RCv3Description,
     RCv3Node,
     ServerState,
-    StackState)
+    StackState,
+    index_lb_nodes)
 from otter.convergence.steps import (
     AddNodesToCLB,
     BulkAddToRCv3,
@@ -336,9 +337,9 @@ def converge_launch_server(desired_state, servers_with_cheese,
     :param set servers_with_cheese: a list of :obj:`NovaServer` instances.
         This must only contain servers that are being managed for the specified
         group.
-    :param load_balancer_contents: a set of :obj:`ILBNode` providers.  This
-        must contain all the load balancer mappings for all the load balancers
-        (of all types) on the tenant.
+    :param load_balancer_contents: a set of :obj:`ILBNode` providers, or an
+        :obj:`LBNodeIndex` of them.  This must contain all the load balancer
+        mappings for all the load balancers (of all types) on the tenant.
     :param float now: number of seconds since the POSIX epoch indicating the
         time at which the convergence was requested.
     :param float timeout: Number of seconds after which we will delete a server
@@ -346,6 +347,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
     :rtype: :obj:`pbag` of `IStep`
 
     """
+    lb_nodes = index_lb_nodes(load_balancer_contents)
     newest_to_oldest = sorted(servers_with_cheese, key=lambda s: -s.created)
 
     servers = defaultdict(lambda: [], groupby(get_destiny, newest_to_oldest))
@@ -383,7 +385,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
         return _drain_and_delete(
             server,
             desired_state.draining_timeout,
-            [node for node in load_balancer_contents if node.matches(server)],
+            lb_nodes.matching(server),
             now)
 
     scale_down_steps = list(mapcat(drain_and_delete_a_server,
@@ -399,7 +401,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
     cleanup_errored_and_deleted_steps = [
         remove_node_from_lb(lb_node)
         for server in servers[Destiny.DELETE] + servers[Destiny.CLEANUP]
-        for lb_node in load_balancer_contents if lb_node.matches(server)]
+        for lb_node in lb_nodes.matching(server)]
 
     # converge all the servers that remain to their desired load balancer state
     still_active_servers = filter(lambda s: s not in servers_to_delete,
@@ -407,9 +409,7 @@ def converge_launch_server(desired_state, servers_with_cheese,
     lb_converge_steps = [
         step
         for server in still_active_servers
-        for step in _converge_lb_state(
-            server,
-            [node for node in load_balancer_contents if node.matches(server)])
+        for step in _converge_lb_state(server, lb_nodes.matching(server))
         ]
 
     # Converge again if we expect state transitions on any servers
@@ -0,0 +1,414 @@
+"""
+Scheduling of convergence iterations on a node.
+
+:func:`otter.convergence.service.converge_all_groups` finds every divergent
+group in the node's buckets at once, which after a partition rebalance or a
+mass trigger of convergence can be thousands of groups. Rather than gathering
+all of them at the same time, each group's iteration is wrapped in
+:obj:`ScheduleConvergence`, which is run by a node-local
+:obj:`ConvergenceScheduler` that limits how many iterations run at once, both
+in total and per tenant, and picks the next iteration from the waiting tenants
+in round-robin order so that a tenant with many groups does not hold up the
+others.
+
+Waiting iterations are also ordered by priority (see
+:meth:`ConvergenceScheduler.priority`): newly triggered convergences go before
+background retries, then the groups furthest from their desired capacity go
+first, then the groups that have been waiting for convergence the longest.
+
+Groups that are only waiting for something, like servers to build, are backed
+off with :obj:`BackOff`, so that their retries are dropped until they are
+expected to have something to do. Triggering convergence again changes the
+dirty flag's version, which ends the back off.
+
+What the scheduler remembers about a group is forgotten once no iteration of
+the group has been submitted for :obj:`FORGET_AFTER` seconds, as happens when
+the group converges, is deleted or is moved to another node.
+"""
+
+import heapq
+from collections import OrderedDict
+from functools import partial
+from itertools import count
+
+import attr
+
+from effect import Effect, TypeDispatcher, sync_performer
+
+from twisted.internet.defer import Deferred, maybeDeferred, succeed
+
+from txeffect import deferred_performer, perform
+
+from otter.log.intents import msg
+from otter.util.config import config_value
+
+
+CONCURRENCY = 50
+"""
+Default number of convergence iterations a node runs at the same time.
+"""
+
+TENANT_CONCURRENCY = 5
+"""
+Default number of convergence iterations of a single tenant a node runs at the
+same time.
+"""
+
+FORGET_AFTER = 3600
+"""
+Default number of seconds after which the scheduler forgets the versions,
+divergence and back off of a key that no job has been submitted for.
+"""
+
+
+@attr.s
+class ScheduleConvergence(object):
+    """
+    An intent to perform a convergence iteration when the scheduler has room
+    for it.
+
+    If an iteration with the same key is already waiting to be run, this one
+    is dropped and results in ``None``, since the waiting one will do the same
+    work.
+
+    :ivar str tenant_id: Tenant whose group is being converged
+    :ivar key: hashable key identifying the work, usually the group ID
+    :ivar Effect effect: The convergence iteration
+    :ivar version: Version of the request for convergence, like the dirty
+        flag's version. An iteration with the same version as the last
+        iteration run for the key is a retry of it.
+    :ivar float created: EPOCH at which convergence was first requested
+    """
+    tenant_id = attr.ib()
+    key = attr.ib()
+    effect = attr.ib()
+    version = attr.ib(default=None)
+    created = attr.ib(default=0)
+
+
+def schedule_convergence(tenant_id, key, effect, version=None, created=0):
+    """
+    Return Effect of :obj:`ScheduleConvergence`.
+    """
+    return Effect(
+        ScheduleConvergence(tenant_id, key, effect, version, created))
+
+
+@attr.s
+class RecordDivergence(object):
+    """
+    An intent to tell the scheduler how far a group is from its desired
+    capacity, which is used to prioritize its later iterations.
+
+    :ivar key: key of the work, usually the group ID
+    :ivar int divergence: desired capacity minus current capacity
+    """
+    key = attr.ib()
+    divergence = attr.ib()
+
+
+@attr.s
+class BackOff(object):
+    """
+    An intent to hold back retries of a group's convergence that has to wait
+    for something. See :meth:`ConvergenceScheduler.back_off`.
+
+    :ivar key: key of the work, usually the group ID
+    :ivar float expected: number of seconds after which the group is expected
+        to need converging, or ``None`` if not known
+    """
+    key = attr.ib()
+    expected = attr.ib(default=None)
+
+
+@attr.s
+class _Job(object):
+    key = attr.ib()
+    start = attr.ib()
+    queued_at = attr.ib()
+    version = attr.ib()
+    priority = attr.ib()
+    deferred = attr.ib(default=attr.Factory(Deferred))
+
+
+class ConvergenceScheduler(object):
+    """
+    Runs jobs with at most ``concurrency`` of them running at the same time
+    and at most ``tenant_concurrency`` of them per tenant. Waiting jobs of a
+    tenant are run in order of priority, and the next job is taken from the
+    waiting tenant that had a job started the longest time ago, so that
+    tenants take turns regardless of how many jobs they have waiting. Tenants
+    with new (non-retry) jobs waiting take their turns before tenants with
+    only retries waiting.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param int concurrency: Maximum number of jobs running at the same time
+    :param int tenant_concurrency: Maximum number of jobs of a tenant running
+        at the same time
+    :param float forget_after: Number of seconds after which what is known
+        about a key that no job was submitted for is forgotten
+    """
+
+    def __init__(self, clock, concurrency=CONCURRENCY,
+                 tenant_concurrency=TENANT_CONCURRENCY, backoff_base=0,
+                 max_backoff=0, forget_after=FORGET_AFTER):
+        self.clock = clock
+        self.concurrency = concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.forget_after = forget_after
+        self._waiting = OrderedDict()
+        # key of a waiting job -> tenant it belongs to
+        self._waiting_keys = {}
+        self._running = {}
+        self._served = {}
+        self._serial = count()
+        self._versions = {}
+        self._divergences = {}
+        self._backoffs = {}
+        # key -> time a job was last submitted with it, oldest first
+        self._submitted = OrderedDict()
+        self._starting = False
+
+    @property
+    def waiting(self):
+        """Number of jobs waiting to be run."""
+        return len(self._waiting_keys)
+
+    @property
+    def running(self):
+        """Number of jobs running."""
+        return sum(self._running.itervalues())
+
+    def record_divergence(self, key, divergence):
+        """
+        Record how far the group identified by ``key`` is from its desired
+        capacity. Groups that have converged are forgotten.
+        """
+        if divergence == 0:
+            self._divergences.pop(key, None)
+        else:
+            self._divergences[key] = divergence
+
+    def back_off(self, key, expected=None):
+        """
+        Hold back retries of the job last started with ``key``: jobs with the
+        same key and version submitted in the next ``backoff_base * 2 ** n``
+        seconds are dropped, where ``n`` is the number of times the job has
+        already been backed off. The delay is capped at ``max_backoff``, and
+        at ``expected`` if given. Nothing is held back if ``max_backoff`` is
+        0, or if the job has no version.
+
+        :param key: key of the job
+        :param float expected: number of seconds after which the job is
+            expected to have something to do, if known
+        """
+        version = self._versions.get(key)
+        if not self.max_backoff or version is None:
+            return
+        last_version, retries, _ = self._backoffs.get(key, (None, 0, 0))
+        if last_version != version:
+            retries = 0
+        delay = min(self.backoff_base * 2 ** retries, self.max_backoff)
+        if expected is not None:
+            delay = min(delay, expected)
+        self._backoffs[key] = (version, retries + 1,
+                               self.clock.seconds() + delay)
+
+    def _backed_off(self, key, version):
+        if key not in self._backoffs:
+            return False
+        last_version, _, until = self._backoffs[key]
+        if version != last_version:
+            # convergence was requested again
+            del self._backoffs[key]
+            return False
+        return self.clock.seconds() < until
+
+    def forget(self, key):
+        """
+        Forget the version, divergence and back off recorded for ``key``.
+        """
+        self._submitted.pop(key, None)
+        self._versions.pop(key, None)
+        self._divergences.pop(key, None)
+        self._backoffs.pop(key, None)
+
+    def _forget_stale(self, now):
+        horizon = now - self.forget_after
+        while self._submitted:
+            key, submitted = next(self._submitted.iteritems())
+            if submitted > horizon:
+                break
+            self.forget(key)
+
+    def priority(self, key, version, created):
+        """
+        Get the priority of a job; jobs with lower priorities are run first.
+
+        A job is a retry if its version is the same as the version of the
+        last job started with the same key. Retries go after other jobs. Then
+        jobs go in decreasing order of the last divergence recorded for their
+        key, preferring scale ups, and then in order of ``created``.
+
+        :return: sortable priority
+        """
+        divergence = self._divergences.get(key, 0)
+        retry = version is not None and version == self._versions.get(key)
+        return (retry, -abs(divergence), -divergence, created)
+
+    def submit(self, tenant_id, key, start, version=None, created=0):
+        """
+        Run a job when there is room for it.
+
+        :param str tenant_id: Tenant the job belongs to
+        :param key: hashable key of the job. If a job with the same key is
+            already waiting, the new job is dropped, but the waiting job takes
+            its version and priority if they would have it run sooner.
+        :param callable start: called with the number of seconds the job
+            waited to be run. Returns Deferred that fires when the job is done.
+        :param version: See :obj:`ScheduleConvergence.version`
+        :param float created: See :obj:`ScheduleConvergence.created`
+
+        :return: Deferred that fires with the result of the job, or with
+            ``None`` if it was dropped because it was backed off (see
+            :meth:`back_off`) or already waiting.
+        """
+        now = self.clock.seconds()
+        self._forget_stale(now)
+        self._submitted.pop(key, None)
+        self._submitted[key] = now
+        priority = self.priority(key, version, created)
+        if key in self._waiting_keys:
+            self._reprioritize(key, version, priority)
+            return succeed(None)
+        if self._backed_off(key, version):
+            return succeed(None)
+        job = _Job(key=key, start=start, queued_at=now,
+                   version=version, priority=priority)
+        heapq.heappush(self._waiting.setdefault(tenant_id, []),
+                       (job.priority, next(self._serial), job))
+        self._waiting_keys[job.key] = tenant_id
+        self._run_waiting()
+        return job.deferred
+
+    def _reprioritize(self, key, version, priority):
+        jobs = self._waiting[self._waiting_keys[key]]
+        [(i, serial, job)] = [(i, serial, job)
+                              for i, (_, serial, job) in enumerate(jobs)
+                              if job.key == key]
+        if priority < job.priority:
+            job.version = version
+            job.priority = priority
+            jobs[i] = (priority, serial, job)
+            heapq.heapify(jobs)
+
+    def _next_tenant(self):
+        if self.running >= self.concurrency:
+            return None
+        cap = self.tenant_concurrency
+        tenants = [tenant_id for tenant_id in self._waiting
+                   if self._running.get(tenant_id, 0) < cap]
+        if not tenants:
+            return None
+
+        # tenants with new jobs go first, then the tenant that was served
+        # longest ago goes next
+        def turn(tenant_id):
+            best = self._waiting[tenant_id][0][0]
+            return (best[0], self._served.get(tenant_id, -1), best)
+
+        return min(tenants, key=turn)
+
+    def _run_waiting(self):
+        # Jobs that finish synchronously call this again while jobs are being
+        # started; the loop below will start any job they made room for.
+        if self._starting:
+            return
+        self._starting = True
+        try:
+            self._start_waiting()
+        finally:
+            self._starting = False
+
+    def _start_waiting(self):
+        tenant_id = self._next_tenant()
+        while tenant_id is not None:
+            jobs = self._waiting[tenant_id]
+            _, _, job = heapq.heappop(jobs)
+            if not jobs:
+                del self._waiting[tenant_id]
+            del self._waiting_keys[job.key]
+            self._served[tenant_id] = next(self._serial)
+            if job.version is not None:
+                self._versions[job.key] = job.version
+            self._running[tenant_id] = self._running.get(tenant_id, 0) + 1
+            d = maybeDeferred(job.start, self.clock.seconds() - job.queued_at)
+            d.addBoth(self._finished, tenant_id)
+            d.chainDeferred(job.deferred)
+            tenant_id = self._next_tenant()
+
+    def _finished(self, result, tenant_id):
+        self._running[tenant_id] -= 1
+        if self._running[tenant_id] == 0:
+            del self._running[tenant_id]
+            if tenant_id not in self._waiting:
+                del self._served[tenant_id]
+        self._run_waiting()
+        return result
+
+
+@deferred_performer
+def perform_schedule_convergence(scheduler, dispatcher, intent):
+    """
+    Perform a :obj:`ScheduleConvergence` by submitting its effect to
+    ``scheduler``. Logs how long the iteration waited and how much work the
+    scheduler has when the iteration is started.
+    """
+    def start(waited):
+        eff = msg('converge-scheduled', wait_time=waited,
+                  waiting=scheduler.waiting, running=scheduler.running)
+        return perform(dispatcher, eff.on(lambda _: intent.effect))
+
+    return scheduler.submit(intent.tenant_id, intent.key, start,
+                            intent.version, intent.created)
+
+
+@sync_performer
+def perform_record_divergence(scheduler, dispatcher, intent):
+    """Perform a :obj:`RecordDivergence`."""
+    scheduler.record_divergence(intent.key, intent.divergence)
+
+
+@sync_performer
+def perform_back_off(scheduler, dispatcher, intent):
+    """Perform a :obj:`BackOff`."""
+    scheduler.back_off(intent.key, intent.expected)
+
+
+def get_scheduler_dispatcher(clock, scheduler=None):
+    """
+    Get a dispatcher that can perform :obj:`ScheduleConvergence`,
+    :obj:`RecordDivergence` and :obj:`BackOff`.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param ConvergenceScheduler scheduler: Scheduler to use. If not given, one
+        is created with the limits from ``converger.concurrency`` and
+        ``converger.tenant_concurrency`` config. Retries are backed off
+        starting from ``converger.interval`` seconds up to
+        ``converger.max_backoff`` seconds if that is configured.
+    """
+    if scheduler is None:
+        scheduler = ConvergenceScheduler(
+            clock,
+            config_value('converger.concurrency') or CONCURRENCY,
+            config_value('converger.tenant_concurrency') or
+            TENANT_CONCURRENCY,
+            config_value('converger.interval') or 0,
+            config_value('converger.max_backoff') or 0)
+    return TypeDispatcher({
+        ScheduleConvergence: partial(perform_schedule_convergence, scheduler),
+        RecordDivergence: partial(perform_record_divergence, scheduler),
+        BackOff: partial(perform_back_off, scheduler),
+    })
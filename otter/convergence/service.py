@@ -45,9 +45,10 @@ The top-level entry-points into this module are :obj:`ConvergenceStarter` and
 # "bucket" via a simple hash/mod algorithm.
 #
 # In order to actually register that a group needs convergence, we create a
-# ZooKeeper node with the name of the tenant and group, and convergence nodes
-# watch the ZK directory and filter for groups that map to their allocated
-# buckets.
+# ZooKeeper node with the name of the tenant and group in the directory of the
+# group's bucket, and convergence nodes watch and list the directories of their
+# allocated buckets. Flags in the old flat directory, CONVERGENCE_DIRTY_DIR,
+# are moved to their bucket's directory by the node that owns the bucket.
 #
 # Marking a group divergent (or "dirty") is tricky enough that just using a
 # boolean flag for "is group dirty or not" won't work, because that will allow
@@ -92,7 +93,7 @@ from hashlib import sha1
 
 import attr
 
-from effect import Constant, Effect, Func, parallel
+from effect import Constant, Effect, Func, catch, parallel
 from effect.do import do, do_return
 from effect.ref import Reference
 
@@ -107,13 +108,17 @@ import six
 from sumtypes import match
 
 from toolz.functoolz import curry
+from toolz.itertoolz import concat
 
 from twisted.application.service import MultiService
 
 from txeffect import exc_info_to_failure, perform
 
 from otter.cloud_client import TenantScope
-from otter.constants import CONVERGENCE_DIRTY_DIR
+from otter.constants import (
+    CONVERGENCE_BUCKETS,
+    CONVERGENCE_DIRTY_BUCKETS_DIR,
+    CONVERGENCE_DIRTY_DIR)
 from otter.convergence.composition import (get_desired_server_group_state,
                                            get_desired_stack_group_state)
 from otter.convergence.effecting import steps_to_effect
@@ -124,18 +129,39 @@ from otter.convergence.logging import log_steps
 from otter.convergence.model import (
     ConvergenceIterationStatus,
     ServerState,
-    StepResult)
+    StepResult,
+    index_lb_nodes,
+    thaw_server_json)
 from otter.convergence.planning import plan_launch_server, plan_launch_stack
+from otter.convergence.scheduler import (
+    BackOff, RecordDivergence, schedule_convergence)
+from otter.convergence.snapshot import SnapshotScope
 from otter.log.cloudfeeds import cf_err, cf_msg
 from otter.log.intents import err, msg, msg_with_time, with_log
 from otter.models.intents import (
     DeleteGroup, GetScalingGroupInfo, UpdateGroupErrorReasons,
-    UpdateGroupStatus, UpdateServersCache)
+    UpdateGroupStatus, UpdateServersCache, UpdateServersCacheTime)
 from otter.models.interface import NoSuchScalingGroupError, ScalingGroupStatus
-from otter.util.timestamp import datetime_to_epoch
+from otter.util.config import config_value
+from otter.util.deadline import with_deadline
+from otter.util.timestamp import datetime_to_epoch, timestamp_to_epoch
 from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetStat
 
 
+BUILD_HISTORY = 3600
+"""
+Number of seconds of a group's recently built servers that are used to
+estimate how long building a server takes.
+"""
+
+ITERATION_BUDGET = 120
+"""
+Default number of seconds a convergence iteration can spend calling upstream
+services before it fails, so that the group does not stay in
+``currently_converging`` and the iteration is retried in a later cycle.
+"""
+
+
 def get_executor(launch_config):
     """
     Returns a ConvergenceExecutor based upon the launch_config type given.
@@ -160,7 +186,7 @@ def is_autoscale_active(server, lb_nodes):
     Is the given NovaServer in all its desired LB nodes?
 
     :param :obj:`NovaServer` server: NovaServer being checked
-    :param lb_nodes: sequence of :obj:`ILBNode`.
+    :param lb_nodes: sequence of :obj:`ILBNode`, or :obj:`LBNodeIndex`.
 
     :return: True if server is in LB nodes, False otherwise
     """
@@ -175,8 +201,7 @@ def is_autoscale_active(server, lb_nodes):
         return desired_lbs == met_desireds
 
     return (server.state == ServerState.ACTIVE and
-            all_met(server, [node for node in lb_nodes
-                             if node.matches(server)]))
+            all_met(server, index_lb_nodes(lb_nodes).matching(server)))
 
 
 def update_servers_cache(group, now, servers, lb_nodes, include_deleted=True):
@@ -188,9 +213,10 @@ def update_servers_cache(group, now, servers, lb_nodes, include_deleted=True):
     :param list lb_nodes: list of CLBNode objects
     :param include_deleted: Include deleted servers in cache. Defaults to True.
     """
+    lb_nodes = index_lb_nodes(lb_nodes)
     server_dicts = []
     for server in servers:
-        sd = thaw(server.json)
+        sd = thaw_server_json(server.json)
         if is_autoscale_active(server, lb_nodes):
             sd["_is_as_active"] = True
         if server.state != ServerState.DELETED or include_deleted:
@@ -200,6 +226,14 @@ def update_servers_cache(group, now, servers, lb_nodes, include_deleted=True):
         UpdateServersCache(group.tenant_id, group.uuid, now, server_dicts))
 
 
+def update_servers_cache_time(group, now):
+    """
+    Updates only the last update time of the servers cache, when the servers
+    to cache have not changed since it was last updated.
+    """
+    return Effect(UpdateServersCacheTime(group.tenant_id, group.uuid, now))
+
+
 @do
 def _execute_steps(steps):
     """
@@ -235,10 +269,110 @@ def _execute_steps(steps):
     yield do_return((worst_status, reasons))
 
 
+def estimate_build_time(servers, now, history=BUILD_HISTORY):
+    """
+    Estimate how long a server takes to build from how long the given
+    servers that were built in the last ``history`` seconds took, that is the
+    median time between their creation and their last update.
+
+    :param servers: sequence of :obj:`NovaServer`
+    :param float now: number of seconds since the POSIX epoch
+    :param int history: only servers created in this many seconds are used
+
+    :return: number of seconds, or ``None`` if there are no such servers
+    """
+    times = sorted(
+        timestamp_to_epoch(server.json['updated']) - server.created
+        for server in servers
+        if (server.state == ServerState.ACTIVE and
+            now - server.created <= history and
+            'updated' in server.json))
+    if not times:
+        return None
+    return times[len(times) // 2]
+
+
+def expected_state_change(servers, now):
+    """
+    Estimate the number of seconds after which one of the building servers
+    will become active, using :func:`estimate_build_time`.
+
+    :param servers: sequence of :obj:`NovaServer`
+    :param float now: number of seconds since the POSIX epoch
+
+    :return: number of seconds, or ``None`` if no servers are building or
+        there is no estimate of how long building takes
+    """
+    building = [server for server in servers
+                if server.state == ServerState.BUILD]
+    build_time = estimate_build_time(servers, now)
+    if not building or build_time is None:
+        return None
+    return max(0, min(server.created for server in building) +
+               build_time - now)
+
+
+def _server_fingerprint(server):
+    """
+    Return the parts of a :obj:`NovaServer` that planning depends on. Its
+    whole JSON is not hashed, so that it is never frozen (see
+    :obj:`ServerJSON`): Nova changes the server's ``updated`` timestamp
+    whenever the server changes.
+    """
+    return (server.id, server.state, server.created, server.image_id,
+            server.flavor_id, server.servicenet_address, server.desired_lbs,
+            server.json.get('updated'), server.json.get('metadata'))
+
+
+def plan_fingerprint(desired_group_state, group_state, resources, now,
+                     timeouts):
+    """
+    Return a fingerprint of the inputs of planning a group's convergence: the
+    desired state, the group's status, the group's servers or stacks, the load
+    balancer nodes of its servers, and the current time in units of each of
+    the timeouts that planning checks, so that the fingerprint changes when
+    one of them may have expired.
+
+    :param desired_group_state: the group's desired state
+    :param group_state: the group's :obj:`GroupState`
+    :param dict resources: gathered resources as returned by a
+        :obj:`ConvergenceExecutor`'s ``gather``
+    :param float now: number of seconds since the POSIX epoch
+    :param timeouts: sequence of timeouts in seconds. Timeouts that are 0
+        are ignored.
+
+    :return: hashable fingerprint
+    """
+    servers = resources.get('servers', [])
+    lb_nodes = index_lb_nodes(resources.get('lb_nodes', []))
+    return hash((
+        desired_group_state,
+        group_state.status,
+        frozenset(map(_server_fingerprint, servers)),
+        frozenset(concat(lb_nodes.matching(server) for server in servers)),
+        frozenset(resources.get('stacks', [])),
+        tuple(int(now // timeout) for timeout in timeouts if timeout > 0)))
+
+
+def capacity_divergence(desired_capacity, resources):
+    """
+    Return the number of servers or stacks the group needs to add to reach
+    its desired capacity, which is negative if it needs to remove some.
+
+    :param int desired_capacity: the group's desired capacity
+    :param dict resources: gathered resources as returned by a
+        :obj:`ConvergenceExecutor`'s ``gather``
+    """
+    servers = [server for server in resources.get('servers', [])
+               if server.state != ServerState.DELETED]
+    return desired_capacity - len(servers) - len(resources.get('stacks', []))
+
+
 @do
 def convergence_exec_data(tenant_id, group_id, now, get_executor):
     """
-    Get data required while executing convergence
+    Get data required while executing convergence, and tell the convergence
+    scheduler how far the group is from its desired capacity.
     """
     sg_eff = Effect(GetScalingGroupInfo(tenant_id=tenant_id,
                                         group_id=group_id))
@@ -256,11 +390,13 @@ def convergence_exec_data(tenant_id, group_id, now, get_executor):
         desired_capacity = 0
     else:
         desired_capacity = group_state.desired
-        yield executor.update_cache(scaling_group, now, **resources)
 
     desired_group_state = executor.get_desired_group_state(
         group_id, launch_config, desired_capacity)
 
+    yield Effect(RecordDivergence(
+        group_id, capacity_divergence(desired_capacity, resources)))
+
     yield do_return((executor, scaling_group, group_state, desired_group_state,
                      resources))
 
@@ -272,16 +408,25 @@ def _clean_waiting(waiting, group_id):
 
 @do
 def execute_convergence(tenant_id, group_id, build_timeout, waiting,
-                        limited_retry_iterations, get_executor=get_executor):
+                        fingerprints, limited_retry_iterations,
+                        get_executor=get_executor):
     """
     Gather data, plan a convergence, save active and pending servers to the
     group state, and then execute the convergence.
 
+    If the last iteration had nothing to do and the inputs of planning have
+    not changed since then (see :func:`plan_fingerprint`), the group is still
+    converged and the iteration stops without planning. Only the last update
+    time of the servers cache is updated then, so that the next gathering
+    keeps asking for the changes since this iteration.
+
     :param str tenant_id: the tenant ID for the group to converge
     :param str group_id: the ID of the group to be converged
     :param number build_timeout: number of seconds to wait for servers to be in
         building before it's is timed out and deleted
     :param Reference waiting: pmap of waiting groups
+    :param Reference fingerprints: pmap of group ID to the fingerprint of the
+        inputs of its last iteration, if it had nothing to do
     :param int limited_retry_iterations: number of iterations to wait for
         LIMITED_RETRY steps
     :param callable get_all_convergence_data: like
@@ -302,6 +447,18 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
     (executor, scaling_group, group_state, desired_group_state,
      resources) = all_data
 
+    fingerprint = plan_fingerprint(
+        desired_group_state, group_state, resources, datetime_to_epoch(now_dt),
+        [build_timeout, getattr(desired_group_state, 'draining_timeout', 0)])
+    last_fingerprints = yield fingerprints.read()
+    if last_fingerprints.get(group_id) == fingerprint:
+        yield msg('converge-unchanged')
+        yield executor.update_cache_time(scaling_group, now_dt)
+        yield do_return(ConvergenceIterationStatus.Stop())
+
+    if group_state.status != ScalingGroupStatus.DELETING:
+        yield executor.update_cache(scaling_group, now_dt, **resources)
+
     # prepare plan
     steps = executor.plan(desired_group_state, datetime_to_epoch(now_dt),
                           build_timeout, **resources)
@@ -323,7 +480,8 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
         result = yield convergence_succeeded(
             executor, scaling_group, group_state, resources, now_dt)
     elif worst_status == StepResult.FAILURE:
-        result = yield convergence_failed(scaling_group, reasons)
+        result = yield convergence_failed(scaling_group, group_state,
+                                          reasons)
     elif worst_status is StepResult.LIMITED_RETRY:
         # We allow further iterations to proceed as long as we haven't been
         # waiting for a LIMITED_RETRY for N consecutive iterations.
@@ -331,14 +489,27 @@ def execute_convergence(tenant_id, group_id, build_timeout, waiting,
         if current_iterations > limited_retry_iterations:
             yield msg('converge-limited-retry-too-long')
             yield clean_waiting
-            result = yield convergence_failed(scaling_group, reasons)
+            result = yield convergence_failed(scaling_group, group_state,
+                                              reasons)
         else:
             yield waiting.modify(
                 lambda group_iterations:
                     group_iterations.set(group_id, current_iterations + 1))
+            yield Effect(BackOff(group_id))
             result = ConvergenceIterationStatus.Continue()
     else:
+        yield Effect(BackOff(
+            group_id,
+            expected_state_change(resources.get('servers', []),
+                                  datetime_to_epoch(now_dt))))
         result = ConvergenceIterationStatus.Continue()
+
+    # Remember the inputs of an iteration that had nothing to do
+    if (worst_status == StepResult.SUCCESS and not steps and
+            result == ConvergenceIterationStatus.Stop()):
+        yield fingerprints.modify(lambda fps: fps.set(group_id, fingerprint))
+    elif group_id in last_fingerprints:
+        yield fingerprints.modify(lambda fps: fps.discard(group_id))
     yield do_return(result)
 
 
@@ -346,6 +517,10 @@ def update_stacks_cache(scaling_group, now, stacks, include_deleted=True):
     return Effect(Func(lambda: None))
 
 
+def update_stacks_cache_time(scaling_group, now):
+    return Effect(Func(lambda: None))
+
+
 @do
 def convergence_succeeded(executor, scaling_group, group_state, resources,
                           now):
@@ -369,19 +544,23 @@ def convergence_succeeded(executor, scaling_group, group_state, resources,
 
 
 @do
-def convergence_failed(scaling_group, reasons):
+def convergence_failed(scaling_group, group_state, reasons):
     """
-    Handle convergence failure
+    Handle convergence failure. The group's status and error reasons are not
+    written again if they are already the same in ``group_state``.
     """
-    yield Effect(UpdateGroupStatus(scaling_group=scaling_group,
-                                   status=ScalingGroupStatus.ERROR))
+    if group_state.status != ScalingGroupStatus.ERROR:
+        yield Effect(UpdateGroupStatus(scaling_group=scaling_group,
+                                       status=ScalingGroupStatus.ERROR))
     presented_reasons = sorted(present_reasons(reasons))
     if len(presented_reasons) == 0:
         presented_reasons = [u"Unknown error occurred"]
     yield cf_err(
         'group-status-error', status=ScalingGroupStatus.ERROR.name,
         reasons=presented_reasons)
-    yield Effect(UpdateGroupErrorReasons(scaling_group, presented_reasons))
+    if (group_state.status != ScalingGroupStatus.ERROR or
+            list(group_state.error_reasons) != presented_reasons):
+        yield Effect(UpdateGroupErrorReasons(scaling_group, presented_reasons))
     yield do_return(ConvergenceIterationStatus.Stop())
 
 
@@ -395,6 +574,17 @@ def parse_dirty_flag(flag):
     return flag.split('_', 1)
 
 
+def dirty_flag_dir(bucket):
+    """Return the ZooKeeper directory of the dirty flags of a bucket."""
+    return CONVERGENCE_DIRTY_BUCKETS_DIR + '/' + str(bucket)
+
+
+def dirty_flag_path(tenant_id, group_id, num_buckets=CONVERGENCE_BUCKETS):
+    """Return the path of a group's dirty flag ZooKeeper node."""
+    return (dirty_flag_dir(bucket_of_tenant(tenant_id, num_buckets)) + '/' +
+            format_dirty_flag(tenant_id, group_id))
+
+
 def mark_divergent(tenant_id, group_id):
     """
     Indicate that a group should be converged.
@@ -409,8 +599,7 @@ def mark_divergent(tenant_id, group_id):
         recorded.
     """
     # See note [Divergent flags]
-    flag = format_dirty_flag(tenant_id, group_id)
-    path = CONVERGENCE_DIRTY_DIR + '/' + flag
+    path = dirty_flag_path(tenant_id, group_id)
     eff = Effect(CreateOrSet(path=path, content='dirty'))
     return eff
 
@@ -423,8 +612,7 @@ def delete_divergent_flag(tenant_id, group_id, version):
 
     :return: Effect of None.
     """
-    flag = format_dirty_flag(tenant_id, group_id)
-    path = CONVERGENCE_DIRTY_DIR + '/' + flag
+    path = dirty_flag_path(tenant_id, group_id)
     fields = dict(path=path, dirty_version=version)
     try:
         yield Effect(DeleteNode(path=path, version=version))
@@ -510,6 +698,58 @@ def non_concurrently(locks, key, eff):
     yield do_return(result)
 
 
+def get_divergent_flags(my_buckets):
+    """
+    List the dirty flags in the directories of the given buckets.
+
+    :param my_buckets: collection of buckets allocated to this node
+
+    :return: Effect of list of dirty flag names
+    """
+    def list_bucket(bucket):
+        return Effect(GetChildren(dirty_flag_dir(bucket))).on(
+            error=catch(NoNodeError, lambda _: []))
+
+    return parallel(map(list_bucket, my_buckets)).on(concat).on(list)
+
+
+@do
+def migrate_divergent_flags(my_buckets, all_buckets):
+    """
+    Move the dirty flags of our buckets from the flat
+    ``CONVERGENCE_DIRTY_DIR``, where they were created before flags were
+    sharded by bucket, to their bucket's directory. The flag is marked in its
+    bucket's directory before it is deleted from the flat directory, so that
+    the group stays divergent.
+
+    :param my_buckets: collection of buckets allocated to this node
+    :param all_buckets: collection of all buckets
+
+    :return: Effect of None
+    """
+    try:
+        flags = yield Effect(GetChildren(CONVERGENCE_DIRTY_DIR))
+    except NoNodeError:
+        return
+    num_buckets = len(all_buckets)
+    mine = [
+        flag for flag in flags
+        if bucket_of_tenant(parse_dirty_flag(flag)[0], num_buckets)
+        in my_buckets]
+    if not mine:
+        return
+
+    def migrate(flag):
+        tenant_id, group_id = parse_dirty_flag(flag)
+        delete = Effect(DeleteNode(path=CONVERGENCE_DIRTY_DIR + '/' + flag,
+                                   version=-1))
+        return mark_divergent(tenant_id, group_id).on(
+            lambda _: delete.on(error=catch(NoNodeError, lambda _: None)))
+
+    yield parallel(map(migrate, mine))
+    yield msg('migrate-divergent-flags', flags=mine)
+
+
 def get_my_divergent_groups(my_buckets, all_buckets, divergent_flags):
     """
     Given a list of dirty-flags, filter out the ones that aren't associated
@@ -522,15 +762,16 @@ def get_my_divergent_groups(my_buckets, all_buckets, divergent_flags):
     :returns: list of dicts, where each dict has ``tenant_id``,
         ``group_id``, and ``dirty-flag`` keys.
     """
+    num_buckets = len(all_buckets)
+
     def structure_info(path):
         # Names of the dirty flags are {tenant_id}_{group_id}.
         tenant, group = parse_dirty_flag(path)
         return {'tenant_id': tenant,
                 'group_id': group,
-                'dirty-flag': CONVERGENCE_DIRTY_DIR + '/' + path}
+                'dirty-flag': dirty_flag_path(tenant, group, num_buckets)}
 
     dirty_info = map(structure_info, divergent_flags)
-    num_buckets = len(all_buckets)
     converging = [
         info for info in dirty_info
         if bucket_of_tenant(info['tenant_id'], num_buckets) in my_buckets]
@@ -545,16 +786,18 @@ def eff_finally(eff, after_eff):
 
 @do
 def converge_one_group(currently_converging, recently_converged, waiting,
-                       tenant_id, group_id, version,
+                       fingerprints, tenant_id, group_id, version,
                        build_timeout, limited_retry_iterations,
                        execute_convergence=execute_convergence):
     """
     Converge one group, non-concurrently, and clean up the dirty flag when
-    done.
+    done. The iteration is given a time budget, see :obj:`ITERATION_BUDGET`.
 
     :param Reference currently_converging: pset of currently converging groups
     :param Reference recently_converged: pmap of recently converged groups
     :param Reference waiting: pmap of waiting groups
+    :param Reference fingerprints: pmap of group ID to fingerprint of its
+        last iteration's inputs, see :func:`execute_convergence`
     :param str tenant_id: the tenant ID of the group that is converging
     :param str group_id: the ID of the group that is converging
     :param version: version number of ZNode of the group's dirty flag
@@ -568,9 +811,12 @@ def converge_one_group(currently_converging, recently_converged, waiting,
     mark_recently_converged = Effect(Func(time.time)).on(
         lambda time_done: recently_converged.modify(
             lambda rcg: rcg.set(group_id, time_done)))
+    budget = config_value('converger.iteration_budget') or ITERATION_BUDGET
     cvg = eff_finally(
-        execute_convergence(tenant_id, group_id, build_timeout, waiting,
-                            limited_retry_iterations),
+        with_deadline(
+            execute_convergence(tenant_id, group_id, build_timeout, waiting,
+                                fingerprints, limited_retry_iterations),
+            budget),
         mark_recently_converged)
 
     try:
@@ -581,6 +827,7 @@ def converge_one_group(currently_converging, recently_converged, waiting,
     except NoSuchScalingGroupError:
         yield err(None, 'converge-fatal-error')
         yield _clean_waiting(waiting, group_id)
+        yield fingerprints.modify(lambda fps: fps.discard(group_id))
         yield delete_divergent_flag(tenant_id, group_id, version)
         return
     except Exception:
@@ -605,20 +852,24 @@ def converge_one_group(currently_converging, recently_converged, waiting,
 
 @do
 def converge_all_groups(
-        currently_converging, recently_converged, waiting,
+        currently_converging, recently_converged, waiting, fingerprints,
         my_buckets, all_buckets,
         divergent_flags, build_timeout, interval,
         limited_retry_iterations,
         converge_one_group=converge_one_group):
     """
     Check for groups that need convergence and which match up to the
-    buckets we've been allocated.
+    buckets we've been allocated. Each group's convergence is run through the
+    node's convergence scheduler (see :mod:`otter.convergence.scheduler`),
+    prioritized by its dirty flag's version and creation time.
 
     :param Reference currently_converging: pset of currently converging groups
     :param Reference recently_converged: pmap of group ID to time last
         convergence finished
     :param Reference waiting: pmap of group ID to number of iterations already
         waited
+    :param Reference fingerprints: pmap of group ID to fingerprint of its
+        last iteration's inputs, see :func:`execute_convergence`
     :param my_buckets: The buckets that should be checked for group IDs to
         converge on.
     :param all_buckets: The set of all buckets that can be checked for group
@@ -657,11 +908,16 @@ def converge_all_groups(
             yield msg('converge-divergent-flag-disappeared', znode=dirty_flag)
         else:
             eff = converge_one_group(currently_converging, recently_converged,
-                                     waiting,
+                                     waiting, fingerprints,
                                      tenant_id, group_id,
                                      stat.version, build_timeout,
                                      limited_retry_iterations)
-            result = yield Effect(TenantScope(eff, tenant_id))
+            # a flag that is deleted and created again starts again from
+            # version 0, so the creation time is part of its version
+            result = yield schedule_convergence(
+                tenant_id, group_id, Effect(TenantScope(eff, tenant_id)),
+                version=(stat.ctime, stat.version),
+                created=stat.ctime / 1000.0)
             yield do_return(result)
 
     recent_groups = yield get_recently_converged_groups(recently_converged,
@@ -768,12 +1024,14 @@ class Converger(MultiService):
         self.recently_converged = Reference(pmap())
         # Groups we're waiting on temporarily, and may give up on.
         self.waiting = Reference(pmap())  # {group_id: num_iterations_waited}
+        # Inputs of the groups' last iterations that had nothing to do
+        self.fingerprints = Reference(pmap())  # {group_id: fingerprint}
 
     def _converge_all(self, my_buckets, divergent_flags):
         """Run :func:`converge_all_groups` and log errors."""
         eff = self._converge_all_groups(
             self.currently_converging, self.recently_converged,
-            self.waiting,
+            self.waiting, self.fingerprints,
             my_buckets, self._buckets, divergent_flags, self.build_timeout,
             self.interval, self.limited_retry_iterations)
         return eff.on(
@@ -782,19 +1040,26 @@ class Converger(MultiService):
 
     def _with_conv_runid(self, eff):
         """
-        Return Effect wrapped with converger_run_id log field
+        Return Effect wrapped with converger_run_id log field and a gathering
+        snapshot scope for the run, so that tenant-wide data is gathered only
+        once per tenant in the run.
         """
         return Effect(Func(uuid.uuid4)).on(str).on(
-            lambda uid: with_log(eff, otter_service='converger',
+            lambda uid: with_log(Effect(SnapshotScope(eff, uid)),
+                                 otter_service='converger',
                                  converger_run_id=uid))
 
     def buckets_acquired(self, my_buckets):
         """
-        Get dirty flags from zookeeper and run convergence with them.
+        Get dirty flags of our buckets from zookeeper and run convergence with
+        them, after moving any of their flags left in the flat directory.
 
         This is used as the partitioner callback.
         """
-        ceff = Effect(GetChildren(CONVERGENCE_DIRTY_DIR)).on(
+        migrate = migrate_divergent_flags(my_buckets, self._buckets).on(
+            error=lambda e: err(
+                exc_info_to_failure(e), 'migrate-divergent-flags-error'))
+        ceff = migrate.on(lambda _: get_divergent_flags(my_buckets)).on(
             partial(self._converge_all, my_buckets))
         # Return deferred as 1-element tuple for testing only.
         # Returning deferred would block otter from shutting down until
@@ -802,20 +1067,17 @@ class Converger(MultiService):
         # and will be triggered in next start of otter
         return (perform(self._dispatcher, self._with_conv_runid(ceff)), )
 
-    def divergent_changed(self, children):
+    def divergent_changed(self, bucket, children):
         """
         ZooKeeper children-watch callback that lets this service know when the
-        divergent groups have changed. If any of the divergent flags are for
-        tenants associated with this service's buckets, a convergence will be
+        divergent groups of a bucket have changed. If the bucket is one of this
+        service's buckets and has divergent flags, a convergence will be
         triggered.
         """
         if self.partitioner.get_current_state() != PartitionState.ACQUIRED:
             return
         my_buckets = self.partitioner.get_current_buckets()
-        changed_buckets = set(
-            bucket_of_tenant(parse_dirty_flag(child)[0], len(self._buckets))
-            for child in children)
-        if set(my_buckets).intersection(changed_buckets):
+        if children and bucket in my_buckets:
             # the return value is ignored, but we return this for testing
             eff = self._converge_all(my_buckets, children)
             return perform(self._dispatcher, self._with_conv_runid(eff))
@@ -831,17 +1093,20 @@ class ConvergenceExecutor(object):
     plan = attr.ib()
     get_desired_group_state = attr.ib()
     update_cache = attr.ib()
+    update_cache_time = attr.ib()
 
 
 launch_server_executor = ConvergenceExecutor(
     gather=get_all_launch_server_data,
     plan=plan_launch_server,
     get_desired_group_state=get_desired_server_group_state,
-    update_cache=update_servers_cache)
+    update_cache=update_servers_cache,
+    update_cache_time=update_servers_cache_time)
 
 
 launch_stack_executor = ConvergenceExecutor(
     gather=get_all_launch_stack_data,
     plan=plan_launch_stack,
     get_desired_group_state=get_desired_stack_group_state,
-    update_cache=update_stacks_cache)
+    update_cache=update_stacks_cache,
+    update_cache_time=update_stacks_cache_time)
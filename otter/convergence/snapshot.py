@@ -0,0 +1,229 @@
+"""
+Tenant-wide snapshots of gathered data, shared by all groups of a tenant that
+are converged in the same convergence cycle.
+
+Most of the data gathered for a group (the list of the tenant's servers, the
+tenant's load balancers and their nodes) is not specific to the group, so when
+several groups of the same tenant are converged in one cycle, each upstream
+listing only needs to happen once. :obj:`SnapshotScope` marks a convergence
+cycle, and :obj:`ReadSnapshot` is used by the gathering code to read the
+tenant-wide listings through the cycle's snapshot.
+
+A snapshot is fetched on behalf of all its readers, so it is fetched with the
+dispatcher the :obj:`SnapshotScope` is performed with, and not with the one of
+the group that happens to read it first, which carries that group's log fields
+and deadline. Each reader waits for the snapshot within its own deadline.
+"""
+
+from functools import partial
+
+import attr
+
+from effect import ComposedDispatcher, Effect, TypeDispatcher, perform
+
+from twisted.internet.defer import Deferred
+from twisted.python.failure import Failure
+
+from txeffect import deferred_performer, perform as twisted_perform
+
+from otter.cloud_client import TenantScope
+from otter.util.config import config_value
+from otter.util.deadline import within_deadline
+
+
+SNAPSHOT_TTL = 10
+"""
+Default number of seconds a snapshot can be reused for after it was first
+requested.
+"""
+
+
+@attr.s
+class SnapshotScope(object):
+    """
+    An intent that shares the results of any :obj:`ReadSnapshot` performed
+    while performing ``effect`` between all other :obj:`ReadSnapshot`s in the
+    scope with the same tenant ID and name.
+
+    :ivar Effect effect: The effect to perform in the scope
+    :ivar str run_id: ID identifying the scope, usually a convergence cycle
+    """
+    effect = attr.ib()
+    run_id = attr.ib()
+
+
+@attr.s
+class ReadSnapshot(object):
+    """
+    An intent to get tenant-wide data, which will be taken from the current
+    :obj:`SnapshotScope` if it has already been read in that scope.
+
+    The result is shared among all the readers of the snapshot and hence must
+    not be mutated.
+
+    :ivar str tenant_id: Tenant the data belongs to
+    :ivar str name: Name of the data, like "servers" or "clb"
+    :ivar Effect effect: The effect that gets the data
+    """
+    tenant_id = attr.ib()
+    name = attr.ib()
+    effect = attr.ib()
+
+
+def read_snapshot(tenant_id, name, effect):
+    """
+    Return Effect of :obj:`ReadSnapshot`.
+    """
+    return Effect(ReadSnapshot(tenant_id, name, effect))
+
+
+class _SharedResult(object):
+    """
+    The result of a Deferred which can be given to any number of consumers.
+    """
+
+    def __init__(self):
+        self._waiters = []
+        self._fired = False
+        self._result = None
+
+    def follow(self, d):
+        """Take the result of the given Deferred when it fires."""
+        d.addBoth(self._got_result)
+
+    def _got_result(self, result):
+        self._fired = True
+        self._result = result
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            self._give(waiter)
+
+    def _give(self, d):
+        if isinstance(self._result, Failure):
+            d.errback(self._result)
+        else:
+            d.callback(self._result)
+
+    def get(self):
+        """
+        Return a new Deferred that fires with the result. Cancelling it stops
+        waiting for the result.
+        """
+        d = Deferred(self._waiters.remove)
+        if self._fired:
+            self._give(d)
+        else:
+            self._waiters.append(d)
+        return d
+
+
+class TenantSnapshots(object):
+    """
+    Node-local store of snapshots keyed on (run ID, tenant ID, name).
+
+    A snapshot is fetched when it is first read and is then shared with all
+    readers for ``ttl`` seconds, including readers that come in while it is
+    still being fetched. Failed fetches are not kept, so that the next reader
+    will fetch again.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param number ttl: Number of seconds a snapshot is kept for
+    """
+
+    def __init__(self, clock, ttl=SNAPSHOT_TTL):
+        self.clock = clock
+        self.ttl = ttl
+        self._snapshots = {}
+
+    def _expire(self, now):
+        expired = [key for key, (created, _) in self._snapshots.iteritems()
+                   if now - created > self.ttl]
+        for key in expired:
+            del self._snapshots[key]
+
+    def _forget(self, failure, key, shared):
+        if self._snapshots.get(key, (None, None))[1] is shared:
+            del self._snapshots[key]
+        return failure
+
+    def get(self, key, fetch):
+        """
+        Get the snapshot identified by ``key``, calling ``fetch`` to get it if
+        it is not stored.
+
+        :param key: hashable key of the snapshot
+        :param callable fetch: no-argument callable returning Deferred of the
+            snapshot's data
+
+        :return: Deferred of the snapshot's data
+        """
+        now = self.clock.seconds()
+        self._expire(now)
+        if key in self._snapshots:
+            return self._snapshots[key][1].get()
+        shared = _SharedResult()
+        self._snapshots[key] = (now, shared)
+        d = fetch()
+        d.addErrback(self._forget, key, shared)
+        shared.follow(d)
+        return shared.get()
+
+    def __len__(self):
+        return len(self._snapshots)
+
+
+@deferred_performer
+def perform_read_snapshot(snapshots, run_id, scope_dispatcher, dispatcher,
+                          intent):
+    """
+    Perform a :obj:`ReadSnapshot` inside a :obj:`SnapshotScope` by reading
+    through ``snapshots``.
+
+    :param scope_dispatcher: The dispatcher the scope is performed with. The
+        snapshot's effect is performed with it in a :obj:`TenantScope` of the
+        snapshot's tenant.
+    """
+    fetch = partial(twisted_perform, scope_dispatcher,
+                    Effect(TenantScope(intent.effect, intent.tenant_id)))
+    return within_deadline(
+        dispatcher, 'Reading {} snapshot'.format(intent.name),
+        snapshots.get, (run_id, intent.tenant_id, intent.name), fetch)
+
+
+def perform_read_snapshot_unscoped(dispatcher, intent, box):
+    """
+    Perform a :obj:`ReadSnapshot` outside of any :obj:`SnapshotScope` by just
+    performing its effect.
+    """
+    perform(dispatcher, intent.effect.on(box.succeed, box.fail))
+
+
+def perform_snapshot_scope(snapshots, dispatcher, scope, box):
+    """
+    Perform a :obj:`SnapshotScope` by performing its effect with a dispatcher
+    that reads :obj:`ReadSnapshot` intents through ``snapshots``.
+    """
+    new_disp = ComposedDispatcher([
+        TypeDispatcher({
+            ReadSnapshot: partial(perform_read_snapshot, snapshots,
+                                  scope.run_id, dispatcher)}),
+        dispatcher])
+    perform(new_disp, scope.effect.on(box.succeed, box.fail))
+
+
+def get_snapshot_dispatcher(clock, snapshots=None):
+    """
+    Get a dispatcher that can perform :obj:`SnapshotScope` and
+    :obj:`ReadSnapshot`.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param TenantSnapshots snapshots: Store to use. If not given, a store is
+        created with TTL from ``converger.snapshot_ttl`` config.
+    """
+    if snapshots is None:
+        snapshots = TenantSnapshots(
+            clock, config_value('converger.snapshot_ttl') or SNAPSHOT_TTL)
+    return TypeDispatcher({
+        SnapshotScope: partial(perform_snapshot_scope, snapshots),
+        ReadSnapshot: perform_read_snapshot_unscoped,
+    })
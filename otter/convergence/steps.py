@@ -43,6 +43,7 @@ from otter.util.fp import set_in
 from otter.util.hashkey import generate_server_name
 from otter.util.http import APIError, append_segments
 from otter.util.retry import (
+    FULL_JITTER,
     exponential_backoff_interval,
     retry_effect,
     retry_times)
@@ -228,7 +229,8 @@ class DeleteServer(object):
 
         eff = retry_effect(
             delete_and_verify(self.server_id), can_retry=retry_times(3),
-            next_interval=exponential_backoff_interval(2))
+            next_interval=exponential_backoff_interval(2, jitter=FULL_JITTER),
+            budget=ServiceType.CLOUD_SERVERS)
 
         def report_success(result):
             return StepResult.RETRY, [
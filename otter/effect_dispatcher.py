@@ -1,5 +1,7 @@
 """Effect dispatchers for Otter."""
 
+from functools import partial
+
 from effect import (
     ComposedDispatcher,
     TypeDispatcher,
@@ -15,16 +17,20 @@ from .auth import (
     perform_invalidate_token,
 )
 from .cloud_client import get_cloud_client_dispatcher
+from .convergence.drain_times import get_drain_times_dispatcher
+from .convergence.scheduler import get_scheduler_dispatcher
+from .convergence.snapshot import get_snapshot_dispatcher
 from .log.intents import get_log_dispatcher, get_msg_time_dispatcher
 from .models.cass import get_cql_dispatcher
 from .models.intents import get_model_dispatcher
+from .util.deadline import get_deadline_dispatcher
 from .util.pure_http import Request, perform_request
 from .util.retry import Retry, perform_retry
 from .util.zk import get_zk_dispatcher
 from .worker_intents import get_eviction_dispatcher
 
 
-def get_simple_dispatcher(reactor):
+def get_simple_dispatcher(reactor, retry_budgets=None):
     """
     Get an Effect dispatcher that can handle most of the effects in Otter,
     suitable for passing to :func:`effect.perform`. Note that this does NOT
@@ -33,6 +39,9 @@ def get_simple_dispatcher(reactor):
     Usually, :func:`get_full_dispatcher` should be used instead of this
     function. The simple dispatcher should only be used in tests or legacy
     code.
+
+    :param retry_budgets: :obj:`RetryBudgets` limiting the retries of
+        :obj:`Retry` intents with a budget, if any.
     """
     return ComposedDispatcher([
         base_dispatcher,
@@ -40,7 +49,7 @@ def get_simple_dispatcher(reactor):
             Authenticate: perform_authenticate,
             InvalidateToken: perform_invalidate_token,
             Request: perform_request,
-            Retry: perform_retry,
+            Retry: partial(perform_retry, budgets=retry_budgets),
         }),
         make_twisted_dispatcher(reactor),
         reference_dispatcher,
@@ -48,18 +57,24 @@ def get_simple_dispatcher(reactor):
 
 
 def get_full_dispatcher(reactor, authenticator, log, service_configs,
-                        kz_client, store, supervisor, cass_client):
+                        kz_client, store, supervisor, cass_client,
+                        retry_budgets=None, pools=None, limiters=None):
     """
     Return a dispatcher that can perform all of Otter's effects.
     """
     return ComposedDispatcher([
-        get_legacy_dispatcher(reactor, authenticator, log, service_configs),
+        get_legacy_dispatcher(reactor, authenticator, log, service_configs,
+                              retry_budgets, pools, limiters),
         get_zk_dispatcher(kz_client),
         get_model_dispatcher(log, store),
         get_eviction_dispatcher(supervisor),
         get_log_dispatcher(log, {}),
         get_msg_time_dispatcher(reactor),
-        get_cql_dispatcher(cass_client)
+        get_cql_dispatcher(cass_client),
+        get_snapshot_dispatcher(reactor),
+        get_scheduler_dispatcher(reactor),
+        get_drain_times_dispatcher(reactor),
+        get_deadline_dispatcher(reactor)
     ])
 
 
@@ -74,13 +89,17 @@ def get_working_cql_dispatcher(reactor, cass_client):
     ])
 
 
-def get_legacy_dispatcher(reactor, authenticator, log, service_configs):
+def get_legacy_dispatcher(reactor, authenticator, log, service_configs,
+                          retry_budgets=None, pools=None, limiters=None):
     """
     Return a dispatcher that can perform effects that are needed by the old
     worker code.
+
+    :param pools: :obj:`ConnectionPools` to make HTTP requests with, if any.
+    :param limiters: :obj:`RateLimiters` to throttle requests with, if any.
     """
     return ComposedDispatcher([
         get_cloud_client_dispatcher(
-            reactor, authenticator, log, service_configs),
-        get_simple_dispatcher(reactor),
+            reactor, authenticator, log, service_configs, pools, limiters),
+        get_simple_dispatcher(reactor, retry_budgets),
     ])
@@ -12,12 +12,14 @@ from toolz.dicttoolz import keyfilter
 from txeffect import perform
 
 from otter.cloud_client import TenantScope, publish_to_cloudfeeds
+from otter.constants import ServiceType
 from otter.effect_dispatcher import get_legacy_dispatcher
 from otter.log import log as otter_log
 from otter.log.formatters import LogLevel
 from otter.log.intents import err as err_effect, msg as msg_effect
 from otter.util.http import APIError
 from otter.util.retry import (
+    FULL_JITTER,
     compose_retries,
     exponential_backoff_interval,
     retry_effect,
@@ -166,14 +168,17 @@ def add_event(event, admin_tenant_id, region, log):
                        f.value.code < 400 or
                        f.value.code >= 500),
             retry_times(5)),
-        exponential_backoff_interval(2))
+        exponential_backoff_interval(2, jitter=FULL_JITTER),
+        budget=ServiceType.CLOUD_FEEDS)
     return Effect(TenantScope(tenant_id=admin_tenant_id, effect=eff))
 
 
 @attributes(['reactor', 'authenticator', 'tenant_id', 'region',
-             'service_configs', 'log', 'get_disp', 'add_event'],
+             'service_configs', 'log', 'get_disp', 'add_event',
+             'retry_budgets', 'pools', 'limiters'],
             defaults={'log': otter_log, 'get_disp': get_legacy_dispatcher,
-                      'add_event': add_event})
+                      'add_event': add_event, 'retry_budgets': None,
+                      'pools': None, 'limiters': None})
 class CloudFeedsObserver(object):
     """
     Log observer that pushes events to cloud feeds
@@ -200,5 +205,6 @@ class CloudFeedsObserver(object):
         else:
             return perform(
                 self.get_disp(self.reactor, self.authenticator, log,
-                              self.service_configs),
+                              self.service_configs, self.retry_budgets,
+                              self.pools, self.limiters),
                 eff).addErrback(log.err, 'cf-add-failure')
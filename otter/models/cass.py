@@ -6,12 +6,13 @@ import functools
 import json
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from itertools import cycle, takewhile
 
 from characteristic import attributes
 
-from effect import Constant, Effect, TypeDispatcher, parallel
+from effect import Effect, TypeDispatcher, parallel
 from effect.do import do, do_return
 
 from jsonschema import ValidationError
@@ -53,6 +54,7 @@ from otter.models.interface import (
 from otter.util import timestamp
 from otter.util.config import config_value
 from otter.util.cqlbatch import Batch, batch
+from otter.util.deadline import within_deadline
 from otter.util.deferredutils import with_lock
 from otter.util.hashkey import generate_capability, generate_key_str
 from otter.util.retry import repeating_interval, retry, retry_times
@@ -65,6 +67,12 @@ DEFAULT_CONSISTENCY = ConsistencyLevel.QUORUM
 
 QUERY_LIMIT = 10000
 
+MANIFEST_CACHE_SIZE = 10000
+"""
+Default maximum number of groups whose configurations are kept in a
+:obj:`ManifestCache`.
+"""
+
 
 @attributes(['query', 'params', 'consistency_level'])
 class CQLQueryExecute(object):
@@ -76,9 +84,11 @@ class CQLQueryExecute(object):
 @deferred_performer
 def perform_cql_query(conn, disp, intent):
     """
-    Perform CQLQueryExecute intent using given silverberg connection
+    Perform CQLQueryExecute intent using given silverberg connection, within
+    the deadline of the current :obj:`DeadlineScope` if there is one.
     """
-    return conn.execute(
+    return within_deadline(
+        disp, 'CQL query', conn.execute,
         intent.query, intent.params, intent.consistency_level)
 
 
@@ -150,6 +160,24 @@ _cql_view_manifest = (
     '"policyTouched", paused, desired, created_at, status, error_reasons, '
     'deleting FROM {cf} '
     'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+_cql_view_state = (
+    'SELECT "tenantId", "groupId", group_config, active, pending, '
+    '"groupTouched", "policyTouched", paused, desired, created_at, status, '
+    'error_reasons, deleting FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;')
+_cql_view_manifest_versioned = (
+    'SELECT "tenantId", "groupId", group_config, '
+    'launch_config, active, pending, "groupTouched", '
+    '"policyTouched", paused, desired, created_at, status, error_reasons, '
+    'deleting, writetime(group_config) AS group_config_ts, '
+    'writetime(launch_config) AS launch_config_ts FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;')
+_cql_view_state_versioned = (
+    'SELECT "tenantId", "groupId", active, pending, "groupTouched", '
+    '"policyTouched", paused, desired, created_at, status, error_reasons, '
+    'deleting, writetime(group_config) AS group_config_ts, '
+    'writetime(launch_config) AS launch_config_ts FROM {cf} '
+    'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;')
 _cql_insert_policy = (
     'INSERT INTO {cf}("tenantId", "groupId", "policyId", data, version) '
     'VALUES (:tenantId, :groupId, :{name}policyId, :{name}data, '
@@ -244,6 +272,57 @@ _cql_count_for_group = (
     'AND "groupId" = :groupId;')
 _cql_count_all = ('SELECT COUNT(*) FROM {cf};')
 
+# Servers cache table
+_cql_view_servers = (
+    'SELECT server_blob, server_as_active, last_update FROM {cf} '
+    'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+_cql_view_old_servers = (
+    'SELECT server_blob, server_as_active, last_update FROM {cf} '
+    'WHERE "tenantId"=:tenantId AND "groupId"=:groupId '
+    'ORDER BY last_update DESC;')
+_cql_update_servers_ts = (
+    'UPDATE {cf} USING TIMESTAMP :ts SET last_update=:last_update '
+    'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+_cql_insert_server = (
+    'INSERT INTO {cf} ("tenantId", "groupId", server_id, '
+    'server_blob, server_as_active) '
+    'VALUES(:tenantId, :groupId, :server_id{i}, '
+    ':server_blob{i}, :server_as_active{i}) USING TIMESTAMP :ts;')
+_cql_clear_servers = (
+    'DELETE FROM {cf} USING TIMESTAMP :clear_ts '
+    'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
+
+# Statements of the hot group state, event and servers cache paths, built
+# once here rather than formatted on every call
+_view_manifest_query = _cql_view_manifest.format(cf='scaling_group')
+_view_manifest_versioned_query = _cql_view_manifest_versioned.format(
+    cf='scaling_group')
+_view_state_query = _cql_view_state.format(cf='scaling_group')
+_view_state_versioned_query = _cql_view_state_versioned.format(
+    cf='scaling_group')
+_view_group_config_query = _cql_view.format(cf='scaling_group',
+                                            column='group_config')
+_view_launch_config_query = _cql_view.format(cf='scaling_group',
+                                             column='launch_config')
+_delete_group_query = _cql_delete_all_in_group.format(cf='scaling_group',
+                                                      name='')
+_insert_group_state_query = _cql_insert_group_state.format(
+    cf='scaling_group')
+_update_status_query = _cql_update.format(cf='scaling_group',
+                                          column='status', name=':status')
+_update_deleting_query = _cql_update.format(cf='scaling_group',
+                                            column='deleting',
+                                            name=':deleting')
+_fetch_batch_of_events_query = _cql_fetch_batch_of_events.format(
+    cf='scaling_schedule_v2')
+_oldest_event_query = _cql_oldest_event.format(cf='scaling_schedule_v2')
+_find_webhook_token_query = _cql_find_webhook_token.format(cf='webhook_keys')
+_view_servers_query = _cql_view_servers.format(cf='servers_cache_v2')
+_view_old_servers_query = _cql_view_old_servers.format(cf='servers_cache')
+_update_servers_ts_query = _cql_update_servers_ts.format(
+    cf='servers_cache_v2')
+_clear_servers_query = _cql_clear_servers.format(cf='servers_cache_v2')
+
 # seems to be pretty quick no matter the consistency - unfortunately this only
 # checks we can connect to Cassandra, and not whether the otter keyspace is
 # correct, etc.
@@ -593,6 +672,94 @@ def _check_deleting(group, get_deleting=False):
     return group
 
 
+class ManifestCache(object):
+    """
+    Node-local cache of the serialized group and launch configurations of
+    scaling groups, keyed on ``(tenant_id, group_id)``.
+
+    Configurations are changed far less often than they are read, so a
+    :obj:`CassScalingGroup` with a cache reads only the group's state and the
+    write times of its configuration columns, and reads the configurations
+    themselves only when their write times are not the cached ones. The
+    least recently used groups are dropped when there are more than
+    ``max_size`` of them.
+
+    :param int max_size: Maximum number of groups kept
+    """
+
+    def __init__(self, max_size=MANIFEST_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, version):
+        """
+        Return the configurations cached for ``key`` if they are of the given
+        version, or ``None`` otherwise. Reading them counts as a hit.
+
+        :param tuple key: ``(tenant_id, group_id)``
+        :param version: Write times of the configurations
+        :return: tuple of group config and launch config as stored
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self._entries[key] = entry
+        if entry[0] != version:
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, configs):
+        """
+        Cache configurations that were read from Cassandra since they were
+        not cached. This counts as a miss.
+        """
+        self.misses += 1
+        self._entries.pop(key, None)
+        self._entries[key] = (version, configs)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Forget the configurations of ``key``.
+        """
+        self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Get the cache's usage.
+
+        :return: dict of ``size`` (number of groups cached), ``hits``,
+            ``misses`` and ``hit_rate`` (ratio of hits to reads, or ``None``
+            before any read)
+        """
+        reads = self.hits + self.misses
+        return {'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / reads if reads else None}
+
+    def health_check(self):
+        """
+        Return the cache's usage as a health check that is always healthy.
+        """
+        return True, self.stats()
+
+
+def _config_version(group):
+    """
+    Return the version of a group row's configurations as per their write
+    times.
+    """
+    return (group['group_config_ts'], group['launch_config_ts'])
+
+
 @implementer(IScalingGroup)
 class CassScalingGroup(object):
     """
@@ -620,6 +787,12 @@ class CassScalingGroup(object):
     :ivar local_locks: Local locks used when modifying state
     :type local_locks: :class:`WeakLocks`
 
+    :ivar manifest_cache: Cache of the group's configurations, if any
+    :type manifest_cache: :class:`ManifestCache` or ``None``
+
+    :ivar lock_leases: Leases of the group's ZooKeeper lock, if they are kept
+    :type lock_leases: :class:`LockLeases` or ``None``
+
     IMPORTANT REMINDER: In CQL, update will create a new row if one doesn't
     exist.  Therefore, before doing an update, a read must be performed first
     else an entry is created where none should have been.
@@ -634,7 +807,8 @@ class CassScalingGroup(object):
 
     """
     def __init__(self, log, tenant_id, uuid, connection, buckets, kz_client,
-                 reactor, local_locks):
+                 reactor, local_locks, manifest_cache=None,
+                 lock_leases=None):
         """
         Creates a CassScalingGroup object.
         """
@@ -648,6 +822,8 @@ class CassScalingGroup(object):
         self.kz_client = kz_client
         self.reactor = reactor
         self.local_locks = local_locks
+        self.manifest_cache = manifest_cache
+        self.lock_leases = lock_leases
 
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
@@ -656,7 +832,7 @@ class CassScalingGroup(object):
         self.webhooks_table = "policy_webhooks"
         self.webhooks_keys_table = "webhook_keys"
         self.event_table = "scaling_schedule_v2"
-        self.servers_cache_table = "servers_cache"
+        self.servers_cache_table = "servers_cache_v2"
 
     def with_timestamp(self, func):
         """
@@ -674,6 +850,43 @@ class CassScalingGroup(object):
             return func(get_client_ts(self.reactor), *args)
         return wrapper
 
+    def _view_group(self, get_deleting=False):
+        """
+        Read the group's row, with its configurations taken from the
+        :obj:`ManifestCache` if they are cached and up to date.
+
+        :return: Deferred that fires with the row
+        """
+        cache = self.manifest_cache
+        key = (self.tenant_id, self.uuid)
+
+        def _view(query):
+            d = verified_view(
+                self.connection, query, _delete_group_query,
+                {"tenantId": self.tenant_id, "groupId": self.uuid},
+                DEFAULT_CONSISTENCY,
+                NoSuchScalingGroupError(self.tenant_id, self.uuid), self.log)
+            return d.addCallback(_check_deleting, get_deleting)
+
+        def _store(group):
+            cache.put(key, _config_version(group),
+                      (group['group_config'], group['launch_config']))
+            return group
+
+        def _from_cache(group):
+            configs = cache.get(key, _config_version(group))
+            if configs is None:
+                return _view(_view_manifest_versioned_query).addCallback(
+                    _store)
+            return merge(group, {'group_config': configs[0],
+                                 'launch_config': configs[1]})
+
+        if cache is None:
+            return _view(_view_manifest_query)
+        if key in cache:
+            return _view(_view_state_versioned_query).addCallback(_from_cache)
+        return _view(_view_manifest_versioned_query).addCallback(_store)
+
     def view_manifest(self, with_policies=True, with_webhooks=False,
                       get_deleting=False):
         """
@@ -708,17 +921,7 @@ class CassScalingGroup(object):
             }
             return m
 
-        view_query = _cql_view_manifest.format(
-            cf=self.group_table)
-        del_query = _cql_delete_all_in_group.format(
-            cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
-                          {"tenantId": self.tenant_id,
-                           "groupId": self.uuid},
-                          DEFAULT_CONSISTENCY,
-                          NoSuchScalingGroupError(self.tenant_id, self.uuid),
-                          self.log)
-        d.addCallback(_check_deleting, get_deleting)
+        d = self._view_group(get_deleting)
         d.addCallback(_generate_manifest_group_part)
 
         if with_policies:
@@ -734,11 +937,12 @@ class CassScalingGroup(object):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_config`
         """
-        view_query = _cql_view.format(
-            cf=self.group_table, column='group_config')
-        del_query = _cql_delete_all_in_group.format(
-            cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
+        if self.manifest_cache is not None:
+            return self._view_group().addCallback(
+                lambda group: _jsonloads_data(group['group_config']))
+
+        d = verified_view(self.connection, _view_group_config_query,
+                          _delete_group_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
                           DEFAULT_CONSISTENCY,
@@ -752,11 +956,12 @@ class CassScalingGroup(object):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_launch_config`
         """
-        view_query = _cql_view.format(
-            cf=self.group_table, column='launch_config')
-        del_query = _cql_delete_all_in_group.format(
-            cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
+        if self.manifest_cache is not None:
+            return self._view_group().addCallback(
+                lambda group: _jsonloads_data(group['launch_config']))
+
+        d = verified_view(self.connection, _view_launch_config_query,
+                          _delete_group_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
                           DEFAULT_CONSISTENCY,
@@ -766,17 +971,30 @@ class CassScalingGroup(object):
         return d.addCallback(lambda group:
                              _jsonloads_data(group['launch_config']))
 
-    def view_state(self, consistency=None, get_deleting=False):
+    def view_state(self, consistency=None, get_deleting=False,
+                   with_config=False):
         """
         see :meth:`otter.models.interface.IScalingGroup.view_state`
+
+        Only the state columns and the group config (which has the group's
+        name) are read; the launch config is not.
+
+        :param bool with_config: Whether to also return the group config
+            read with the state, which saves a separate :meth:`view_config`
+        :return: Deferred that fires with the :obj:`GroupState`, or a tuple of
+            it and the group config if ``with_config`` is true
         """
         if consistency is None:
             consistency = DEFAULT_CONSISTENCY
 
-        view_query = _cql_view_manifest.format(cf=self.group_table)
-        del_query = _cql_delete_all_in_group.format(
-            cf=self.group_table, name='')
-        d = verified_view(self.connection, view_query, del_query,
+        def _unmarshal(group):
+            state = _unmarshal_state(group)
+            if with_config:
+                return state, _jsonloads_data(group['group_config'])
+            return state
+
+        d = verified_view(self.connection, _view_state_query,
+                          _delete_group_query,
                           {"tenantId": self.tenant_id,
                            "groupId": self.uuid},
                           consistency,
@@ -784,13 +1002,17 @@ class CassScalingGroup(object):
                           self.log)
 
         d.addCallback(_check_deleting, get_deleting)
-        return d.addCallback(_unmarshal_state)
+        return d.addCallback(_unmarshal)
 
     def modify_state(self, modifier_callable, *args, **kwargs):
         """
         see :meth:`otter.models.interface.IScalingGroup.modify_state`
+
+        The group config is read along with the state, so passing it to the
+        modifier does not cost another read.
         """
         modify_state_reason = kwargs.pop('modify_state_reason', None)
+        with_config = kwargs.pop('with_config', False)
         log = self.log.bind(
             system='CassScalingGroup.modify_state',
             modify_state_reason=modify_state_reason)
@@ -813,17 +1035,19 @@ class CassScalingGroup(object):
                 'ts': timestamp
             }
             return self.connection.execute(
-                _cql_insert_group_state.format(cf=self.group_table),
-                params, consistency)
+                _insert_group_state_query, params, consistency)
+
+        def _modify((state, config)):
+            if with_config:
+                kwargs['config'] = config
+            return modifier_callable(self, state, *args, **kwargs)
 
         def _modify_state():
-            d = self.view_state(consistency)
-            d.addCallback(lambda state: modifier_callable(
-                self, state, *args, **kwargs))
+            d = self.view_state(consistency, with_config=True)
+            d.addCallback(_modify)
             return d.addCallback(_write_state)
 
-        lock = self.kz_client.Lock(LOCK_PATH + '/' + self.uuid)
-        lock.acquire = functools.partial(lock.acquire, timeout=120)
+        lock = self._lock()
         local_lock = self.local_locks.get_lock(self.uuid)
         return local_lock.run(
             with_lock, self.reactor, lock, _modify_state,
@@ -831,6 +1055,31 @@ class CassScalingGroup(object):
             acquire_timeout=150,
             release_timeout=30)
 
+    def _lock(self, keep=True):
+        """
+        Get the group's ZooKeeper lock, from ``lock_leases`` if there are
+        any.
+
+        :param bool keep: Keep the lock leased after it is released?
+        """
+        path = LOCK_PATH + '/' + self.uuid
+        if self.lock_leases is None:
+            lock = self.kz_client.Lock(path)
+        else:
+            lock = self.lock_leases.lock(self.kz_client, path, keep)
+        lock.acquire = functools.partial(lock.acquire, timeout=120)
+        return lock
+
+    def _invalidate_manifest(self, result):
+        """
+        Forget the group's cached configurations after they were changed.
+
+        :return: ``result``
+        """
+        if self.manifest_cache is not None:
+            self.manifest_cache.invalidate((self.tenant_id, self.uuid))
+        return result
+
     def update_status(self, status):
         """
         see :meth:`otter.models.interface.IScalingGroup.update_status`
@@ -840,9 +1089,7 @@ class CassScalingGroup(object):
         @self.with_timestamp
         def _do_update(ts, _):
             return self.connection.execute(
-                _cql_update.format(cf=self.group_table,
-                                   column='status',
-                                   name=':status'),
+                _update_status_query,
                 {'tenantId': self.tenant_id,
                  'groupId': self.uuid,
                  'ts': ts,
@@ -852,9 +1099,7 @@ class CassScalingGroup(object):
         @self.with_timestamp
         def set_deleting(ts, _):
             return self.connection.execute(
-                _cql_update.format(cf=self.group_table,
-                                   column='deleting',
-                                   name=':deleting'),
+                _update_deleting_query,
                 {'tenantId': self.tenant_id,
                  'groupId': self.uuid,
                  'ts': ts,
@@ -908,7 +1153,7 @@ class CassScalingGroup(object):
 
         d = self.view_config()
         d.addCallback(_do_update_config)
-        return d
+        return d.addCallback(self._invalidate_manifest)
 
     def update_launch_config(self, data):
         """
@@ -931,7 +1176,7 @@ class CassScalingGroup(object):
 
         d = self.view_config()
         d.addCallback(_do_update_launch)
-        return d
+        return d.addCallback(self._invalidate_manifest)
 
     def _naive_list_policies(self, limit=None, marker=None):
         """
@@ -1318,12 +1563,13 @@ class CassScalingGroup(object):
                     exc=f.value,
                     otter_msg_type="ignore-delete-lock-error"))
 
-        lock = self.kz_client.Lock(LOCK_PATH + '/' + self.uuid)
-        lock.acquire = functools.partial(lock.acquire, timeout=120)
+        # The lock will be deleted, so it must not be kept leased
+        lock = self._lock(keep=False)
         d = with_lock(self.reactor, lock, _delete_group,
                       log.bind(category='locking', lock_reason='delete_group'),
                       acquire_timeout=150,
                       release_timeout=30)
+        d.addCallback(self._invalidate_manifest)
         # Cleanup /locks/<groupID> znode as it will not be required anymore
         d.addCallback(_delete_lock_znode)
         d.addCallback(lambda _: None)
@@ -1366,18 +1612,26 @@ class CassScalingGroupCollection:
     Also, because deletes are done as tombstones rather than actually deleting,
     deletes are also updates and hence a read must be performed before deletes.
     """
-    def __init__(self, connection, reactor, max_groups):
+    def __init__(self, connection, reactor, max_groups, manifest_cache=None,
+                 lock_leases=None):
         """
         Init
 
         :param CQLClient connection: Silverberg client implementation
         :param reactor: Twisted reactor
         :param int max_groups: Maximum number of groups allowed per tenant
+        :param manifest_cache: :obj:`ManifestCache` shared by the groups got
+            from this collection, if any
+        :param lock_leases: :obj:`LockLeases` of the locks of the groups got
+            from this collection, if they are to be leased
         """
         self.connection = connection
         self.reactor = reactor
         self.max_groups = max_groups
+        self.manifest_cache = manifest_cache
+        self.lock_leases = lock_leases
         self.local_locks = WeakLocks()
+        self.policy_executions = {}
         self.group_table = "scaling_group"
         self.launch_table = "launch_config"
         self.policies_table = "scaling_policies"
@@ -1518,7 +1772,8 @@ class CassScalingGroupCollection:
         """
         return CassScalingGroup(log, tenant_id, scaling_group_id,
                                 self.connection, self.buckets, self.kz_client,
-                                self.reactor, self.local_locks)
+                                self.reactor, self.local_locks,
+                                self.manifest_cache, self.lock_leases)
 
     def fetch_and_delete(self, bucket, now, size=100):
         """
@@ -1541,7 +1796,7 @@ class CassScalingGroupCollection:
             return b.execute(self.connection).addCallback(lambda _: events)
 
         d = self.connection.execute(
-            _cql_fetch_batch_of_events.format(cf=self.event_table),
+            _fetch_batch_of_events_query,
             {"size": size, "now": now, "bucket": bucket}, DEFAULT_CONSISTENCY)
         return d.addCallback(delete_events)
 
@@ -1564,7 +1819,7 @@ class CassScalingGroupCollection:
         see :meth:`IScalingScheduleCollection.get_oldest_event`
         """
         d = self.connection.execute(
-            _cql_oldest_event.format(cf=self.event_table),
+            _oldest_event_query,
             {'bucket': bucket}, ConsistencyLevel.ONE)
         d.addCallback(lambda r: r[0] if len(r) > 0 else None)
         return d
@@ -1574,7 +1829,7 @@ class CassScalingGroupCollection:
         see :meth:`IScalingGroupCollection.webhook_info_by_hash`
         """
         d = self.connection.execute(
-            _cql_find_webhook_token.format(cf=self.webhook_keys_table),
+            _find_webhook_token_query,
             {"webhookKey": capability_hash}, ConsistencyLevel.ONE)
 
         def extract_info(rows):
@@ -1787,13 +2042,19 @@ class CassScalingGroupCollection:
 @implementer(IScalingGroupServersCache)
 class CassScalingGroupServersCache(object):
     """
-    Collection of cache of scaling group servers
+    Collection of cache of scaling group servers. Only the current servers of
+    a group are kept, one row per server, so that updating the cache does not
+    leave a new generation of rows behind.
+
+    Groups whose cache has not been written since ``servers_cache_v2`` was
+    created are read from the old ``servers_cache`` table, which keeps a
+    generation of rows per update, until their cache is next updated.
     """
 
     def __init__(self, tenant_id, group_id, clock=None):
         self.tenantId = tenant_id
         self.groupId = group_id
-        self.table = "servers_cache"
+        self.table = "servers_cache_v2"
         self.params = {"tenantId": self.tenantId, "groupId": self.groupId}
         if clock is None:
             from twisted.internet import reactor
@@ -1806,14 +2067,17 @@ class CassScalingGroupServersCache(object):
         """
         See :method:`IScalingGroupServersCache.get_servers`
         """
-        query = ('SELECT server_blob, server_as_active, last_update FROM {cf} '
-                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId '
-                 'ORDER BY last_update DESC;')
-        rows = yield cql_eff(query.format(cf=self.table), self.params)
+        rows = yield cql_eff(_view_servers_query, self.params)
         if len(rows) == 0:
-            yield do_return(([], None))
+            # Not updated since servers_cache_v2 was created
+            rows = yield cql_eff(_view_old_servers_query, self.params)
+            if len(rows) == 0:
+                yield do_return(([], None))
         last_update = rows[0]['last_update']
+        # servers_cache has a generation of rows per update, latest first
         rows = takewhile(lambda r: r['last_update'] == last_update, rows)
+        # A group without servers has a row with only the static last_update
+        rows = [r for r in rows if r['server_blob'] is not None]
 
         def _dict(r): return json.loads(r['server_blob'])
         rfunc = (
@@ -1825,36 +2089,48 @@ class CassScalingGroupServersCache(object):
     def insert_servers(self, last_update, servers, clear_others):
         """
         See :method:`IScalingGroupServersCache.insert_servers`
+
+        The servers are written without reading the cache first. With
+        ``clear_others``, the group's cache is deleted as of just before the
+        servers are written, which removes the servers that are not given.
         """
-        if len(servers) == 0:
-            return Effect(Constant(None))
-        query = ('INSERT INTO {cf} ("tenantId", "groupId", last_update, '
-                 'server_id, server_blob, server_as_active) '
-                 'VALUES(:tenantId, :groupId, :last_update, :server_id{i}, '
-                 ':server_blob{i}, :server_as_active{i});')
-        params = merge(self.params, {"last_update": last_update})
+        ts = get_client_ts(self.clock)
+        params = merge(self.params, {"last_update": last_update, "ts": ts})
         queries = []
+        if clear_others:
+            params['clear_ts'] = ts - 1
+            queries.append(_clear_servers_query)
+        queries.append(_update_servers_ts_query)
         for i, server in enumerate(servers):
             params['server_id{}'.format(i)] = server['id']
             params['server_as_active{}'.format(i)] = server.pop(
                 '_is_as_active', False)
-            params['server_blob{}'.format(i)] = json.dumps(server)
-            queries.append(query.format(cf=self.table, i=i))
-        if clear_others:
-            return self.delete_servers().on(
-                lambda _: cql_eff(
-                    batch(queries, get_client_ts(self.clock)), params))
-        else:
-            return cql_eff(batch(queries, get_client_ts(self.clock)), params)
+            params['server_blob{}'.format(i)] = json.dumps(server,
+                                                           sort_keys=True)
+            queries.append(_cql_insert_server.format(cf=self.table, i=i))
+        return cql_eff(batch(queries), params)
+
+    def update_time(self, last_update):
+        """
+        See :method:`IScalingGroupServersCache.update_time`
+        """
+        return cql_eff(
+            _update_servers_ts_query,
+            merge(self.params, {"last_update": last_update,
+                                "ts": get_client_ts(self.clock)}))
 
     def delete_servers(self):
         """
         See :method:`IScalingGroupServersCache.delete_servers`
+
+        The servers are also deleted from the old ``servers_cache`` table so
+        that they are not read from there instead.
         """
         query = ('DELETE FROM {cf} USING TIMESTAMP :ts '
-                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId')
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;')
         return cql_eff(
-            query.format(cf=self.table),
+            batch([query.format(cf=cf)
+                   for cf in (self.table, 'servers_cache')]),
             merge(self.params, {"ts": get_client_ts(self.clock)}))
 
 
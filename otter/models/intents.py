@@ -95,6 +95,23 @@ def perform_update_servers_cache(disp, intent):
     return cache.insert_servers(intent.time, intent.servers, True)
 
 
+@attr.s
+class UpdateServersCacheTime(object):
+    """
+    Intent to update only the last update time of the servers cache
+    """
+    tenant_id = attr.ib()
+    group_id = attr.ib()
+    time = attr.ib()
+
+
+@sync_performer
+def perform_update_servers_cache_time(disp, intent):
+    """ Perform :obj:`UpdateServersCacheTime` """
+    cache = CassScalingGroupServersCache(intent.tenant_id, intent.group_id)
+    return cache.update_time(intent.time)
+
+
 @attr.s
 class UpdateGroupErrorReasons(object):
     """
@@ -136,6 +153,7 @@ def get_model_dispatcher(log, store):
         DeleteGroup: partial(perform_delete_group, log, store),
         UpdateGroupStatus: perform_update_group_status,
         UpdateServersCache: perform_update_servers_cache,
+        UpdateServersCacheTime: perform_update_servers_cache_time,
         UpdateGroupErrorReasons: perform_update_error_reasons,
         ModifyGroupStatePaused: perform_modify_group_state_paused,
         GetAllGroups: partial(perform_get_all_groups, store),
@@ -422,6 +422,8 @@ class IScalingGroup(Interface):
             arguments the :class:`IScalingGroup`, a :class:`GroupState`, and
             returns a :class:`GroupState`.  Other arguments provided to
             :func:`modify_state` will be passed to the ``callable``.
+        :param bool with_config: If true, the group config is also passed
+            to the ``callable``, as its ``config`` keyword argument.
 
         :return: a :class:`twisted.internet.defer.Deferred` that fires with None
 
@@ -659,8 +661,17 @@ class IScalingGroupServersCache(Interface):
             field with boolean value to represent if this server has become
             active from autoscale's perpective. This field will be popped
             before storing the blob
-        :param bool clear_others: Should any other cache from a different
-            update_time be deleted?
+        :param bool clear_others: Should any other cached servers not in
+            ``servers`` be removed?
+
+        :return: Effect of None
+        """
+
+    def update_time(last_update):
+        """
+        Update the last update time of the cache without changing its servers
+
+        :param datetime last_update: Update time of the cache
 
         :return: Effect of None
         """
@@ -717,6 +728,10 @@ class IScalingGroupCollection(Interface):
     """
     Collection of scaling groups
     """
+    policy_executions = Attribute(
+        "Policy executions of the groups waiting for their group's lock, to "
+        "be coalesced by :func:`otter.controller.execute_and_trigger`.")
+
     def create_scaling_group(log, tenant_id, config, launch, policies=None):
         """
         Create scaling group based on the tenant id, the configuration
@@ -12,6 +12,7 @@ from otter.rest.otterapp import OtterApp
 from otter.rest.webhooks import OtterExecute
 
 from otter.util.config import config_value
+from otter.util.deadline import Deadline, bind_deadline
 
 Request.defaultContentType = 'application/json'
 
@@ -22,15 +23,33 @@ class Otter(object):
     """
     app = OtterApp()
 
-    def __init__(self, store, region, health_check_function=None, _treq=None):
+    def __init__(self, store, region, health_check_function=None, _treq=None,
+                 clock=None):
         self.store = store
         self.region = region
         self.health_check_function = health_check_function
         self.scheduler = None
         self.treq = _treq
+        self.clock = clock
         # Effect dispatcher for all otter intents
         self.dispatcher = None
 
+    def request_dispatcher(self):
+        """
+        Return the dispatcher to perform a request's effects with. If
+        ``rest.time_budget`` is configured, the effects are bound to a deadline
+        that many seconds from now (see :mod:`otter.util.deadline`).
+        """
+        budget = config_value('rest.time_budget')
+        if budget is None or self.dispatcher is None:
+            return self.dispatcher
+        clock = self.clock
+        if clock is None:  # pragma: no cover
+            from twisted.internet import reactor
+            clock = reactor
+        return bind_deadline(self.dispatcher,
+                             Deadline(clock.seconds() + budget, clock))
+
     @app.route('/', methods=['GET'])
     def base(self, request):
         """
@@ -60,7 +79,7 @@ class Otter(object):
         group routes delegated to OtterGroups.
         """
         return OtterGroups(
-            self.store, tenant_id, self.dispatcher).app.resource()
+            self.store, tenant_id, self.request_dispatcher()).app.resource()
 
     @app.route('/v1.0/execute/<string:cap_version>/<string:cap_hash>/')
     def execute(self, request, cap_version, cap_hash):
@@ -68,7 +87,7 @@ class Otter(object):
         execute route handled by OtterExecute
         """
         return OtterExecute(self.store, cap_version, cap_hash,
-                            self.dispatcher).app.resource()
+                            self.request_dispatcher()).app.resource()
 
     @app.route('/v1.0/<string:tenant_id>/limits')
     def limits(self, request, tenant_id):
@@ -380,13 +380,14 @@ class OtterPolicy(object):
         """
         group = self.store.get_scaling_group(self.log, self.tenant_id,
                                              self.scaling_group_id)
-        d = controller.modify_and_trigger(
+        d = controller.execute_and_trigger(
             self.dispatcher,
             group,
             bound_log_kwargs(self.log),
             partial(controller.maybe_execute_scaling_policy,
                     self.log, transaction_id(request),
                     policy_id=self.policy_id),
+            self.store.policy_executions,
             modify_state_reason='execute_policy')
         d.addCallback(lambda _: "{}")  # Return value TBD
         return d
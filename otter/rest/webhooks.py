@@ -371,13 +371,14 @@ class OtterExecute(object):
             logl[0] = bound_log
             group = self.store.get_scaling_group(bound_log, tenant_id,
                                                  group_id)
-            return controller.modify_and_trigger(
+            return controller.execute_and_trigger(
                 self.dispatcher,
                 group,
                 bound_log_kwargs(bound_log),
                 partial(controller.maybe_execute_scaling_policy,
                         bound_log, transaction_id(request),
                         policy_id=policy_id),
+                self.store.policy_executions,
                 modify_state_reason='execute_webhook')
 
         d.addCallback(execute_policy)
@@ -11,7 +11,8 @@ from twisted.application.service import MultiService
 from twisted.internet import defer
 
 from otter.controller import (
-    CannotExecutePolicyError, maybe_execute_scaling_policy, modify_and_trigger)
+    CannotExecutePolicyError, execute_and_trigger,
+    maybe_execute_scaling_policy)
 from otter.log import log as otter_log
 from otter.log.bound import bound_log_kwargs
 from otter.models.interface import (
@@ -209,13 +210,14 @@ def execute_event(dispatcher, store, log, event, deleted_policy_ids):
                    scheduled_time=event["trigger"].isoformat() + "Z")
     log.msg('sch-exec-pol', cloud_feed=True)
     group = store.get_scaling_group(log, tenant_id, group_id)
-    d = modify_and_trigger(
+    d = execute_and_trigger(
         dispatcher,
         group,
         bound_log_kwargs(log),
         partial(maybe_execute_scaling_policy,
                 log, generate_transaction_id(),
                 policy_id=policy_id, version=event['version']),
+        store.policy_executions,
         modify_state_reason='scheduler.execute_event')
     d.addErrback(ignore_and_log, CannotExecutePolicyError,
                  log, "sch-cannot-exec", cloud_feed=True)
@@ -88,15 +88,25 @@ class SupervisorService(Service, object):
     :ivar str region: The region in which this supervisor is operating.
     :ivar DeferredPool deferred_pool: a pool in which to store deferreds that
         should be waited on
+    :ivar RetryBudgets retry_budgets: Budgets limiting the retries of requests
+        made while executing launch configurations, if any.
+    :ivar ConnectionPools pools: Connection pools to make those requests
+        with, if any.
+    :ivar RateLimiters limiters: Rate limiters to throttle those requests
+        with, if any. They are shared by all the request bags.
     """
     name = "supervisor"
 
-    def __init__(self, authenticator, region, coiterate, service_configs):
+    def __init__(self, authenticator, region, coiterate, service_configs,
+                 retry_budgets=None, pools=None, limiters=None):
         self.authenticator = authenticator
         self.region = region
         self.coiterate = coiterate
         self.deferred_pool = DeferredPool()
         self.service_configs = service_configs
+        self.retry_budgets = retry_budgets
+        self.pools = pools
+        self.limiters = limiters
 
     def _get_request_bag(self, log, scaling_group):
         """
@@ -105,7 +115,9 @@ class SupervisorService(Service, object):
         """
         tenant_id = scaling_group.tenant_id
         dispatcher = get_legacy_dispatcher(reactor, self.authenticator, log,
-                                           self.service_configs)
+                                           self.service_configs,
+                                           self.retry_budgets, self.pools,
+                                           self.limiters)
         lb_region = config_value('regionOverrides.cloudLoadBalancers')
 
         def authenticate():
@@ -30,15 +30,19 @@ from txkazoo.recipe.watchers import watch_children
 from otter.auth import generate_authenticator
 from otter.bobby import BobbyClient
 from otter.constants import (
-    CONVERGENCE_DIRTY_DIR,
+    CONVERGENCE_BUCKETS,
     CONVERGENCE_PARTITIONER_PATH,
     get_service_configs)
-from otter.convergence.service import Converger
+from otter.convergence.service import Converger, dirty_flag_dir
 from otter.effect_dispatcher import get_full_dispatcher
 from otter.log import log
 from otter.log.cloudfeeds import CloudFeedsObserver
 from otter.log.formatters import add_to_fanout
-from otter.models.cass import CassAdmin, CassScalingGroupCollection
+from otter.models.cass import (
+    CassAdmin,
+    CassScalingGroupCollection,
+    MANIFEST_CACHE_SIZE,
+    ManifestCache)
 from otter.rest.admin import OtterAdmin
 from otter.rest.application import Otter
 from otter.rest.bobby import set_bobby
@@ -47,6 +51,10 @@ from otter.supervisor import SupervisorService, set_supervisor
 from otter.util.config import config_value, set_config_data
 from otter.util.cqlbatch import TimingOutCQLClient
 from otter.util.deferredutils import timeout_deferred
+from otter.util.http_pools import ConnectionPools
+from otter.util.lockleases import LockLeases
+from otter.util.ratelimit import RateLimiters
+from otter.util.retry import RetryBudgets
 from otter.util.zkpartitioner import Partitioner
 
 assert os.environ.get("PYRSISTENT_NO_C_EXTENSION"), (
@@ -201,8 +209,12 @@ def makeService(config):
             config_value('cassandra.timeout') or 30),
         log.bind(system='otter.silverberg'))
 
+    lock_lease = config_value('zookeeper.lock_lease')
     store = CassScalingGroupCollection(
-        cassandra_cluster, reactor, config_value('limits.absolute.maxGroups'))
+        cassandra_cluster, reactor, config_value('limits.absolute.maxGroups'),
+        ManifestCache(config_value('cassandra.manifest_cache_size') or
+                      MANIFEST_CACHE_SIZE),
+        LockLeases(reactor, lock_lease) if lock_lease else None)
     admin_store = CassAdmin(cassandra_cluster)
 
     bobby_url = config_value('bobby_url')
@@ -211,9 +223,15 @@ def makeService(config):
 
     service_configs = get_service_configs(config)
 
+    retry_budgets = RetryBudgets(reactor, config_value('retry_budget'))
+    pools = ConnectionPools(
+        reactor, **(config_value('cloud_client.connection_pool') or {}))
+    limiters = RateLimiters(reactor, log)
+
     authenticator = generate_authenticator(reactor, config['identity'])
     supervisor = SupervisorService(authenticator, region, coiterate,
-                                   service_configs)
+                                   service_configs, retry_budgets, pools,
+                                   limiters)
     supervisor.setServiceParent(parent)
 
     set_supervisor(supervisor)
@@ -221,7 +239,9 @@ def makeService(config):
     health_checker = HealthChecker(reactor, {
         'store': getattr(store, 'health_check', None),
         'kazoo': store.kazoo_health_check,
-        'supervisor': supervisor.health_check
+        'supervisor': supervisor.health_check,
+        'http_pools': pools.health_check,
+        'manifest_cache': store.manifest_cache.health_check
     })
 
     # Setup cassandra cluster to disconnect when otter shuts down
@@ -255,7 +275,10 @@ def makeService(config):
             authenticator=generate_authenticator(reactor, id_conf),
             tenant_id=cf_conf['tenant_id'],
             region=region,
-            service_configs=service_configs))
+            service_configs=service_configs,
+            retry_budgets=retry_budgets,
+            pools=pools,
+            limiters=limiters))
 
     # Setup Kazoo client
     if config_value('zookeeper'):
@@ -277,7 +300,8 @@ def makeService(config):
             dispatcher = get_full_dispatcher(reactor, authenticator, log,
                                              get_service_configs(config),
                                              kz_client, store, supervisor,
-                                             cassandra_cluster)
+                                             cassandra_cluster, retry_budgets,
+                                             pools, limiters)
             # Setup scheduler service after starting
             scheduler = setup_scheduler(parent, dispatcher, store, kz_client)
             health_checker.checks['scheduler'] = scheduler.health_check
@@ -310,7 +334,10 @@ def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
                     limited_retry_iterations):
     """
     Create a Converger service, which has a Partitioner as a child service, so
-    that if the Converger is stopped, the partitioner is also stopped.
+    that if the Converger is stopped, the partitioner is also stopped, and
+    watch the dirty flag directory of every bucket.
+
+    :return: Deferred that fires when the directories are watched
     """
     partitioner_factory = partial(
         Partitioner,
@@ -319,11 +346,21 @@ def setup_converger(parent, kz_client, dispatcher, interval, build_timeout,
         partitioner_path=CONVERGENCE_PARTITIONER_PATH,
         time_boundary=15,  # time boundary
     )
-    cvg = Converger(log, dispatcher, 10, partitioner_factory, build_timeout,
-                    interval / 2,
+    cvg = Converger(log, dispatcher, CONVERGENCE_BUCKETS, partitioner_factory,
+                    build_timeout, interval / 2,
                     limited_retry_iterations)
     cvg.setServiceParent(parent)
-    watch_children(kz_client, CONVERGENCE_DIRTY_DIR, cvg.divergent_changed)
+
+    def watch(bucket):
+        # the directory must exist for the watch to be set up
+        path = dirty_flag_dir(bucket)
+        d = kz_client.ensure_path(path)
+        d.addCallback(lambda _: watch_children(
+            kz_client, path, partial(cvg.divergent_changed, bucket)))
+        d.addErrback(log.err, 'watch-divergent-flags-failed', path=path)
+        return d
+
+    return gatherResults(map(watch, range(CONVERGENCE_BUCKETS)))
 
 
 def setup_scheduler(parent, dispatcher, store, kz_client):
@@ -0,0 +1,86 @@
+"""Tests for :mod:`otter.convergence.drain_times`."""
+
+from effect import Effect, sync_perform
+
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.convergence.drain_times import (
+    DrainTimes,
+    GetDrainTimes,
+    StoreDrainTimes,
+    get_drain_times,
+    get_drain_times_dispatcher,
+    store_drain_times)
+
+
+class DrainTimesTests(SynchronousTestCase):
+    """Tests for :obj:`DrainTimes`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.times = DrainTimes(self.clock, 10)
+
+    def test_get_stored(self):
+        """
+        Stored drain times of the given nodes are returned.
+        """
+        self.times.store({('1', 'a'): 5.0, ('1', 'b'): 6.0})
+        self.assertEqual(self.times.get(['1'], [('1', 'a'), ('1', 'c')]),
+                         {('1', 'a'): 5.0})
+
+    def test_forgets_not_draining(self):
+        """
+        Drain times of the listed load balancers' nodes that are no longer
+        draining are forgotten. Other load balancers' nodes are kept.
+        """
+        self.times.store({('1', 'a'): 5.0, ('1', 'b'): 6.0, ('2', 'c'): 7.0})
+        self.assertEqual(self.times.get(['1'], [('1', 'a')]),
+                         {('1', 'a'): 5.0})
+        self.assertEqual(len(self.times), 2)
+        self.assertEqual(self.times.get(['2'], [('2', 'c')]),
+                         {('2', 'c'): 7.0})
+
+    def test_expires(self):
+        """
+        Drain times not read for longer than the TTL are forgotten.
+        """
+        self.times.store({('1', 'a'): 5.0, ('2', 'b'): 6.0})
+        self.clock.advance(10)
+        self.assertEqual(self.times.get([], [('1', 'a')]), {('1', 'a'): 5.0})
+        self.clock.advance(1)
+        self.assertEqual(self.times.get([], [('1', 'a'), ('2', 'b')]),
+                         {('1', 'a'): 5.0})
+        self.assertEqual(len(self.times), 1)
+
+
+class DrainTimesDispatcherTests(SynchronousTestCase):
+    """
+    Tests for :obj:`GetDrainTimes` and :obj:`StoreDrainTimes` performers got
+    from :func:`get_drain_times_dispatcher`.
+    """
+
+    def test_intents(self):
+        """
+        :func:`get_drain_times` and :func:`store_drain_times` return Effects
+        of their intents.
+        """
+        self.assertEqual(get_drain_times(['1'], [('1', 'a')]).intent,
+                         GetDrainTimes(['1'], [('1', 'a')]))
+        self.assertEqual(store_drain_times({('1', 'a'): 2.0}).intent,
+                         StoreDrainTimes({('1', 'a'): 2.0}))
+
+    def test_perform(self):
+        """
+        Drain times stored with :obj:`StoreDrainTimes` are got with
+        :obj:`GetDrainTimes`.
+        """
+        clock = Clock()
+        times = DrainTimes(clock)
+        dispatcher = get_drain_times_dispatcher(clock, times)
+        self.assertIsNone(sync_perform(
+            dispatcher, Effect(StoreDrainTimes({('1', 'a'): 2.0}))))
+        self.assertEqual(
+            sync_perform(dispatcher,
+                         Effect(GetDrainTimes(['1'], [('1', 'a')]))),
+            {('1', 'a'): 2.0})
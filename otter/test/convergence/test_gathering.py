@@ -31,7 +31,9 @@ from otter.cloud_client import (
     service_request
 )
 from otter.constants import ServiceType
+from otter.convergence.drain_times import GetDrainTimes, StoreDrainTimes
 from otter.convergence.gathering import (
+    changes_since_time,
     extract_CLB_drained_at,
     get_all_launch_server_data,
     get_all_launch_stack_data,
@@ -42,7 +44,9 @@ from otter.convergence.gathering import (
     get_rcv3_contents,
     get_scaling_group_servers,
     get_scaling_group_stacks,
-    mark_deleted_servers)
+    mark_deleted_servers,
+    merge_changed_servers,
+    needs_full_resync)
 from otter.convergence.model import (
     CLBDescription,
     CLBNode,
@@ -51,12 +55,14 @@ from otter.convergence.model import (
     RCv3Description,
     RCv3Node,
     ServerState)
+from otter.convergence.snapshot import ReadSnapshot
 from otter.log.intents import Log
 from otter.test.utils import (
     EffectServersCache,
     StubResponse,
     intent_func,
     nested_sequence,
+    noop,
     patch,
     resolve_stubs,
     server,
@@ -64,7 +70,8 @@ from otter.test.utils import (
 )
 from otter.util.fp import assoc_obj
 from otter.util.retry import (
-    Retry, ShouldDelayAndRetry, exponential_backoff_interval, retry_times)
+    FULL_JITTER, Retry, ShouldDelayAndRetry, exponential_backoff_interval,
+    retry_times)
 from otter.util.timestamp import timestamp_to_epoch
 
 
@@ -224,6 +231,33 @@ class GetAllScalingGroupServersTests(SynchronousTestCase):
             result,
             {'a': [as_servers[0], as_servers[3]], 'b': [as_servers[6]]})
 
+    def test_groups_across_pages(self):
+        """
+        Servers of all the pages are filtered and grouped.
+        """
+        servers = [{'metadata': {'rax:auto_scaling_group_id': g}, 'id': i}
+                   for i, g in enumerate('abab')]
+        bodies = [
+            {'servers': servers[:2] + [{'id': 'x'}],
+             'servers_links': [{'href': 'url?limit=100&marker=1',
+                                'rel': 'next'}]},
+            {'servers': servers[2:]}]
+        eff = get_all_scaling_group_servers()
+        next_page = service_request(
+            *(self.req[:-1] + ({'limit': ['100'], 'marker': ['1']},)))
+        sequence = [
+            (service_request(*self.req).intent,
+             lambda i: (StubResponse(200, None), bodies[0])),
+            (Log(mock.ANY, mock.ANY), lambda i: None),
+            (next_page.intent,
+             lambda i: (StubResponse(200, None), bodies[1])),
+            (Log(mock.ANY, mock.ANY), lambda i: None)
+        ]
+        result = perform_sequence(sequence, eff)
+        self.assertEqual(
+            result,
+            {'a': [servers[0], servers[2]], 'b': [servers[1], servers[3]]})
+
 
 class GetScalingGroupServersTests(SynchronousTestCase):
     """
@@ -245,7 +279,10 @@ class GetScalingGroupServersTests(SynchronousTestCase):
                                     {'id': 'b', 'b': 'c'}]
         sequence = [
             (("cachegstidgid", False), lambda i: (object(), None)),
-            (("all-as",), lambda i: {} if empty else {"gid": current})]
+            (ReadSnapshot('tid', 'as-servers', mock.ANY),
+             nested_sequence([
+                 (("all-as",), lambda i: {} if empty else {"gid": current})
+             ]))]
         self.assertEqual(perform_sequence(sequence, self._invoke()), current)
 
     def test_no_cache(self):
@@ -274,13 +311,54 @@ class GetScalingGroupServersTests(SynchronousTestCase):
         last_update = datetime(2010, 5, 20)
         sequence = [
             (("cachegstidgid", False), lambda i: (cache, last_update)),
-            (("alls",), lambda i: current)]
+            (ReadSnapshot('tid', 'servers', mock.ANY),
+             nested_sequence([(("alls",), lambda i: current)]))]
         del_cache_server = deepcopy(cache[1])
         del_cache_server["status"] = "DELETED"
         self.assertEqual(
             self.freeze(perform_sequence(sequence, self._invoke())),
             self.freeze([del_cache_server, cache[-1]] + current[0:2]))
 
+    def test_from_cache_changes_since(self):
+        """
+        If cache is there and a full resync is not due, only the servers
+        changed since the cache was last updated are fetched and merged into
+        the cached servers.
+        """
+        asmetakey = "rax:autoscale:group:id"
+        cache = [
+            {'id': 'a', 'metadata': {asmetakey: "gid"}},  # gets updated
+            {'id': 'b', 'metadata': {asmetakey: "gid"}},  # deleted
+            {'id': 'd', 'metadata': {asmetakey: "gid"}},  # meta removed
+            {'id': 'c', 'metadata': {asmetakey: "gid"}}]  # not changed
+        changed = [
+            {'id': 'a', 'b': 'c', 'metadata': {asmetakey: "gid"}},
+            {'id': 'b', 'status': 'DELETED', 'metadata': {asmetakey: "gid"}},
+            {'id': 'z', 'z': 'w', 'metadata': {asmetakey: "gid"}},  # new
+            {'id': 'd', 'metadata': {"changed": "yes"}}]
+        self.now = datetime(2010, 5, 31, 0, 20, 13)
+        last_update = datetime(2010, 5, 31, 0, 10, 32)
+        since = datetime(2010, 5, 31, 0, 9)
+        sequence = [
+            (("cachegstidgid", False), lambda i: (cache, last_update)),
+            (ReadSnapshot('tid', 'servers-changes-since-2010-05-31T00:09:00',
+                          mock.ANY),
+             nested_sequence([(("alls", since), lambda i: changed)]))]
+        self.assertEqual(
+            self.freeze(perform_sequence(sequence, self._invoke())),
+            self.freeze([cache[-1]] + changed[0:3]))
+
+    def test_merge_changed_servers(self):
+        """
+        :func:`merge_changed_servers` replaces old servers with their changed
+        versions, keeps unchanged old servers and adds new ones.
+        """
+        old = [{'id': 'a', 'a': 1}, {'id': 'b', 'b': 2}]
+        changed = [{'id': 'd', 'd': 3}, {'id': 'b', 'b': 4}]
+        self.assertEqual(
+            self.freeze(merge_changed_servers(old, changed)),
+            self.freeze([old[0]] + changed))
+
     def test_mark_deleted_servers_precedence(self):
         """
         In :func:`mark_deleted_servers`, if old list has common servers with
@@ -316,6 +394,37 @@ class GetScalingGroupServersTests(SynchronousTestCase):
             self.freeze(exp_old))
 
 
+class ChangesSinceTests(SynchronousTestCase):
+    """
+    Tests for :func:`changes_since_time` and :func:`needs_full_resync`.
+    """
+
+    def test_changes_since_time(self):
+        """
+        Changes are fetched from ``overlap`` seconds before last update,
+        rounded down to a multiple of ``overlap``.
+        """
+        self.assertEqual(
+            changes_since_time(datetime(2010, 5, 31, 0, 10, 32, 500), 60),
+            datetime(2010, 5, 31, 0, 9))
+        self.assertEqual(
+            changes_since_time(datetime(2010, 5, 31, 0, 10), 60),
+            datetime(2010, 5, 31, 0, 9))
+
+    def test_needs_full_resync(self):
+        """
+        A full resync is needed when the last update and now fall in
+        different intervals.
+        """
+        last_update = datetime(2010, 5, 31, 0, 59, 50)
+        self.assertFalse(
+            needs_full_resync(datetime(2010, 5, 31, 0, 59, 59), last_update,
+                              3600))
+        self.assertTrue(
+            needs_full_resync(datetime(2010, 5, 31, 1, 0, 1), last_update,
+                              3600))
+
+
 class ExtractDrainedTests(SynchronousTestCase):
     """
     Tests for :func:`otter.convergence.extract_CLB_drained_at`
@@ -364,7 +473,9 @@ def lb_req(url, json_response, response):
             effect=mock.ANY,
             should_retry=ShouldDelayAndRetry(
                 can_retry=retry_times(5),
-                next_interval=exponential_backoff_interval(2))
+                next_interval=exponential_backoff_interval(
+                    2, jitter=FULL_JITTER)),
+            budget=ServiceType.CLOUD_LOAD_BALANCERS
         ),
         nested_sequence([
             (service_request(
@@ -420,8 +531,11 @@ class GetCLBContentsTests(SynchronousTestCase):
                    {'loadBalancers': [{'id': 1}, {'id': 2}]}),
             parallel_sequence([[nodes_req(1, [node11, node12])],
                                [nodes_req(2, [node21, node22])]]),
+            (GetDrainTimes(['1', '2'], [('1', '11'), ('2', '22')]),
+             lambda i: {}),
             parallel_sequence([[node_feed_req(1, '11', '11feed')],
                                [node_feed_req(2, '22', '22feed')]]),
+            (StoreDrainTimes({('1', '11'): 1.0, ('2', '22'): 2.0}), noop),
         ]
         eff = get_clb_contents()
         self.assertEqual(
@@ -431,6 +545,45 @@ class GetCLBContentsTests(SynchronousTestCase):
              CLBNode.from_node_json(2, node21),
              assoc_obj(CLBNode.from_node_json(2, node22), drained_at=2.0)])
 
+    def test_known_drain_times(self):
+        """
+        Feeds are not fetched for the draining nodes whose drain time is
+        already known.
+        """
+        node11 = node('11', 'a11', condition='DRAINING')
+        node22 = node('22', 'a22', weight=None, condition='DRAINING')
+        seq = [
+            lb_req('loadbalancers', True,
+                   {'loadBalancers': [{'id': 1}, {'id': 2}]}),
+            parallel_sequence([[nodes_req(1, [node11])],
+                               [nodes_req(2, [node22])]]),
+            (GetDrainTimes(['1', '2'], [('1', '11'), ('2', '22')]),
+             lambda i: {('1', '11'): 5.0}),
+            parallel_sequence([[node_feed_req(2, '22', '22feed')]]),
+            (StoreDrainTimes({('2', '22'): 2.0}), noop),
+        ]
+        self.assertEqual(
+            perform_sequence(seq, get_clb_contents()),
+            [assoc_obj(CLBNode.from_node_json(1, node11), drained_at=5.0),
+             assoc_obj(CLBNode.from_node_json(2, node22), drained_at=2.0)])
+        self.assertEqual(self.mock_eda.call_count, 1)
+
+    def test_all_drain_times_known(self):
+        """
+        Nothing is fetched or stored if all the drain times are known.
+        """
+        node11 = node('11', 'a11', condition='DRAINING')
+        seq = [
+            lb_req('loadbalancers', True, {'loadBalancers': [{'id': 1}]}),
+            parallel_sequence([[nodes_req(1, [node11])]]),
+            (GetDrainTimes(['1'], [('1', '11')]),
+             lambda i: {('1', '11'): 5.0}),
+            parallel_sequence([]),
+        ]
+        self.assertEqual(
+            perform_sequence(seq, get_clb_contents()),
+            [assoc_obj(CLBNode.from_node_json(1, node11), drained_at=5.0)])
+
     def test_no_lb(self):
         """
         Return empty list if there are no LB
@@ -438,6 +591,7 @@ class GetCLBContentsTests(SynchronousTestCase):
         seq = [
             lb_req('loadbalancers', True, {'loadBalancers': []}),
             parallel_sequence([]),  # No LBs to fetch
+            (GetDrainTimes([], []), lambda i: {}),
             parallel_sequence([]),  # No nodes to fetch
         ]
         eff = get_clb_contents()
@@ -451,6 +605,7 @@ class GetCLBContentsTests(SynchronousTestCase):
             lb_req('loadbalancers', True,
                    {'loadBalancers': [{'id': 1}, {'id': 2}]}),
             parallel_sequence([[nodes_req(1, [])], [nodes_req(2, [])]]),
+            (GetDrainTimes(['1', '2'], []), lambda i: {}),
             parallel_sequence([]),  # No nodes to fetch
         ]
         self.assertEqual(perform_sequence(seq, get_clb_contents()), [])
@@ -464,6 +619,7 @@ class GetCLBContentsTests(SynchronousTestCase):
                    {'loadBalancers': [{'id': 1}, {'id': 2}]}),
             parallel_sequence([[nodes_req(1, [node('11', 'a11')])],
                                [nodes_req(2, [node('21', 'a21')])]]),
+            (GetDrainTimes(['1', '2'], []), lambda i: {}),
             parallel_sequence([])  # No nodes to fetch
         ]
         make_desc = partial(CLBDescription, port=20, weight=2,
@@ -490,6 +646,7 @@ class GetCLBContentsTests(SynchronousTestCase):
                 [lb_req('loadbalancers/2/nodes', True,
                         CLBNotFoundError(lb_id=u'2'))],
             ]),
+            (GetDrainTimes(['1', '2'], []), lambda i: {}),
             parallel_sequence([])  # No nodes to fetch
         ]
         make_desc = partial(CLBDescription, port=20, weight=2,
@@ -515,9 +672,12 @@ class GetCLBContentsTests(SynchronousTestCase):
                                node('12', 'a12')])],
                 [nodes_req(2, [node21])]
             ]),
+            (GetDrainTimes(['1', '2'], [('1', '11'), ('2', '21')]),
+             lambda i: {}),
             parallel_sequence([
                 [node_feed_req(1, '11', CLBNotFoundError(lb_id=u'1'))],
                 [node_feed_req(2, '21', '22feed')]]),
+            (StoreDrainTimes({('2', '21'): 2.0}), noop),
         ]
         eff = get_clb_contents()
         self.assertEqual(
@@ -660,24 +820,35 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
         ]
         self.now = datetime(2010, 10, 20, 03, 30, 00)
 
+    def _invoke(self, servers, clb_nodes, rcv3_nodes):
+        eff = get_all_launch_server_data(
+            'tid',
+            'gid',
+            self.now,
+            get_scaling_group_servers=intent_func('gsgs'),
+            get_clb_contents=intent_func('clb'),
+            get_rcv3_contents=intent_func('rcv3'))
+        sequence = [
+            parallel_sequence([
+                [(('gsgs', 'tid', 'gid', self.now), lambda i: servers)],
+                [(ReadSnapshot('tid', 'clb', mock.ANY),
+                  nested_sequence([(('clb',), lambda i: clb_nodes)]))],
+                [(ReadSnapshot('tid', 'rcv3', mock.ANY),
+                  nested_sequence([(('rcv3',), lambda i: rcv3_nodes)]))]
+            ])
+        ]
+        return perform_sequence(sequence, eff)
+
     def test_success(self):
         """
         The data is returned as a tuple of ([NovaServer], [CLBNode/RCv3Node]).
+        Load balancer contents are read through the tenant's snapshot.
         """
         clb_nodes = [CLBNode(node_id='node1', address='ip1',
                              description=CLBDescription(lb_id='lb1', port=80))]
         rcv3_nodes = [RCv3Node(node_id='node2', cloud_server_id='a',
                                description=RCv3Description(lb_id='lb2'))]
 
-        eff = get_all_launch_server_data(
-            'tid',
-            'gid',
-            self.now,
-            get_scaling_group_servers=_constant_as_eff(
-                ('tid', 'gid', self.now), self.servers),
-            get_clb_contents=_constant_as_eff((), clb_nodes),
-            get_rcv3_contents=_constant_as_eff((), rcv3_nodes))
-
         expected_servers = [
             server('a', ServerState.ACTIVE, servicenet_address='10.0.0.1',
                    links=freeze([{'href': 'link1', 'rel': 'self'}]),
@@ -687,7 +858,7 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
                    links=freeze([{'href': 'link2', 'rel': 'self'}]),
                    json=freeze(self.servers[1]))
         ]
-        self.assertEqual(resolve_stubs(eff),
+        self.assertEqual(self._invoke(self.servers, clb_nodes, rcv3_nodes),
                          {'servers': expected_servers,
                           'lb_nodes': clb_nodes + rcv3_nodes})
 
@@ -696,16 +867,8 @@ class GetAllLaunchServerDataTests(SynchronousTestCase):
         If there are no servers in a group, get_all_launch_server_data includes
         an empty list.
         """
-        eff = get_all_launch_server_data(
-            'tid',
-            'gid',
-            self.now,
-            get_scaling_group_servers=_constant_as_eff(
-                ('tid', 'gid', self.now), []),
-            get_clb_contents=_constant_as_eff((), []),
-            get_rcv3_contents=_constant_as_eff((), []))
-
-        self.assertEqual(resolve_stubs(eff), {'servers': [], 'lb_nodes': []})
+        self.assertEqual(self._invoke([], [], []),
+                         {'servers': [], 'lb_nodes': []})
 
 
 class GetAllStacksTests(SynchronousTestCase):
@@ -5,6 +5,8 @@ from uuid import uuid4
 
 from characteristic import attributes
 
+import mock
+
 from pyrsistent import freeze, pmap, pset
 
 from twisted.trial.unittest import SynchronousTestCase
@@ -20,15 +22,20 @@ from otter.convergence.model import (
     IDrainable,
     ILBDescription,
     ILBNode,
+    LBNodeIndex,
     NovaServer,
     RCv3Description,
+    RCv3Node,
+    ServerJSON,
     ServerState,
     StackState,
     _private_ipv4_addresses,
     _servicenet_address,
     get_service_metadata,
     generate_metadata,
-    group_id_from_metadata
+    group_id_from_metadata,
+    index_lb_nodes,
+    thaw_server_json
 )
 
 
@@ -270,6 +277,72 @@ class CLBNodeTests(SynchronousTestCase):
                         type=CLBNodeType.SECONDARY)))
 
 
+class LBNodeIndexTests(SynchronousTestCase):
+    """
+    Tests for :class:`LBNodeIndex` and :func:`index_lb_nodes`.
+    """
+    def setUp(self):
+        self.clb1 = CLBNode(node_id='1', address='10.1.1.1',
+                            description=CLBDescription(lb_id='1', port=80))
+        self.clb2 = CLBNode(node_id='2', address='10.1.1.1',
+                            description=CLBDescription(lb_id='2', port=80))
+        self.clb3 = CLBNode(node_id='3', address='10.1.1.2',
+                            description=CLBDescription(lb_id='1', port=80))
+        self.rcv3 = RCv3Node(node_id='4', cloud_server_id='a',
+                             description=RCv3Description(lb_id='5'))
+        self.nodes = [self.clb1, self.clb2, self.clb3, self.rcv3]
+
+    def _server(self, server_id, address):
+        return NovaServer(id=server_id, state=ServerState.ACTIVE,
+                          created=0.0, servicenet_address=address,
+                          image_id='image', flavor_id='flavor')
+
+    def test_matching(self):
+        """
+        :func:`LBNodeIndex.matching` returns the same nodes that
+        :func:`ILBNode.matches` the server.
+        """
+        index = LBNodeIndex(self.nodes)
+        for server in [self._server('a', '10.1.1.1'),
+                       self._server('a', '10.1.1.2'),
+                       self._server('b', '10.1.1.1'),
+                       self._server('b', ''),
+                       DummyServer(servicenet_address='10.1.1.1')]:
+            self.assertEqual(
+                sorted(index.matching(server)),
+                sorted(node for node in self.nodes if node.matches(server)))
+
+    def test_other_nodes_use_matches(self):
+        """
+        Nodes that are not :obj:`CLBNode` or :obj:`RCv3Node` are matched
+        using their ``matches`` method.
+        """
+        other = mock.Mock(spec=['matches'])
+        other.matches.side_effect = lambda server: server.id == 'a'
+        index = LBNodeIndex([self.rcv3, other])
+        self.assertEqual(index.matching(self._server('a', '')),
+                         [self.rcv3, other])
+        self.assertEqual(index.matching(self._server('b', '')), [])
+
+    def test_iterable(self):
+        """
+        Iterating over the index gives all the nodes it was built from.
+        """
+        index = LBNodeIndex(iter(self.nodes))
+        self.assertEqual(list(index), self.nodes)
+        self.assertEqual(len(index), 4)
+
+    def test_index_lb_nodes(self):
+        """
+        :func:`index_lb_nodes` returns an index of the nodes, or the index
+        itself if it is given one.
+        """
+        index = index_lb_nodes(self.nodes)
+        self.assertIsInstance(index, LBNodeIndex)
+        self.assertEqual(list(index), self.nodes)
+        self.assertIs(index_lb_nodes(index), index)
+
+
 class ServiceMetadataTests(SynchronousTestCase):
     """
     Tests for :func:`get_service_metadata`.
@@ -619,6 +692,69 @@ class NovaServerTests(SynchronousTestCase):
         self.assertEqual(server.state, ServerState.UNKNOWN_TO_OTTER)
         self.assertEqual(server.json['status'], 'ablrduelh')
 
+    def test_hash(self):
+        """
+        A server created from JSON hashes the same as, and is equal to, the
+        server with the frozen JSON.
+        """
+        server = NovaServer.from_server_details_json(self.servers[0])
+        frozen = NovaServer(id='a',
+                            state=ServerState.ACTIVE,
+                            image_id='valid_image',
+                            flavor_id='valid_flavor',
+                            created=self.createds[0],
+                            servicenet_address='',
+                            links=freeze(self.servers[0]['links']),
+                            json=freeze(self.servers[0]))
+        self.assertEqual(hash(server), hash(frozen))
+        self.assertEqual(len(set([server, frozen])), 1)
+
+
+class ServerJSONTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ServerJSON`
+    """
+
+    def setUp(self):
+        self.raw = {'id': 'a', 'metadata': {'k': 'v'},
+                    'links': [{'href': 'l'}]}
+        self.json = ServerJSON(self.raw)
+
+    def test_mapping(self):
+        """
+        :obj:`ServerJSON` is a mapping of the JSON's keys to frozen values.
+        """
+        self.assertEqual(self.json['metadata'], pmap({'k': 'v'}))
+        self.assertIs(self.json['links'], self.json['links'])
+        self.assertEqual(self.json.get('updated', 'x'), 'x')
+        self.assertEqual(sorted(self.json), ['id', 'links', 'metadata'])
+        self.assertEqual(len(self.json), 3)
+        self.assertIn('id', self.json)
+
+    def test_like_frozen(self):
+        """
+        :obj:`ServerJSON` is equal to and hashes the same as the frozen JSON,
+        and is not equal to different JSON.
+        """
+        frozen = freeze(self.raw)
+        self.assertEqual(self.json, frozen)
+        self.assertEqual(frozen, self.json)
+        self.assertEqual(self.json, ServerJSON(dict(self.raw)))
+        self.assertEqual(hash(self.json), hash(frozen))
+        self.assertNotEqual(self.json, frozen.set('id', 'b'))
+        self.assertNotEqual(self.json, ServerJSON({'id': 'a'}))
+
+    def test_thaw(self):
+        """
+        :func:`thaw_server_json` returns a copy of the JSON for both
+        :obj:`ServerJSON` and :obj:`PMap`.
+        """
+        thawed = thaw_server_json(self.json)
+        self.assertEqual(thawed, self.raw)
+        thawed['metadata']['k'] = 'changed'
+        self.assertEqual(self.raw['metadata']['k'], 'v')
+        self.assertEqual(thaw_server_json(freeze(self.raw)), self.raw)
+
 
 class IPAddressTests(SynchronousTestCase):
     """
@@ -0,0 +1,375 @@
+"""Tests for :mod:`otter.convergence.scheduler`."""
+
+from effect import (
+    ComposedDispatcher, Effect, TypeDispatcher, parallel, sync_perform,
+    sync_performer)
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from txeffect import deferred_performer, perform
+
+from otter.convergence.scheduler import (
+    BackOff,
+    ConvergenceScheduler,
+    RecordDivergence,
+    ScheduleConvergence,
+    get_scheduler_dispatcher,
+    schedule_convergence)
+from otter.log.intents import Log
+from otter.test.utils import test_dispatcher
+
+
+class ConvergenceSchedulerTests(SynchronousTestCase):
+    """Tests for :obj:`ConvergenceScheduler`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2)
+        self.started = []
+
+    def submit(self, tenant_id, key, version=None, created=0):
+        def start(waited):
+            d = Deferred()
+            self.started.append((key, waited, d))
+            return d
+        return self.scheduler.submit(tenant_id, key, start, version, created)
+
+    def finish(self, key, result=None):
+        [d] = [d for k, _, d in self.started if k == key]
+        d.callback(result)
+
+    def started_keys(self):
+        return [key for key, _, _ in self.started]
+
+    def test_runs_immediately(self):
+        """
+        Jobs are started as soon as they are submitted if there is room and
+        their result is returned.
+        """
+        d = self.submit('t1', 'g1')
+        self.assertEqual(self.started_keys(), ['g1'])
+        self.assertEqual(self.scheduler.running, 1)
+        self.assertNoResult(d)
+        self.finish('g1', 'done')
+        self.assertEqual(self.successResultOf(d), 'done')
+        self.assertEqual(self.scheduler.running, 0)
+
+    def test_global_concurrency(self):
+        """
+        At most ``concurrency`` jobs run at the same time. The waiting ones
+        start when running jobs finish, with the time they waited.
+        """
+        for tenant_id, key in [('t1', 'g1'), ('t2', 'g2'), ('t3', 'g3'),
+                               ('t4', 'g4')]:
+            self.submit(tenant_id, key)
+        self.assertEqual(self.started_keys(), ['g1', 'g2', 'g3'])
+        self.assertEqual(self.scheduler.waiting, 1)
+        self.clock.advance(5)
+        self.finish('g2')
+        self.assertEqual(self.started[-1][:2], ('g4', 5))
+        self.assertEqual(self.scheduler.waiting, 0)
+
+    def test_tenant_concurrency(self):
+        """
+        At most ``tenant_concurrency`` jobs of a tenant run at the same time,
+        and other tenants' jobs are run instead.
+        """
+        for key in ['g1', 'g2', 'g3']:
+            self.submit('t1', key)
+        self.submit('t2', 'g4')
+        self.assertEqual(self.started_keys(), ['g1', 'g2', 'g4'])
+        self.finish('g4')
+        self.assertEqual(self.started_keys(), ['g1', 'g2', 'g4'])
+        self.finish('g1')
+        self.assertEqual(self.started_keys(), ['g1', 'g2', 'g4', 'g3'])
+
+    def test_round_robin(self):
+        """
+        Waiting tenants are taken in turn, regardless of how many jobs each of
+        them has waiting.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        for key in ['a1', 'a2', 'a3']:
+            self.submit('ta', key)
+        for key in ['b1', 'b2']:
+            self.submit('tb', key)
+        self.submit('tc', 'c1')
+        for key in ['a1', 'b1', 'c1', 'a2', 'b2']:
+            self.finish(key)
+        self.assertEqual(self.started_keys(),
+                         ['a1', 'b1', 'c1', 'a2', 'b2', 'a3'])
+
+    def test_priority(self):
+        """
+        A tenant's waiting jobs are run in order of largest recorded
+        divergence, preferring scale ups, and then oldest ``created``.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        self.submit('t1', 'running')
+        self.scheduler.record_divergence('down', -5)
+        self.scheduler.record_divergence('up', 5)
+        self.scheduler.record_divergence('small', 1)
+        self.scheduler.record_divergence('converged', 3)
+        self.scheduler.record_divergence('converged', 0)
+        for key, created in [('converged', 1), ('new', 20), ('small', 50),
+                             ('down', 40), ('old', 10), ('up', 30)]:
+            self.submit('t1', key, created=created)
+        for key in ['running', 'up', 'down', 'small', 'converged', 'old']:
+            self.finish(key)
+        self.assertEqual(
+            self.started_keys(),
+            ['running', 'up', 'down', 'small', 'converged', 'old', 'new'])
+
+    def test_retries_last(self):
+        """
+        Jobs with the same version as the last started job of their key are
+        retries, which are run after other jobs, including other tenants'
+        jobs that would otherwise wait for their turn.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        self.submit('t2', 'r', version=1)
+        self.finish('r')
+        self.submit('t1', 'a', version=1)
+        self.submit('t2', 'r', version=1)
+        self.submit('t1', 'b', version=1)
+        self.assertEqual(self.scheduler.priority('r', 1, 0)[0], True)
+        self.assertEqual(self.scheduler.priority('r', 2, 0)[0], False)
+        self.finish('a')
+        self.finish('b')
+        self.assertEqual(self.started_keys(), ['r', 'a', 'b', 'r'])
+
+    def test_drops_duplicate_waiting(self):
+        """
+        A job with the same key as a waiting job is dropped with a result of
+        ``None``. It is not dropped once the job with that key has started.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        self.submit('t1', 'g1')
+        self.submit('t1', 'g2')
+        self.assertIsNone(self.successResultOf(self.submit('t1', 'g2')))
+        self.assertEqual(self.scheduler.waiting, 1)
+        self.assertNoResult(self.submit('t1', 'g1'))
+        self.assertEqual(self.scheduler.waiting, 2)
+
+    def test_duplicate_reprioritizes_waiting(self):
+        """
+        When a job with the same key as a waiting job would run sooner than
+        it, the waiting job takes its version and priority. The waiting job
+        keeps its priority otherwise.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        self.submit('t1', 'r', version=1)
+        self.finish('r')
+        self.submit('t1', 'running')
+        self.submit('t1', 'r', version=1)
+        self.submit('t1', 'g', created=10)
+        self.assertIsNone(
+            self.successResultOf(self.submit('t1', 'r', version=2,
+                                             created=5)))
+        self.assertIsNone(
+            self.successResultOf(self.submit('t1', 'g', created=20)))
+        self.assertEqual(self.scheduler.waiting, 2)
+        self.finish('running')
+        self.assertEqual(self.started_keys(), ['r', 'running', 'r'])
+        [(priority, _, _)] = self.scheduler._waiting['t1']
+        self.assertEqual(priority, (False, 0, 0, 10))
+        self.assertEqual(self.scheduler.priority('r', 2, 0)[0], True)
+
+    def test_back_off(self):
+        """
+        Jobs with the same key and version as a backed off job are dropped
+        until the back off delay passes. The delay doubles every time the
+        same version is backed off, up to ``max_backoff``.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30)
+        for delay in [10, 20, 30, 30]:
+            self.submit('t1', 'g', version=1)
+            self.finish('g')
+            self.scheduler.back_off('g')
+            self.clock.advance(delay - 1)
+            self.assertIsNone(
+                self.successResultOf(self.submit('t1', 'g', version=1)))
+            self.clock.advance(1)
+            self.started = []
+
+    def test_back_off_expected(self):
+        """
+        The back off delay is no longer than the expected time for the job to
+        have something to do.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30)
+        self.submit('t1', 'g', version=1)
+        self.finish('g')
+        self.scheduler.back_off('g', 3)
+        self.clock.advance(3)
+        self.assertNoResult(self.submit('t1', 'g', version=1))
+
+    def test_back_off_new_version(self):
+        """
+        A job with a new version is not dropped even if the key is backed off,
+        and its back off starts over.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30)
+        self.submit('t1', 'g', version=1)
+        self.finish('g')
+        self.scheduler.back_off('g')
+        self.scheduler.back_off('g')
+        self.started = []
+        self.assertNoResult(self.submit('t1', 'g', version=2))
+        self.finish('g')
+        self.scheduler.back_off('g')
+        self.clock.advance(10)
+        self.assertNoResult(self.submit('t1', 'g', version=2))
+
+    def test_no_back_off(self):
+        """
+        Nothing is backed off if ``max_backoff`` is 0 or the job has no
+        version.
+        """
+        self.submit('t1', 'g', version=1)
+        self.finish('g')
+        self.scheduler.back_off('g')
+        self.assertNoResult(self.submit('t1', 'g', version=1))
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30)
+        self.submit('t1', 'h')
+        self.finish('h')
+        self.scheduler.back_off('h')
+        self.assertNoResult(self.submit('t1', 'h'))
+
+    def test_forget_stale(self):
+        """
+        The version, divergence and back off of a key are forgotten when no
+        job has been submitted with it for ``forget_after`` seconds.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30, 100)
+        self.submit('t1', 'g', version=1)
+        self.finish('g')
+        self.scheduler.record_divergence('g', 3)
+        self.scheduler.back_off('g')
+        self.clock.advance(50)
+        self.submit('t1', 'h', version=1)
+        self.clock.advance(50)
+        self.submit('t1', 'i')
+        self.assertEqual(self.scheduler.priority('g', 1, 0), (False, 0, 0, 0))
+        self.assertEqual(self.scheduler.priority('h', 1, 0), (True, 0, 0, 0))
+        self.assertNoResult(self.submit('t1', 'g', version=1))
+
+    def test_forget(self):
+        """
+        ``forget`` forgets the version, divergence and back off of a key.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 3, 2, 10, 30)
+        self.submit('t1', 'g', version=1)
+        self.finish('g')
+        self.scheduler.record_divergence('g', 3)
+        self.scheduler.back_off('g')
+        self.scheduler.forget('g')
+        self.assertEqual(self.scheduler.priority('g', 1, 0), (False, 0, 0, 0))
+        self.assertNoResult(self.submit('t1', 'g', version=1))
+
+    def test_failure(self):
+        """
+        A job's failure is returned and frees its place.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        d = self.scheduler.submit('t1', 'g1',
+                                  lambda w: fail(ValueError('bad')))
+        self.failureResultOf(d, ValueError)
+        self.submit('t1', 'g2')
+        self.assertEqual(self.started_keys(), ['g2'])
+
+    def test_synchronous_jobs(self):
+        """
+        Jobs that finish synchronously start the waiting jobs without
+        recursing for each of them.
+        """
+        self.scheduler = ConvergenceScheduler(self.clock, 1, 1)
+        self.submit('t1', 'first')
+        ds = [self.scheduler.submit('t1', i, lambda w, i=i: succeed(i))
+              for i in range(2000)]
+        self.finish('first')
+        self.assertEqual([self.successResultOf(d) for d in ds], range(2000))
+        self.assertEqual(self.scheduler.running, 0)
+
+
+class SchedulerDispatcherTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ScheduleConvergence` performer got from
+    :func:`get_scheduler_dispatcher`.
+    """
+
+    def test_schedule_convergence(self):
+        """
+        :func:`schedule_convergence` returns Effect of
+        :obj:`ScheduleConvergence`.
+        """
+        eff = Effect('converge')
+        self.assertEqual(schedule_convergence('t', 'g', eff).intent,
+                         ScheduleConvergence('t', 'g', eff))
+        self.assertEqual(
+            schedule_convergence('t', 'g', eff, version=3, created=2).intent,
+            ScheduleConvergence('t', 'g', eff, 3, 2))
+
+    def test_record_divergence(self):
+        """
+        :obj:`RecordDivergence` records the divergence in the scheduler.
+        """
+        clock = Clock()
+        scheduler = ConvergenceScheduler(clock)
+        dispatcher = get_scheduler_dispatcher(clock, scheduler)
+        sync_perform(dispatcher, Effect(RecordDivergence('g', 4)))
+        self.assertEqual(scheduler.priority('g', None, 0), (False, -4, -4, 0))
+
+    def test_back_off(self):
+        """
+        :obj:`BackOff` backs off the job in the scheduler.
+        """
+        clock = Clock()
+        scheduler = ConvergenceScheduler(clock, 1, 1, 10, 30)
+        dispatcher = get_scheduler_dispatcher(clock, scheduler)
+        scheduler.submit('t', 'g', lambda w: None, 1)
+        sync_perform(dispatcher, Effect(BackOff('g', 5)))
+        self.assertIsNone(self.successResultOf(
+            scheduler.submit('t', 'g', lambda w: 1 / 0, 1)))
+        clock.advance(5)
+        self.assertEqual(self.successResultOf(
+            scheduler.submit('t', 'g', lambda w: 'done', 1)), 'done')
+
+    def test_perform(self):
+        """
+        The effect is performed when the scheduler has room for it, after
+        logging the time it waited and the scheduler's load.
+        """
+        clock = Clock()
+        converging = []
+        logs = []
+
+        @deferred_performer
+        def converge(dispatcher, intent):
+            d = Deferred()
+            converging.append(d)
+            return d
+
+        dispatcher = ComposedDispatcher([
+            get_scheduler_dispatcher(clock, ConvergenceScheduler(clock, 1)),
+            TypeDispatcher({
+                str: converge,
+                Log: sync_performer(
+                    lambda d, i: logs.append((i.msg, i.fields)))}),
+            test_dispatcher()])
+        d = perform(dispatcher, parallel([
+            schedule_convergence('t1', 'g1', Effect('converge')),
+            schedule_convergence('t2', 'g2', Effect('converge'))]))
+        self.assertEqual(len(converging), 1)
+        clock.advance(3)
+        converging[0].callback('g1 done')
+        converging[1].callback('g2 done')
+        self.assertEqual(self.successResultOf(d), ['g1 done', 'g2 done'])
+        self.assertEqual(
+            logs,
+            [('converge-scheduled',
+              {'wait_time': 0, 'waiting': 0, 'running': 1}),
+             ('converge-scheduled',
+              {'wait_time': 3, 'waiting': 0, 'running': 1})])
@@ -30,26 +30,39 @@ from otter.convergence.composition import (get_desired_server_group_state,
 from otter.convergence.gathering import (get_all_launch_server_data,
                                          get_all_launch_stack_data)
 from otter.convergence.model import (
-    CLBDescription, CLBNode, ConvergenceIterationStatus, ErrorReason,
-    ServerState, StepResult)
+    CLBDescription, CLBNode, ConvergenceIterationStatus,
+    DesiredStackGroupState, ErrorReason, ServerJSON, ServerState, StepResult)
 from otter.convergence.planning import plan_launch_server, plan_launch_stack
+from otter.convergence.scheduler import (
+    BackOff, RecordDivergence, ScheduleConvergence)
 from otter.convergence.service import (
     ConcurrentError,
     ConvergenceExecutor,
     ConvergenceStarter,
     Converger,
+    ITERATION_BUDGET,
+    capacity_divergence,
     converge_all_groups,
     converge_one_group,
+    dirty_flag_path,
+    estimate_build_time,
     execute_convergence,
+    expected_state_change,
+    get_divergent_flags,
     get_executor,
     get_my_divergent_groups,
     is_autoscale_active,
     launch_server_executor,
     launch_stack_executor,
+    migrate_divergent_flags,
     non_concurrently,
+    plan_fingerprint,
     trigger_convergence,
     update_servers_cache,
-    update_stacks_cache)
+    update_servers_cache_time,
+    update_stacks_cache,
+    update_stacks_cache_time)
+from otter.convergence.snapshot import SnapshotScope
 from otter.convergence.steps import ConvergeLater, CreateServer
 from otter.log.intents import BoundFields, Log, LogErr, MsgWithTime
 from otter.models.intents import (
@@ -57,7 +70,8 @@ from otter.models.intents import (
     GetScalingGroupInfo,
     UpdateGroupErrorReasons,
     UpdateGroupStatus,
-    UpdateServersCache)
+    UpdateServersCache,
+    UpdateServersCacheTime)
 from otter.models.interface import (
     GroupState, NoSuchScalingGroupError, ScalingGroupStatus)
 from otter.test.convergence.test_planning import server
@@ -73,7 +87,11 @@ from otter.test.utils import (
     noop,
     raise_,
     raise_to_exc_info,
+    stack,
     transform_eq)
+from otter.util.config import set_config_data
+from otter.util.deadline import DeadlineScope
+from otter.util.timestamp import epoch_to_utctimestr
 from otter.util.zk import CreateOrSet, DeleteNode, GetChildren, GetStat
 
 
@@ -87,7 +105,8 @@ class TriggerConvergenceTests(SynchronousTestCase):
         Divergent flag is set with bound log and msg is logged
         """
         seq = [
-            (CreateOrSet(path="/groups/divergent/t_g", content="dirty"), noop),
+            (CreateOrSet(path="/groups/divergent-buckets/3/t_g",
+                         content="dirty"), noop),
             (Log("mark-dirty-success", {}), noop)
         ]
         self.assertEqual(
@@ -99,7 +118,8 @@ class TriggerConvergenceTests(SynchronousTestCase):
         If setting divergent flag errors, then error is logged and raised
         """
         seq = [
-            (CreateOrSet(path="/groups/divergent/t_g", content="dirty"),
+            (CreateOrSet(path="/groups/divergent-buckets/3/t_g",
+                         content="dirty"),
              lambda i: raise_(ValueError("oops"))),
             (LogErr(CheckFailureValue(ValueError("oops")),
                     "mark-dirty-failure", {}),
@@ -123,8 +143,9 @@ class ConvergenceStarterTests(SynchronousTestCase):
         self.assertEqual(
             self.successResultOf(d),
             ('my-dispatcher',
-             Effect(CreateOrSet(path='/groups/divergent/tenant_group',
-                                content='dirty'))))
+             Effect(CreateOrSet(
+                 path='/groups/divergent-buckets/9/tenant_group',
+                 content='dirty'))))
         log.msg.assert_called_once_with(
             'mark-dirty-success', tenant_id='tenant', scaling_group_id='group')
 
@@ -172,7 +193,9 @@ class ConvergerTests(SynchronousTestCase):
             (BoundFields(effect=mock.ANY,
                          fields={'otter_service': 'converger',
                                  'converger_run_id': exp_uid}),
-             nested_sequence(intents)),
+             nested_sequence([
+                 (SnapshotScope(mock.ANY, exp_uid), nested_sequence(intents))
+             ])),
         ])
 
     def test_buckets_acquired(self):
@@ -181,21 +204,26 @@ class ConvergerTests(SynchronousTestCase):
         performed.
         """
         def converge_all_groups(currently_converging, recent, waiting,
-                                _my_buckets, all_buckets,
+                                fingerprints, _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
                                 limited_retry_iterations):
             return Effect(
-                ('converge-all', currently_converging, _my_buckets,
-                 all_buckets, divergent_flags, build_timeout, interval,
-                 limited_retry_iterations))
+                ('converge-all', currently_converging, fingerprints,
+                 _my_buckets, all_buckets, divergent_flags, build_timeout,
+                 interval, limited_retry_iterations))
 
         my_buckets = [0, 5]
         bound_sequence = [
-            (GetChildren(CONVERGENCE_DIRTY_DIR),
-                lambda i: ['flag1', 'flag2']),
+            (GetChildren(CONVERGENCE_DIRTY_DIR), lambda i: []),
+            parallel_sequence([
+                [(GetChildren('/groups/divergent-buckets/0'),
+                  lambda i: ['flag1'])],
+                [(GetChildren('/groups/divergent-buckets/5'),
+                  lambda i: ['flag2'])]]),
             (('converge-all',
                 transform_eq(lambda cc: cc is converger.currently_converging,
                              True),
+                transform_eq(lambda fps: fps is converger.fingerprints, True),
                 my_buckets,
                 range(self.num_buckets),
                 ['flag1', 'flag2'],
@@ -218,14 +246,16 @@ class ConvergerTests(SynchronousTestCase):
         logged, and None is the ultimate result.
         """
         def converge_all_groups(currently_converging, recent, waiting,
-                                _my_buckets, all_buckets,
+                                fingerprints, _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
                                 limited_retry_iterations):
             return Effect('converge-all')
 
         bound_sequence = [
-            (GetChildren(CONVERGENCE_DIRTY_DIR),
-                lambda i: ['flag1', 'flag2']),
+            (GetChildren(CONVERGENCE_DIRTY_DIR), lambda i: []),
+            parallel_sequence([
+                [(GetChildren('/groups/divergent-buckets/0'),
+                  lambda i: ['flag1', 'flag2'])]]),
             ('converge-all', lambda i: raise_(RuntimeError('foo'))),
             (LogErr(
                 CheckFailureValue(RuntimeError('foo')),
@@ -240,6 +270,35 @@ class ConvergerTests(SynchronousTestCase):
             result, = self.fake_partitioner.got_buckets([0])
         self.assertEqual(self.successResultOf(result), None)
 
+    def test_buckets_acquired_migration_errors(self):
+        """
+        Errors moving the flags out of the flat directory are logged, and the
+        flags in the buckets' directories are converged anyway.
+        """
+        def converge_all_groups(currently_converging, recent, waiting,
+                                fingerprints, _my_buckets, all_buckets,
+                                divergent_flags, build_timeout, interval,
+                                limited_retry_iterations):
+            return Effect(('converge-all', divergent_flags))
+
+        bound_sequence = [
+            (GetChildren(CONVERGENCE_DIRTY_DIR),
+             lambda i: raise_(RuntimeError('foo'))),
+            (LogErr(
+                CheckFailureValue(RuntimeError('foo')),
+                'migrate-divergent-flags-error', {}), noop),
+            parallel_sequence([
+                [(GetChildren('/groups/divergent-buckets/0'),
+                  lambda i: ['flag1'])]]),
+            (('converge-all', ['flag1']), lambda i: 'foo')
+        ]
+        sequence = self._log_sequence(bound_sequence)
+        self._converger(converge_all_groups, dispatcher=sequence)
+
+        with sequence.consume():
+            result, = self.fake_partitioner.got_buckets([0])
+        self.assertEqual(self.successResultOf(result), 'foo')
+
     def test_divergent_changed_not_acquired(self):
         """
         When notified that divergent groups have changed and we have not
@@ -250,28 +309,29 @@ class ConvergerTests(SynchronousTestCase):
                                     dispatcher=dispatcher)
         # Doesn't try to get buckets
         self.fake_partitioner.get_current_buckets = lambda s: 1 / 0
-        converger.divergent_changed(['group1', 'group2'])
+        converger.divergent_changed(3, ['group1', 'group2'])
 
     def test_divergent_changed_not_ours(self):
         """
-        When notified that divergent groups have changed but they're not ours,
-        nothing is done.
+        When notified that divergent groups of a bucket have changed but the
+        bucket is not ours, or it has no divergent groups, nothing is done.
         """
         dispatcher = SequenceDispatcher([])  # "nothing happens"
         converger = self._converger(lambda *a, **kw: 1 / 0,
                                     dispatcher=dispatcher)
         self.fake_partitioner.current_state = PartitionState.ACQUIRED
-        converger.divergent_changed(['group1', 'group2'])
+        self.fake_partitioner.my_buckets = [3]
+        converger.divergent_changed(2, ['group1', 'group2'])
+        converger.divergent_changed(3, [])
 
     def test_divergent_changed(self):
         """
-        When notified that divergent groups have changed, and one of the groups
-        is associated with a bucket assigned to us, convergence is triggered,
-        and the list of child nodes is passed on to
-        :func:`converge_all_groups`.
+        When notified that divergent groups of a bucket assigned to us have
+        changed, convergence is triggered, and the list of child nodes is
+        passed on to :func:`converge_all_groups`.
         """
         def converge_all_groups(currently_converging, recent, waiting,
-                                _my_buckets, all_buckets,
+                                fingerprints, _my_buckets, all_buckets,
                                 divergent_flags, build_timeout, interval,
                                 limited_retry_iterations):
             return Effect(('converge-all-groups', divergent_flags))
@@ -284,11 +344,10 @@ class ConvergerTests(SynchronousTestCase):
 
         converger = self._converger(converge_all_groups, dispatcher=sequence)
 
-        # sha1('group1') % 10 == 3
         self.fake_partitioner.current_state = PartitionState.ACQUIRED
         self.fake_partitioner.my_buckets = [3]
         with sequence.consume():
-            converger.divergent_changed(['group1', 'group2'])
+            converger.divergent_changed(3, ['group1', 'group2'])
 
 
 def add_to_recently(recently, group_id, cvg_time):
@@ -344,20 +403,30 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         self.group_id = 'g1'
         self.version = 5
         self.waiting = Reference(pmap())
+        self.fingerprints = Reference(pmap())
         self._exec_intent = (
-            'ec', self.tenant_id, self.group_id, 3600, self.waiting, 43)
+            'ec', self.tenant_id, self.group_id, 3600, self.waiting,
+            self.fingerprints, 43)
 
     def _execute_convergence(self, tenant_id, group_id, build_timeout, waiting,
-                             limited_retry_iterations):
+                             fingerprints, limited_retry_iterations):
         return Effect(('ec', tenant_id, group_id, build_timeout, waiting,
-                       limited_retry_iterations))
+                       fingerprints, limited_retry_iterations))
+
+    def _expect_exec(self, iter_status, budget=ITERATION_BUDGET):
+        """
+        Return a sequence item that expects the execute_convergence effect
+        in a time budget, and results in the given values.
+        """
+        return self._expect_exec_with(lambda i: iter_status, budget)
 
-    def _expect_exec(self, iter_status):
+    def _expect_exec_with(self, performer, budget=ITERATION_BUDGET):
         """
-        Return a sequence item that expects the execute_convergence effect,
-        and results in the given values.
+        Return a sequence item that expects the execute_convergence effect
+        in a time budget, and performs it with ``performer``.
         """
-        return (self._exec_intent, lambda i: iter_status)
+        return (DeadlineScope(mock.ANY, budget),
+                nested_sequence([(self._exec_intent, performer)]))
 
     def _verify_sequence(self, sequence, converging=None,
                          recent=None, allow_refs=True):
@@ -369,7 +438,7 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         if recent is None:
             recent = Reference(pmap())
         eff = converge_one_group(
-            converging, recent, self.waiting,
+            converging, recent, self.waiting, self.fingerprints,
             self.tenant_id, self.group_id, self.version,
             3600, 43, execute_convergence=self._execute_convergence)
         fb_dispatcher = _get_dispatcher() if allow_refs else base_dispatcher
@@ -380,7 +449,7 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         if version is None:
             version = self.version
         return [
-            (DeleteNode(path='/groups/divergent/%s_%s' % (tenant, group),
+            (DeleteNode(path=dirty_flag_path(tenant, group),
                         version=version), noop),
             (Log('mark-clean-success', {}), noop)
         ]
@@ -409,7 +478,7 @@ class ConvergeOneGroupTests(SynchronousTestCase):
             remove_from_currently(currently, self.group_id),
         ] + self._clean_divergent()
         eff = converge_one_group(
-            currently, recently, self.waiting,
+            currently, recently, self.waiting, self.fingerprints,
             self.tenant_id, self.group_id, self.version,
             3600, 43, execute_convergence=self._execute_convergence)
         perform_sequence(sequence, eff)
@@ -421,19 +490,36 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         """
         self._verify_sequence([], Reference(pset([self.group_id])))
 
+    def test_configured_budget(self):
+        """
+        The iteration is given the time budget configured in
+        ``converger.iteration_budget``.
+        """
+        set_config_data({'converger': {'iteration_budget': 30}})
+        self.addCleanup(set_config_data, {})
+        sequence = [
+            self._expect_exec(ConvergenceIterationStatus.Stop(), budget=30),
+        ] + self._clean_divergent()
+        self._verify_sequence(sequence)
+
     def test_no_scaling_group(self):
         """
-        When the scaling group disappears, a fatal error is logged and the
-        dirty flag is cleaned up.
+        When the scaling group disappears, a fatal error is logged, the
+        dirty flag is cleaned up and the group's fingerprint is forgotten.
         """
+        self.fingerprints = Reference(pmap({self.group_id: 1, 'g2': 2}))
+        self._exec_intent = self._exec_intent[:5] + (self.fingerprints, 43)
         expected_error = NoSuchScalingGroupError(self.tenant_id, self.group_id)
         sequence = [
-            (self._exec_intent, lambda i: raise_(expected_error)),
+            self._expect_exec_with(lambda i: raise_(expected_error)),
             (LogErr(CheckFailureValue(expected_error),
                     'converge-fatal-error', {}),
              noop),
         ] + self._clean_divergent()
         self._verify_sequence(sequence)
+        self.assertEqual(sync_perform(_get_dispatcher(),
+                                      self.fingerprints.read()),
+                         pmap({'g2': 2}))
 
     def test_unexpected_errors(self):
         """
@@ -446,7 +532,7 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         sequence = [
             (ReadReference(converging), lambda i: pset()),
             add_to_currently(converging, self.group_id),
-            (self._exec_intent, lambda i: raise_(expected_error)),
+            self._expect_exec_with(lambda i: raise_(expected_error)),
             (Func(time.time), lambda i: 100),
             add_to_recently(recent, self.group_id, 100),
             (ModifyReference(converging,
@@ -467,11 +553,11 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         """
         sequence = [
             self._expect_exec(ConvergenceIterationStatus.Stop()),
-            (DeleteNode(path='/groups/divergent/tenant-id_g1',
+            (DeleteNode(path='/groups/divergent-buckets/3/tenant-id_g1',
                         version=self.version),
              lambda i: raise_(BadVersionError())),
             (Log('mark-clean-skipped',
-                 dict(path='/groups/divergent/tenant-id_g1',
+                 dict(path='/groups/divergent-buckets/3/tenant-id_g1',
                       dirty_version=self.version)), noop)
         ]
         self._verify_sequence(sequence)
@@ -483,11 +569,11 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         """
         sequence = [
             self._expect_exec(ConvergenceIterationStatus.Stop()),
-            (DeleteNode(path='/groups/divergent/tenant-id_g1',
+            (DeleteNode(path='/groups/divergent-buckets/3/tenant-id_g1',
                         version=self.version),
              lambda i: raise_(NoNodeError())),
             (Log('mark-clean-not-found',
-                 dict(path='/groups/divergent/tenant-id_g1',
+                 dict(path='/groups/divergent-buckets/3/tenant-id_g1',
                       dirty_version=self.version)), noop)
         ]
         self._verify_sequence(sequence)
@@ -496,12 +582,12 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         """When marking clean raises arbitrary errors, an error is logged."""
         sequence = [
             self._expect_exec(ConvergenceIterationStatus.Stop()),
-            (DeleteNode(path='/groups/divergent/tenant-id_g1',
+            (DeleteNode(path='/groups/divergent-buckets/3/tenant-id_g1',
                         version=self.version),
              lambda i: raise_(ZeroDivisionError())),
             (LogErr(CheckFailureValue(ZeroDivisionError()),
                     'mark-clean-failure',
-                    dict(path='/groups/divergent/tenant-id_g1',
+                    dict(path='/groups/divergent-buckets/3/tenant-id_g1',
                          dirty_version=self.version)), noop)
         ]
         self._verify_sequence(sequence)
@@ -524,7 +610,8 @@ class ConvergeOneGroupTests(SynchronousTestCase):
         """
         sequence = [
             self._expect_exec(ConvergenceIterationStatus.GroupDeleted()),
-            (DeleteNode(path='/groups/divergent/tenant-id_g1', version=-1),
+            (DeleteNode(path='/groups/divergent-buckets/3/tenant-id_g1',
+                        version=-1),
              noop),
             (Log('mark-clean-success', {}), noop),
         ]
@@ -546,18 +633,20 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
         self.currently_converging = Reference(pset())
         self.recently_converged = Reference(pmap())
         self.waiting = Reference(pmap())
+        self.fingerprints = Reference(pmap())
         self.my_buckets = [1, 6]
         self.all_buckets = range(10)
         self.group_infos = [
             {'tenant_id': '00', 'group_id': 'g1',
-             'dirty-flag': '/groups/divergent/00_g1'},
+             'dirty-flag': '/groups/divergent-buckets/6/00_g1'},
             {'tenant_id': '01', 'group_id': 'g2',
-             'dirty-flag': '/groups/divergent/01_g2'}
+             'dirty-flag': '/groups/divergent-buckets/1/01_g2'}
         ]
 
     def _converge_all_groups(self, flags):
         return converge_all_groups(
             self.currently_converging, self.recently_converged, self.waiting,
+            self.fingerprints,
             self.my_buckets, self.all_buckets,
             flags,
             3600,
@@ -567,8 +656,8 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
 
     def _converge_one_group(self,
                             currently_converging, recently_converged, waiting,
-                            tenant_id, group_id, version, build_timeout,
-                            limited_retry_iterations):
+                            fingerprints, tenant_id, group_id, version,
+                            build_timeout, limited_retry_iterations):
         return Effect(
             ('converge', tenant_id, group_id, version, build_timeout,
              limited_retry_iterations))
@@ -582,14 +671,16 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
             BoundFields(mock.ANY,
                         dict(tenant_id=tenant_id, scaling_group_id=group_id)),
             nested_sequence([
-                (GetStat(
-                    path='/groups/divergent/{tenant_id}_{group_id}'.format(
-                        tenant_id=tenant_id, group_id=group_id)),
-                 lambda i: ZNodeStatStub(version=5)),
-                (TenantScope(mock.ANY, tenant_id),
+                (GetStat(path=dirty_flag_path(tenant_id, group_id)),
+                 lambda i: ZNodeStatStub(version=5, ctime=2500)),
+                (ScheduleConvergence(tenant_id, group_id, mock.ANY,
+                                     (2500, 5), 2.5),
                  nested_sequence([
-                     (('converge', tenant_id, group_id, 5, 3600, 23),
-                      lambda i: 'converged {}!'.format(group_id)),
+                     (TenantScope(mock.ANY, tenant_id),
+                      nested_sequence([
+                          (('converge', tenant_id, group_id, 5, 3600, 23),
+                           lambda i: 'converged {}!'.format(group_id)),
+                      ])),
                  ])),
             ]))
 
@@ -683,6 +774,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
 
         result = converge_all_groups(
             self.currently_converging, self.recently_converged, self.waiting,
+            self.fingerprints,
             self.my_buckets, self.all_buckets, [],
             3600, 15, 23, converge_one_group=converge_one_group)
         self.assertEqual(sync_perform(_get_dispatcher(), result), None)
@@ -700,7 +792,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
         def get_bound_sequence(tid, gid):
             # since this GetStat is going to return None, no more effects will
             # be run. This is the crux of what we're testing.
-            znode = '/groups/divergent/{}_{}'.format(tid, gid)
+            znode = dirty_flag_path(tid, gid)
             return [
                 (GetStat(path=znode), noop),
                 (Log('converge-divergent-flag-disappeared',
@@ -719,7 +811,7 @@ class ConvergeAllGroupsTests(SynchronousTestCase):
                 [(BoundFields(mock.ANY, fields={'tenant_id': '00',
                                                 'scaling_group_id': 'g1'}),
                   nested_sequence(get_bound_sequence('00', 'g1')))],
-             ]),
+            ]),
         ]
         self.assertEqual(perform_sequence(sequence, eff), [None])
 
@@ -737,9 +829,77 @@ class GetMyDivergentGroupsTests(SynchronousTestCase):
         self.assertEqual(
             result,
             [{'tenant_id': '00', 'group_id': 'gr1',
-              'dirty-flag': '/groups/divergent/00_gr1'},
+              'dirty-flag': '/groups/divergent-buckets/6/00_gr1'},
              {'tenant_id': '00', 'group_id': 'gr2',
-              'dirty-flag': '/groups/divergent/00_gr2'}])
+              'dirty-flag': '/groups/divergent-buckets/6/00_gr2'}])
+
+
+class DivergentFlagsTests(SynchronousTestCase):
+    """
+    Tests for :func:`dirty_flag_path`, :func:`get_divergent_flags` and
+    :func:`migrate_divergent_flags`.
+    """
+
+    def test_dirty_flag_path(self):
+        """
+        Dirty flags are in the directory of their tenant's bucket.
+        """
+        self.assertEqual(dirty_flag_path('00', 'g1'),
+                         '/groups/divergent-buckets/6/00_g1')
+        self.assertEqual(dirty_flag_path('00', 'g1', 4),
+                         '/groups/divergent-buckets/2/00_g1')
+
+    def test_get_divergent_flags(self):
+        """
+        The flags in the directories of the given buckets are listed, and
+        directories that don't exist have no flags.
+        """
+        sequence = [
+            parallel_sequence([
+                [(GetChildren('/groups/divergent-buckets/1'),
+                  lambda i: ['01_g1', '01_g2'])],
+                [(GetChildren('/groups/divergent-buckets/6'),
+                  lambda i: raise_(NoNodeError()))],
+                [(GetChildren('/groups/divergent-buckets/7'),
+                  lambda i: ['g3'])]])]
+        self.assertEqual(
+            perform_sequence(sequence, get_divergent_flags([1, 6, 7])),
+            ['01_g1', '01_g2', 'g3'])
+
+    def test_migrate(self):
+        """
+        Flags of our buckets in the flat directory are marked in their
+        bucket's directory and then deleted.
+        """
+        sequence = [
+            (GetChildren(CONVERGENCE_DIRTY_DIR),
+             lambda i: ['00_g1', '01_g2', '00_g3']),
+            parallel_sequence([
+                [(CreateOrSet(path='/groups/divergent-buckets/6/00_g1',
+                              content='dirty'), noop),
+                 (DeleteNode(path='/groups/divergent/00_g1', version=-1),
+                  noop)],
+                [(CreateOrSet(path='/groups/divergent-buckets/6/00_g3',
+                              content='dirty'), noop),
+                 (DeleteNode(path='/groups/divergent/00_g3', version=-1),
+                  lambda i: raise_(NoNodeError()))]]),
+            (Log('migrate-divergent-flags', {'flags': ['00_g1', '00_g3']}),
+             noop)]
+        self.assertIsNone(perform_sequence(
+            sequence, migrate_divergent_flags([6], range(10))))
+
+    def test_migrate_nothing(self):
+        """
+        Nothing is done if the flat directory does not exist or has no flags
+        of our buckets.
+        """
+        sequence = [(GetChildren(CONVERGENCE_DIRTY_DIR),
+                     lambda i: raise_(NoNodeError()))]
+        self.assertIsNone(perform_sequence(
+            sequence, migrate_divergent_flags([6], range(10))))
+        sequence = [(GetChildren(CONVERGENCE_DIRTY_DIR), lambda i: ['01_g2'])]
+        self.assertIsNone(perform_sequence(
+            sequence, migrate_divergent_flags([6], range(10))))
 
 
 def _get_dispatcher():
@@ -850,25 +1010,38 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                                       'lb_nodes': self.lb_nodes}
         self.now = datetime(1970, 1, 1)
         self.waiting = Reference(pmap())
+        self.fingerprints = Reference(pmap())
 
-    def get_seq(self, with_cache=True):
+    def get_seq(self, with_cache=True, fingerprints=pmap()):
         exec_seq = [
             (self.gsgi, lambda i: self.gsgi_result),
             (("gacd", self.tenant_id, self.group_id, self.now),
-             self.gacd_runner)
+             self.gacd_runner),
+            (RecordDivergence(self.group_id, mock.ANY), noop)
         ]
-        if with_cache:
-            exec_seq.append(
-                (UpdateServersCache(
-                    self.tenant_id, self.group_id, self.now, self.cache),
-                 noop)
-            )
-        return [
+        seq = [
             (Log("begin-convergence", {}), noop),
             (Func(datetime.utcnow), lambda i: self.now),
             (MsgWithTime("gather-convergence-data", mock.ANY),
-             nested_sequence(exec_seq))
+             nested_sequence(exec_seq)),
+            (ReadReference(self.fingerprints), lambda i: fingerprints)
         ]
+        if with_cache:
+            seq.append(
+                (UpdateServersCache(
+                    self.tenant_id, self.group_id, self.now, self.cache),
+                 noop))
+        return seq
+
+    def store_fingerprint(self):
+        """
+        Return a sequence item that matches storing the group's fingerprint.
+        """
+        return (
+            ModifyReference(
+                self.fingerprints,
+                transform_eq(lambda f: f(pmap()).keys(), [self.group_id])),
+            noop)
 
     def _invoke(self, plan=None, executor_base=launch_server_executor):
         kwargs = {'plan': plan} if plan is not None else {}
@@ -876,7 +1049,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                               gather=intent_func("gacd"), **kwargs)
         return execute_convergence(
             self.tenant_id, self.group_id, build_timeout=3600,
-            waiting=self.waiting,
+            waiting=self.waiting, fingerprints=self.fingerprints,
             limited_retry_iterations=43,
             get_executor=lambda _: executor)
 
@@ -898,7 +1071,8 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                 "tenant-id", "group-id", self.now,
                 [thaw(self.servers[0].json.set('_is_as_active', True)),
                  thaw(self.servers[1].json.set("_is_as_active", True))]),
-             noop)
+             noop),
+            self.store_fingerprint()
         ]
         self.state_active = {
             'a': {'id': 'a', 'links': [{'href': 'link1', 'rel': 'self'}]},
@@ -910,6 +1084,31 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             perform_sequence(self.get_seq() + sequence, self._invoke()),
             ConvergenceIterationStatus.Stop())
 
+    def test_server_json_not_frozen(self):
+        """
+        A convergence iteration does not freeze the whole JSON of the servers
+        (see :obj:`ServerJSON`).
+        """
+        self.lb_nodes = ()
+        for serv in self.servers:
+            serv.desired_lbs = pset()
+            serv.json = ServerJSON(thaw(serv.json))
+        sequence = [
+            parallel_sequence([]),
+            (Log('execute-convergence', mock.ANY), noop),
+            (Log('execute-convergence-results', mock.ANY), noop),
+            clean_waiting(self.waiting, self.group_id),
+            (UpdateServersCache("tenant-id", "group-id", self.now,
+                                self.cache),
+             noop),
+            self.store_fingerprint()
+        ]
+        self.assertEqual(
+            perform_sequence(self.get_seq() + sequence, self._invoke()),
+            ConvergenceIterationStatus.Stop())
+        self.assertEqual([serv.json._hash for serv in self.servers],
+                         [None, None])
+
     def test_success(self):
         """
         Executes the plan and returns SUCCESS when that's the most severe
@@ -1006,6 +1205,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             (Log(msg='execute-convergence-results', fields=expected_fields),
              noop),
             clean_waiting(self.waiting, self.group_id),
+            (BackOff(self.group_id, None), noop),
         ]
 
         self.assertEqual(
@@ -1035,6 +1235,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             ]),
             (Log(msg='execute-convergence-results', fields=mock.ANY), noop),
             clean_waiting(self.waiting, self.group_id),
+            (BackOff(self.group_id, None), noop),
         ]
 
         self.assertEqual(
@@ -1057,6 +1258,8 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             (Log('execute-convergence-results', mock.ANY), noop),
             clean_waiting(self.waiting, self.group_id),
         ]
+        if step_result == StepResult.RETRY:
+            sequence.append((BackOff(self.group_id, None), noop))
         if with_delete:
             sequence.append((DeleteGroup(tenant_id=self.tenant_id,
                                          group_id=self.group_id), noop))
@@ -1104,6 +1307,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             ]),
             (Log('execute-convergence-results', mock.ANY), noop),
             clean_waiting(self.waiting, self.group_id),
+            (BackOff(self.group_id, None), noop),
         ]
         self.assertEqual(
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
@@ -1194,6 +1398,91 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
             ConvergenceIterationStatus.Stop())
 
+    def test_failure_same_error_state(self):
+        """
+        The group's status and error reasons are not written again if the
+        group is already in ERROR state with the same reasons.
+        """
+        self.state.status = ScalingGroupStatus.ERROR
+        self.state.error_reasons = ('Unknown error occurred',)
+        exc_info = raise_to_exc_info(ValueError('wat'))
+
+        def plan(*args, **kwargs):
+            return [TestStep(Effect("fail"))]
+
+        sequence = [
+            parallel_sequence([]),
+            (Log(msg='execute-convergence', fields=mock.ANY), noop),
+            parallel_sequence([
+                [("fail", lambda i: (StepResult.FAILURE,
+                                     [ErrorReason.Exception(exc_info)]))]
+            ]),
+            (Log(msg='execute-convergence-results', fields=mock.ANY), noop),
+            clean_waiting(self.waiting, self.group_id),
+            (Log('group-status-error',
+                 dict(isError=True, cloud_feed=True, status='ERROR',
+                      reasons=['Unknown error occurred'])),
+             noop)
+        ]
+        self.assertEqual(
+            perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
+            ConvergenceIterationStatus.Stop())
+
+    def test_unchanged(self):
+        """
+        If the fingerprint of the planning inputs is the same as the one
+        stored after the group's last iteration, nothing is planned or
+        executed, only the last update time of the servers cache is updated
+        and convergence stops.
+        """
+        dgs = get_desired_server_group_state(self.group_id, self.lc, 2)
+        fingerprint = plan_fingerprint(
+            dgs, self.state,
+            {'servers': self.servers, 'lb_nodes': self.lb_nodes}, 0, [3600])
+        sequence = [
+            (Log('converge-unchanged', {}), noop),
+            (UpdateServersCacheTime(self.tenant_id, self.group_id, self.now),
+             noop)]
+
+        def plan(*args, **kwargs):
+            1 / 0  # This should not be run
+
+        self.assertEqual(
+            perform_sequence(
+                self.get_seq(with_cache=False,
+                             fingerprints=pmap({self.group_id: fingerprint})) +
+                sequence,
+                self._invoke(plan)),
+            ConvergenceIterationStatus.Stop())
+
+    def test_changed_fingerprint_forgotten(self):
+        """
+        If the planning inputs have changed and the iteration has something to
+        do, the fingerprint stored for the group is forgotten.
+        """
+        def plan(*args, **kwargs):
+            return [TestStep(Effect("retry"))]
+
+        sequence = [
+            parallel_sequence([]),
+            (Log('execute-convergence', mock.ANY), noop),
+            parallel_sequence([
+                [("retry", lambda i: (StepResult.RETRY, []))],
+            ]),
+            (Log('execute-convergence-results', mock.ANY), noop),
+            clean_waiting(self.waiting, self.group_id),
+            (BackOff(self.group_id, None), noop),
+            (ModifyReference(self.fingerprints,
+                             match_func(pmap({self.group_id: 1}), pmap())),
+             noop),
+        ]
+        self.assertEqual(
+            perform_sequence(
+                self.get_seq(fingerprints=pmap({self.group_id: 1})) +
+                sequence,
+                self._invoke(plan)),
+            ConvergenceIterationStatus.Continue())
+
     def test_reactivate_group_on_success_after_steps(self):
         """
         When the group started in ERROR state, and convergence succeeds, the
@@ -1252,7 +1541,8 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                 "tenant-id", "group-id", self.now,
                 [thaw(self.servers[0].json.set("_is_as_active", True)),
                  thaw(self.servers[1].json.set("_is_as_active", True))]),
-             noop)
+             noop),
+            self.store_fingerprint()
         ]
         self.state_active = {
             'a': {'id': 'a', 'links': [{'href': 'link1', 'rel': 'self'}]},
@@ -1283,6 +1573,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
             (ModifyReference(self.waiting,
                              match_func(pmap({}), pmap({self.group_id: 1}))),
              dispatch(reference_dispatcher)),
+            (BackOff(self.group_id), noop),
         ]
         # No "waiting" map cleanup!
         self.assertEqual(
@@ -1342,6 +1633,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                              match_func(pmap({self.group_id: 43}),
                                         pmap({self.group_id: 44}))),
              dispatch(reference_dispatcher)),
+            (BackOff(self.group_id), noop),
         ]
         self.assertEqual(
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
@@ -1368,7 +1660,8 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                 "tenant-id", "group-id", self.now,
                 [thaw(self.servers[0].json.set("_is_as_active", True)),
                  thaw(self.servers[1].json.set("_is_as_active", True))]),
-             noop)
+             noop),
+            self.store_fingerprint()
         ]
         self.assertEqual(
             perform_sequence(self.get_seq() + sequence, self._invoke(plan)),
@@ -1401,6 +1694,7 @@ class ExecuteConvergenceTests(SynchronousTestCase):
                              match_func(pmap({self.group_id: 43}),
                                         pmap())),
              dispatch(reference_dispatcher)),
+            self.store_fingerprint()
         ]
         result = perform_sequence(
             self.get_seq(with_cache=False) + seq,
@@ -1408,6 +1702,174 @@ class ExecuteConvergenceTests(SynchronousTestCase):
         self.assertEqual(result, ConvergenceIterationStatus.Stop())
 
 
+class PlanFingerprintTests(SynchronousTestCase):
+    """Tests for :func:`plan_fingerprint`."""
+
+    def setUp(self):
+        self.state = GroupState('t', 'g', 'n', {}, {}, None, {}, False,
+                                ScalingGroupStatus.ACTIVE, desired=1)
+        self.desired = get_desired_server_group_state(
+            'g', {'args': {'server': {'name': 'foo'}}}, 1)
+        clb_desc = CLBDescription(lb_id='23', port=80)
+        self.resources = {
+            'servers': [server('a', ServerState.ACTIVE,
+                               servicenet_address='10.0.0.1')],
+            'lb_nodes': [CLBNode(node_id='1', address='10.0.0.1',
+                                 description=clb_desc)]}
+        self.other_node = CLBNode(node_id='2', address='10.0.0.2',
+                                  description=clb_desc)
+
+    def fingerprint(self, desired=None, state=None, resources=None, now=0,
+                    timeouts=(3600,)):
+        return plan_fingerprint(desired or self.desired, state or self.state,
+                                resources or self.resources, now, timeouts)
+
+    def test_same_inputs(self):
+        """
+        The fingerprint of equal inputs is the same, regardless of the load
+        balancer nodes of other servers and of time within the timeouts.
+        """
+        resources = {
+            'servers': [server('a', ServerState.ACTIVE,
+                               servicenet_address='10.0.0.1')],
+            'lb_nodes': self.resources['lb_nodes'] + [self.other_node]}
+        self.assertEqual(self.fingerprint(), self.fingerprint(now=3599))
+        self.assertEqual(self.fingerprint(),
+                         self.fingerprint(resources=resources))
+        self.assertEqual(self.fingerprint(),
+                         self.fingerprint(timeouts=(3600, 0)))
+
+    def test_changed_inputs(self):
+        """
+        The fingerprint changes when any of the planning inputs change, or
+        when the current time passes a multiple of any of the timeouts.
+        """
+        error = GroupState('t', 'g', 'n', {}, {}, None, {}, False,
+                           ScalingGroupStatus.ERROR, desired=1)
+        building = {
+            'servers': [server('a', ServerState.BUILD,
+                               servicenet_address='10.0.0.1')],
+            'lb_nodes': self.resources['lb_nodes']}
+        fingerprints = [
+            self.fingerprint(),
+            self.fingerprint(desired=get_desired_server_group_state(
+                'g', {'args': {'server': {'name': 'foo'}}}, 2)),
+            self.fingerprint(state=error),
+            self.fingerprint(resources=building),
+            self.fingerprint(resources={
+                'servers': self.resources['servers'],
+                'lb_nodes': []}),
+            self.fingerprint(now=3600),
+            self.fingerprint(now=30, timeouts=(3600, 30))]
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
+
+    def test_server_changes(self):
+        """
+        The fingerprint changes when a server's ``updated`` timestamp or
+        metadata change, and hashing it does not freeze the whole JSON of
+        the servers.
+        """
+        def with_json(**json):
+            serv = server('a', ServerState.ACTIVE,
+                          servicenet_address='10.0.0.1')
+            serv.json = ServerJSON(dict(thaw(serv.json), **json))
+            return serv
+
+        servers = [
+            with_json(updated='2015-01-01T00:00:00Z'),
+            with_json(updated='2015-01-01T00:00:01Z'),
+            with_json(updated='2015-01-01T00:00:01Z', metadata={'a': 'b'})]
+        fingerprints = [
+            self.fingerprint(resources={'servers': [serv]})
+            for serv in servers]
+        self.assertEqual(len(set(fingerprints)), len(fingerprints))
+        self.assertEqual([serv.json._hash for serv in servers],
+                         [None, None, None])
+
+    def test_stacks(self):
+        """
+        The fingerprint of stack groups depends on their stacks.
+        """
+        desired = DesiredStackGroupState(stack_config={}, capacity=1)
+        self.assertNotEqual(
+            self.fingerprint(desired=desired, resources={'stacks': []}),
+            self.fingerprint(desired=desired,
+                             resources={'stacks': [stack('s1')]}))
+
+
+class CapacityDivergenceTests(SynchronousTestCase):
+    """Tests for :func:`capacity_divergence`."""
+
+    def test_servers(self):
+        """
+        Desired capacity is compared with the number of servers that are not
+        deleted.
+        """
+        servers = [server('a', ServerState.ACTIVE),
+                   server('b', ServerState.BUILD),
+                   server('c', ServerState.DELETED)]
+        self.assertEqual(
+            capacity_divergence(5, {'servers': servers, 'lb_nodes': []}), 3)
+        self.assertEqual(capacity_divergence(0, {'servers': servers}), -2)
+
+    def test_stacks(self):
+        """Desired capacity is compared with the number of stacks."""
+        self.assertEqual(capacity_divergence(1, {'stacks': ['s1', 's2']}), -1)
+
+
+class BuildTimeTests(SynchronousTestCase):
+    """
+    Tests for :func:`estimate_build_time` and :func:`expected_state_change`.
+    """
+
+    def _built(self, id, created, built):
+        return server(id, ServerState.ACTIVE, created=created,
+                      json={'id': id, 'status': 'ACTIVE',
+                            'updated': epoch_to_utctimestr(built)})
+
+    def test_estimate_build_time(self):
+        """
+        The estimate is the median build time of the active servers built in
+        the last hour.
+        """
+        servers = [self._built('a', 1000, 1100),
+                   self._built('b', 2000, 2300),
+                   self._built('c', 3000, 3200),
+                   self._built('old', 0, 5000),
+                   server('d', ServerState.BUILD, created=3500),
+                   server('e', ServerState.ACTIVE, created=3000)]
+        self.assertEqual(estimate_build_time(servers, 4000), 200)
+
+    def test_no_estimate(self):
+        """
+        Without any recently built servers there is no estimate.
+        """
+        self.assertIsNone(estimate_build_time(
+            [self._built('old', 0, 100), server('d', ServerState.BUILD)],
+            5000))
+
+    def test_expected_state_change(self):
+        """
+        The state change is expected when the oldest building server is
+        estimated to be built, or right away if it is late.
+        """
+        built = self._built('a', 1000, 1300)
+        servers = [built, server('b', ServerState.BUILD, created=1800),
+                   server('c', ServerState.BUILD, created=1900)]
+        self.assertEqual(expected_state_change(servers, 2000), 100)
+        self.assertEqual(expected_state_change(servers, 2200), 0)
+
+    def test_no_expected_state_change(self):
+        """
+        No state change is expected if there are no building servers or no
+        estimate of building time.
+        """
+        built = self._built('a', 1000, 1300)
+        self.assertIsNone(expected_state_change([built], 2000))
+        self.assertIsNone(expected_state_change(
+            [server('b', ServerState.BUILD, created=1800)], 2000))
+
+
 class IsAutoscaleActiveTests(SynchronousTestCase):
     """Tests for :func:`is_autoscale_active`."""
 
@@ -1498,6 +1960,7 @@ class ConvergenceExecutorTests(SynchronousTestCase):
             'plan': 'p',
             'get_desired_group_state': 'gdgs',
             'update_cache': 'uc',
+            'update_cache_time': 'uct',
         }
         self.lse = launch_server_executor
         self.stack_exec = launch_stack_executor
@@ -1511,6 +1974,7 @@ class ConvergenceExecutorTests(SynchronousTestCase):
             'plan': plan_launch_server,
             'get_desired_group_state': get_desired_server_group_state,
             'update_cache': update_servers_cache,
+            'update_cache_time': update_servers_cache_time,
         }
         self.assertTrue(isinstance(self.lse, ConvergenceExecutor))
         self.assertEqual(attr.asdict(self.lse), attrs)
@@ -1531,6 +1995,7 @@ class ConvergenceExecutorTests(SynchronousTestCase):
             'plan': plan_launch_stack,
             'get_desired_group_state': get_desired_stack_group_state,
             'update_cache': update_stacks_cache,
+            'update_cache_time': update_stacks_cache_time,
         }
         self.assertTrue(isinstance(self.stack_exec, ConvergenceExecutor))
         self.assertEqual(attr.asdict(self.stack_exec), attrs)
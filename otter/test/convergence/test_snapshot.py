@@ -0,0 +1,227 @@
+"""Tests for :mod:`otter.convergence.snapshot`."""
+
+import attr
+
+from effect import (
+    ComposedDispatcher, Effect, TypeDispatcher, parallel, sync_performer)
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from txeffect import deferred_performer, perform
+
+from otter.cloud_client import TenantScope
+from otter.convergence.snapshot import (
+    ReadSnapshot,
+    SnapshotScope,
+    TenantSnapshots,
+    get_snapshot_dispatcher,
+    read_snapshot)
+from otter.test.utils import test_dispatcher
+from otter.util.deadline import (
+    current_deadline, get_deadline_dispatcher, with_deadline)
+from otter.util.deferredutils import TimedOutError
+
+
+@attr.s
+class Fetch(object):
+    """A test intent that is performed with :obj:`Fetcher`."""
+    name = attr.ib()
+
+
+class Fetcher(object):
+    """
+    Records :obj:`Fetch` intents, and the deadline they are performed within,
+    and returns unfired Deferreds for them.
+    """
+    def __init__(self):
+        self.fetches = []
+        self.deadlines = []
+
+    @deferred_performer
+    def __call__(self, dispatcher, intent):
+        d = Deferred()
+        self.fetches.append((intent.name, d))
+        self.deadlines.append(current_deadline(dispatcher))
+        return d
+
+
+class TenantSnapshotsTests(SynchronousTestCase):
+    """Tests for :obj:`TenantSnapshots`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.snapshots = TenantSnapshots(self.clock, 10)
+        self.fetches = []
+
+    def fetch(self):
+        d = Deferred()
+        self.fetches.append(d)
+        return d
+
+    def test_shares_inflight(self):
+        """
+        Snapshots that are being fetched are shared with readers that come in
+        before the fetch finishes.
+        """
+        d1 = self.snapshots.get('k', self.fetch)
+        d2 = self.snapshots.get('k', self.fetch)
+        self.assertEqual(len(self.fetches), 1)
+        self.assertNoResult(d1)
+        self.fetches[0].callback('data')
+        self.assertEqual(self.successResultOf(d1), 'data')
+        self.assertEqual(self.successResultOf(d2), 'data')
+
+    def test_shares_fetched(self):
+        """
+        Snapshots that have been fetched are returned without fetching again.
+        """
+        self.snapshots.get('k', lambda: succeed('data'))
+        d = self.snapshots.get('k', lambda: 1 / 0)
+        self.assertEqual(self.successResultOf(d), 'data')
+
+    def test_different_keys(self):
+        """Snapshots with different keys are fetched separately."""
+        self.snapshots.get('k1', self.fetch)
+        self.snapshots.get('k2', self.fetch)
+        self.assertEqual(len(self.fetches), 2)
+
+    def test_expires(self):
+        """
+        Snapshots older than the TTL are forgotten and fetched again.
+        """
+        self.snapshots.get('k', lambda: succeed('old'))
+        self.clock.advance(10)
+        self.assertEqual(
+            self.successResultOf(self.snapshots.get('k', lambda: 1 / 0)),
+            'old')
+        self.clock.advance(1)
+        d = self.snapshots.get('k', lambda: succeed('new'))
+        self.assertEqual(self.successResultOf(d), 'new')
+        self.assertEqual(len(self.snapshots), 1)
+
+    def test_failure_not_kept(self):
+        """
+        Failed fetches are given to all the readers waiting for them but are
+        not kept for later readers.
+        """
+        d1 = self.snapshots.get('k', self.fetch)
+        d2 = self.snapshots.get('k', self.fetch)
+        self.fetches[0].errback(ValueError('bad'))
+        self.failureResultOf(d1, ValueError)
+        self.failureResultOf(d2, ValueError)
+        self.assertEqual(len(self.snapshots), 0)
+        d = self.snapshots.get('k', lambda: succeed('data'))
+        self.assertEqual(self.successResultOf(d), 'data')
+
+    def test_synchronous_failure_not_kept(self):
+        """
+        A fetch that fails immediately is not kept.
+        """
+        d = self.snapshots.get('k', lambda: fail(ValueError('bad')))
+        self.failureResultOf(d, ValueError)
+        self.assertEqual(len(self.snapshots), 0)
+
+
+class SnapshotDispatcherTests(SynchronousTestCase):
+    """
+    Tests for :obj:`SnapshotScope` and :obj:`ReadSnapshot` performers got from
+    :func:`get_snapshot_dispatcher`.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.fetcher = Fetcher()
+        self.tenants = []
+        self.dispatcher = ComposedDispatcher([
+            get_snapshot_dispatcher(
+                self.clock, TenantSnapshots(self.clock, 10)),
+            get_deadline_dispatcher(self.clock),
+            TypeDispatcher({Fetch: self.fetcher,
+                            TenantScope: self.perform_tenant_scope}),
+            test_dispatcher()])
+
+    @sync_performer
+    def perform_tenant_scope(self, dispatcher, scope):
+        self.tenants.append(scope.tenant_id)
+        return scope.effect
+
+    def _read(self, tenant_id, name):
+        return read_snapshot(tenant_id, name, Effect(Fetch(name)))
+
+    def test_read_snapshot(self):
+        """
+        :func:`read_snapshot` returns Effect of :obj:`ReadSnapshot`.
+        """
+        eff = Effect(Fetch('servers'))
+        self.assertEqual(read_snapshot('t', 'servers', eff).intent,
+                         ReadSnapshot('t', 'servers', eff))
+
+    def test_shared_in_scope(self):
+        """
+        Reads of the same tenant and name within a scope are fetched once and
+        shared, while other tenants and names are fetched separately.
+        """
+        eff = parallel([self._read('t1', 'servers'),
+                        self._read('t1', 'servers'),
+                        self._read('t2', 'servers'),
+                        self._read('t1', 'clb')])
+        d = perform(self.dispatcher, Effect(SnapshotScope(eff, 'run1')))
+        self.assertEqual([name for name, _ in self.fetcher.fetches],
+                         ['servers', 'servers', 'clb'])
+        self.assertEqual(self.tenants, ['t1', 't2', 't1'])
+        for i, (_, fd) in enumerate(self.fetcher.fetches):
+            fd.callback(i)
+        self.assertEqual(self.successResultOf(d), [0, 0, 1, 2])
+
+    def test_fetched_outside_reader_deadline(self):
+        """
+        A snapshot is fetched with the dispatcher of the scope, outside of
+        the deadline of the reader that first reads it.
+        """
+        eff = with_deadline(self._read('t1', 'servers'), 5)
+        perform(self.dispatcher, Effect(SnapshotScope(eff, 'run1')))
+        self.assertEqual(self.fetcher.deadlines, [None])
+        self.assertEqual(self.tenants, ['t1'])
+
+    def test_reader_deadline(self):
+        """
+        Each reader waits for the snapshot within its own deadline, without
+        cancelling the fetch shared with the other readers.
+        """
+        d1, d2 = [
+            perform(self.dispatcher,
+                    Effect(SnapshotScope(
+                        with_deadline(self._read('t1', 'servers'), budget),
+                        'run1')))
+            for budget in (5, 20)]
+        self.clock.advance(5)
+        self.failureResultOf(d1, TimedOutError)
+        self.assertNoResult(d2)
+        (_, fd), = self.fetcher.fetches
+        self.assertFalse(fd.called)
+        fd.callback('servers')
+        self.assertEqual(self.successResultOf(d2), 'servers')
+
+    def test_not_shared_across_scopes(self):
+        """
+        Reads in different scopes are not shared.
+        """
+        for run_id in ('run1', 'run2'):
+            perform(self.dispatcher,
+                    Effect(SnapshotScope(self._read('t1', 'servers'), run_id)))
+        self.assertEqual(len(self.fetcher.fetches), 2)
+
+    def test_unscoped(self):
+        """
+        Outside of a scope, :obj:`ReadSnapshot` just performs its effect every
+        time.
+        """
+        eff = parallel([self._read('t1', 'servers'),
+                        self._read('t1', 'servers')])
+        d = perform(self.dispatcher, eff)
+        self.assertEqual(len(self.fetcher.fetches), 2)
+        for i, (_, fd) in enumerate(self.fetcher.fetches):
+            fd.callback(i)
+        self.assertEqual(self.successResultOf(d), [0, 1])
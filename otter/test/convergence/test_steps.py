@@ -78,7 +78,8 @@ from otter.test.utils import (
 from otter.util.hashkey import generate_server_name
 from otter.util.http import APIError
 from otter.util.retry import (
-    Retry, ShouldDelayAndRetry, exponential_backoff_interval, retry_times)
+    FULL_JITTER, Retry, ShouldDelayAndRetry, exponential_backoff_interval,
+    retry_times)
 
 
 def service_request_error_response(error):
@@ -240,8 +241,11 @@ class DeleteServerTests(SynchronousTestCase):
         self.assertIsInstance(eff.intent, Retry)
         self.assertEqual(
             eff.intent.should_retry,
-            ShouldDelayAndRetry(can_retry=retry_times(3),
-                                next_interval=exponential_backoff_interval(2)))
+            ShouldDelayAndRetry(
+                can_retry=retry_times(3),
+                next_interval=exponential_backoff_interval(
+                    2, jitter=FULL_JITTER)))
+        self.assertEqual(eff.intent.budget, ServiceType.CLOUD_SERVERS)
         self.assertEqual(eff.intent.effect.intent, 'abc123')
 
         self.assertEqual(
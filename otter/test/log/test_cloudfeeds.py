@@ -38,6 +38,7 @@ from otter.test.utils import (
 )
 from otter.util.http import APIError
 from otter.util.retry import (
+    FULL_JITTER,
     Retry,
     ShouldDelayAndRetry,
     exponential_backoff_interval
@@ -248,9 +249,13 @@ class EventTests(SynchronousTestCase):
         seq = [
             (TenantScope(mock.ANY, 'tid'), nested_sequence([
                 retry_sequence(
-                    Retry(effect=svrq, should_retry=ShouldDelayAndRetry(
-                        can_retry=mock.ANY,
-                        next_interval=exponential_backoff_interval(2))),
+                    Retry(
+                        effect=svrq,
+                        should_retry=ShouldDelayAndRetry(
+                            can_retry=mock.ANY,
+                            next_interval=exponential_backoff_interval(
+                                2, jitter=FULL_JITTER)),
+                        budget=ServiceType.CLOUD_FEEDS),
                     response_sequence
                 )
             ]))
@@ -9,7 +9,7 @@ from datetime import datetime
 from functools import partial
 
 from effect import (
-    Constant, Effect, ParallelEffects, TypeDispatcher, sync_perform)
+    Effect, ParallelEffects, TypeDispatcher, sync_perform)
 from effect.testing import perform_sequence, resolve_effect
 
 from jsonschema import ValidationError
@@ -31,7 +31,7 @@ from twisted.internet import defer
 from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
-from txeffect import deferred_performer
+from txeffect import deferred_performer, perform
 
 from otter.json_schema import group_examples
 from otter.models.cass import (
@@ -40,6 +40,7 @@ from otter.models.cass import (
     CassScalingGroup,
     CassScalingGroupCollection,
     CassScalingGroupServersCache,
+    ManifestCache,
     WeakLocks,
     _assemble_webhook_from_row,
     assemble_webhooks_in_policies,
@@ -74,6 +75,8 @@ from otter.test.utils import (
     patch,
     test_dispatcher)
 from otter.util.config import set_config_data
+from otter.util.deadline import Deadline, DeadlineExceeded, bind_deadline
+from otter.util.deferredutils import TimedOutError
 from otter.util.timestamp import from_timestamp
 
 
@@ -144,6 +147,26 @@ class EffectTests(SynchronousTestCase):
         conn.execute.assert_called_once_with(
             'query', {'w': 2}, ConsistencyLevel.ONE)
 
+    def test_perform_cql_query_deadline(self):
+        """
+        `perform_cql_query` does not execute the query after the deadline of
+        the current deadline scope, and times out the query at the deadline.
+        """
+        clock = Clock()
+        conn = mock.Mock(spec=CQLClient)
+        conn.execute.return_value = defer.Deferred()
+        dispatcher = bind_deadline(
+            TypeDispatcher({CQLQueryExecute: partial(perform_cql_query,
+                                                     conn)}),
+            Deadline(5, clock))
+        eff = cql_eff('query')
+        d = perform(dispatcher, eff)
+        clock.advance(5)
+        self.failureResultOf(d, TimedOutError)
+        conn.execute.reset_mock()
+        self.failureResultOf(perform(dispatcher, eff), DeadlineExceeded)
+        self.assertFalse(conn.execute.called)
+
     @mock.patch('otter.models.cass.perform_cql_query')
     def test_cql_disp(self, mock_pcq):
         """
@@ -528,11 +551,11 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         d = self.group.view_state()
         r = self.successResultOf(d)
         expectedCql = (
-            'SELECT "tenantId", "groupId", group_config, launch_config, '
+            'SELECT "tenantId", "groupId", group_config, '
             'active, pending, "groupTouched", "policyTouched", paused, '
             'desired, created_at, status, error_reasons, deleting '
             'FROM scaling_group '
-            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;')
         expectedData = {"tenantId": self.tenant_id, "groupId": self.group_id}
         self.connection.execute.assert_called_once_with(
             expectedCql, expectedData, ConsistencyLevel.QUORUM)
@@ -673,11 +696,11 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         d = self.group.view_state()
         self.failureResultOf(d, NoSuchScalingGroupError)
         viewCql = (
-            'SELECT "tenantId", "groupId", group_config, launch_config, '
+            'SELECT "tenantId", "groupId", group_config, '
             'active, pending, "groupTouched", "policyTouched", paused, '
             'desired, created_at, status, error_reasons, deleting '
             'FROM scaling_group '
-            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
+            'WHERE "tenantId" = :tenantId AND "groupId" = :groupId;')
         delCql = ('DELETE FROM scaling_group '
                   'WHERE "tenantId" = :tenantId AND "groupId" = :groupId')
         expectedData = {"tenantId": self.tenant_id, "groupId": self.group_id}
@@ -735,7 +758,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         state as the first two arguments, and the other args and keyword args
         passed to it.
         """
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
         # calling with a Deferred that never gets callbacked, because we aren't
         # testing the saving portion in this test
         modifier = mock.Mock(return_value=defer.Deferred())
@@ -743,6 +767,46 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         modifier.assert_called_once_with(
             self.group, 'state', 'arg1', kwarg1='1')
 
+    def test_view_state_with_config(self):
+        """
+        ``view_state`` with ``with_config=True`` also returns the group config
+        read along with the state.
+        """
+        self.returns = [[
+            merge(scaling_group_entry,
+                  {'tenantId': self.tenant_id, 'groupId': self.group_id})]]
+        state, config = self.successResultOf(
+            self.group.view_state(with_config=True))
+        self.assertEqual(state.group_name, 'a')
+        self.assertEqual(config, {'name': 'a'})
+        self.assertEqual(self.connection.execute.call_count, 1)
+
+    def test_modify_state_with_config(self):
+        """
+        ``modify_state`` passes the config read with the state to the
+        modifier as its ``config`` argument if ``with_config`` is true, and
+        does not otherwise.
+        """
+        self.group.view_state = mock.Mock(
+            side_effect=lambda *a, **kw: defer.succeed(
+                ('state', {'name': 'a'})))
+        calls = []
+
+        def modifier(group, state, *args, **kwargs):
+            calls.append((state, args, kwargs))
+            raise ValueError('no change')
+
+        self.failureResultOf(
+            self.group.modify_state(modifier, 'arg', with_config=True,
+                                    modify_state_reason='r'),
+            ValueError)
+        self.failureResultOf(self.group.modify_state(modifier, 'arg'),
+                             ValueError)
+        self.assertEqual(calls,
+                         [('state', ('arg',), {'config': {'name': 'a'}}),
+                          ('state', ('arg',), {})])
+        self.assertEqual(self.connection.execute.call_count, 0)
+
     def test_modify_state_propagates_view_state_error(self):
         """
         ``modify_state`` should propagate a :class:`NoSuchScalingGroupError`
@@ -777,12 +841,14 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                      desired=5)
             return group_state
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
         self.clock.advance(10.345)
 
         d = self.group.modify_state(modifier)
         self.assertEqual(self.successResultOf(d), None)
-        self.group.view_state.assert_called_once_with(ConsistencyLevel.QUORUM)
+        self.group.view_state.assert_called_once_with(
+            ConsistencyLevel.QUORUM, with_config=True)
         expectedCql = (
             'INSERT INTO scaling_group("tenantId", "groupId", active, '
             'pending, "groupTouched", "policyTouched", paused, desired) '
@@ -802,6 +868,27 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         self.lock._acquire.assert_called_once_with(timeout=120)
         self.lock.release.assert_called_once_with()
 
+    def test_modify_state_lock_leases(self):
+        """
+        ``modify_state`` takes the group's lock from the group's lock leases
+        if it has any, and keeps it leased.
+        """
+        leases = mock.Mock(spec=['lock'])
+        leases.lock.return_value = self.lock
+        self.group.lock_leases = leases
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
+
+        def modifier(group, state):
+            raise ValueError('no change')
+
+        self.failureResultOf(self.group.modify_state(modifier), ValueError)
+        leases.lock.assert_called_once_with(
+            self.kz_client, '/locks/' + self.group.uuid, True)
+        self.assertFalse(self.kz_client.Lock.called)
+        self.lock._acquire.assert_called_once_with(timeout=120)
+        self.lock.release.assert_called_once_with()
+
     def test_modify_state_local_lock_before_kz_lock(self):
         """
         ``modify_state`` first acquires local lock then acquires kz lock
@@ -819,7 +906,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                      desired=5)
             return group_state
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
         # setup local lock
         llock = defer.DeferredLock()
         self.group.local_locks = mock.Mock(
@@ -863,7 +951,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         def modifier(group, state):
             raise
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
 
         d = self.group.modify_state(modifier)
         self.failureResultOf(d, ValueError)
@@ -890,7 +979,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                      paused=True)
             return group_state
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
         self.returns = [None, None]
         log = self.group.log = mock.Mock()
 
@@ -910,7 +1000,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         def modifier(group, state):
             raise NoSuchScalingGroupError(self.tenant_id, self.group_id)
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -935,7 +1026,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                      paused=True)
             return group_state
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -960,7 +1052,8 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
                                      paused=True)
             return group_state
 
-        self.group.view_state = mock.Mock(return_value=defer.succeed('state'))
+        self.group.view_state = mock.Mock(
+            return_value=defer.succeed(('state', {})))
 
         d = self.group.modify_state(modifier)
         f = self.failureResultOf(d)
@@ -1951,6 +2044,25 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
         # locks znode is not deleted
         self.assertFalse(self.kz_client.delete.called)
 
+    @mock.patch('otter.models.cass.CassScalingGroup.view_state')
+    def test_delete_group_lock_leases(self, mock_view_state):
+        """
+        ``delete_group`` takes the group's lock from the group's lock leases
+        if it has any, without keeping it leased.
+        """
+        leases = mock.Mock(spec=['lock'])
+        leases.lock.return_value = self.lock
+        self.group.lock_leases = leases
+        mock_view_state.return_value = defer.succeed(GroupState(
+            self.tenant_id, self.group_id, '', {'1': {}}, {}, None, {}, False,
+            ScalingGroupStatus.ACTIVE))
+        self.failureResultOf(self.group.delete_group(), GroupNotEmptyError)
+        leases.lock.assert_called_once_with(
+            self.kz_client, '/locks/' + self.group.uuid, False)
+        self.assertFalse(self.kz_client.Lock.called)
+        self.lock._acquire.assert_called_once_with(timeout=120)
+        self.lock.release.assert_called_once_with()
+
     @mock.patch('otter.models.cass.CassScalingGroup.view_state')
     @mock.patch('otter.models.cass.CassScalingGroup._naive_list_all_webhooks')
     def test_delete_non_empty_scaling_deleting_group_succeeds(
@@ -2009,7 +2121,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             'DELETE FROM policy_webhooks '
             'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
 
-            'DELETE FROM servers_cache '
+            'DELETE FROM servers_cache_v2 '
             'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
 
             'DELETE FROM scaling_group USING TIMESTAMP :ts '
@@ -2059,7 +2171,7 @@ class CassScalingGroupTests(CassScalingGroupTestCase):
             'DELETE FROM policy_webhooks '
             'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
 
-            'DELETE FROM servers_cache '
+            'DELETE FROM servers_cache_v2 '
             'WHERE "tenantId" = :tenantId AND "groupId" = :groupId '
 
             'DELETE FROM scaling_group USING TIMESTAMP :ts '
@@ -2457,6 +2569,169 @@ class ViewManifestTests(CassScalingGroupTestCase):
         self.assertFalse(self.group._naive_list_policies.called)
 
 
+class ManifestCacheTests(SynchronousTestCase):
+    """
+    Tests for :class:`ManifestCache`
+    """
+
+    def setUp(self):
+        self.cache = ManifestCache(2)
+
+    def test_get(self):
+        """
+        Configs are returned if they are of the given version, and reading
+        them counts as a hit. Storing them counts as a miss.
+        """
+        self.assertIsNone(self.cache.get('k', 1))
+        self.cache.put('k', 1, ('g', 'l'))
+        self.assertEqual(self.cache.get('k', 1), ('g', 'l'))
+        self.assertIsNone(self.cache.get('k', 2))
+        self.assertEqual(
+            self.cache.stats(),
+            {'size': 1, 'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+
+    def test_stats_before_reads(self):
+        """
+        The hit rate is ``None`` before anything is read.
+        """
+        self.assertEqual(
+            self.cache.health_check(),
+            (True, {'size': 0, 'hits': 0, 'misses': 0, 'hit_rate': None}))
+
+    def test_bounded(self):
+        """
+        The least recently used key is dropped when there are more than
+        ``max_size`` keys.
+        """
+        self.cache.put('a', 1, 'ca')
+        self.cache.put('b', 1, 'cb')
+        self.cache.get('a', 1)
+        self.cache.put('c', 1, 'cc')
+        self.assertIn('a', self.cache)
+        self.assertNotIn('b', self.cache)
+        self.assertIn('c', self.cache)
+
+    def test_invalidate(self):
+        """
+        Invalidated keys are forgotten.
+        """
+        self.cache.put('a', 1, 'ca')
+        self.cache.invalidate('a')
+        self.cache.invalidate('b')
+        self.assertNotIn('a', self.cache)
+
+
+class CachedViewTests(CassScalingGroupTestCase):
+    """
+    Tests for viewing a group with a :class:`ManifestCache`
+    """
+
+    def setUp(self):
+        """
+        Mock verified view to return the full row or the state columns
+        depending on the query
+        """
+        super(CachedViewTests, self).setUp()
+        self.group.manifest_cache = self.cache = ManifestCache()
+        self.row = {
+            'tenantId': self.tenant_id,
+            'groupId': self.group_id,
+            'group_config': serialize_json_data(self.config, 1.0),
+            'launch_config': serialize_json_data(self.launch_config, 1.0),
+            'active': '{}',
+            'pending': '{}',
+            'groupTouched': None,
+            'policyTouched': '{}',
+            'paused': False,
+            'desired': 0,
+            'created_at': 23,
+            'deleting': False,
+            'status': 'ACTIVE',
+            'error_reasons': None,
+            'group_config_ts': 1,
+            'launch_config_ts': 2
+        }
+        self.queries = []
+
+        def verified_view(conn, query, *args):
+            self.queries.append(query)
+            if 'group_config,' in query:
+                return defer.succeed(self.row)
+            return defer.succeed(
+                {k: v for k, v in self.row.items()
+                 if k not in ('group_config', 'launch_config')})
+
+        patch(self, 'otter.models.cass.verified_view',
+              side_effect=verified_view)
+
+    def view(self):
+        return self.successResultOf(
+            self.group.view_manifest(with_policies=False))
+
+    def test_miss_then_hit(self):
+        """
+        The configs are read from Cassandra the first time, and then only the
+        state and configs' write times are read.
+        """
+        manifest = self.view()
+        self.assertEqual(manifest['groupConfiguration'], self.config)
+        self.assertEqual(manifest['launchConfiguration'], self.launch_config)
+        self.assertEqual(self.view(), manifest)
+        self.assertIn('launch_config, active', self.queries[0])
+        self.assertIn('writetime(launch_config)', self.queries[0])
+        self.assertNotIn('launch_config,', self.queries[1])
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_stale(self):
+        """
+        The configs are read again when their write time changed.
+        """
+        self.view()
+        self.row['launch_config_ts'] = 3
+        self.row['launch_config'] = serialize_json_data({'new': 'lc'}, 1.0)
+        self.assertEqual(self.view()['launchConfiguration'], {'new': 'lc'})
+        self.assertEqual(len(self.queries), 3)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.view()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_configs_not_shared(self):
+        """
+        Changing a returned config does not change the cached one.
+        """
+        self.view()['groupConfiguration']['minEntities'] = 100
+        self.assertEqual(self.view()['groupConfiguration'], self.config)
+
+    def test_view_config(self):
+        """
+        ``view_config`` and ``view_launch_config`` take the configs from the
+        cache, and fail for deleting groups.
+        """
+        self.assertEqual(self.successResultOf(self.group.view_config()),
+                         self.config)
+        self.assertEqual(
+            self.successResultOf(self.group.view_launch_config()),
+            self.launch_config)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.row['deleting'] = True
+        self.failureResultOf(self.group.view_config(),
+                             NoSuchScalingGroupError)
+
+    def test_update_config_invalidates(self):
+        """
+        ``update_config`` and ``update_launch_config`` forget the cached
+        configs once they are written.
+        """
+        for update in (self.group.update_config,
+                       self.group.update_launch_config):
+            self.view()
+            self.assertIn((self.tenant_id, self.group_id), self.cache)
+            self.returns = [None]
+            self.successResultOf(update({}))
+            self.assertNotIn((self.tenant_id, self.group_id), self.cache)
+
+
 class CassScalingGroupUpdatePolicyTests(CassScalingGroupTestCase):
     """
     Tests for `ScalingGroup.update_policy`
@@ -3557,6 +3832,23 @@ class CassScalingGroupsCollectionTestCase(IScalingGroupCollectionProviderMixin,
         self.assertEqual(g.uuid, '12345678')
         self.assertEqual(g.tenant_id, '123')
         self.assertIs(g.local_locks, self.collection.local_locks)
+        self.assertIsNone(g.manifest_cache)
+
+    def test_get_scaling_group_manifest_cache(self):
+        """
+        The collection's manifest cache is passed to the groups it gets.
+        """
+        self.collection.manifest_cache = ManifestCache()
+        g = self.collection.get_scaling_group(self.mock_log, '123', '1')
+        self.assertIs(g.manifest_cache, self.collection.manifest_cache)
+
+    def test_get_scaling_group_lock_leases(self):
+        """
+        The collection's lock leases are passed to the groups it gets.
+        """
+        self.collection.lock_leases = object()
+        g = self.collection.get_scaling_group(self.mock_log, '123', '1')
+        self.assertIs(g.lock_leases, self.collection.lock_leases)
 
     def test_webhook_info_by_hash(self):
         """
@@ -3738,15 +4030,25 @@ class CassGroupServersCacheTests(SynchronousTestCase):
             self.tenant_id, self.group_id, self.clock)
         self.dt = datetime(2010, 10, 20, 10, 0, 0)
 
-    def _test_get_servers(self, only_as_active, query_result, exp_result):
+    def _test_get_servers(self, only_as_active, query_result, exp_result,
+                          old_result=None):
         sequence = [
             (CQLQueryExecute(
                 query=('SELECT server_blob, server_as_active, last_update '
-                       'FROM servers_cache '
-                       'WHERE "tenantId"=:tenantId AND "groupId"=:groupId '
-                       'ORDER BY last_update DESC;'),
+                       'FROM servers_cache_v2 '
+                       'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'),
                 params=self.params, consistency_level=ConsistencyLevel.QUORUM),
              lambda i: query_result)]
+        if old_result is not None:
+            sequence.append(
+                (CQLQueryExecute(
+                    query=('SELECT server_blob, server_as_active, last_update '
+                           'FROM servers_cache WHERE "tenantId"=:tenantId '
+                           'AND "groupId"=:groupId ORDER BY last_update '
+                           'DESC;'),
+                    params=self.params,
+                    consistency_level=ConsistencyLevel.QUORUM),
+                 lambda i: old_result))
         self.assertEqual(
             perform_sequence(sequence, self.cache.get_servers(only_as_active),
                              test_dispatcher(sequence)),
@@ -3754,15 +4056,26 @@ class CassGroupServersCacheTests(SynchronousTestCase):
 
     def test_get_servers_empty(self):
         """
-        `get_servers` returns ([], None) if cache is empty
+        `get_servers` returns ([], None) if cache is empty in both the
+        servers_cache_v2 and the old servers_cache tables
+        """
+        self._test_get_servers(True, [], ([], None), [])
+        self._test_get_servers(False, [], ([], None), [])
+
+    def test_get_servers_no_servers(self):
+        """
+        `get_servers` returns no servers with the last update time if the
+        cache has been updated without servers
         """
-        self._test_get_servers(True, [], ([], None))
-        self._test_get_servers(False, [], ([], None))
+        self._test_get_servers(
+            False,
+            [{"server_blob": None, "last_update": self.dt,
+              "server_as_active": None}],
+            ([], self.dt))
 
     def test_get_servers_all(self):
         """
-        `get_servers` fetches all servers that have highest last_fetch
-        time
+        `get_servers` fetches all servers
         """
         self._test_get_servers(
             False,
@@ -3776,8 +4089,7 @@ class CassGroupServersCacheTests(SynchronousTestCase):
 
     def test_get_servers_as_active(self):
         """
-        `get_servers` fetches only AS active servers that have highest
-        last_fetch time
+        `get_servers` fetches only AS active servers
         """
         self._test_get_servers(
             True,
@@ -3787,89 +4099,105 @@ class CassGroupServersCacheTests(SynchronousTestCase):
               "server_as_active": False}],
             ([{"a": "b"}], self.dt))
 
-    def test_get_servers_diff_last_update(self):
+    def test_get_servers_old_cache(self):
+        """
+        `get_servers` reads the latest servers from the old servers_cache
+        table if the group has no rows in servers_cache_v2
+        """
+        old_dt = datetime(2010, 10, 20, 9, 0, 0)
+        old_rows = [
+            {"server_blob": '{"a": "b"}', "last_update": self.dt,
+             "server_as_active": True},
+            {"server_blob": '{"d": "e"}', "last_update": self.dt,
+             "server_as_active": False},
+            {"server_blob": '{"f": "g"}', "last_update": old_dt,
+             "server_as_active": True}]
+        self._test_get_servers(False, [], ([{"a": "b"}, {"d": "e"}], self.dt),
+                               old_rows)
+        self._test_get_servers(True, [], ([{"a": "b"}], self.dt), old_rows)
+
+    def _test_insert_servers(self, servers, clear_others, queries, params):
+        clear = ('DELETE FROM servers_cache_v2 USING TIMESTAMP :clear_ts '
+                 'WHERE "tenantId"=:tenantId AND "groupId"=:groupId; ')
+        update = (
+            'UPDATE servers_cache_v2 USING TIMESTAMP :ts '
+            'SET last_update=:last_update '
+            'WHERE "tenantId"=:tenantId AND "groupId"=:groupId; ')
+        query = 'BEGIN BATCH {}{}{}APPLY BATCH;'.format(
+            clear if clear_others else '', update,
+            ''.join(q + ' ' for q in queries))
+        params = merge(self.params, {"last_update": self.dt, "ts": 2500000},
+                       params)
+        if clear_others:
+            params['clear_ts'] = 2499999
+        self.assertEqual(
+            self.cache.insert_servers(self.dt, servers, clear_others),
+            cql_eff(query, params))
+
+    def _insert(self, i):
+        return ('INSERT INTO servers_cache_v2 ("tenantId", "groupId", '
+                'server_id, server_blob, server_as_active) '
+                'VALUES(:tenantId, :groupId, :server_id{i}, '
+                ':server_blob{i}, :server_as_active{i}) '
+                'USING TIMESTAMP :ts;').format(i=i)
+
+    def test_insert_servers(self):
         """
-        `get_servers` will return servers with only latest last_update time
-        if there are multiple caches
+        `insert_servers` issues query to insert servers as json blobs with
+        sorted keys, and updates the last update time, without reading the
+        cache first
         """
-        dt_earlier = datetime(2010, 10, 15, 10, 0, 0)
-        self._test_get_servers(
-            False,
-            [{"server_blob": '{"a": "b"}', "last_update": self.dt,
-              "server_as_active": False},
-             {"server_blob": '{"d": "e"}', "last_update": self.dt,
-              "server_as_active": False},
-             {"server_blob": '{"c": "f"}', "last_update": dt_earlier,
-              "server_as_active": False}],
-            ([{"a": "b"}, {"d": "e"}], self.dt))
-        # Test with only_as_active as True
-        self._test_get_servers(
-            True,
-            [{"server_blob": '{"a": "b"}', "last_update": self.dt,
-              "server_as_active": False},
-             {"server_blob": '{"d": "e"}', "last_update": self.dt,
-              "server_as_active": True},
-             {"server_blob": '{"c": "f"}', "last_update": dt_earlier,
-              "server_as_active": True}],
-            ([{"d": "e"}], self.dt))
-
-    def _test_insert_servers(self, eff, ts=2500000):
-        query = (
-            'BEGIN BATCH USING TIMESTAMP {} '
-            'INSERT INTO servers_cache ("tenantId", "groupId", last_update, '
-            'server_id, server_blob, server_as_active) '
-            'VALUES(:tenantId, :groupId, :last_update, :server_id0, '
-            ':server_blob0, :server_as_active0); '
-            'INSERT INTO servers_cache ("tenantId", "groupId", last_update, '
-            'server_id, server_blob, server_as_active) '
-            'VALUES(:tenantId, :groupId, :last_update, :server_id1, '
-            ':server_blob1, :server_as_active1); APPLY BATCH;').format(ts)
-        self.params.update(
+        self._test_insert_servers(
+            [{"id": "a", "_is_as_active": True}, {"id": "b", "c": 1}], False,
+            [self._insert(0), self._insert(1)],
             {"server_id0": "a", "server_blob0": '{"id": "a"}',
              "server_as_active0": True,
-             "server_id1": "b", "server_blob1": '{"id": "b"}',
-             "server_as_active1": False,
-             "last_update": self.dt})
-        self.assertEqual(eff, cql_eff(query, self.params))
-        self.assertEqual(resolve_effect(eff, None), None)
+             "server_id1": "b", "server_blob1": '{"c": 1, "id": "b"}',
+             "server_as_active1": False})
 
-    def test_insert_servers(self):
+    def test_insert_servers_clear_others(self):
         """
-        `insert_servers` issues query to insert server as json blobs
+        `insert_servers` with clear_others=True deletes the group's cache as
+        of just before the servers are written, in the same batch
         """
-        eff = self.cache.insert_servers(
-            self.dt, [{"id": "a", "_is_as_active": True}, {"id": "b"}], False)
-        self._test_insert_servers(eff)
+        self._test_insert_servers(
+            [{"id": "a"}], True, [self._insert(0)],
+            {"server_id0": "a", "server_blob0": '{"id": "a"}',
+             "server_as_active0": False})
 
-    def test_insert_servers_delete(self):
+    def test_insert_empty(self):
         """
-        `insert_servers` deletes existing caches before inserting
-        when clear_others=True
+        `insert_servers` with empty servers list only updates the last update
+        time, after deleting all the servers if clear_others=True
         """
-        self.cache.delete_servers = lambda: Effect("delete")
-        eff = self.cache.insert_servers(
-            self.dt, [{"id": "a", "_is_as_active": True}, {"id": "b"}], True)
-        self.assertEqual(eff.intent, "delete")
-        self.clock.advance(1)
-        eff = resolve_effect(eff, None)
-        self._test_insert_servers(eff, 3500000)
+        self._test_insert_servers([], False, [], {})
+        self._test_insert_servers([], True, [], {})
 
-    def test_insert_empty(self):
+    def test_update_time(self):
         """
-        `insert_servers` does nothing if called with empty servers list
+        `update_time` only updates the last update time of the cache
         """
         self.assertEqual(
-            self.cache.insert_servers(self.dt, [], False),
-            Effect(Constant(None)))
+            self.cache.update_time(self.dt),
+            cql_eff(('UPDATE servers_cache_v2 USING TIMESTAMP :ts '
+                     'SET last_update=:last_update '
+                     'WHERE "tenantId"=:tenantId AND "groupId"=:groupId;'),
+                    merge(self.params, {"last_update": self.dt,
+                                        "ts": 2500000})))
 
     def test_delete_servers(self):
         """
-        `delete_servers` issues query to delete the whole cache
+        `delete_servers` issues query to delete the whole cache, in both the
+        servers_cache_v2 and the old servers_cache tables
         """
         self.assertEqual(
             self.cache.delete_servers(),
-            cql_eff(('DELETE FROM servers_cache USING TIMESTAMP :ts WHERE '
-                     '"tenantId"=:tenantId AND "groupId"=:groupId'),
+            cql_eff(('BEGIN BATCH '
+                     'DELETE FROM servers_cache_v2 USING TIMESTAMP :ts WHERE '
+                     '"tenantId"=:tenantId AND "groupId"=:groupId; '
+                     'DELETE FROM servers_cache USING TIMESTAMP :ts WHERE '
+                     '"tenantId"=:tenantId AND "groupId"=:groupId; '
+                     'APPLY BATCH;'),
                     merge(self.params, {"ts": 2500000})))
 
 
@@ -12,7 +12,7 @@ from otter.log.intents import get_log_dispatcher
 from otter.models.intents import (
     DeleteGroup, GetScalingGroupInfo, ModifyGroupStatePaused,
     UpdateGroupErrorReasons, UpdateGroupStatus, UpdateServersCache,
-    get_model_dispatcher)
+    UpdateServersCacheTime, get_model_dispatcher)
 from otter.models.interface import (
     GroupState, IScalingGroupCollection, ScalingGroupStatus)
 from otter.test.utils import (
@@ -147,6 +147,25 @@ class ScalingGroupIntentsTests(SynchronousTestCase):
             self.get_dispatcher(self.get_store())])
         self.assertIsNone(sync_perform(disp, eff))
 
+    @mock.patch('otter.models.intents.CassScalingGroupServersCache',
+                new=EffectServersCache)
+    def test_perform_update_servers_cache_time(self):
+        """
+        Performing :obj:`UpdateServersCacheTime` updates the last update time
+        using CassScalingGroupServersCache
+        """
+        dt = datetime(1970, 1, 1)
+        eff = Effect(UpdateServersCacheTime('tid', 'gid', dt))
+
+        @sync_performer
+        def perform_update_tuple(disp, intent):
+            self.assertEqual(intent, ('cacheuttidgid', dt))
+
+        disp = ComposedDispatcher([
+            TypeDispatcher({tuple: perform_update_tuple}),
+            self.get_dispatcher(self.get_store())])
+        self.assertIsNone(sync_perform(disp, eff))
+
     def test_perform_update_error_reasons(self):
         """
         Performing :obj:`UpdateGroupErrorReasons` calls `update_error_reasons`
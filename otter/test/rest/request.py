@@ -308,7 +308,8 @@ class RestAPITestMixin(RequestTestMixin):
 
 def setup_mod_and_trigger(testcase):
     """
-    Mock `modify_and_trigger` function by calling internal modifier
+    Mock `modify_and_trigger` and `execute_and_trigger` functions by calling
+    internal modifier
 
     :param testcase: test case that is expected to have mocked controller
         as `mock_controller` attr
@@ -322,7 +323,13 @@ def setup_mod_and_trigger(testcase):
         return defer.maybeDeferred(
             mod, testcase.mock_group, testcase.mock_state, *args, **kwargs)
 
+    def exec_and_trigger(disp, group, la, mod, executions,
+                         modify_state_reason=None):
+        testcase.assertIs(executions, testcase.mock_store.policy_executions)
+        return mod_and_trigger(disp, group, la, mod)
+
     testcase.mock_controller.modify_and_trigger.side_effect = mod_and_trigger
+    testcase.mock_controller.execute_and_trigger.side_effect = exec_and_trigger
 
 
 class AdminRestAPITestMixin(RequestTestMixin):
@@ -4,20 +4,30 @@
 Tests for :mod:`otter.rest.application`
 """
 import json
+
+from effect import base_dispatcher
+
 import mock
 
 from twisted.internet.defer import succeed
+from twisted.internet.task import Clock
 from twisted.trial.unittest import TestCase
 
 from otter.rest.application import Otter
+from otter.rest.decorators import log_arguments, with_transaction_id
 from otter.rest.otterapp import OtterApp
-from otter.rest.decorators import with_transaction_id, log_arguments
 from otter.test.rest.request import RequestTestMixin, RestAPITestMixin
 from otter.test.utils import patch
-from otter.util.http import (get_autoscale_links, transaction_id, get_collection_links,
-                             get_groups_links, get_policies_links, get_webhooks_links,
-                             next_marker_by_offset)
 from otter.util.config import set_config_data
+from otter.util.deadline import Deadline, current_deadline, unbound_dispatcher
+from otter.util.http import (
+    get_autoscale_links,
+    get_collection_links,
+    get_groups_links,
+    get_policies_links,
+    get_webhooks_links,
+    next_marker_by_offset,
+    transaction_id)
 
 
 class LinkGenerationTestCase(TestCase):
@@ -636,6 +646,51 @@ class RootRouteTestCase(RestAPITestMixin, TestCase):
         self.assertEqual(response_wrapper.content, 'happyhappyhappy')
 
 
+class RequestDispatcherTests(TestCase):
+    """
+    Tests for :meth:`Otter.request_dispatcher`.
+    """
+
+    def setUp(self):
+        """
+        Otter with a dispatcher and a clock
+        """
+        self.clock = Clock()
+        self.clock.advance(100)
+        self.otter = Otter(None, 'region', clock=self.clock)
+        self.otter.dispatcher = base_dispatcher
+        self.addCleanup(set_config_data, {})
+
+    def test_no_budget(self):
+        """
+        Without a configured time budget, the dispatcher is not wrapped.
+        """
+        self.assertIs(self.otter.request_dispatcher(), base_dispatcher)
+
+    def test_budget(self):
+        """
+        With ``rest.time_budget`` configured, the request's effects are bound
+        to a deadline that many seconds from now.
+        """
+        set_config_data({'rest': {'time_budget': 30}})
+        self.assertEqual(current_deadline(self.otter.request_dispatcher()),
+                         Deadline(130, self.clock))
+
+    def test_budget_unbound(self):
+        """
+        The dispatchers of requests bound to their deadlines are all made from
+        the app's dispatcher, so that work shared by several requests (like
+        coalesced policy executions) can be done outside of their deadlines.
+        """
+        set_config_data({'rest': {'time_budget': 30}})
+        first = self.otter.request_dispatcher()
+        self.clock.advance(10)
+        second = self.otter.request_dispatcher()
+        self.assertIsNot(first, second)
+        self.assertIs(unbound_dispatcher(first), base_dispatcher)
+        self.assertIs(unbound_dispatcher(second), base_dispatcher)
+
+
 class SchedulerResetTests(RestAPITestMixin, TestCase):
     """
     Tests that the scheduler reset endpoint resets the scheduler with new path
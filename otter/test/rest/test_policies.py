@@ -570,7 +570,8 @@ class OnePolicyTestCase(RestAPITestMixin, SynchronousTestCase):
         self.assertEqual(response_body, "{}")
         self.mock_store.get_scaling_group.assert_called_once_with(
             mock.ANY, '11111', '1')
-        self.assertEqual(self.mock_controller.modify_and_trigger.call_count, 1)
+        self.assertEqual(
+            self.mock_controller.execute_and_trigger.call_count, 1)
         exec_pol = self.mock_controller.maybe_execute_scaling_policy
         exec_pol.assert_called_once_with(
             mock.ANY,
@@ -584,8 +585,8 @@ class OnePolicyTestCase(RestAPITestMixin, SynchronousTestCase):
         """
         Try to execute a nonexistant policy, fails with a 404.
         """
-        self.mock_controller.modify_and_trigger.side_effect = None
-        self.mock_controller.modify_and_trigger.return_value = defer.fail(
+        self.mock_controller.execute_and_trigger.side_effect = None
+        self.mock_controller.execute_and_trigger.return_value = defer.fail(
             NoSuchPolicyError('11111', '1', '2'))
 
         response_body = self.assert_status_code(404,
@@ -600,8 +601,8 @@ class OnePolicyTestCase(RestAPITestMixin, SynchronousTestCase):
         If a policy cannot be executed due to cooldowns or budgetary
         constraints, fail with a 403.
         """
-        self.mock_controller.modify_and_trigger.side_effect = None
-        self.mock_controller.modify_and_trigger.return_value = defer.fail(
+        self.mock_controller.execute_and_trigger.side_effect = None
+        self.mock_controller.execute_and_trigger.return_value = defer.fail(
             CannotExecutePolicyError('11111', '1', '2', 'meh'))
 
         response_body = self.assert_status_code(403,
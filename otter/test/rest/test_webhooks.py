@@ -473,8 +473,9 @@ class OneWebhookTestCase(RestAPITestMixin, SynchronousTestCase):
                        capability_hash='11111',
                        capability_version='1',
                        system='otter.rest.webhooks.execute_webhook')
-        self.mock_controller.modify_and_trigger.assert_called_once_with(
+        self.mock_controller.execute_and_trigger.assert_called_once_with(
             "disp", self.mock_group, logargs, mock.ANY,
+            self.mock_store.policy_executions,
             modify_state_reason="execute_webhook")
         exec_pol = self.mock_controller.maybe_execute_scaling_policy
         exec_pol.assert_called_once_with(
@@ -543,7 +544,7 @@ class OneWebhookTestCase(RestAPITestMixin, SynchronousTestCase):
         for exc in exceptions:
             self.mock_store.webhook_info_by_hash.return_value = defer.succeed(
                 ('tenant', 'group', 'policy'))
-            self.mock_controller.modify_and_trigger.side_effect = \
+            self.mock_controller.execute_and_trigger.side_effect = \
                 lambda *args, **kwargs: defer.fail(exc)
             self.assert_status_code(202, '/v1.0/execute/1/11111/', 'POST')
 
@@ -15,8 +15,7 @@ from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter.auth import CachingAuthenticator, SingleTenantAuthenticator
-from otter.constants import (
-    CONVERGENCE_DIRTY_DIR, ServiceType, get_service_configs)
+from otter.constants import ServiceType, get_service_configs
 from otter.convergence.service import Converger
 from otter.log.cloudfeeds import CloudFeedsObserver
 from otter.log.formatters import get_fanout, set_fanout
@@ -35,6 +34,9 @@ from otter.test.test_effect_dispatcher import full_intents
 from otter.test.utils import CheckFailure, matches, patch
 from otter.util.config import set_config_data
 from otter.util.deferredutils import DeferredPool
+from otter.util.http_pools import ConnectionPools
+from otter.util.ratelimit import RateLimiters
+from otter.util.retry import RetryBudgets
 from otter.util.zkpartitioner import Partitioner
 
 
@@ -435,6 +437,36 @@ class APIMakeServiceTests(SynchronousTestCase):
         makeService(test_config)
         self.assertEqual(self.store.max_groups, 100)
 
+    def test_manifest_cache(self):
+        """
+        CassScalingGroupCollection is created with a manifest cache, whose
+        size is taken from config if it is there.
+        """
+        makeService(test_config)
+        self.assertEqual(self.store.manifest_cache.max_size, 10000)
+        config = deepcopy(test_config)
+        config['cassandra']['manifest_cache_size'] = 5
+        makeService(config)
+        self.assertEqual(self.store.manifest_cache.max_size, 5)
+
+    @mock.patch('otter.tap.api.TxKazooClient')
+    @mock.patch('otter.tap.api.KazooClient')
+    @mock.patch('otter.tap.api.ThreadPool')
+    @mock.patch('otter.tap.api.TxLogger')
+    def test_lock_leases(self, mock_tx_logger, mock_thread_pool,
+                         mock_kazoo_client, mock_txkz):
+        """
+        CassScalingGroupCollection is created with lock leases only if a
+        lease is configured.
+        """
+        makeService(test_config)
+        self.assertIsNone(self.store.lock_leases)
+        config = deepcopy(test_config)
+        config['zookeeper'] = {'hosts': 'zk_hosts', 'threads': 20,
+                               'lock_lease': 2}
+        makeService(config)
+        self.assertEqual(self.store.lock_leases.lease, 2)
+
     @mock.patch('otter.tap.api.reactor')
     @mock.patch('otter.tap.api.generate_authenticator')
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
@@ -451,8 +483,8 @@ class APIMakeServiceTests(SynchronousTestCase):
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
     def test_health_checker_no_zookeeper(self, supervisor):
         """
-        A health checker is constructed by default with the store and kazoo
-        health check
+        A health checker is constructed by default with the store, kazoo,
+        supervisor, HTTP connection pools and manifest cache health checks
         """
         self.addCleanup(lambda: set_supervisor(None))
         self.assertIsNone(self.health_checker)
@@ -464,6 +496,10 @@ class APIMakeServiceTests(SynchronousTestCase):
                          self.store.kazoo_health_check)
         self.assertEqual(self.health_checker.checks['supervisor'],
                          get_supervisor().health_check)
+        self.assertEqual(self.health_checker.checks['http_pools'],
+                         get_supervisor().pools.health_check)
+        self.assertEqual(self.health_checker.checks['manifest_cache'],
+                         self.store.manifest_cache.health_check)
 
     @mock.patch('otter.tap.api.SupervisorService', wraps=SupervisorService)
     def test_supervisor_service_set_by_default(self, supervisor):
@@ -477,6 +513,46 @@ class APIMakeServiceTests(SynchronousTestCase):
 
         self.assertEqual(get_supervisor(), supervisor_service)
 
+    def test_retry_budgets(self):
+        """
+        The supervisor is given retry budgets configured with the
+        ``retry_budget`` config.
+        """
+        self.addCleanup(lambda: set_supervisor(None))
+        config = deepcopy(test_config)
+        config['retry_budget'] = {'ratio': 0.5}
+        makeService(config)
+        budgets = get_supervisor().retry_budgets
+        self.assertIsInstance(budgets, RetryBudgets)
+        self.assertIs(budgets.clock, self.reactor)
+        self.assertEqual(budgets.config, {'ratio': 0.5})
+
+    def test_connection_pools(self):
+        """
+        The supervisor is given connection pools configured with the
+        ``cloud_client.connection_pool`` config.
+        """
+        self.addCleanup(lambda: set_supervisor(None))
+        config = deepcopy(test_config)
+        config['cloud_client'] = {
+            'connection_pool': {'max_persistent_per_host': 3}}
+        makeService(config)
+        pools = get_supervisor().pools
+        self.assertIsInstance(pools, ConnectionPools)
+        self.assertIs(pools.reactor, self.reactor)
+        self.assertEqual(pools.max_persistent_per_host, 3)
+
+    def test_rate_limiters(self):
+        """
+        The supervisor is given rate limiters, which are shared by all the
+        dispatchers of the service.
+        """
+        self.addCleanup(lambda: set_supervisor(None))
+        makeService(test_config)
+        limiters = get_supervisor().limiters
+        self.assertIsInstance(limiters, RateLimiters)
+        self.assertIs(limiters.clock, self.reactor)
+
     def test_cloudfeeds_setup(self):
         """
         Cloud feeds observer is setup if it is there in config
@@ -501,7 +577,10 @@ class APIMakeServiceTests(SynchronousTestCase):
                 authenticator=matches(IsInstance(CachingAuthenticator)),
                 tenant_id='tid',
                 region='ord',
-                service_configs=serv_confs))
+                service_configs=serv_confs,
+                retry_budgets=get_supervisor().retry_budgets,
+                pools=get_supervisor().pools,
+                limiters=get_supervisor().limiters))
 
         # single tenant authenticator is created
         authenticator = cf_observer.authenticator
@@ -570,6 +649,9 @@ class APIMakeServiceTests(SynchronousTestCase):
         start_d.callback(None)
         mock_setup_scheduler.assert_called_once_with(
             parent, "disp", self.store, kz_client)
+        # the dispatcher shares the supervisor's rate limiters
+        supervisor = parent.getServiceNamed('supervisor')
+        self.assertIs(mock_gfd.call_args[0][-1], supervisor.limiters)
         self.assertEqual(self.store.kz_client, kz_client)
         sch = mock_setup_scheduler.return_value
         self.assertEqual(self.health_checker.checks['scheduler'],
@@ -707,13 +789,16 @@ class ConvergerSetupTests(SynchronousTestCase):
     def test_setup_converger(self, mock_watch_children):
         """
         Puts a :obj:`Converger` with a :obj:`Partitioner` in the given parent
-        service.
+        service, and watches the dirty flag directory of every bucket after
+        making sure it exists.
         """
         ms = MultiService()
-        kz_client = object()
+        kz_client = mock.Mock(spec=['ensure_path'])
+        kz_client.ensure_path.return_value = defer.succeed(None)
         dispatcher = object()
         interval = 50
-        setup_converger(ms, kz_client, dispatcher, interval, 35, 52)
+        d = setup_converger(ms, kz_client, dispatcher, interval, 35, 52)
+        self.successResultOf(d)
         [converger] = ms.services
         self.assertIs(converger.__class__, Converger)
         self.assertEqual(converger.build_timeout, 35)
@@ -726,8 +811,14 @@ class ConvergerSetupTests(SynchronousTestCase):
         self.assertIs(partitioner, converger.partitioner)
         self.assertIs(partitioner.kz_client, kz_client)
         self.assertEqual(timer.step, interval)
-        mock_watch_children.assert_called_once_with(
-            kz_client, CONVERGENCE_DIRTY_DIR, converger.divergent_changed)
+        paths = ['/groups/divergent-buckets/{}'.format(i) for i in range(10)]
+        self.assertEqual(kz_client.ensure_path.mock_calls,
+                         [mock.call(path) for path in paths])
+        self.assertEqual(
+            [(args[:2], args[2].func, args[2].args)
+             for args, _ in mock_watch_children.call_args_list],
+            [((kz_client, path), converger.divergent_changed, (i,))
+             for i, path in enumerate(paths)])
 
 
 class SchedulerSetupTests(SynchronousTestCase):
@@ -20,10 +20,11 @@ from otter.auth import (
     IAuthenticator,
     ICachingAuthenticator,
     ImpersonatingAuthenticator,
-    NoSuchEndpoint,
-    SingleTenantAuthenticator,
     InvalidateToken,
+    NoSuchEndpoint,
     RetryingAuthenticator,
+    SingleTenantAuthenticator,
+    Token,
     WaitingAuthenticator,
     authenticate_user,
     endpoints,
@@ -35,7 +36,7 @@ from otter.auth import (
     user_for_tenant
 )
 from otter.effect_dispatcher import get_simple_dispatcher
-from otter.test.utils import SameJSON, iMock, mock_log, patch
+from otter.test.utils import CheckFailure, SameJSON, iMock, mock_log, patch
 from otter.util.http import APIError, UpstreamError
 
 
@@ -78,6 +79,17 @@ class HelperTests(SynchronousTestCase):
         """
         resp = {'access': {'token': {'id': u'11111-111111-1111111-1111111'}}}
         self.assertEqual(extract_token(resp), '11111-111111-1111111-1111111')
+        self.assertIsNone(extract_token(resp).expires)
+
+    def test_extract_token_expires(self):
+        """
+        The token returned by extract_token knows when it expires.
+        """
+        resp = {'access': {'token': {'id': u'1111',
+                                     'expires': '1970-01-01T01:00:00.000Z'}}}
+        token = extract_token(resp)
+        self.assertIsInstance(token, Token)
+        self.assertEqual((token, token.expires), ('1111', 3600))
 
     def _verify_request_invoked_with_pool(self, **kwargs):
         pool = kwargs.get("pool", None)
@@ -635,9 +647,67 @@ class ImpersonatingAuthenticatorTests(SynchronousTestCase):
         self.endpoints_for_token.side_effect = lambda *a, **kw: fail(
             UpstreamError(Failure(APIError(500, '500')), 'identity', 'o'))
 
-        f = self.failureResultOf(self.ia.authenticate_tenant(111111), UpstreamError)
+        f = self.failureResultOf(self.ia.authenticate_tenant(111111),
+                                 UpstreamError)
         self.assertEqual(f.value.reason.value.code, 500)
 
+    def caching_authenticator(self):
+        """
+        Return an :obj:`ImpersonatingAuthenticator` that caches users for 20
+        seconds and catalogs for 10 seconds, and its clock.
+        """
+        clock = Clock()
+        return clock, ImpersonatingAuthenticator(
+            self.user, self.password, self.url, self.admin_url, clock,
+            user_ttl=20, catalog_ttl=10)
+
+    def test_caches_user_and_catalog(self):
+        """
+        With a reactor, the tenant's user and catalog are cached for their
+        TTLs, and only the impersonation is done every time.
+        """
+        clock, ia = self.caching_authenticator()
+        r1 = self.successResultOf(ia.authenticate_tenant(1))
+        r2 = self.successResultOf(ia.authenticate_tenant(1))
+        self.assertEqual(r1, r2)
+        self.assertIs(r1[1], r2[1])
+        counts = lambda: (self.user_for_tenant.call_count,
+                          self.impersonate_user.call_count,
+                          self.endpoints_for_token.call_count)
+        self.assertEqual(counts(), (1, 2, 1))
+        clock.advance(11)
+        self.successResultOf(ia.authenticate_tenant(1))
+        self.assertEqual(counts(), (1, 3, 2))
+        clock.advance(10)
+        self.successResultOf(ia.authenticate_tenant(1))
+        self.assertEqual(counts(), (2, 4, 2))
+
+    def test_cache_max_size(self):
+        """
+        When more tenants than ``max_size`` are cached, the users and catalogs
+        of the least recently used tenants are evicted.
+        """
+        clock = Clock()
+        ia = ImpersonatingAuthenticator(
+            self.user, self.password, self.url, self.admin_url, clock,
+            max_size=2)
+        for tenant_id in [1, 2, 1, 3]:
+            self.successResultOf(ia.authenticate_tenant(tenant_id))
+        self.assertEqual(ia._users.keys(), [1, 3])
+        self.assertEqual(ia._catalogs.keys(), [1, 3])
+        self.assertEqual(self.user_for_tenant.call_count, 3)
+
+    def test_impersonation_failure_forgets_user(self):
+        """
+        The tenant's cached user is forgotten if impersonating it fails.
+        """
+        clock, ia = self.caching_authenticator()
+        self.successResultOf(ia.authenticate_tenant(1))
+        self.impersonate_user.side_effect = lambda *a, **kw: fail(
+            UpstreamError(Failure(APIError(404, '404')), 'identity', 'o'))
+        self.failureResultOf(ia.authenticate_tenant(1), UpstreamError)
+        self.assertEqual(ia._users, {})
+
 
 class CachingAuthenticatorTests(SynchronousTestCase):
     """
@@ -782,6 +852,123 @@ class CachingAuthenticatorTests(SynchronousTestCase):
         self.assertEqual(self.successResultOf(d), 'r2')
 
 
+class RefreshAheadCachingAuthenticatorTests(SynchronousTestCase):
+    """
+    Tests for :obj:`CachingAuthenticator` in refresh-ahead mode.
+    """
+    def setUp(self):
+        """
+        Configure a clock and a fake authenticator returning tokens that
+        expire 100 seconds after they are got.
+        """
+        self.clock = Clock()
+        self.calls = []
+        self.resps = {}
+
+        class FakeAuthenticator(object):
+            def authenticate_tenant(fself, tenant_id, log=None):
+                self.calls.append(tenant_id)
+                r = self.resps.get(tenant_id)
+                if isinstance(r, Deferred):
+                    return r
+                if isinstance(r, Exception):
+                    return fail(r)
+                if r is not None:
+                    return succeed(r)
+                token = Token('token{}'.format(len(self.calls)),
+                              self.clock.seconds() + 100)
+                return succeed((token, 'catalog'))
+
+        self.log = mock_log()
+        self.ca = CachingAuthenticator(
+            self.clock, FakeAuthenticator(), 10, refresh_ahead=20,
+            max_refreshing=1, max_size=2)
+
+    def authenticate(self, tenant_id):
+        """Return the token got for the tenant."""
+        return self.successResultOf(
+            self.ca.authenticate_tenant(tenant_id, log=self.log))[0]
+
+    def test_cached_until_expiry(self):
+        """
+        Tokens are cached until their expiry instead of the TTL.
+        """
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.clock.advance(79)
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.assertEqual(self.calls, [1])
+
+    def test_ttl_without_expiry(self):
+        """
+        Tokens whose expiry is not known are cached for the TTL.
+        """
+        self.resps[1] = ('token', 'catalog')
+        self.authenticate(1)
+        self.clock.advance(11)
+        self.authenticate(1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_refreshes_ahead(self):
+        """
+        A request within ``refresh_ahead`` seconds of the expiry gets the
+        cached token while the token is refreshed in the background.
+        """
+        self.authenticate(1)
+        self.clock.advance(80)
+        self.resps[1] = Deferred()
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.assertEqual(self.calls, [1, 1])
+        self.resps[1].callback((Token('token2', 200), 'catalog'))
+        self.clock.advance(20)
+        self.assertEqual(self.authenticate(1), 'token2')
+        self.assertEqual(len(self.calls), 2)
+
+    def test_refresh_failure(self):
+        """
+        A failed refresh is logged, the cached token is kept and the refresh
+        is tried again on the next request.
+        """
+        self.authenticate(1)
+        self.clock.advance(80)
+        self.resps[1] = APIError(500, '500')
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.assertEqual(
+            self.log.err.call_args[0],
+            (CheckFailure(APIError), 'otter.auth.cache.refresh-failed'))
+        del self.resps[1]
+        self.assertEqual(self.authenticate(1), 'token1')
+        self.assertEqual(self.authenticate(1), 'token3')
+
+    def test_max_refreshing(self):
+        """
+        No more than ``max_refreshing`` refreshes run at the same time.
+        """
+        self.authenticate(1)
+        self.authenticate(2)
+        self.clock.advance(80)
+        self.resps[1] = Deferred()
+        self.authenticate(1)
+        self.authenticate(2)
+        self.assertEqual(self.calls, [1, 2, 1])
+        self.resps[1].callback((Token('token', 200), 'catalog'))
+        self.authenticate(2)
+        self.assertEqual(self.calls, [1, 2, 1, 2])
+
+    def test_evicts_least_recently_used(self):
+        """
+        The least recently used tenants are evicted when there are more than
+        ``max_size`` tenants cached.
+        """
+        self.authenticate(1)
+        self.authenticate(2)
+        self.authenticate(1)
+        self.authenticate(3)
+        self.assertEqual(list(self.ca._cache), [1, 3])
+        self.authenticate(1)
+        self.assertEqual(self.calls, [1, 2, 3])
+
+
 class RetryingAuthenticatorTests(SynchronousTestCase):
     """
     Tests for `RetryingAuthenticator`
@@ -942,6 +1129,21 @@ class AuthenticatorTests(SynchronousTestCase):
         self.assertEqual(ia._identity_admin_password, 'pwd')
         self.assertEqual(ia._url, 'htp')
         self.assertEqual(ia._admin_url, 'ad')
+        self.assertIdentical(ia._reactor, r)
+        self.assertEqual((ia._user_ttl, ia._catalog_ttl), (86400, 3600))
+        self.assertIsNone(ia._max_size)
+
+    def test_impersonation_cache_ttls(self):
+        """
+        The user and catalog cache TTLs and maximum size of
+        ImpersonatingAuthenticator are taken from config if given.
+        """
+        self.config.update({'user_cache_ttl': 10, 'catalog_cache_ttl': 5,
+                            'cache_max_size': 7})
+        a = generate_authenticator(mock.Mock(), self.config)
+        ia = a._authenticator._authenticator._authenticator
+        self.assertEqual((ia._user_ttl, ia._catalog_ttl), (10, 5))
+        self.assertEqual(ia._max_size, 7)
 
     def test_composition_single_tenant(self):
         """
@@ -988,3 +1190,19 @@ class AuthenticatorTests(SynchronousTestCase):
         r = mock.Mock()
         a = generate_authenticator(r, self.config)
         self.assertEqual(a._ttl, 300)
+
+    def test_refresh_ahead(self):
+        """
+        CachingAuthenticator is created with the refresh-ahead settings if
+        given, and without refresh-ahead or size limit if not.
+        """
+        r = mock.Mock()
+        a = generate_authenticator(r, self.config)
+        self.assertEqual((a._refresh_ahead, a._max_refreshing, a._max_size),
+                         (None, 10, None))
+        self.config.update({'cache_refresh_ahead': 600,
+                            'cache_max_refreshing': 5,
+                            'cache_max_size': 1000})
+        a = generate_authenticator(r, self.config)
+        self.assertEqual((a._refresh_ahead, a._max_refreshing, a._max_size),
+                         (600, 5, 1000))
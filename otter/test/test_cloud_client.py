@@ -10,7 +10,8 @@ from effect import (
     Effect,
     TypeDispatcher,
     base_dispatcher,
-    sync_perform)
+    sync_perform,
+    sync_performer)
 from effect.testing import EQFDispatcher, SequenceDispatcher, perform_sequence
 
 import mock
@@ -19,8 +20,11 @@ import six
 
 from toolz.dicttoolz import assoc
 
+from twisted.internet.defer import Deferred, fail
 from twisted.internet.task import Clock
+from twisted.python.failure import Failure
 from twisted.trial.unittest import SynchronousTestCase
+from twisted.web.http_headers import Headers
 
 from txeffect import perform
 
@@ -28,9 +32,9 @@ from otter.auth import Authenticate, InvalidateToken
 from otter.cloud_client import (
     CLBDeletedError,
     CLBDuplicateNodesError,
+    CLBImmutableError,
     CLBNodeLimitError,
     CLBNotActiveError,
-    CLBImmutableError,
     CLBRateLimitError,
     CreateServerConfigurationError,
     CreateServerOverQuoteError,
@@ -44,6 +48,7 @@ from otter.cloud_client import (
     TenantScope,
     _Throttle,
     _default_throttler,
+    _over_limit_wait,
     _perform_throttle,
     add_bind_service,
     add_clb_nodes,
@@ -53,6 +58,7 @@ from otter.cloud_client import (
     create_server,
     create_stack,
     delete_stack,
+    fold_servers_details,
     get_clb_node_feed,
     get_clb_nodes,
     get_clbs,
@@ -80,8 +86,9 @@ from otter.test.utils import (
 from otter.test.worker.test_launch_server_v1 import fake_service_catalog
 from otter.util.config import set_config_data
 from otter.util.http import APIError, headers
+from otter.util.http_pools import ConnectionPools
 from otter.util.pure_http import Request, has_code
-from otter.util.weaklocks import WeakLocks
+from otter.util.ratelimit import RateLimiters
 
 
 def make_service_configs():
@@ -373,19 +380,23 @@ class ThrottleTests(SynchronousTestCase):
 class DefaultThrottlerTests(SynchronousTestCase):
     """Tests for :func:`_default_throttler`."""
 
+    def setUp(self):
+        self.clock = Clock()
+        self.limiters = RateLimiters(self.clock)
+
     def tearDown(self):
         set_config_data(None)
 
     def test_mismatch(self):
         """policy doesn't have a throttler for random junk."""
         bracket = _default_throttler(
-            WeakLocks(), None, 'foo', 'get', 'any-tenant')
+            self.limiters, 'foo', 'get', 'any-tenant')
         self.assertIs(bracket, None)
 
     def test_no_config(self):
         """ No config results in no throttling """
         bracket = _default_throttler(
-            WeakLocks(), None, ServiceType.CLOUD_SERVERS, 'get', 'any-tenant')
+            self.limiters, ServiceType.CLOUD_SERVERS, 'get', 'any-tenant')
         self.assertIs(bracket, None)
 
     def test_post_and_delete_not_the_same(self):
@@ -395,85 +406,74 @@ class DefaultThrottlerTests(SynchronousTestCase):
         set_config_data(
             {"cloud_client": {"throttling": {"create_server_delay": 1,
                                              "delete_server_delay": 0.4}}})
-        clock = Clock()
-        locks = WeakLocks()
         deleter = _default_throttler(
-            locks, clock, ServiceType.CLOUD_SERVERS, 'delete', 'any-tenant')
+            self.limiters, ServiceType.CLOUD_SERVERS, 'delete', 'any-tenant')
         poster = _default_throttler(
-            locks, clock, ServiceType.CLOUD_SERVERS, 'post', 'any-tenant')
-        self.assertIsNot(deleter, poster)
+            self.limiters, ServiceType.CLOUD_SERVERS, 'post', 'any-tenant')
+        self.assertIsNot(deleter.__self__, poster.__self__)
 
     def _test_throttle(self, cfg_name, stype, method):
-        """Test a specific throttling configuration."""
-        locks = WeakLocks()
+        """
+        Test a specific delay configuration: one request is allowed at a
+        time, every ``delay`` seconds.
+        """
         set_config_data(
             {'cloud_client': {'throttling': {cfg_name: 500}}})
         self.addCleanup(set_config_data, {})
-        clock = Clock()
-        bracket = _default_throttler(locks, clock, stype, method, 'tenant1')
+        bracket = _default_throttler(self.limiters, stype, method, 'tenant1')
         if bracket is None:
             self.fail("No throttler for %s and %s" % (stype, method))
-        d = bracket(lambda: 'foo')
-        clock.advance(499)
-        self.assertNoResult(d)
-        clock.advance(500)
-        self.assertEqual(self.successResultOf(d), 'foo')
-
-        # also make sure that the lock is shared between different calls to the
-        # throttler.
-        bracket1 = _default_throttler(locks, clock, stype, method, 'tenant1')
+        d = Deferred()
+        self.assertNoResult(bracket(lambda: d))
+        # also make sure that the bucket is shared between different calls
+        # to the throttler.
+        bracket1 = _default_throttler(
+            self.limiters, stype, method, 'tenant1')
         result1 = bracket1(lambda: 'bar1')
-        bracket2 = _default_throttler(locks, clock, stype, method, 'tenant1')
-        result2 = bracket2(lambda: 'bar2')
-        clock.advance(499)
+        self.clock.advance(500)
         self.assertNoResult(result1)
-        self.assertNoResult(result2)
-        clock.advance(1)
+        d.callback('foo')
         self.assertEqual(self.successResultOf(result1), 'bar1')
+        bracket2 = _default_throttler(
+            self.limiters, stype, method, 'tenant1')
+        result2 = bracket2(lambda: 'bar2')
+        self.clock.advance(499)
         self.assertNoResult(result2)
-        clock.advance(500)
+        self.clock.advance(1)
         self.assertEqual(self.successResultOf(result2), 'bar2')
 
     def _test_tenant(self, cfg_name, stype, method):
         """
-        Test a specific throttling configuration, and ensure that locks are
+        Test a specific delay configuration, and ensure that limits are
         per-tenant.
         """
-        locks = WeakLocks()
         set_config_data(
             {'cloud_client': {'throttling': {cfg_name: 500}}})
         self.addCleanup(set_config_data, {})
-        clock = Clock()
-        bracket1 = _default_throttler(locks, clock, stype, method, 'tenant1')
+        bracket1 = _default_throttler(self.limiters, stype, method, 'tenant1')
         if bracket1 is None:
             self.fail("No throttler for %s and %s" % (stype, method))
-        result1 = bracket1(lambda: 'bar1')
-        bracket2 = _default_throttler(locks, clock, stype, method, 'tenant2')
-        result2 = bracket2(lambda: 'bar2')
-        self.assertNoResult(result1)
-        self.assertNoResult(result2)
-        clock.advance(500)
+        d1, d2 = Deferred(), Deferred()
+        result1 = bracket1(lambda: d1)
+        bracket2 = _default_throttler(self.limiters, stype, method, 'tenant2')
+        result2 = bracket2(lambda: d2)
+        d1.callback('bar1')
+        d2.callback('bar2')
         self.assertEqual(self.successResultOf(result1), 'bar1')
         self.assertEqual(self.successResultOf(result2), 'bar2')
 
     def test_delay_configurable(self):
         """Delays are configurable."""
-        self._test_throttle(
-            'create_server_delay', ServiceType.CLOUD_SERVERS, 'post')
-        self._test_throttle(
-            'delete_server_delay', ServiceType.CLOUD_SERVERS, 'delete')
-        self._test_throttle(
-            'create_server_delay', ServiceType.CLOUD_SERVERS, 'post')
-        self._test_throttle(
-            'delete_server_delay', ServiceType.CLOUD_SERVERS, 'delete')
-        self._test_throttle(
-            'get_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'get')
-        self._test_throttle(
-            'post_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'post')
-        self._test_throttle(
-            'put_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'put')
-        self._test_throttle(
-            'delete_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'delete')
+        for cfg_name, stype, method in [
+                ('create_server_delay', ServiceType.CLOUD_SERVERS, 'post'),
+                ('delete_server_delay', ServiceType.CLOUD_SERVERS, 'delete'),
+                ('get_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'get'),
+                ('post_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'post'),
+                ('put_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'put'),
+                ('delete_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS,
+                 'delete')]:
+            self.limiters = RateLimiters(self.clock)
+            self._test_throttle(cfg_name, stype, method)
 
     def test_tenant_specific_locking(self):
         self._test_tenant(
@@ -485,6 +485,113 @@ class DefaultThrottlerTests(SynchronousTestCase):
         self._test_tenant(
             'delete_clb_delay', ServiceType.CLOUD_LOAD_BALANCERS, 'delete')
 
+    def test_rate_limits(self):
+        """
+        Rate limits configured in ``cloud_client.rate_limits`` take
+        precedence over delays, and allow bursts and concurrent requests.
+        """
+        set_config_data(
+            {'cloud_client': {
+                'throttling': {'create_server_delay': 500},
+                'rate_limits': {'create_server': {
+                    'rate': 2, 'burst': 3, 'max_in_flight': 2}}}})
+        bracket = _default_throttler(
+            self.limiters, ServiceType.CLOUD_SERVERS, 'post', 'tenant1')
+        ds = [Deferred() for _ in range(4)]
+        results = [bracket(lambda d=d: d) for d in ds]
+        self.assertEqual(bracket.__self__.in_flight, 2)
+        ds[0].callback('a')
+        self.assertEqual(bracket.__self__.in_flight, 2)
+        ds[1].callback('b')
+        ds[2].callback('c')
+        self.assertNoResult(results[3])
+        self.clock.advance(0.5)
+        ds[3].callback('d')
+        self.assertEqual(map(self.successResultOf, results),
+                         ['a', 'b', 'c', 'd'])
+
+    def test_rate_limits_per_tenant(self):
+        """
+        Rate limits can be configured to be per tenant or global, overriding
+        the default for the request.
+        """
+        set_config_data(
+            {'cloud_client': {'rate_limits': {
+                'create_server': {'rate': 1, 'per_tenant': True},
+                'get_clb': {'rate': 1, 'per_tenant': False}}}})
+        for stype, method, same in [
+                (ServiceType.CLOUD_SERVERS, 'post', False),
+                (ServiceType.CLOUD_LOAD_BALANCERS, 'get', True)]:
+            b1 = _default_throttler(self.limiters, stype, method, 't1')
+            b2 = _default_throttler(self.limiters, stype, method, 't2')
+            self.assertEqual(b1.__self__ is b2.__self__, same)
+
+    def test_adaptive_limit(self):
+        """
+        If configured, requests of a tenant to a service share an adaptive
+        limit, which is decreased when the service rate limits a request,
+        around any other rate limit.
+        """
+        set_config_data(
+            {'cloud_client': {
+                'adaptive_limit': {'maximum': 2},
+                'throttling': {'create_server_delay': 0}}})
+        get = _default_throttler(
+            self.limiters, ServiceType.CLOUD_SERVERS, 'get', 't1')
+        post = _default_throttler(
+            self.limiters, ServiceType.CLOUD_SERVERS, 'post', 't1')
+        over_limit = APIError(413, json.dumps({'overLimit': {}}))
+        self.failureResultOf(get(lambda: fail(over_limit)), APIError)
+        d = Deferred()
+        post(lambda: d)
+        result = get(lambda: 'got')
+        self.assertNoResult(result)
+        other = _default_throttler(
+            self.limiters, ServiceType.CLOUD_SERVERS, 'get', 't2')
+        self.assertEqual(self.successResultOf(other(lambda: 'other')),
+                         'other')
+        d.callback('posted')
+        self.assertEqual(self.successResultOf(result), 'got')
+
+
+class OverLimitWaitTests(SynchronousTestCase):
+    """Tests for :func:`_over_limit_wait`."""
+
+    def _wait(self, code, body, headers=None):
+        return _over_limit_wait(Failure(APIError(code, body, headers)))
+
+    def test_over_limit(self):
+        """
+        413 and 429 responses with an ``overLimit`` error are rate limited,
+        with no time to wait.
+        """
+        body = json.dumps({'overLimit': {'message': 'OverLimit Retry...'}})
+        self.assertEqual(self._wait(413, body), 0)
+        self.assertEqual(self._wait(429, body), 0)
+
+    def test_retry_after(self):
+        """
+        Responses with a ``Retry-After`` header are rate limited, with the
+        number of seconds in the header to wait.
+        """
+        self.assertEqual(
+            self._wait(503, 'busy', Headers({'Retry-After': ['7']})), 7)
+        self.assertEqual(
+            self._wait(413, json.dumps({'overLimit': {}}),
+                       Headers({'Retry-After': ['Sat, 1 Jan 2000']})),
+            0)
+
+    def test_not_over_limit(self):
+        """
+        Other errors are not rate limiting.
+        """
+        self.assertIsNone(self._wait(
+            413, json.dumps({'message': 'Nodes must not exceed 25 per load '
+                                        'balancer', 'code': 413})))
+        self.assertIsNone(self._wait(413, 'not json'))
+        self.assertIsNone(self._wait(500, json.dumps({'overLimit': {}})))
+        self.assertIsNone(_over_limit_wait(Failure(ValueError())))
+
 
 class GetCloudClientDispatcherTests(SynchronousTestCase):
     """Tests for :func:`get_cloud_client_dispatcher`."""
@@ -496,16 +603,60 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
                              effect=Effect(Constant('foo')))
         self.assertIs(dispatcher(throttle), _perform_throttle)
 
-    @mock.patch('twisted.internet.defer.DeferredLock.run')
-    def test_performs_tenant_scope(self, deferred_lock_run):
+    def test_performs_request_with_pools(self):
+        """
+        :obj:`Request` is performed with the given connection pools, and
+        left to other dispatchers if none are given.
+        """
+        pools = ConnectionPools(None)
+        dispatcher = get_cloud_client_dispatcher(None, None, None, None,
+                                                 pools)
+        performer = dispatcher(Request(method='GET', url='http://a/'))
+        self.assertIs(performer.args[0], pools)
+
+        dispatcher = get_cloud_client_dispatcher(None, None, None, None)
+        self.assertIsNone(dispatcher(Request(method='GET', url='http://a/')))
+
+    def test_shares_rate_limiters(self):
+        """
+        Dispatchers given the same rate limiters throttle their requests with
+        the same buckets.
+        """
+        set_config_data(
+            {"cloud_client": {"throttling": {"create_server_delay": 1}}})
+        self.addCleanup(set_config_data, None)
+        clock = Clock()
+        limiters = RateLimiters(clock)
+        fake = TypeDispatcher({
+            Authenticate: sync_performer(
+                lambda d, i: ('token', fake_service_catalog)),
+            Request: sync_performer(
+                lambda d, i: stub_pure_response({}, 200))})
+        svcreq = service_request(ServiceType.CLOUD_SERVERS, 'POST', 'servers')
+
+        def create_server():
+            dispatcher = get_cloud_client_dispatcher(
+                clock, object(), object(), make_service_configs(),
+                limiters=limiters)
+            return perform(ComposedDispatcher([fake, dispatcher]),
+                           Effect(TenantScope(tenant_id='111', effect=svcreq)))
+
+        self.successResultOf(create_server())
+        d = create_server()
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.successResultOf(d)
+
+    @mock.patch('otter.util.ratelimit.TokenBucket.run')
+    def test_performs_tenant_scope(self, bucket_run):
         """
         :func:`perform_tenant_scope` performs :obj:`TenantScope`, and uses the
         default throttler
         """
         # We want to ensure
         # 1. the TenantScope can be performed
-        # 2. the ServiceRequest is run within a lock, since it matches the
-        #    default throttling policy
+        # 2. the ServiceRequest is run within a rate limit, since it matches
+        #    the default throttling policy
 
         set_config_data(
             {"cloud_client": {"throttling": {"create_server_delay": 1,
@@ -524,7 +675,7 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
             result.addCallback(
                 lambda x: (x[0], assoc(x[1], 'locked', True)))
             return result
-        deferred_lock_run.side_effect = run
+        bucket_run.side_effect = run
 
         response = stub_pure_response({}, 200)
         seq = SequenceDispatcher([
@@ -539,8 +690,6 @@ class GetCloudClientDispatcherTests(SynchronousTestCase):
         disp = ComposedDispatcher([seq, dispatcher])
         with seq.consume():
             result = perform(disp, Effect(tscope))
-            self.assertNoResult(result)
-            clock.advance(1)
             self.assertEqual(self.successResultOf(result),
                              (response[0], {'locked': True}))
 
@@ -1339,6 +1488,31 @@ class NovaClientTests(SynchronousTestCase):
         result = perform_sequence(seq, eff)
         self.assertEqual(result, ['1', '2', '3', '4', '5', '6'])
 
+    def test_fold_servers_details(self):
+        """
+        :func:`fold_servers_details` combines each page of servers with the
+        result so far, and returns the result of the last page.
+        """
+        bodies = [
+            {'servers': ['1', '2'],
+             'servers_links': [{'href': 'doesnt_matter_url?marker=3',
+                                'rel': 'next'}]},
+            {'servers': ['3']}
+        ]
+        resps = [json.dumps(d) for d in bodies]
+
+        eff = fold_servers_details(lambda acc, page: acc + (len(page),), (),
+                                   {'marker': ['1']})
+        seq = [
+            (self._list_server_details_intent({'marker': ['1']}),
+             service_request_eqf(stub_pure_response(resps[0], 200))),
+            (self._list_server_details_log_intent(bodies[0]), lambda _: None),
+            (self._list_server_details_intent({'marker': ['3']}),
+             service_request_eqf(stub_pure_response(resps[1], 200))),
+            (self._list_server_details_log_intent(bodies[1]), lambda _: None)
+        ]
+        self.assertEqual(perform_sequence(seq, eff), (2, 1))
+
     def test_list_servers_details_all_blows_up_if_got_same_link_twice(self):
         """
         :func:`list_servers_details_all` raises an exception if Nova returns
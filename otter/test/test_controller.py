@@ -6,7 +6,9 @@ from datetime import datetime, timedelta
 from effect import (
     ComposedDispatcher,
     Effect,
-    sync_perform)
+    TypeDispatcher,
+    sync_perform,
+    sync_performer)
 from effect.testing import (
     SequenceDispatcher, parallel_sequence, perform_sequence)
 
@@ -15,6 +17,7 @@ import mock
 from testtools.matchers import ContainsDict, Equals
 
 from twisted.internet import defer
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from otter import controller
@@ -23,8 +26,9 @@ from otter.cloud_client import (
     TenantScope,
     get_server_details,
     set_nova_metadata_item)
+from otter.constants import ServiceType
 from otter.convergence.planning import DRAINING_METADATA
-from otter.log.intents import BoundFields, Log
+from otter.log.intents import BoundFields, Log, get_log_dispatcher
 from otter.models.intents import GetScalingGroupInfo, ModifyGroupStatePaused
 from otter.models.interface import (
     GroupNotEmptyError, GroupState, IScalingGroup, NoSuchPolicyError,
@@ -45,9 +49,11 @@ from otter.test.utils import (
     raise_,
     test_dispatcher)
 from otter.util.config import set_config_data
+from otter.util.deadline import Deadline, bind_deadline, current_deadline
 from otter.util.fp import assoc_obj
 from otter.util.retry import (
-    Retry, ShouldDelayAndRetry, exponential_backoff_interval, retry_times)
+    FULL_JITTER, Retry, ShouldDelayAndRetry, exponential_backoff_interval,
+    retry_times)
 from otter.util.timestamp import MIN
 from otter.util.zk import CreateOrSet, DeleteNode
 from otter.worker_intents import EvictServerFromScalingGroup
@@ -75,7 +81,7 @@ class PauseGroupTests(SynchronousTestCase):
              nested_sequence([
                  parallel_sequence([
                      [(ModifyGroupStatePaused(self.group, True), noop)],
-                     [(DeleteNode(path="/groups/divergent/tid_gid",
+                     [(DeleteNode(path="/groups/divergent-buckets/4/tid_gid",
                                   version=-1),
                        noop),
                       (Log("mark-clean-success", {}), noop)],
@@ -119,7 +125,7 @@ class PauseGroupTests(SynchronousTestCase):
              nested_sequence([
                  parallel_sequence([
                      [(ModifyGroupStatePaused(self.group, False), noop)],
-                     [(CreateOrSet(path="/groups/divergent/tid_gid",
+                     [(CreateOrSet(path="/groups/divergent-buckets/4/tid_gid",
                                    content="dirty"),
                        noop),
                       (Log("mark-dirty-success", {}), noop)]
@@ -1217,6 +1223,20 @@ class MaybeExecuteScalingPolicyTestCase(SynchronousTestCase):
         # state should have been updated
         self.assertEqual(self.mock_state.policy_touched["pol1"], "now")
 
+    def test_config_given(self):
+        """
+        The given config is used without reading it from the group.
+        """
+        self.mocks['execute_launch_config'].return_value = defer.succeed(None)
+        d = controller.maybe_execute_scaling_policy(
+            self.mock_log, 'transaction', self.group, self.mock_state, 'pol1',
+            config="given config")
+        self.assertEqual(self.successResultOf(d), self.mock_state)
+        self.assertFalse(self.group.view_config.called)
+        self.mocks['check_cooldowns'].assert_called_once_with(
+            self.mock_log.bind.return_value, self.mock_state, "given config",
+            "policy", 'pol1')
+
     def test_execute_launch_config_failure_on_positive_delta(self):
         """
         If ``execute_launch_config`` fails for some reason, then state should
@@ -1572,9 +1592,206 @@ class ModifyAndTriggerTests(SynchronousTestCase):
         self.assertTrue(self.disp.consumed())
 
 
+class ExecuteAndTriggerTests(SynchronousTestCase):
+    """
+    Tests for :func:`execute_and_trigger`
+    """
+
+    def setUp(self):
+        self.group = iMock(IScalingGroup, tenant_id="t", uuid="g")
+        self.locks = []
+        self.saved = []
+
+        def modify_state(modifier, with_config=False,
+                         modify_state_reason=None):
+            self.assertTrue(with_config)
+            lock = defer.Deferred()
+            self.locks.append(lock)
+            lock.addCallback(lambda _: modifier(self.group, [], "config"))
+            return lock.addCallback(self.saved.append)
+
+        self.group.modify_state.side_effect = modify_state
+        set_config_data({"convergence-tenants": ["t"]})
+        self.addCleanup(set_config_data, None)
+        self.mock_tg = patch(self, "otter.controller.trigger_convergence",
+                             side_effect=intent_func("tg"))
+        self.logargs = {"a": "b"}
+        self.disp = SequenceDispatcher([self.trigger()])
+        self.executions = {}
+
+    def trigger(self):
+        """
+        Expected convergence trigger of the group.
+        """
+        return (BoundFields(mock.ANY, self.logargs),
+                nested_sequence([(("tg", "t", "g"), noop)]))
+
+    def execute(self, policy_id, error=None, reason="r"):
+        """
+        Execute a policy whose modifier appends ``policy_id`` to the state
+        and then fails with ``error`` if given.
+        """
+        def modifier(group, state, config):
+            self.assertEqual(config, "config")
+            state.append(policy_id)
+            if error is not None:
+                raise error
+            return state
+
+        return controller.execute_and_trigger(
+            self.disp, self.group, self.logargs, modifier, self.executions,
+            modify_state_reason=reason)
+
+    def test_coalesced(self):
+        """
+        Executions that come in while the first one waits for the lock are
+        applied in order under one ``modify_state``. Failing executions do
+        not change the state, the state is saved and convergence triggered
+        once, and each execution gets its own result.
+        """
+        ce = controller.CannotExecutePolicyError("t", "g", "b", "w")
+        ds = [self.execute("a"), self.execute("b", ce), self.execute("c")]
+        self.group.modify_state.assert_called_once_with(
+            mock.ANY, with_config=True, modify_state_reason="r")
+        for d in ds:
+            self.assertNoResult(d)
+        self.assertFalse(self.disp.consumed())
+
+        self.locks[0].callback(None)
+        self.assertEqual(self.saved, [["a", "c"]])
+        self.assertIsNone(self.successResultOf(ds[0]))
+        self.assertIs(self.failureResultOf(ds[1]).value, ce)
+        self.assertIsNone(self.successResultOf(ds[2]))
+        self.assertTrue(self.disp.consumed())
+        self.assertEqual(self.executions, {})
+
+    def test_not_coalesced(self):
+        """
+        Executions of another group or with another ``modify_state_reason``
+        are not coalesced.
+        """
+        self.disp = SequenceDispatcher([
+            self.trigger(), self.trigger(),
+            (BoundFields(mock.ANY, self.logargs),
+             nested_sequence([(("tg", "t", "g2"), noop)]))])
+        d1 = self.execute("a")
+        d2 = self.execute("b", reason="other")
+        group, self.group = self.group, iMock(
+            IScalingGroup, tenant_id="t", uuid="g2")
+        self.group.modify_state.side_effect = group.modify_state.side_effect
+        d3 = self.execute("c")
+        self.assertEqual(len(self.locks), 3)
+        for lock in self.locks:
+            lock.callback(None)
+        for d in (d1, d2, d3):
+            self.assertIsNone(self.successResultOf(d))
+        self.assertEqual(self.saved, [["a"], ["b"], ["c"]])
+        self.assertTrue(self.disp.consumed())
+
+    def test_coalesced_with_request_deadlines(self):
+        """
+        Executions performed with dispatchers bound to their own deadlines,
+        like the ones of REST requests when ``rest.time_budget`` is
+        configured, are coalesced. Convergence is triggered outside of any
+        deadline.
+        """
+        clock = Clock()
+        triggered = []
+
+        @sync_performer
+        def perform_trigger(dispatcher, intent):
+            triggered.append((intent, current_deadline(dispatcher)))
+
+        base = ComposedDispatcher([
+            TypeDispatcher({tuple: perform_trigger}),
+            get_log_dispatcher(mock_log(), {})])
+        self.disp = bind_deadline(base, Deadline(10, clock))
+        d1 = self.execute("a")
+        self.disp = bind_deadline(base, Deadline(20, clock))
+        d2 = self.execute("b")
+        self.assertEqual(len(self.locks), 1)
+
+        clock.advance(15)
+        self.locks[0].callback(None)
+        self.assertEqual(self.saved, [["a", "b"]])
+        self.assertIsNone(self.successResultOf(d1))
+        self.assertIsNone(self.successResultOf(d2))
+        self.assertEqual(triggered, [(("tg", "t", "g"), None)])
+
+    def test_new_batch_once_applying(self):
+        """
+        Executions that come in after the queued ones started being applied
+        wait for the next ``modify_state``.
+        """
+        applying = defer.Deferred()
+        self.disp = SequenceDispatcher([self.trigger(), self.trigger()])
+        d1 = controller.execute_and_trigger(
+            self.disp, self.group, self.logargs,
+            lambda group, state, config: applying, self.executions,
+            modify_state_reason="r")
+        self.locks[0].callback(None)
+        d2 = self.execute("b")
+        self.assertEqual(len(self.locks), 2)
+        applying.callback(["a"])
+        self.assertIsNone(self.successResultOf(d1))
+        self.assertNoResult(d2)
+
+        self.locks[1].callback(None)
+        self.assertIsNone(self.successResultOf(d2))
+        self.assertEqual(self.saved, [["a"], ["b"]])
+        self.assertTrue(self.disp.consumed())
+
+    def test_none_applied(self):
+        """
+        If no execution succeeds, the state is not saved and each execution
+        fails with its own error. Convergence is still triggered if one of
+        them could not be executed.
+        """
+        ce = controller.CannotExecutePolicyError("t", "g", "b", "w")
+        d1 = self.execute("a", ValueError("a"))
+        d2 = self.execute("b", ce)
+        self.locks[0].callback(None)
+        self.assertEqual(self.saved, [])
+        self.failureResultOf(d1, ValueError)
+        self.assertIs(self.failureResultOf(d2).value, ce)
+        self.assertTrue(self.disp.consumed())
+
+    def test_errors_only(self):
+        """
+        Convergence is not triggered if every execution failed with an error
+        other than :obj:`CannotExecutePolicyError`.
+        """
+        d = self.execute("a", ValueError("a"))
+        self.locks[0].callback(None)
+        self.failureResultOf(d, ValueError)
+        self.assertFalse(self.disp.consumed())
+
+    def test_modify_state_error(self):
+        """
+        If ``modify_state`` fails, every execution fails with its error and
+        convergence is not triggered.
+        """
+        ds = [self.execute("a"), self.execute("b")]
+        self.locks[0].errback(NoSuchScalingGroupError("t", "g"))
+        for d in ds:
+            self.failureResultOf(d, NoSuchScalingGroupError)
+        self.assertFalse(self.disp.consumed())
+        self.assertEqual(self.executions, {})
+
+    def test_worker_tenant(self):
+        """
+        Convergence is not triggered for worker tenants.
+        """
+        set_config_data(None)
+        d = self.execute("a")
+        self.locks[0].callback(None)
+        self.assertIsNone(self.successResultOf(d))
+        self.assertFalse(self.disp.consumed())
+
+
 _should_retry_params = ShouldDelayAndRetry(
     can_retry=retry_times(3),
-    next_interval=exponential_backoff_interval(2))
+    next_interval=exponential_backoff_interval(2, jitter=FULL_JITTER))
 
 
 class ConvergenceRemoveServerTests(SynchronousTestCase):
@@ -1639,7 +1856,8 @@ class ConvergenceRemoveServerTests(SynchronousTestCase):
         return (
             TenantScope(mock.ANY, self.group.tenant_id),
             nested_sequence([
-                (Retry(effect=mock.ANY, should_retry=_should_retry_params),
+                (Retry(effect=mock.ANY, should_retry=_should_retry_params,
+                       budget=ServiceType.CLOUD_SERVERS),
                  nested_sequence(seq))
             ])
         )
@@ -7,6 +7,10 @@ from twisted.trial.unittest import SynchronousTestCase
 
 from otter.auth import Authenticate, InvalidateToken
 from otter.cloud_client import TenantScope
+from otter.convergence.drain_times import GetDrainTimes, StoreDrainTimes
+from otter.convergence.scheduler import (
+    BackOff, RecordDivergence, ScheduleConvergence)
+from otter.convergence.snapshot import ReadSnapshot, SnapshotScope
 from otter.effect_dispatcher import (
     get_full_dispatcher,
     get_legacy_dispatcher,
@@ -14,6 +18,7 @@ from otter.effect_dispatcher import (
 from otter.log.intents import BoundFields, Log, LogErr, MsgWithTime
 from otter.models.cass import CQLQueryExecute
 from otter.models.intents import GetScalingGroupInfo
+from otter.util.deadline import DeadlineScope
 from otter.util.pure_http import Request
 from otter.util.retry import Retry
 from otter.util.zk import CreateOrSet
@@ -47,7 +52,15 @@ def full_intents():
                                     server_id='server_id'),
         Log('msg', {}), LogErr('f', 'msg', {}), BoundFields(Effect(None), {}),
         MsgWithTime('msg', Effect(None)),
-        CQLQueryExecute(query='q', params={}, consistency_level=7)
+        CQLQueryExecute(query='q', params={}, consistency_level=7),
+        SnapshotScope(Effect(None), 'run'),
+        ReadSnapshot('tenant', 'servers', Effect(None)),
+        ScheduleConvergence('tenant', 'group', Effect(None)),
+        RecordDivergence('group', 1),
+        BackOff('group'),
+        GetDrainTimes([], []),
+        StoreDrainTimes({}),
+        DeadlineScope(Effect(None), 10),
     ]
 
 
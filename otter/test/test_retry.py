@@ -2,6 +2,7 @@
 Tests for :mod:`otter.utils.retry`
 """
 import sys
+from functools import partial
 
 from effect import (
     ComposedDispatcher, Constant, Delay, Effect, Func, TypeDispatcher,
@@ -18,7 +19,11 @@ from twisted.trial.unittest import SynchronousTestCase
 from otter.test.utils import (
     CheckFailure, CheckFailureValue, DummyException, resolve_effect)
 from otter.util.retry import (
+    DECORRELATED_JITTER,
+    FULL_JITTER,
     Retry,
+    RetryBudget,
+    RetryBudgets,
     ShouldDelayAndRetry,
     compose_retries,
     exponential_backoff_interval,
@@ -407,6 +412,106 @@ class NextIntervalHelperTests(SynchronousTestCase):
         self.assertEqual(next_interval(err), 6)
         self.assertEqual(next_interval(err), 12)
 
+    def test_exp_backoff_full_jitter(self):
+        """
+        With full jitter, each interval is random between 0 and the
+        exponentially growing interval.
+        """
+        err = DummyException()
+        next_interval = exponential_backoff_interval(3, jitter=FULL_JITTER)
+        with mock.patch('otter.util.retry.random.uniform',
+                        side_effect=lambda a, b: (a, b)):
+            self.assertEqual(next_interval(err), (0, 3))
+            self.assertEqual(next_interval(err), (0, 6))
+            self.assertEqual(next_interval(err), (0, 12))
+
+    def test_exp_backoff_decorrelated_jitter(self):
+        """
+        With decorrelated jitter, each interval is random between ``start``
+        and three times the previous interval.
+        """
+        err = DummyException()
+        next_interval = exponential_backoff_interval(
+            3, jitter=DECORRELATED_JITTER)
+        with mock.patch('otter.util.retry.random.uniform',
+                        side_effect=[3, 7, 10]) as uniform:
+            self.assertEqual(
+                [next_interval(err) for _ in range(3)], [3, 7, 10])
+        self.assertEqual(uniform.mock_calls,
+                         [mock.call(3, 3), mock.call(3, 9),
+                          mock.call(3, 21)])
+
+
+class RetryBudgetTests(SynchronousTestCase):
+    """Tests for :obj:`RetryBudget`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.budget = RetryBudget(self.clock, ratio=0.5,
+                                  min_retries_per_second=0.2, ttl=10)
+
+    def test_minimum(self):
+        """
+        ``min_retries_per_second * ttl`` retries are allowed without any
+        successes.
+        """
+        self.assertEqual(self.budget.balance(), 2)
+        self.budget.withdraw()
+        self.assertTrue(self.budget.can_retry())
+        self.budget.withdraw()
+        self.assertFalse(self.budget.can_retry())
+
+    def test_ratio(self):
+        """
+        ``ratio`` retries are allowed per success.
+        """
+        for _ in range(4):
+            self.budget.deposit()
+        self.assertEqual(self.budget.balance(), 4)
+
+    def test_expiry(self):
+        """
+        Successes and retries older than ``ttl`` seconds are forgotten.
+        """
+        self.budget.deposit()
+        self.budget.deposit()
+        self.budget.withdraw()
+        self.clock.advance(5)
+        self.budget.withdraw()
+        self.assertEqual(self.budget.balance(), 1)
+        self.clock.advance(5)
+        self.assertEqual(self.budget.balance(), 1)
+        self.clock.advance(5)
+        self.assertEqual(self.budget.balance(), 2)
+
+
+class RetryBudgetsTests(SynchronousTestCase):
+    """
+    Tests for :obj:`RetryBudgets`.
+    """
+
+    def test_one_budget_per_service(self):
+        """
+        :meth:`RetryBudgets.get` returns one budget per service, created with
+        the given clock and config.
+        """
+        clock = Clock()
+        budgets = RetryBudgets(clock, {'ratio': 0.3, 'ttl': 5})
+        budget = budgets.get('nova')
+        self.assertIs(budget.clock, clock)
+        self.assertEqual((budget.ratio, budget.ttl), (0.3, 5))
+        self.assertIs(budgets.get('nova'), budget)
+        self.assertIsNot(budgets.get('clb'), budget)
+
+    def test_default_config(self):
+        """
+        :obj:`RetryBudgets` creates budgets with the default
+        :obj:`RetryBudget` arguments if not given a config.
+        """
+        budget = RetryBudgets(Clock()).get('nova')
+        self.assertEqual((budget.ratio, budget.min_retries_per_second,
+                          budget.ttl), (0.2, 1, 10))
+
 
 STUB = Effect(Stub(Constant("foo")))
 
@@ -430,6 +535,13 @@ class RetryEffectTests(SynchronousTestCase):
                 should_retry=ShouldDelayAndRetry(can_retry=can_retry,
                                                  next_interval=next_interval))))
 
+    def test_retry_effect_budget(self):
+        """
+        :func:`retry_effect` puts the budget it is given in the :obj:`Retry`.
+        """
+        eff = retry_effect(STUB, None, None, budget='nova')
+        self.assertEqual(eff.intent.budget, 'nova')
+
 
 def _raise(exc):
     raise exc
@@ -494,6 +606,57 @@ class EffectfulRetryTests(SynchronousTestCase):
         result = sync_perform(self.dispatcher, Effect(retry))
         self.assertEqual(result, "final")
 
+    def test_perform_retry_budget(self):
+        """
+        When the :obj:`Retry` has a budget, successes are deposited in the
+        service's budget, retries are withdrawn from it, and the effect is not
+        retried when it is exhausted.
+        """
+        budgets = RetryBudgets(Clock(), {'ratio': 1,
+                                         'min_retries_per_second': 0.1})
+        dispatcher = ComposedDispatcher([
+            base_dispatcher,
+            TypeDispatcher({Retry: partial(perform_retry, budgets=budgets)})])
+        budget = budgets.get('nova')
+        budget.withdraw()
+        should_retry_calls = []
+
+        def should_retry(exc_info):
+            should_retry_calls.append(exc_info)
+            return Effect(Constant(True))
+
+        func = _repeated_effect_func(
+            lambda: _raise(RuntimeError("foo")),
+            lambda: _raise(RuntimeError("foo")),
+            lambda: "final")
+        retry = Retry(effect=Effect(Func(func)), should_retry=should_retry,
+                      budget='nova')
+
+        # Only the minimum budget, which is already used up
+        self.assertRaises(RuntimeError,
+                          sync_perform, dispatcher, Effect(retry))
+        self.assertEqual(should_retry_calls, [])
+
+        budget.deposit()
+        self.assertEqual(sync_perform(dispatcher, Effect(retry)), "final")
+        self.assertEqual(len(should_retry_calls), 1)
+        # 1 minimum retry + 2 successes - 2 retries
+        self.assertEqual(budget.balance(), 1)
+
+    def test_perform_retry_without_budgets(self):
+        """
+        The budget of the :obj:`Retry` is ignored if the performer is not
+        given any budgets.
+        """
+        func = _repeated_effect_func(
+            lambda: _raise(RuntimeError("foo")),
+            lambda: "final")
+        retry = Retry(effect=Effect(Func(func)),
+                      should_retry=lambda e: Effect(Constant(True)),
+                      budget='nova')
+        self.assertEqual(sync_perform(self.dispatcher, Effect(retry)),
+                         "final")
+
 
 def get_exc_info():
     """Get the exc_info tuple representing a ZeroDivisionError('foo')"""
@@ -511,16 +511,17 @@ class ExecuteEventTests(SchedulerTests):
         self.mock_group = iMock(IScalingGroup)
         self.mock_store.get_scaling_group.return_value = self.mock_group
 
-        # mock out modify_and_trigger
-        self.mock_mt = patch(self, "otter.scheduler.modify_and_trigger")
+        # mock out execute_and_trigger
+        self.mock_mt = patch(self, "otter.scheduler.execute_and_trigger")
         self.new_state = None
 
         def _set_new_state(new_state):
             self.new_state = new_state
 
-        def _mock_modify_trigger(disp, group, logargs, modifier,
+        def _mock_modify_trigger(disp, group, logargs, modifier, executions,
                                  modify_state_reason=None, *args, **kwargs):
             self.assertEqual(disp, "disp")
+            self.assertIs(executions, self.mock_store.policy_executions)
             d = modifier(group, "state", *args, **kwargs)
             return d.addCallback(_set_new_state)
 
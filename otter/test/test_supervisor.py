@@ -1,7 +1,8 @@
 """
 Tests for the worker supervisor.
 """
-from effect import Constant, Effect
+from effect import (
+    ComposedDispatcher, Constant, Effect, TypeDispatcher, sync_performer)
 
 import mock
 
@@ -9,13 +10,15 @@ from testtools.matchers import ContainsDict, Equals, IsInstance
 
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.defer import succeed, fail, Deferred
-from twisted.internet.task import Cooperator
+from twisted.internet.task import Clock, Cooperator
+
+from txeffect import perform
 
 from zope.interface.verify import verifyObject
 
 from otter import supervisor
-from otter.auth import IAuthenticator
-from otter.cloud_client import TenantScope
+from otter.auth import Authenticate, IAuthenticator
+from otter.cloud_client import TenantScope, service_request
 from otter.constants import ServiceType
 from otter.models.interface import (
     GroupState, IScalingGroup, NoSuchScalingGroupError, ScalingGroupStatus)
@@ -27,10 +30,15 @@ from otter.supervisor import (
     execute_launch_config,
     remove_server_from_group,
     set_supervisor)
+from otter.test.test_cloud_client import make_service_configs
 from otter.test.utils import (
     CheckFailure, DummyException, FakeSupervisor, IsBoundWith, iMock, matches,
-    mock_group, mock_log, patch)
+    mock_group, mock_log, patch, stub_pure_response)
+from otter.test.worker.test_launch_server_v1 import fake_service_catalog
+from otter.util.config import set_config_data
 from otter.util.deferredutils import DeferredPool
+from otter.util.pure_http import Request
+from otter.util.ratelimit import RateLimiters
 
 
 class FakeSupervisorTests(SynchronousTestCase):
@@ -148,6 +156,45 @@ class HealthCheckTests(SupervisorTests):
                          (True, {'jobs': 0}))
 
 
+class RequestBagTests(SupervisorTests):
+    """
+    Tests for the request bags made by the supervisor.
+    """
+
+    def test_request_bags_share_rate_limits(self):
+        """
+        The dispatchers of all the request bags throttle their requests with
+        the supervisor's rate limiters, so creating servers in different
+        groups draws from the same ``create_server`` bucket.
+        """
+        set_config_data(
+            {"cloud_client": {"throttling": {"create_server_delay": 1}}})
+        self.addCleanup(set_config_data, None)
+        clock = Clock()
+        supervisor = SupervisorService(
+            self.authenticator, self.region, self.cooperator.coiterate,
+            make_service_configs(), limiters=RateLimiters(clock))
+        fake = TypeDispatcher({
+            Authenticate: sync_performer(
+                lambda d, i: ('token', fake_service_catalog)),
+            Request: sync_performer(
+                lambda d, i: stub_pure_response({}, 200))})
+        svcreq = service_request(ServiceType.CLOUD_SERVERS, 'POST', 'servers')
+
+        def create_server(group):
+            bag = self.successResultOf(
+                supervisor._get_request_bag(self.log, group))
+            return perform(
+                ComposedDispatcher([fake, bag.dispatcher]),
+                Effect(TenantScope(tenant_id=group.tenant_id, effect=svcreq)))
+
+        self.successResultOf(create_server(self.group))
+        d = create_server(mock_group(None, '22222', 'other-group'))
+        self.assertNoResult(d)
+        clock.advance(1)
+        self.successResultOf(d)
+
+
 class LaunchConfigTests(SupervisorTests):
     """
     Test supervisor worker execution.
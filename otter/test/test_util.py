@@ -1,10 +1,13 @@
 """
 Tests for ``otter.util``
 """
+from collections import OrderedDict
 from datetime import datetime
 import mock
 import json
 
+import iso8601
+
 from twisted.trial.unittest import SynchronousTestCase
 from twisted.internet.defer import succeed, fail, Deferred
 from twisted.internet.task import Clock
@@ -430,6 +433,64 @@ class TimestampTests(SynchronousTestCase):
             timestamp.timestamp_to_epoch('2015-05-01T04:51:12.078580Z'),
             1430455872.078580)
 
+    def test_timestamp_to_epoch_other_formats(self):
+        """
+        ``timestamp_to_epoch`` parses timestamps that are not in the
+        ``YYYY-MM-DDTHH:MM:SS[.ffffff]Z`` format with :mod:`iso8601`, and
+        raises its error for invalid timestamps.
+        """
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('2015-05-01T06:51:12.5+02:00'),
+            1430455872.5)
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('2015-05-01T04:51:12.1234567Z'),
+            1430455872.123456)
+        self.assertRaises(iso8601.ParseError, timestamp.timestamp_to_epoch,
+                          '2015-13-01T04:51:12Z')
+
+    def test_timestamp_to_epoch_remembers(self):
+        """
+        ``timestamp_to_epoch`` remembers EPOCHs of timestamps it converted,
+        up to ``EPOCH_CACHE_SIZE`` of them.
+        """
+        self.patch(timestamp, '_epochs', OrderedDict())
+        self.patch(timestamp, 'EPOCH_CACHE_SIZE', 2)
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:01Z')
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:02Z')
+        self.assertEqual(timestamp._epochs,
+                         {'1970-01-01T00:00:01Z': 1.0,
+                          '1970-01-01T00:00:02Z': 2.0})
+        self.patch(timestamp, '_parse_zulu', lambda ts: 1 / 0)
+        self.assertEqual(
+            timestamp.timestamp_to_epoch('1970-01-01T00:00:01Z'), 1.0)
+
+    def test_timestamp_to_epoch_evicts_least_recently_used(self):
+        """
+        When ``EPOCH_CACHE_SIZE`` timestamps are remembered,
+        ``timestamp_to_epoch`` forgets the least recently converted one to
+        remember a new one.
+        """
+        self.patch(timestamp, '_epochs', OrderedDict())
+        self.patch(timestamp, 'EPOCH_CACHE_SIZE', 2)
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:01Z')
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:02Z')
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:01Z')
+        timestamp.timestamp_to_epoch('1970-01-01T00:00:03Z')
+        self.assertEqual(timestamp._epochs.items(),
+                         [('1970-01-01T00:00:01Z', 1.0),
+                          ('1970-01-01T00:00:03Z', 3.0)])
+
+    def test_timestamp_to_epoch_unhashable(self):
+        """
+        ``timestamp_to_epoch`` does not remember non-string timestamps, so
+        unhashable ones fail in :mod:`iso8601` like any other invalid
+        timestamp rather than with a ``TypeError`` from the cache.
+        """
+        self.patch(timestamp, '_epochs', OrderedDict())
+        self.assertRaises(iso8601.ParseError, timestamp.timestamp_to_epoch,
+                          ['1970-01-01T00:00:01Z'])
+        self.assertEqual(timestamp._epochs, {})
+
     def test_datetime_to_epoch(self):
         """
         `datetime_to_epoch` returns EPOCH seconds for given datetime
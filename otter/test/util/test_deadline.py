@@ -0,0 +1,184 @@
+"""Tests for :mod:`otter.util.deadline`."""
+
+from effect import (
+    ComposedDispatcher, Delay, Effect, TypeDispatcher, base_dispatcher,
+    sync_perform, sync_performer)
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.deadline import (
+    Deadline,
+    DeadlineExceeded,
+    GetDeadline,
+    bind_deadline,
+    current_deadline,
+    get_deadline_dispatcher,
+    unbound_dispatcher,
+    with_deadline,
+    within_deadline)
+from otter.util.deferredutils import TimedOutError
+
+
+class DeadlineTests(SynchronousTestCase):
+    """Tests for :obj:`Deadline`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(100)
+        self.deadline = Deadline(110, self.clock)
+
+    def test_remaining(self):
+        """
+        ``remaining`` is the number of seconds left before the deadline, or 0
+        after it.
+        """
+        self.assertEqual(self.deadline.remaining(), 10)
+        self.clock.advance(15)
+        self.assertEqual(self.deadline.remaining(), 0)
+
+    def test_check(self):
+        """
+        ``check`` raises :obj:`DeadlineExceeded` if the time needed is not
+        left before the deadline.
+        """
+        self.deadline.check('work', 9)
+        e = self.assertRaises(DeadlineExceeded,
+                              self.deadline.check, 'work', 10)
+        self.assertEqual((e.description, e.remaining), ('work', 10))
+        self.clock.advance(10)
+        self.assertRaises(DeadlineExceeded, self.deadline.check, 'work')
+
+    def test_bound(self):
+        """
+        ``bound`` times out the Deferred at the deadline.
+        """
+        d = self.deadline.bound(Deferred(), 'work')
+        self.clock.advance(9)
+        self.assertNoResult(d)
+        self.clock.advance(1)
+        self.failureResultOf(d, TimedOutError)
+
+
+class DeadlineScopeTests(SynchronousTestCase):
+    """
+    Tests for performing :obj:`DeadlineScope` with the dispatcher from
+    :func:`get_deadline_dispatcher`.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.delays = []
+        self.dispatcher = ComposedDispatcher([
+            get_deadline_dispatcher(self.clock),
+            TypeDispatcher({
+                Delay: sync_performer(
+                    lambda d, i: self.delays.append(i.delay))}),
+            base_dispatcher])
+
+    def test_no_deadline(self):
+        """
+        Outside of a scope there is no deadline.
+        """
+        self.assertIsNone(current_deadline(self.dispatcher))
+
+    def test_deadline(self):
+        """
+        Inside a scope, the deadline is the scope's budget from now.
+        """
+        self.clock.advance(10)
+        eff = with_deadline(Effect(GetDeadline()), 5)
+        self.assertEqual(sync_perform(self.dispatcher, eff),
+                         Deadline(15, self.clock))
+
+    def test_nested_scope_cannot_extend(self):
+        """
+        A scope nested in another one takes the earlier of the two deadlines.
+        """
+        eff = with_deadline(with_deadline(Effect(GetDeadline()), 50), 5)
+        self.assertEqual(sync_perform(self.dispatcher, eff).at, 5)
+        eff = with_deadline(with_deadline(Effect(GetDeadline()), 3), 5)
+        self.assertEqual(sync_perform(self.dispatcher, eff).at, 3)
+
+    def test_delay_within_budget(self):
+        """
+        A delay that ends before the deadline is performed by the outer
+        dispatcher.
+        """
+        eff = with_deadline(Effect(Delay(4)), 5)
+        sync_perform(self.dispatcher, eff)
+        self.assertEqual(self.delays, [4])
+
+    def test_delay_beyond_budget(self):
+        """
+        A delay that would end at or after the deadline fails with
+        :obj:`DeadlineExceeded` without delaying.
+        """
+        eff = with_deadline(Effect(Delay(5)), 5)
+        self.assertRaises(DeadlineExceeded, sync_perform, self.dispatcher, eff)
+        self.assertEqual(self.delays, [])
+
+
+class UnboundDispatcherTests(SynchronousTestCase):
+    """Tests for :func:`unbound_dispatcher`."""
+
+    def test_not_bound(self):
+        """
+        A dispatcher not bound to a deadline is returned as is.
+        """
+        self.assertIs(unbound_dispatcher(base_dispatcher), base_dispatcher)
+
+    def test_bound(self):
+        """
+        The dispatcher that was bound to deadlines is returned, however many
+        times it was bound.
+        """
+        clock = Clock()
+        bound = bind_deadline(
+            bind_deadline(base_dispatcher, Deadline(10, clock)),
+            Deadline(5, clock))
+        self.assertIs(unbound_dispatcher(bound), base_dispatcher)
+
+
+class WithinDeadlineTests(SynchronousTestCase):
+    """Tests for :func:`within_deadline`."""
+
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = []
+
+    def work(self, *args, **kwargs):
+        self.calls.append((args, kwargs))
+        self.d = Deferred()
+        return self.d
+
+    def test_no_deadline(self):
+        """
+        Outside of a scope, the function is just called.
+        """
+        d = within_deadline(base_dispatcher, 'work', self.work, 1, a=2)
+        self.assertIs(d, self.d)
+        self.assertEqual(self.calls, [((1,), {'a': 2})])
+        self.clock.advance(1000)
+        self.assertNoResult(d)
+
+    def test_bound(self):
+        """
+        The function's Deferred is timed out at the deadline.
+        """
+        disp = bind_deadline(base_dispatcher, Deadline(5, self.clock))
+        d = within_deadline(disp, 'work', self.work, 1)
+        self.assertEqual(self.calls, [((1,), {})])
+        self.clock.advance(5)
+        self.failureResultOf(d, TimedOutError)
+
+    def test_expired(self):
+        """
+        The function is not called after the deadline.
+        """
+        disp = bind_deadline(base_dispatcher, Deadline(5, self.clock))
+        self.clock.advance(5)
+        self.assertRaises(DeadlineExceeded,
+                          within_deadline, disp, 'work', self.work)
+        self.assertEqual(self.calls, [])
@@ -0,0 +1,85 @@
+"""Tests for :mod:`otter.util.http_pools`."""
+
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.util.http_pools import ConnectionPools
+
+
+class FakeConnection(object):
+    """A connection that is always ready to be reused."""
+    state = 'QUIESCENT'
+
+
+class FakeEndpoint(object):
+    """An endpoint that connects immediately."""
+
+    def connect(self, factory):
+        return succeed(FakeConnection())
+
+
+class ConnectionPoolsTests(SynchronousTestCase):
+    """
+    Tests for :obj:`ConnectionPools`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.pools = ConnectionPools(self.clock, 3, 10)
+        self.used = []
+
+    def use_pool(self, url):
+        """Run a call with ``url``'s pool and return the pool."""
+        self.pools.run(url, lambda pool: self.used.append(pool))
+        return self.used[-1]
+
+    def used_pool(self, host):
+        """Return the pool of the given host."""
+        return self.pools._pools[host]
+
+    def test_pool_per_host(self):
+        """
+        The same pool is given to calls to the same host, and different
+        pools to different hosts, ports or schemes.
+        """
+        pool = self.use_pool('https://a.com/v2/servers')
+        self.assertIs(self.use_pool('https://a.com/v2/flavors?x=1'), pool)
+        self.assertIsNot(self.use_pool('https://b.com/v2/servers'), pool)
+        self.assertIsNot(self.use_pool('https://a.com:8443/v2/servers'), pool)
+        self.assertIsNot(self.use_pool('http://a.com/v2/servers'), pool)
+        self.assertEqual(
+            (pool.persistent, pool.maxPersistentPerHost,
+             pool.cachedConnectionTimeout),
+            (True, 3, 10))
+
+    def test_run(self):
+        """
+        ``run`` calls the function with the given arguments and the pool,
+        and returns its result.
+        """
+        d = self.pools.run('http://a/', lambda *a, **kw: (a, kw), 1, b=2)
+        self.assertEqual(self.successResultOf(d),
+                         ((1,), {'b': 2, 'pool': self.used_pool('http://a')}))
+
+    def test_stats(self):
+        """
+        ``stats`` returns the number of connections asked for, reused and
+        opened by each host's pool, and the number of calls in flight.
+        """
+        d = Deferred()
+        self.pools.run('http://a/', lambda pool: d)
+        pool = self.used_pool('http://a')
+        endpoint = FakeEndpoint()
+        conn = self.successResultOf(pool.getConnection('k', endpoint))
+        pool._putConnection('k', conn)
+        self.assertEqual(
+            self.pools.stats(),
+            {'http://a': {'requests': 1, 'hits': 0, 'misses': 1,
+                          'in_flight': 1, 'idle': 1}})
+        pool.getConnection('k', endpoint)
+        d.callback(None)
+        self.assertEqual(
+            self.pools.health_check(),
+            (True, {'http://a': {'requests': 2, 'hits': 1, 'misses': 1,
+                                 'in_flight': 0, 'idle': 0}}))
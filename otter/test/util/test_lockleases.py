@@ -0,0 +1,183 @@
+"""Tests for :mod:`otter.util.lockleases`."""
+
+import mock
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.test.utils import CheckFailure
+from otter.util.lockleases import LockLeases
+
+
+class FakeLock(object):
+    """
+    A txkazoo lock recording its acquisitions and releases.
+    """
+
+    def __init__(self, path, identifier):
+        self.path = path
+        self.identifier = identifier
+        self.acquired = []
+        self.released = 0
+        self.contending = [identifier]
+
+    def acquire(self, timeout=None):
+        self.acquired.append(timeout)
+        return succeed(True)
+
+    def release(self):
+        self.released += 1
+        return succeed(True)
+
+    def contenders(self):
+        return succeed(self.contending)
+
+
+class LockLeasesTests(SynchronousTestCase):
+    """
+    Tests for :obj:`LockLeases` and the :obj:`LeasedLock` it gives.
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.log = mock.Mock()
+        self.leases = LockLeases(self.clock, 5, self.log)
+        self.locks = []
+        self.kz_client = mock.Mock(spec=['Lock'])
+        self.kz_client.Lock.side_effect = self.new_lock
+
+    def new_lock(self, path, identifier):
+        lock = FakeLock(path, identifier)
+        self.locks.append(lock)
+        return lock
+
+    def use(self, keep=True):
+        """
+        Acquire and release the lock on ``/locks/g``.
+        """
+        lock = self.leases.lock(self.kz_client, '/locks/g', keep)
+        self.assertTrue(self.successResultOf(lock.acquire(timeout=10)))
+        self.successResultOf(lock.release())
+
+    def test_acquires_in_zookeeper(self):
+        """
+        The first acquisition acquires a lock with the leases' identifier in
+        ZooKeeper, with the given timeout.
+        """
+        self.use()
+        [lock] = self.locks
+        self.assertEqual((lock.path, lock.identifier, lock.acquired),
+                         ('/locks/g', self.leases.identifier, [10]))
+
+    def test_kept_until_lease_expires(self):
+        """
+        A released lock is kept until its lease expires.
+        """
+        self.use()
+        [lock] = self.locks
+        self.clock.advance(4.9)
+        self.assertEqual(lock.released, 0)
+        self.clock.advance(0.1)
+        self.assertEqual(lock.released, 1)
+
+    def test_reused_while_leased(self):
+        """
+        The lock is reused without acquiring it in ZooKeeper again while it
+        is leased, and its lease restarts when it is released again.
+        """
+        self.use()
+        self.clock.advance(4)
+        self.use()
+        [lock] = self.locks
+        self.assertEqual((lock.acquired, lock.released), ([10], 0))
+        self.clock.advance(4)
+        self.assertEqual(lock.released, 0)
+        self.clock.advance(1)
+        self.assertEqual(lock.released, 1)
+
+    def test_handed_over_to_contender(self):
+        """
+        A leased lock that somebody else is waiting for is released and
+        acquired again in ZooKeeper.
+        """
+        self.use()
+        self.locks[0].contending = [self.leases.identifier, 'other']
+        self.use()
+        first, second = self.locks
+        self.assertEqual(first.released, 1)
+        self.assertEqual(second.acquired, [10])
+
+    def test_contenders_error(self):
+        """
+        If the contenders of a leased lock cannot be read, the error is
+        logged, and the lock is released and acquired again in ZooKeeper.
+        """
+        self.use()
+        err = ValueError('oops')
+        self.locks[0].contenders = lambda: fail(err)
+        self.use()
+        first, second = self.locks
+        self.assertEqual(first.released, 1)
+        self.assertEqual(second.acquired, [10])
+        self.log.bind.return_value.err.assert_called_once_with(
+            CheckFailure(ValueError), 'Could not check leased lock',
+            lock_path='/locks/g')
+
+    def test_lost_lock_acquired_again(self):
+        """
+        A leased lock that this node does not hold anymore is acquired again
+        in ZooKeeper.
+        """
+        self.use()
+        self.locks[0].contending = []
+        self.use()
+        self.assertEqual(len(self.locks), 2)
+
+    def test_released_for_local_waiter(self):
+        """
+        A lock is released right away when another lock of this node is
+        waiting for it in ZooKeeper.
+        """
+        first = self.leases.lock(self.kz_client, '/locks/g')
+        self.successResultOf(first.acquire())
+        second = self.leases.lock(self.kz_client, '/locks/g')
+        waiting = Deferred()
+        lock = FakeLock('/locks/g', self.leases.identifier)
+        lock.acquire = lambda timeout: waiting
+        self.kz_client.Lock.side_effect = lambda *a: lock
+        d = second.acquire()
+        self.successResultOf(first.release())
+        self.assertEqual(self.locks[0].released, 1)
+        waiting.callback(True)
+        self.assertTrue(self.successResultOf(d))
+        self.successResultOf(second.release())
+        self.assertEqual(lock.released, 0)
+
+    def test_not_kept(self):
+        """
+        A lock got with ``keep=False`` is released right away, even if it was
+        leased before.
+        """
+        self.use()
+        self.use(keep=False)
+        [lock] = self.locks
+        self.assertEqual(lock.released, 1)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_expiry_release_error_logged(self):
+        """
+        Failure to release a lock when its lease expires is logged.
+        """
+        self.use()
+        err = ValueError('oops')
+
+        def release():
+            d = Deferred()
+            d.errback(err)
+            return d
+
+        self.locks[0].release = release
+        self.clock.advance(5)
+        self.log.bind.return_value.err.assert_called_once_with(
+            mock.ANY, 'Could not release leased lock', lock_path='/locks/g')
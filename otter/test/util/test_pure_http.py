@@ -1,13 +1,18 @@
 """Tests for otter.util.pure_http"""
 
 import json
+from functools import partial
 from itertools import starmap
 
-from effect import ComposedDispatcher, Constant, Effect, Func
+from effect import ComposedDispatcher, Constant, Effect, Func, TypeDispatcher
 from effect.testing import Stub
 
+import mock
+
 from testtools import TestCase
 
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
 from twisted.trial.unittest import SynchronousTestCase
 
 from txeffect import perform
@@ -18,6 +23,8 @@ from otter.log.intents import get_log_dispatcher, with_log
 from otter.test.utils import (
     IsBoundWith, StubResponse, StubTreq, matches, mock_log,
     resolve_stubs, stub_pure_response)
+from otter.util.deadline import Deadline, DeadlineExceeded, bind_deadline
+from otter.util.deferredutils import TimedOutError
 from otter.util.http import APIError
 from otter.util.pure_http import (
     Request,
@@ -32,6 +39,7 @@ from otter.util.pure_http import (
     check_response,
     effect_on_response,
     has_code,
+    perform_pooled_request,
     request,
 )
 
@@ -130,6 +138,55 @@ class RequestEffectTests(SynchronousTestCase):
             self.successResultOf(perform(dispatcher, bound_log_eff)),
             (response, "content"))
 
+    def test_pooled(self):
+        """
+        :func:`perform_pooled_request` makes the request with the connection
+        pool of the request's URL.
+        """
+        pools_run = []
+
+        class Pools(object):
+            def run(self, url, f, *args):
+                pools_run.append(url)
+                return f(*args, pool='pool')
+
+        req = ('GET', 'http://google.com/', None, None, None,
+               {'log': default_log, 'pool': 'pool'})
+        response = StubResponse(200, {})
+        treq = StubTreq(reqs=[(req, response)],
+                        contents=[(response, "content")])
+        req = Request(method="get", url="http://google.com/")
+        req.treq = treq
+        dispatcher = ComposedDispatcher([
+            TypeDispatcher({Request: partial(perform_pooled_request,
+                                             Pools())}),
+            get_simple_dispatcher(None)])
+        self.assertEqual(
+            self.successResultOf(perform(dispatcher, Effect(req))),
+            (response, "content"))
+        self.assertEqual(pools_run, ['http://google.com/'])
+
+    def test_deadline(self):
+        """
+        Inside a deadline scope, the request times out at the deadline, and
+        is not made at all once the deadline has passed.
+        """
+        clock = Clock()
+        treq = mock.Mock(spec=['request', 'content'])
+        treq.request.return_value = Deferred()
+        req = Request(method="get", url="http://google.com/")
+        req.treq = treq
+        dispatcher = bind_deadline(get_simple_dispatcher(None),
+                                   Deadline(5, clock))
+        d = perform(dispatcher, Effect(req))
+        clock.advance(5)
+        self.failureResultOf(d, TimedOutError)
+
+        treq.request.reset_mock()
+        d = perform(dispatcher, Effect(req))
+        self.failureResultOf(d, DeadlineExceeded)
+        self.assertFalse(treq.request.called)
+
 
 class AddErrorHandlingTests(SynchronousTestCase):
     """Tests :func:`add_error_handling`."""
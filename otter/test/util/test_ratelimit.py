@@ -0,0 +1,266 @@
+"""Tests for :mod:`otter.util.ratelimit`."""
+
+from twisted.internet.defer import Deferred, fail, succeed
+from twisted.internet.task import Clock
+from twisted.trial.unittest import SynchronousTestCase
+
+from otter.test.utils import mock_log
+from otter.util.ratelimit import AdaptiveLimit, RateLimiters, TokenBucket
+
+
+class TokenBucketTests(SynchronousTestCase):
+    """
+    Tests for :obj:`TokenBucket`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.waits = []
+        self.bucket = TokenBucket(self.clock, 2, 3,
+                                  on_wait=self.waits.append)
+
+    def test_burst(self):
+        """
+        Up to ``burst`` calls run immediately, after which calls run at
+        ``rate`` per second.
+        """
+        results = [self.bucket.run(succeed, i) for i in range(5)]
+        self.assertEqual(map(self.successResultOf, results[:3]), [0, 1, 2])
+        self.assertNoResult(results[3])
+        self.assertEqual(self.bucket.waiting, 2)
+        self.clock.advance(0.5)
+        self.assertEqual(self.successResultOf(results[3]), 3)
+        self.assertNoResult(results[4])
+        self.clock.advance(0.5)
+        self.assertEqual(self.successResultOf(results[4]), 4)
+        self.assertEqual(self.waits, [0.5, 1.0])
+        self.assertEqual(
+            (self.bucket.waited, self.bucket.total_wait,
+             self.bucket.max_wait),
+            (2, 1.5, 1.0))
+
+    def test_refills_up_to_burst(self):
+        """
+        Tokens are added while the bucket is idle, up to ``burst``.
+        """
+        for _ in range(3):
+            self.bucket.run(succeed, None)
+        self.assertFalse(self.bucket.idle())
+        self.clock.advance(10)
+        self.assertTrue(self.bucket.idle())
+        results = [self.bucket.run(succeed, i) for i in range(4)]
+        self.assertEqual(map(self.successResultOf, results[:3]), [0, 1, 2])
+        self.assertNoResult(results[3])
+
+    def test_max_in_flight(self):
+        """
+        At most ``max_in_flight`` calls run at the same time, and waiting
+        calls are run in order when running calls finish.
+        """
+        bucket = TokenBucket(self.clock, None, max_in_flight=2)
+        ds = [Deferred() for _ in range(3)]
+        results = [bucket.run(lambda d=d: d) for d in ds]
+        self.assertEqual((bucket.in_flight, bucket.waiting), (2, 1))
+        ds[1].callback('b')
+        self.assertEqual(self.successResultOf(results[1]), 'b')
+        self.assertEqual((bucket.in_flight, bucket.waiting), (2, 0))
+        ds[0].callback('a')
+        ds[2].callback('c')
+        self.assertEqual(self.successResultOf(results[2]), 'c')
+        self.assertEqual(bucket.in_flight, 0)
+
+    def test_pause(self):
+        """
+        No calls are run while the bucket is paused.
+        """
+        self.bucket.pause(5)
+        d = self.bucket.run(succeed, 1)
+        self.clock.advance(4)
+        self.assertNoResult(d)
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(d), 1)
+
+    def test_set_limits(self):
+        """
+        Changing the limits runs the waiting calls they allow.
+        """
+        bucket = TokenBucket(self.clock, None, max_in_flight=1)
+        bucket.run(Deferred)
+        d = bucket.run(succeed, 1)
+        self.assertNoResult(d)
+        bucket.set_limits(None, max_in_flight=2)
+        self.assertEqual(self.successResultOf(d), 1)
+
+    def test_failure(self):
+        """
+        A call's failure is returned and frees its place.
+        """
+        bucket = TokenBucket(self.clock, None, max_in_flight=1)
+        self.failureResultOf(bucket.run(fail, ValueError('bad')), ValueError)
+        self.assertEqual(self.successResultOf(bucket.run(succeed, 1)), 1)
+
+    def test_synchronous_calls(self):
+        """
+        Calls that finish synchronously run the waiting calls without
+        recursing for each of them.
+        """
+        bucket = TokenBucket(self.clock, None, max_in_flight=1)
+        d = Deferred()
+        bucket.run(lambda: d)
+        results = [bucket.run(succeed, i) for i in range(2000)]
+        d.callback(None)
+        self.assertEqual(map(self.successResultOf, results), range(2000))
+
+
+class OverLimit(Exception):
+    """The exception of calls that were rate limited."""
+    def __init__(self, wait=0):
+        super(OverLimit, self).__init__(wait)
+        self.wait = wait
+
+
+def overloaded(failure):
+    """Return the wait time of :obj:`OverLimit` failures."""
+    return failure.value.wait if failure.check(OverLimit) else None
+
+
+class AdaptiveLimitTests(SynchronousTestCase):
+    """
+    Tests for :obj:`AdaptiveLimit`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.decreases = []
+        self.limit = AdaptiveLimit(
+            self.clock, overloaded, 4,
+            on_decrease=lambda *a: self.decreases.append(a))
+
+    def overload(self, wait=0):
+        self.failureResultOf(self.limit.run(fail, OverLimit(wait)), OverLimit)
+
+    def test_decrease(self):
+        """
+        The window is halved when a call is rate limited, which limits the
+        number of calls running. Further rate limited calls within the
+        cooldown do not decrease it again.
+        """
+        ds = [Deferred() for _ in range(4)]
+        results = [self.limit.run(lambda d=d: d) for d in ds]
+        ds[0].errback(OverLimit())
+        self.failureResultOf(results[0], OverLimit)
+        self.assertEqual(self.limit.window, 2)
+        ds[1].errback(OverLimit())
+        self.failureResultOf(results[1], OverLimit)
+        self.assertEqual(self.limit.window, 2)
+        d = self.limit.run(succeed, 'x')
+        self.assertNoResult(d)
+        ds[2].errback(ValueError())
+        self.failureResultOf(results[2], ValueError)
+        self.assertEqual(self.successResultOf(d), 'x')
+        self.assertEqual(self.limit.window, 2.5)
+        self.clock.advance(1)
+        self.overload()
+        self.assertEqual(self.limit.window, 1.25)
+        self.assertEqual(self.decreases, [(2, 0), (1.25, 0)])
+        ds[3].callback(None)
+
+    def test_increase(self):
+        """
+        The window grows by ``increase`` for every window's worth of calls
+        that succeed, up to the maximum.
+        """
+        self.overload()
+        self.clock.advance(1)
+        self.overload()
+        self.assertEqual(self.limit.window, 1)
+        windows = []
+        for _ in range(4):
+            self.limit.run(succeed, None)
+            windows.append(self.limit.window)
+        self.assertEqual(windows, [2, 2.5, 2.9, 2.9 + 1 / 2.9])
+        for _ in range(10):
+            self.limit.run(succeed, None)
+        self.assertEqual(self.limit.window, 4)
+        self.assertTrue(self.limit.idle())
+
+    def test_other_failures(self):
+        """
+        Failures that are not due to rate limiting do not change the window.
+        """
+        self.failureResultOf(self.limit.run(fail, ValueError()), ValueError)
+        self.assertEqual(self.limit.window, 4)
+
+    def test_retry_after(self):
+        """
+        No calls are run for the number of seconds the service asked to wait.
+        """
+        self.overload(5)
+        d = self.limit.run(succeed, 'x')
+        self.clock.advance(4)
+        self.assertNoResult(d)
+        self.clock.advance(1)
+        self.assertEqual(self.successResultOf(d), 'x')
+        self.assertEqual(self.decreases, [(2, 5)])
+
+
+class RateLimitersTests(SynchronousTestCase):
+    """
+    Tests for :obj:`RateLimiters`
+    """
+
+    def setUp(self):
+        self.clock = Clock()
+        self.log = mock_log()
+        self.limiters = RateLimiters(self.clock, self.log)
+
+    def test_same_key(self):
+        """
+        `get` returns the same bucket for the same key while it is in use,
+        updating its limits, and different buckets for different keys.
+        """
+        bucket = self.limiters.get('a', 1)
+        bucket.run(Deferred)
+        self.assertIs(self.limiters.get('a', 2, 3, 4), bucket)
+        self.assertEqual((bucket.rate, bucket.burst, bucket.max_in_flight),
+                         (2, 3, 4))
+        self.assertIsNot(self.limiters.get('b', 1), bucket)
+
+    def test_drops_idle(self):
+        """
+        Buckets back to their initial state are dropped when a new bucket
+        is created.
+        """
+        self.limiters.get('a', 1).run(succeed, None)
+        self.limiters.get('b', 1)
+        self.assertEqual(len(self.limiters), 2)
+        self.clock.advance(1)
+        self.limiters.get('c', 1)
+        self.assertEqual(len(self.limiters), 1)
+
+    def test_adaptive(self):
+        """
+        `get_adaptive` returns the same adaptive limit for the same key while
+        it is not back to its initial state, and its decreases are logged.
+        """
+        limit = self.limiters.get_adaptive('a', overloaded, 4, minimum=2)
+        self.assertIs(self.limiters.get_adaptive('a', overloaded, 4), limit)
+        self.assertEqual(limit.minimum, 2)
+        self.failureResultOf(limit.run(fail, OverLimit(3)), OverLimit)
+        self.limiters.get_adaptive('b', overloaded, 4)
+        self.assertIs(self.limiters.get_adaptive('a', overloaded, 4), limit)
+        self.log.msg.assert_called_once_with(
+            'adaptive-limit-decreased', adaptive_limit='a', window=2,
+            wait_time=3)
+
+    def test_logs_wait(self):
+        """
+        Calls that had to wait are logged with the time they waited.
+        """
+        bucket = self.limiters.get(('create_server',), 1)
+        bucket.run(succeed, None)
+        bucket.run(succeed, None)
+        self.clock.advance(1)
+        self.log.msg.assert_called_once_with(
+            'rate-limited', rate_limit=('create_server',), wait_time=1,
+            waiting=0, in_flight=1)
@@ -2,7 +2,7 @@
 
 from functools import partial
 
-from characteristic import attributes
+from characteristic import Attribute, attributes
 
 from effect import ComposedDispatcher, Effect, TypeDispatcher, sync_perform
 
@@ -20,7 +20,7 @@ from otter.util.zk import (
     perform_create_or_set, perform_delete_node)
 
 
-@attributes(['version'])
+@attributes(['version', Attribute('ctime', default_value=0)])
 class ZNodeStatStub(object):
     """Like a :obj:`ZnodeStat`, but only supporting the data we need."""
 
@@ -941,6 +941,9 @@ class EffectServersCache(object):
     def insert_servers(self, time, servers, clear):
         return Effect((self.ids("is"), time, servers, clear))
 
+    def update_time(self, time):
+        return Effect((self.ids("ut"), time))
+
     def delete_servers(self):
         return Effect(self.ids("ds"))
 
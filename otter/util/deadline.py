@@ -0,0 +1,212 @@
+"""
+Deadlines for effects that call upstream services.
+
+:obj:`DeadlineScope` gives an effect a time budget. Any :obj:`Request`, CQL
+query or retry performed while performing the effect can read the scope's
+:obj:`Deadline` with :func:`current_deadline` and fail fast when there is no
+time left, instead of leaving whatever performs the effect (like a
+convergence iteration) hanging.
+
+Inside a scope, a :obj:`effect.Delay` that would end after the deadline fails
+right away with :obj:`DeadlineExceeded`. Retries made with
+:func:`otter.util.retry.retry_effect` delay before each attempt, so they give
+up as soon as the remaining budget cannot cover another attempt.
+"""
+
+from functools import partial
+
+import attr
+
+from effect import (
+    ComposedDispatcher, Delay, Effect, NoPerformerFoundError, TypeDispatcher,
+    perform, sync_perform, sync_performer)
+
+from otter.util.deferredutils import timeout_deferred
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when some work cannot be done before the deadline of the
+    :obj:`DeadlineScope` it is done in.
+    """
+    def __init__(self, description, remaining):
+        super(DeadlineExceeded, self).__init__(
+            "{desc} cannot be done in the remaining {remaining} seconds of "
+            "the time budget.".format(desc=description, remaining=remaining))
+        self.description = description
+        self.remaining = remaining
+
+
+@attr.s
+class Deadline(object):
+    """
+    A point in time by which some work must be done.
+
+    :ivar float at: Time of the deadline, in seconds since the EPOCH as per
+        ``clock``
+    :ivar clock: An :obj:`IReactorTime` provider
+    """
+    at = attr.ib()
+    clock = attr.ib()
+
+    def remaining(self):
+        """Return the number of seconds left before the deadline."""
+        return max(self.at - self.clock.seconds(), 0)
+
+    def check(self, description, needed=0):
+        """
+        Raise :obj:`DeadlineExceeded` if ``needed`` seconds of work described
+        by ``description`` cannot be done before the deadline.
+        """
+        remaining = self.remaining()
+        if remaining <= needed:
+            raise DeadlineExceeded(description, remaining)
+
+    def bound(self, d, description):
+        """
+        Time out the given Deferred at the deadline, as per
+        :func:`timeout_deferred`.
+
+        :return: ``d``
+        """
+        timeout_deferred(d, self.remaining(), self.clock, description)
+        return d
+
+
+@attr.s
+class DeadlineScope(object):
+    """
+    An intent to perform ``effect`` within ``budget`` seconds. A scope nested
+    in another one cannot extend the outer scope's deadline.
+
+    :ivar Effect effect: The effect to perform in the scope
+    :ivar float budget: Number of seconds the effect can take
+    """
+    effect = attr.ib()
+    budget = attr.ib()
+
+
+@attr.s
+class GetDeadline(object):
+    """
+    An intent to get the :obj:`Deadline` of the current :obj:`DeadlineScope`.
+    It can only be performed inside a scope.
+    """
+
+
+@attr.s
+class _GetUnboundDispatcher(object):
+    """
+    An intent to get the dispatcher that the current deadline was bound to.
+    """
+
+
+def with_deadline(effect, budget):
+    """
+    Return Effect of :obj:`DeadlineScope` giving ``effect`` a time budget of
+    ``budget`` seconds.
+    """
+    return Effect(DeadlineScope(effect, budget))
+
+
+def current_deadline(dispatcher):
+    """
+    Return the :obj:`Deadline` of the :obj:`DeadlineScope` that ``dispatcher``
+    performs in, or ``None`` if it is not in a scope.
+
+    Intended for use in performers of intents that call upstream services.
+    """
+    try:
+        return sync_perform(dispatcher, Effect(GetDeadline()))
+    except NoPerformerFoundError:
+        return None
+
+
+def unbound_dispatcher(dispatcher):
+    """
+    Return the dispatcher that ``dispatcher`` was made from by binding it to
+    deadlines with :func:`bind_deadline`, which performs effects outside of
+    any deadline. ``dispatcher`` itself is returned if it is not bound to a
+    deadline.
+
+    Intended for work that outlives the effect bound to the deadline, like
+    work shared by several requests each with its own deadline.
+    """
+    try:
+        return sync_perform(dispatcher, Effect(_GetUnboundDispatcher()))
+    except NoPerformerFoundError:
+        return dispatcher
+
+
+def within_deadline(dispatcher, description, f, *args, **kwargs):
+    """
+    Call ``f`` with the given arguments, if there is time left before the
+    deadline of the :obj:`DeadlineScope` that ``dispatcher`` performs in, and
+    time out the Deferred it returns at the deadline. Outside of a scope,
+    ``f`` is just called.
+
+    :param str description: Description of the work done by ``f``
+    :raise: :obj:`DeadlineExceeded` if there's no time left
+    :return: Deferred returned by ``f``
+    """
+    deadline = current_deadline(dispatcher)
+    if deadline is None:
+        return f(*args, **kwargs)
+    deadline.check(description)
+    return deadline.bound(f(*args, **kwargs), description)
+
+
+def perform_bounded_delay(deadline, outer_dispatcher, dispatcher, intent,
+                          box):
+    """
+    Perform a :obj:`Delay` inside a :obj:`DeadlineScope` by failing it if it
+    would end after the scope's deadline, or performing it with the dispatcher
+    of the scope's parent otherwise.
+    """
+    try:
+        deadline.check('Delay of {} seconds'.format(intent.delay),
+                       intent.delay)
+    except DeadlineExceeded as e:
+        box.fail((DeadlineExceeded, e, None))
+    else:
+        perform(outer_dispatcher, Effect(intent).on(box.succeed, box.fail))
+
+
+def bind_deadline(dispatcher, deadline):
+    """
+    Return a dispatcher that performs effects like ``dispatcher``, but within
+    ``deadline``.
+
+    :param dispatcher: Dispatcher to wrap
+    :param Deadline deadline: The deadline
+    """
+    return ComposedDispatcher([
+        TypeDispatcher({
+            GetDeadline: sync_performer(lambda d, i: deadline),
+            _GetUnboundDispatcher: sync_performer(
+                lambda d, i: unbound_dispatcher(dispatcher)),
+            Delay: partial(perform_bounded_delay, deadline, dispatcher)}),
+        dispatcher])
+
+
+def perform_deadline_scope(clock, dispatcher, scope, box):
+    """
+    Perform a :obj:`DeadlineScope` by performing its effect with a dispatcher
+    bound to the scope's deadline.
+    """
+    deadline = Deadline(clock.seconds() + scope.budget, clock)
+    outer = current_deadline(dispatcher)
+    if outer is not None and outer.at < deadline.at:
+        deadline = outer
+    perform(bind_deadline(dispatcher, deadline),
+            scope.effect.on(box.succeed, box.fail))
+
+
+def get_deadline_dispatcher(clock):
+    """
+    Get a dispatcher that can perform :obj:`DeadlineScope`.
+
+    :param clock: An :obj:`IReactorTime` provider
+    """
+    return TypeDispatcher({
+        DeadlineScope: partial(perform_deadline_scope, clock)})
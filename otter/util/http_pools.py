@@ -0,0 +1,118 @@
+"""
+Persistent HTTP connection pools, one per host.
+
+treq keeps a single global pool that caches at most 2 connections per host,
+so when many requests are made to a service at the same time most of them
+open (and TLS handshake) a new connection, which is closed right after the
+request. :obj:`ConnectionPools` keeps a pool per host with a configurable
+number of cached connections, and counts how many requests reused a
+connection.
+"""
+
+from urlparse import urlsplit
+
+from twisted.internet.defer import maybeDeferred
+from twisted.web.client import HTTPConnectionPool
+
+
+MAX_PERSISTENT_PER_HOST = 10
+"""
+Default maximum number of idle connections kept open to a host.
+"""
+
+CACHED_CONNECTION_TIMEOUT = 240
+"""
+Default number of seconds an idle connection is kept open.
+"""
+
+
+class _CountingPool(HTTPConnectionPool):
+    """
+    A :obj:`HTTPConnectionPool` that counts the connections it was asked for
+    and the new connections it opened.
+    """
+    requests = 0
+    misses = 0
+
+    def getConnection(self, key, endpoint):
+        """See :meth:`HTTPConnectionPool.getConnection`."""
+        self.requests += 1
+        return HTTPConnectionPool.getConnection(self, key, endpoint)
+
+    def _newConnection(self, key, endpoint):
+        self.misses += 1
+        return HTTPConnectionPool._newConnection(self, key, endpoint)
+
+
+class ConnectionPools(object):
+    """
+    Persistent HTTP connection pools keyed on the scheme, host and port of
+    the URLs requested.
+
+    :param reactor: The reactor used by the pools
+    :param int max_persistent_per_host: Maximum number of idle connections
+        kept open to a host
+    :param float cached_connection_timeout: Number of seconds an idle
+        connection is kept open
+    """
+
+    def __init__(self, reactor,
+                 max_persistent_per_host=MAX_PERSISTENT_PER_HOST,
+                 cached_connection_timeout=CACHED_CONNECTION_TIMEOUT):
+        self.reactor = reactor
+        self.max_persistent_per_host = max_persistent_per_host
+        self.cached_connection_timeout = cached_connection_timeout
+        self._pools = {}
+        self._in_flight = {}
+
+    def _pool(self, host):
+        pool = self._pools.get(host)
+        if pool is None:
+            pool = _CountingPool(self.reactor, persistent=True)
+            pool.maxPersistentPerHost = self.max_persistent_per_host
+            pool.cachedConnectionTimeout = self.cached_connection_timeout
+            self._pools[host] = pool
+        return pool
+
+    def _finished(self, result, host):
+        self._in_flight[host] -= 1
+        return result
+
+    def run(self, url, f, *args, **kwargs):
+        """
+        Call ``f`` with the given arguments and the pool of ``url``'s host as
+        the ``pool`` keyword argument. The call is counted as in flight until
+        the Deferred it returns fires.
+
+        :return: Deferred of the result of ``f``
+        """
+        parts = urlsplit(url)
+        host = '{}://{}'.format(parts.scheme, parts.netloc)
+        pool = self._pool(host)
+        self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        d = maybeDeferred(f, *args, pool=pool, **kwargs)
+        return d.addBoth(self._finished, host)
+
+    def stats(self):
+        """
+        Get the usage of each host's pool.
+
+        :return: dict of host to dict of ``requests`` (number of connections
+            asked for), ``hits`` (number of those that reused an idle
+            connection), ``misses`` (number of connections opened),
+            ``in_flight`` (number of requests being made) and ``idle`` (number
+            of idle connections)
+        """
+        return {
+            host: {'requests': pool.requests,
+                   'hits': pool.requests - pool.misses,
+                   'misses': pool.misses,
+                   'in_flight': self._in_flight.get(host, 0),
+                   'idle': sum(map(len, pool._connections.values()))}
+            for host, pool in self._pools.iteritems()}
+
+    def health_check(self):
+        """
+        Return the pools' usage as a health check that is always healthy.
+        """
+        return True, self.stats()
@@ -0,0 +1,184 @@
+"""
+Leases of ZooKeeper locks.
+
+Acquiring and releasing a ZooKeeper lock takes several round-trips to
+ZooKeeper, most of them writes. When the same node takes the same lock many
+times in a row, :obj:`LockLeases` lets it keep the lock for a short while
+after releasing it and take it again without going to ZooKeeper.
+
+Other contenders are only noticed when this node takes the lock again or the
+lease expires, so another node waiting for a leased lock can wait up to a
+whole lease before getting it.
+"""
+
+import uuid
+
+from twisted.internet import defer
+
+from otter.log import log as default_log
+
+
+class LockLeases(object):
+    """
+    ZooKeeper locks kept by this node for ``lease`` seconds after they are
+    released, so that taking them again in that time is cheap.
+
+    :ivar reactor: :obj:`IReactorTime` provider used to expire leases
+    :ivar float lease: Number of seconds a released lock is kept for, which
+        is also how long other nodes may have to wait for it
+    :ivar str identifier: Identifier of this node's contenders for the locks
+    """
+
+    def __init__(self, reactor, lease, log=default_log):
+        self.reactor = reactor
+        self.lease = lease
+        self.log = log.bind(system=self.__class__.__name__)
+        self.identifier = str(uuid.uuid4())
+        # path -> (lock kept after release, IDelayedCall releasing it)
+        self._leased = {}
+        # path -> number of locks of this node waiting in ZooKeeper
+        self._waiting = {}
+
+    def lock(self, kz_client, path, keep=True):
+        """
+        Get the lock at ``path``.
+
+        :param kz_client: :obj:`txkazoo.TxKazooClient` to lock with
+        :param str path: Path of the lock
+        :param bool keep: Keep the lock for a lease when it is released?
+            Pass ``False`` if the lock will not be needed anymore, like
+            before deleting its path.
+        :return: :obj:`LeasedLock`
+        """
+        return LeasedLock(self, kz_client, path, keep)
+
+    def _take(self, path):
+        """
+        Take the lock leased on ``path``, if any, cancelling its expiry.
+
+        :return: The lock or ``None``
+        """
+        if path not in self._leased:
+            return None
+        lock, call = self._leased.pop(path)
+        call.cancel()
+        return lock
+
+    def _keep(self, path, lock):
+        """
+        Keep ``lock`` on ``path`` that is released by its user for a lease,
+        unless another lock of this node is waiting for it. Locks of other
+        nodes waiting for it get it when the lease expires.
+
+        :return: Deferred that fires when the lock is released or kept
+        """
+        if self.lease <= 0 or self._waiting.get(path):
+            return lock.release()
+        call = self.reactor.callLater(self.lease, self._expire, path)
+        self._leased[path] = (lock, call)
+        return defer.succeed(None)
+
+    def _expire(self, path):
+        """
+        Release the lock on ``path`` at the end of its lease.
+        """
+        lock, _ = self._leased.pop(path)
+        d = lock.release()
+        d.addErrback(self.log.err, 'Could not release leased lock',
+                     lock_path=path)
+
+    def _acquire(self, kz_client, path, timeout):
+        """
+        Acquire a new lock on ``path`` in ZooKeeper.
+
+        :return: Deferred that fires with the acquired lock
+        """
+        lock = kz_client.Lock(path, self.identifier)
+        self._waiting[path] = self._waiting.get(path, 0) + 1
+
+        def acquired(_):
+            self._waiting[path] -= 1
+            if not self._waiting[path]:
+                del self._waiting[path]
+            return _
+
+        d = lock.acquire(timeout=timeout)
+        return d.addBoth(acquired).addCallback(lambda _: lock)
+
+    def _reacquire(self, lock, kz_client, path, timeout):
+        """
+        Release ``lock`` on ``path``, logging any error, and acquire a new
+        one in ZooKeeper.
+
+        :return: Deferred that fires with the acquired lock
+        """
+        d = lock.release()
+        d.addErrback(self.log.err, 'Could not hand over leased lock',
+                     lock_path=path)
+        return d.addCallback(lambda _: self._acquire(kz_client, path, timeout))
+
+    def acquire(self, kz_client, path, timeout=None):
+        """
+        Acquire the lock on ``path``, reusing the lock leased on it if this
+        node still holds it and nobody else is waiting for it.
+
+        :return: Deferred that fires with the acquired lock
+        """
+        lock = self._take(path)
+        if lock is None:
+            return self._acquire(kz_client, path, timeout)
+
+        def check_contenders(contenders):
+            if contenders == [self.identifier]:
+                return lock
+            # Somebody is waiting for the lock or this node lost it (for
+            # example, with its ZooKeeper session): hand it over and queue
+            # up behind the others.
+            return self._reacquire(lock, kz_client, path, timeout)
+
+        def check_failed(failure):
+            # Whether this node still holds the lock is unknown: let it go
+            # and start over.
+            self.log.err(failure, 'Could not check leased lock',
+                         lock_path=path)
+            return self._reacquire(lock, kz_client, path, timeout)
+
+        return lock.contenders().addCallbacks(check_contenders, check_failed)
+
+
+class LeasedLock(object):
+    """
+    A lock got from :obj:`LockLeases`, that can be used like a
+    :obj:`txkazoo` lock by :func:`otter.util.deferredutils.with_lock`.
+    """
+
+    def __init__(self, leases, kz_client, path, keep):
+        self.leases = leases
+        self.kz_client = kz_client
+        self.path = path
+        self.keep = keep
+        self._lock = None
+
+    def acquire(self, timeout=None):
+        """
+        Acquire the lock.
+
+        :return: Deferred that fires with ``True`` when acquired
+        """
+        def acquired(lock):
+            self._lock = lock
+            return True
+
+        d = self.leases.acquire(self.kz_client, self.path, timeout)
+        return d.addCallback(acquired)
+
+    def release(self):
+        """
+        Release the lock, keeping it leased if asked to.
+
+        :return: Deferred that fires when released
+        """
+        lock, self._lock = self._lock, None
+        if self.keep:
+            return self.leases._keep(self.path, lock)
+        return lock.release()
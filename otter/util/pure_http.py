@@ -19,6 +19,7 @@ from txeffect import deferred_performer
 
 from otter.log.intents import merge_effectful_fields
 from otter.util import logging_treq
+from otter.util.deadline import within_deadline
 from otter.util.http import APIError
 
 
@@ -41,22 +42,39 @@ class Request(object):
                 and isinstance(result[1], str))
 
 
-@deferred_performer
 @inlineCallbacks
+def _perform_request(dispatcher, intent, **kwargs):
+    log = merge_effectful_fields(dispatcher, intent.log)
+    description = 'HTTP request to {}'.format(intent.url)
+    response = yield within_deadline(
+        dispatcher, description, intent.treq.request,
+        intent.method.upper(), intent.url, headers=intent.headers,
+        data=intent.data, params=intent.params, log=log, **kwargs)
+    content = yield within_deadline(
+        dispatcher, description, intent.treq.content, response)
+    returnValue((response, content))
+
+
+@deferred_performer
 def perform_request(dispatcher, intent):
     """
     Perform the request with treq.
 
     :return: A two-tuple of (HTTP Response, content as bytes)
     """
-    log = merge_effectful_fields(dispatcher, intent.log)
-    response = yield intent.treq.request(intent.method.upper(), intent.url,
-                                         headers=intent.headers,
-                                         data=intent.data,
-                                         params=intent.params,
-                                         log=log)
-    content = yield intent.treq.content(response)
-    returnValue((response, content))
+    return _perform_request(dispatcher, intent)
+
+
+@deferred_performer
+def perform_pooled_request(pools, dispatcher, intent):
+    """
+    Perform the request with treq, using the connection pool of the
+    request's host from ``pools``.
+
+    :param ConnectionPools pools: The connection pools to use
+    :return: A two-tuple of (HTTP Response, content as bytes)
+    """
+    return pools.run(intent.url, _perform_request, dispatcher, intent)
 
 
 def request(method, url, **kwargs):
@@ -0,0 +1,335 @@
+"""
+Token-bucket rate limiting of Deferred-returning calls.
+"""
+
+from collections import deque
+from functools import partial
+
+from twisted.internet.defer import Deferred, maybeDeferred
+
+
+# Allowance for floating point errors when counting tokens, so that a call
+# woken up exactly when a token is due is not put back to sleep
+_EPSILON = 1e-9
+
+
+class TokenBucket(object):
+    """
+    Limits calls to ``rate`` per second on average while allowing bursts of
+    up to ``burst`` calls, and optionally limits how many calls run at the
+    same time. Calls that cannot be run yet wait in the order they were made.
+
+    The :meth:`run` method is a Deferred bracket like
+    :meth:`DeferredLock.run`.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param float rate: Number of calls allowed per second. ``None`` for no
+        limit on the rate.
+    :param int burst: Number of calls that can be made at once after the
+        bucket has been idle
+    :param int max_in_flight: Maximum number of calls whose Deferreds have not
+        fired yet. ``None`` for no limit.
+    :param callable on_wait: Called with the number of seconds a call waited
+        when a call that had to wait is run
+
+    :ivar float total_wait: Total number of seconds calls have waited
+    :ivar float max_wait: Longest number of seconds a call has waited
+    :ivar int waited: Number of calls that had to wait
+    """
+
+    def __init__(self, clock, rate, burst=1, max_in_flight=None,
+                 on_wait=None):
+        self.clock = clock
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.on_wait = on_wait
+        self.total_wait = 0
+        self.max_wait = 0
+        self.waited = 0
+        self._tokens = float(burst)
+        self._updated = clock.seconds()
+        self._queue = deque()
+        self._in_flight = 0
+        self._wake_call = None
+        self._paused_until = 0
+        self._starting = False
+
+    @property
+    def waiting(self):
+        """Number of calls waiting to be run."""
+        return len(self._queue)
+
+    @property
+    def in_flight(self):
+        """Number of calls running."""
+        return self._in_flight
+
+    def idle(self):
+        """
+        Is the bucket back to its initial state, i.e. no calls are waiting
+        or running and it has all its tokens?
+        """
+        self._refill(self.clock.seconds())
+        return (not self._queue and self._in_flight == 0 and
+                self._tokens + _EPSILON >= self.burst)
+
+    def set_limits(self, rate, burst=1, max_in_flight=None):
+        """
+        Change the limits of the bucket, running any waiting calls that the
+        new limits allow.
+        """
+        self._refill(self.clock.seconds())
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._run_waiting()
+
+    def pause(self, seconds):
+        """
+        Do not run any call for the next ``seconds`` seconds.
+        """
+        self._paused_until = max(self._paused_until,
+                                 self.clock.seconds() + seconds)
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call ``f`` with the given arguments once the limits allow it.
+
+        :return: Deferred that fires with the result of ``f``
+        """
+        d = Deferred()
+        self._queue.append((self.clock.seconds(), d, f, args, kwargs))
+        self._run_waiting()
+        return d
+
+    def _refill(self, now):
+        if self.rate is None:
+            self._tokens = float(self.burst)
+        else:
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _can_start(self, now):
+        return (self._queue and now >= self._paused_until and
+                (self.rate is None or self._tokens + _EPSILON >= 1) and
+                (self.max_in_flight is None or
+                 self._in_flight < self.max_in_flight))
+
+    def _run_waiting(self):
+        # Calls that finish synchronously call this again while calls are
+        # being started; the loop below will start any call they made room
+        # for.
+        if self._starting:
+            return
+        self._starting = True
+        try:
+            self._start_waiting()
+        finally:
+            self._starting = False
+
+    def _start_waiting(self):
+        now = self.clock.seconds()
+        self._refill(now)
+        while self._can_start(now):
+            queued_at, d, f, args, kwargs = self._queue.popleft()
+            if self.rate is not None:
+                self._tokens -= 1
+            self._in_flight += 1
+            waited = now - queued_at
+            if waited > 0:
+                self.waited += 1
+                self.total_wait += waited
+                self.max_wait = max(self.max_wait, waited)
+                if self.on_wait is not None:
+                    self.on_wait(waited)
+            result = maybeDeferred(f, *args, **kwargs)
+            result.addBoth(self._finished)
+            result.chainDeferred(d)
+        if self._queue and self._wake_call is None:
+            delay = self._paused_until - now
+            if self.rate is not None and self._tokens + _EPSILON < 1:
+                delay = max(delay, (1 - self._tokens) / self.rate)
+            if delay > 0:
+                self._wake_call = self.clock.callLater(delay, self._wake)
+
+    def _wake(self):
+        self._wake_call = None
+        self._run_waiting()
+
+    def _finished(self, result):
+        self._in_flight -= 1
+        self._run_waiting()
+        return result
+
+
+class AdaptiveLimit(object):
+    """
+    Limits the number of calls running at the same time to a window that
+    adapts to the upstream service's rate limiting: the window is multiplied
+    by ``decrease`` when a call fails because the service is overloaded, and
+    grows by ``increase`` for every window's worth of calls that succeed
+    (additive increase, multiplicative decrease). Calls that fail for other
+    reasons do not change the window.
+
+    Like :meth:`TokenBucket.run`, :meth:`run` is a Deferred bracket.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param callable overloaded: Called with the :obj:`Failure` of a call.
+        Returns ``None`` if the failure is not due to the service being
+        overloaded, otherwise the number of seconds the service asked to wait
+        before sending more requests, which can be 0.
+    :param int maximum: Largest window, which is also the initial window
+    :param int minimum: Smallest window
+    :param float increase: See above
+    :param float decrease: See above
+    :param float cooldown: Number of seconds after the window is decreased
+        during which it is not decreased again, since the failures are
+        usually of calls that were made before the decrease
+    :param callable on_decrease: Called with the new window and the number
+        of seconds to wait when the window is decreased
+    """
+
+    def __init__(self, clock, overloaded, maximum, minimum=1, increase=1,
+                 decrease=0.5, cooldown=1, on_decrease=None):
+        self.clock = clock
+        self.overloaded = overloaded
+        self.maximum = maximum
+        self.minimum = minimum
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.on_decrease = on_decrease
+        self.window = float(maximum)
+        self._decreased_at = None
+        self._bucket = TokenBucket(clock, None, max_in_flight=maximum)
+
+    @property
+    def waiting(self):
+        """Number of calls waiting to be run."""
+        return self._bucket.waiting
+
+    @property
+    def in_flight(self):
+        """Number of calls running."""
+        return self._bucket.in_flight
+
+    def idle(self):
+        """
+        Is the limit back to its initial state, i.e. no calls are waiting or
+        running and the window is at its maximum?
+        """
+        return self._bucket.idle() and self.window >= self.maximum
+
+    def _set_window(self, window):
+        self.window = float(window)
+        self._bucket.set_limits(None, max_in_flight=int(window))
+
+    def _succeeded(self, result):
+        if self.window < self.maximum:
+            self._set_window(
+                min(self.maximum, self.window + self.increase / self.window))
+        return result
+
+    def _failed(self, failure):
+        wait = self.overloaded(failure)
+        if wait is None:
+            return failure
+        if wait > 0:
+            self._bucket.pause(wait)
+        now = self.clock.seconds()
+        if (self._decreased_at is not None and
+                now - self._decreased_at < self.cooldown):
+            return failure
+        self._decreased_at = now
+        self._set_window(max(self.minimum, self.window * self.decrease))
+        if self.on_decrease is not None:
+            self.on_decrease(self.window, wait)
+        return failure
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call ``f`` with the given arguments once the window allows it, and
+        adapt the window to the result.
+
+        :return: Deferred that fires with the result of ``f``
+        """
+        d = self._bucket.run(f, *args, **kwargs)
+        return d.addCallbacks(self._succeeded, self._failed)
+
+
+class RateLimiters(object):
+    """
+    A collection of :obj:`TokenBucket` and :obj:`AdaptiveLimit` keyed on some
+    arbitrary key, like a tenant ID. Limits that are back to their initial
+    state are dropped when new ones are created.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param log: A bound log. If given, calls that had to wait and decreases
+        of adaptive limits are logged.
+    """
+
+    def __init__(self, clock, log=None):
+        self.clock = clock
+        self.log = log
+        self._buckets = {}
+        self._adaptive = {}
+
+    def _log_wait(self, key, waited):
+        bucket = self._buckets[key]
+        self.log.msg('rate-limited', rate_limit=key, wait_time=waited,
+                     waiting=bucket.waiting, in_flight=bucket.in_flight)
+
+    def _log_decrease(self, key, window, wait):
+        self.log.msg('adaptive-limit-decreased', adaptive_limit=key,
+                     window=window, wait_time=wait)
+
+    def get(self, key, rate, burst=1, max_in_flight=None):
+        """
+        Get the bucket for the given key, creating it if it does not exist.
+        The limits of an existing bucket are updated to the ones given.
+
+        :param key: hashable key of the bucket
+        :return: :obj:`TokenBucket`
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            idle = [k for k, b in self._buckets.iteritems() if b.idle()]
+            for k in idle:
+                del self._buckets[k]
+            on_wait = None
+            if self.log is not None:
+                on_wait = partial(self._log_wait, key)
+            bucket = TokenBucket(self.clock, rate, burst, max_in_flight,
+                                 on_wait)
+            self._buckets[key] = bucket
+        else:
+            bucket.set_limits(rate, burst, max_in_flight)
+        return bucket
+
+    def get_adaptive(self, key, overloaded, maximum, **kwargs):
+        """
+        Get the adaptive limit for the given key, creating it if it does not
+        exist.
+
+        :param key: hashable key of the limit
+        :param overloaded: See :obj:`AdaptiveLimit`
+        :param maximum: See :obj:`AdaptiveLimit`
+        :param kwargs: Other arguments of :obj:`AdaptiveLimit`
+        :return: :obj:`AdaptiveLimit`
+        """
+        limit = self._adaptive.get(key)
+        if limit is None:
+            idle = [k for k, l in self._adaptive.iteritems() if l.idle()]
+            for k in idle:
+                del self._adaptive[k]
+            if self.log is not None:
+                kwargs['on_decrease'] = partial(self._log_decrease, key)
+            limit = AdaptiveLimit(self.clock, overloaded, maximum, **kwargs)
+            self._adaptive[key] = limit
+        return limit
+
+    def __len__(self):
+        return len(self._buckets)
@@ -3,10 +3,11 @@ Module that provides retrying-at-a-particular-interval functionality.
 """
 
 import random
+from collections import deque
 
 from characteristic import Attribute, attributes
 
-from effect import Delay, Effect, Func, sync_performer
+from effect import Constant, Delay, Effect, Func, sync_performer
 from effect.retry import retry as effect_retry
 
 from twisted.internet import defer
@@ -203,15 +204,32 @@ def random_interval(minimum, maximum):
     return lambda f: random.uniform(minimum, maximum)
 
 
-def exponential_backoff_interval(start=2):
+FULL_JITTER = 'full'
+"""
+Jitter strategy of :obj:`ExponentialBackoffInterval` that picks each interval
+at random between 0 and the exponentially growing interval.
+"""
+
+DECORRELATED_JITTER = 'decorrelated'
+"""
+Jitter strategy of :obj:`ExponentialBackoffInterval` that picks each interval
+at random between ``start`` and three times the previous interval.
+"""
+
+
+def exponential_backoff_interval(start=2, jitter=None):
     """
-    Returns a ``next_interval`` function for `:py:func:retry` that returns previous
-    interval * 2 as new interval each time it is called
+    Returns a ``next_interval`` function for `:py:func:retry` that returns
+    previous interval * 2 as new interval each time it is called
 
     :param start: number of seconds > 0 to start with
-    :return: a function that accepts a :class:`Failure` and returns ``interval``
+    :param jitter: ``None`` for no jitter, or :data:`FULL_JITTER` or
+        :data:`DECORRELATED_JITTER`, so that operations failing at the same
+        time do not all retry at the same time.
+    :return: a function that accepts a :class:`Failure` and returns
+        ``interval``
     """
-    return ExponentialBackoffInterval(start=start)
+    return ExponentialBackoffInterval(start=start, jitter=jitter)
 
 
 def retry(do_work, can_retry=None, next_interval=None, clock=None):
@@ -266,22 +284,32 @@ class TransientRetryError(Exception):
 
 # TODO: The following code should be moved to effect.retry if it proves out.
 
-@attributes(['start', Attribute('last_interval', default_value=0)])
+@attributes(['start', Attribute('last_interval', default_value=0),
+             Attribute('jitter', default_value=None)])
 class ExponentialBackoffInterval(object):
     """
     A callable that returns the previous interval * 2 (starting at
     ``start``) every time it's called.
 
     :param start: number of seconds > 0 to start with
-    :return: a function that accepts a :class:`Failure` and returns ``interval``
+    :param jitter: ``None``, :data:`FULL_JITTER` or
+        :data:`DECORRELATED_JITTER`
+    :return: a function that accepts a :class:`Failure` and returns
+        ``interval``
     """
 
     def __call__(self, failure):
         """Return an increasingly larger number."""
+        if self.jitter == DECORRELATED_JITTER:
+            self.last_interval = random.uniform(
+                self.start, max(self.start, self.last_interval * 3))
+            return self.last_interval
         if self.last_interval != 0:
             self.last_interval *= 2
         else:
             self.last_interval = self.start
+        if self.jitter == FULL_JITTER:
+            return random.uniform(0, self.last_interval)
         return self.last_interval
 
 
@@ -325,7 +353,88 @@ class ShouldDelayAndRetry(object):
         return Effect(Func(doit))
 
 
-@attributes(['effect', 'should_retry'])
+class RetryBudget(object):
+    """
+    Limits retries of operations to a fraction of the operations that
+    succeeded recently, so that retries don't multiply the load on a service
+    that is failing.
+
+    Within the last ``ttl`` seconds, ``min_retries_per_second * ttl`` retries
+    plus ``ratio`` retries per success are allowed.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param float ratio: Retries allowed per success
+    :param float min_retries_per_second: Retries always allowed per second,
+        so that rarely used operations can be retried
+    :param int ttl: Number of seconds successes and retries are remembered
+    """
+
+    def __init__(self, clock, ratio=0.2, min_retries_per_second=1, ttl=10):
+        self.clock = clock
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.ttl = ttl
+        # [second, successes, retries] of the last ``ttl`` seconds
+        self._counts = deque()
+
+    def _current(self):
+        now = int(self.clock.seconds())
+        while self._counts and self._counts[0][0] <= now - self.ttl:
+            self._counts.popleft()
+        if not self._counts or self._counts[-1][0] != now:
+            self._counts.append([now, 0, 0])
+        return self._counts[-1]
+
+    def deposit(self):
+        """Record that an operation succeeded."""
+        self._current()[1] += 1
+
+    def withdraw(self):
+        """Record that an operation is retried."""
+        self._current()[2] += 1
+
+    def balance(self):
+        """Return the number of retries currently allowed."""
+        self._current()
+        successes = sum(c[1] for c in self._counts)
+        retries = sum(c[2] for c in self._counts)
+        return (self.min_retries_per_second * self.ttl +
+                self.ratio * successes - retries)
+
+    def can_retry(self):
+        """Return whether an operation can be retried now."""
+        return self.balance() >= 1
+
+
+class RetryBudgets(object):
+    """
+    The :obj:`RetryBudget` of each service, created when first needed.
+
+    :param clock: An :obj:`IReactorTime` provider
+    :param dict config: :obj:`RetryBudget` keyword arguments, like the
+        ``retry_budget`` config
+    """
+
+    def __init__(self, clock, config=None):
+        self.clock = clock
+        self.config = config or {}
+        self._budgets = {}
+
+    def get(self, service):
+        """
+        Get the :obj:`RetryBudget` shared by all retries of requests to the
+        given service.
+
+        :param service: hashable identifying the service, like a
+            :obj:`otter.constants.ServiceType`
+        """
+        if service not in self._budgets:
+            self._budgets[service] = RetryBudget(self.clock, **self.config)
+        return self._budgets[service]
+
+
+@attributes(['effect', 'should_retry',
+             Attribute('budget', default_value=None)])
 class Retry(object):
     """
     An effect intent that, when performed, executes another effect and
@@ -339,25 +448,53 @@ class Retry(object):
     :param effect: The effect to perform.
     :param should_retry: The function to call to determine whether retry
     should occur (usually an instance of :obj:`ShouldDelayAndRetry`).
+    :param budget: The service whose :obj:`RetryBudget` successes of
+        ``effect`` are deposited in and retries are withdrawn from, like a
+        :obj:`otter.constants.ServiceType`. The effect is not retried when
+        the budget is exhausted. ``None`` for no budget.
     """
 
 
 @sync_performer
-def perform_retry(dispatcher, intent):
+def perform_retry(dispatcher, intent, budgets=None):
     """
     Invoke :func:`effect.retry.retry` with the effect and the
-    should_retry function.
+    should_retry function, limited by the intent's budget if any.
+
+    :param budgets: :obj:`RetryBudgets` to find the intent's budget in.
+        Retries are not limited if it is ``None``.
     """
-    return effect_retry(intent.effect, intent.should_retry)
+    if intent.budget is None or budgets is None:
+        return effect_retry(intent.effect, intent.should_retry)
+    budget = budgets.get(intent.budget)
+
+    def deposit(result):
+        budget.deposit()
+        return result
+
+    def withdraw(should):
+        if should:
+            budget.withdraw()
+        return should
+
+    def should_retry(exc_info):
+        if not budget.can_retry():
+            return Effect(Constant(False))
+        return intent.should_retry(exc_info).on(withdraw)
+
+    return effect_retry(intent.effect.on(deposit), should_retry)
 
 
-def retry_effect(effect, can_retry, next_interval):
+def retry_effect(effect, can_retry, next_interval, budget=None):
     """
     Convenience function for wrapping an effect in a :obj:`Retry`.
 
+    :param budget: The service whose :obj:`RetryBudget` limits the
+        retries, if any.
     :return: :obj:`Effect` of :obj:`Retry`.
     """
     return Effect(Retry(
         effect=effect,
         should_retry=ShouldDelayAndRetry(can_retry=can_retry,
-                                         next_interval=next_interval)))
+                                         next_interval=next_interval),
+        budget=budget))
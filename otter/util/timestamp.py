@@ -2,13 +2,27 @@
 Utilities for consistently handling timestamp formats in otter
 """
 
+import calendar
+import re
+from collections import OrderedDict
 from datetime import datetime
+
 import iso8601
-import calendar
 
 
 MIN = "{0}Z".format(datetime.min.isoformat())
 
+EPOCH_CACHE_SIZE = 100000
+"""
+Maximum number of timestamps whose EPOCH :func:`timestamp_to_epoch`
+remembers.
+"""
+
+_ZULU_TIMESTAMP = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?Z\Z')
+
+_epochs = OrderedDict()
+
 
 def now():
     """
@@ -33,14 +47,52 @@ def from_timestamp(timestamp):
     return iso8601.parse_date(timestamp)
 
 
+def _parse_zulu(timestamp):
+    """
+    Parse a ``YYYY-MM-DDTHH:MM:SS[.ffffff]Z`` timestamp, as produced by Nova
+    and :func:`now`, without going through :mod:`iso8601`.
+
+    :return: a naive UTC ``datetime``, or ``None`` if the timestamp does not
+        have this format
+    """
+    if not isinstance(timestamp, basestring):
+        return None
+    match = _ZULU_TIMESTAMP.match(timestamp)
+    if match is None:
+        return None
+    parts = match.groups()
+    fraction = parts[6] or '0'
+    try:
+        return datetime(*(map(int, parts[:6]) + [int(fraction.ljust(6, '0'))]))
+    except ValueError:
+        return None
+
+
 def timestamp_to_epoch(timestamp):
     """
     Convert UTC datetime string to EPOCH seconds
 
+    Timestamps of the common ``YYYY-MM-DDTHH:MM:SS[.ffffff]Z`` format are
+    parsed directly, and the EPOCHs of the :data:`EPOCH_CACHE_SIZE` most
+    recently converted timestamp strings are remembered, since the same
+    servers' timestamps are converted on every convergence iteration.
+
     :param str timestamp: A UTC timestamp string
     :return: EPOCH seconds as float
     """
-    return datetime_to_epoch(from_timestamp(timestamp))
+    if not isinstance(timestamp, basestring):
+        return datetime_to_epoch(from_timestamp(timestamp))
+    try:
+        epoch = _epochs.pop(timestamp)
+    except KeyError:
+        dt = _parse_zulu(timestamp)
+        if dt is None:
+            dt = from_timestamp(timestamp)
+        epoch = datetime_to_epoch(dt)
+        if len(_epochs) >= EPOCH_CACHE_SIZE:
+            _epochs.popitem(last=False)
+    _epochs[timestamp] = epoch
+    return epoch
 
 
 def datetime_to_epoch(dt):